@@ -15,9 +15,13 @@ def refresh_diag():
         a2 = getattr(settings, "ALGORITHM", None)
     except Exception:
         s2 = None; a2 = None
+    from app.auth.keyring import get_keyring
+    ring = get_keyring()
     return {
         "ALG_env": ALG,
         "SECRET_env_sha256": sha256(SECRET.encode()).hexdigest(),
         "ALG_settings": a2,
         "SECRET_settings_sha256": (sha256(s2.encode()).hexdigest() if isinstance(s2,str) else None),
+        "keyring_active_kid": ring.active,
+        "keyring_kids": ring.kids(),
     }
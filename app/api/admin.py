@@ -1,11 +1,11 @@
 ﻿from fastapi import APIRouter, Depends, Request
-from app.deps import get_db
+from app.deps import get_db, get_reporting_db, db_backend
 from app.core.security import require_roles
 
 router = APIRouter()
 
 @router.get("/admin/stats", dependencies=[Depends(require_roles(["owner"]))])
-async def get_stats(request: Request, db=Depends(get_db)):
+async def get_stats(request: Request, db=Depends(get_reporting_db)):
     tenant = request.state.tenant or "public"
 
     def safe_count(coll):
@@ -84,12 +84,21 @@ async def admin_indexes_create(request: Request, db=Depends(get_db)):
     created = {}
     for name, keys in specs.items():
         created[name] = db[name].create_index(keys)
+    from app.common import jobprogress
+    from app.services import job_dedupe, rudra_usage, scan_diff, trinetra_infer
+    for suffix, idx in {**scan_diff.INDEXES, **rudra_usage.INDEXES, **trinetra_infer.INDEXES,
+                        **job_dedupe.INDEXES, **jobprogress.INDEXES}.items():
+        for idx_name, keys, unique in idx:
+            created.setdefault(f"{tenant}{suffix}", idx_name)
+            db[f"{tenant}{suffix}"].create_index(keys, name=idx_name, unique=unique)
     return {"ok": True, "created": created}
 
 @router.get("/admin/indexes/list")
 async def admin_indexes_list(request: Request, db=Depends(get_db)):
     tenant = (getattr(getattr(request, "state", None), "tenant", None) or request.headers.get("Host","default")).split(".")[0]
-    cols = [f"{tenant}_scans", f"{tenant}_qc_results", f"{tenant}_rudra_forecasts", f"{tenant}_nandi", f"{tenant}_users"]
+    cols = [f"{tenant}_scans", f"{tenant}_qc_results", f"{tenant}_rudra_forecasts", f"{tenant}_nandi", f"{tenant}_users",
+            f"{tenant}_kavach_ports", f"{tenant}_kavach_changes", f"{tenant}_rudra_usage",
+            f"{tenant}_trinetra_inferences"]
     info = {name: db[name].index_information() for name in cols}
     return {"ok": True, "indexes": info}
 from fastapi import Request, HTTPException, status
@@ -103,3 +112,177 @@ async def health_check(request: Request):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="missing token")
     ensure_role(claims, "owner")
     return {"status": "ok"}
+
+@router.get("/admin/db/pool", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_db_pool():
+    """Mongo pool sizing and checkout wait metrics for this worker process."""
+    backend = db_backend()
+    if backend != "mongo":
+        return {"backend": backend}
+    from app.db.manager import pool_stats
+    return {"backend": "mongo", **pool_stats()}
+
+from app.common.observability import profiles
+
+def _caller_tenant(request: Request) -> str:
+    # an owner administers their own tenant only: profiles, reports and forecasts are scoped to it
+    tenant = getattr(request.state, "tenant", None)
+    if not tenant:
+        raise HTTPException(status_code=400, detail="missing tenant")
+    return tenant
+
+@router.get("/admin/profiles", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_profiles_list(request: Request):
+    """Most recent request profiles of the caller's tenant held by this worker (newest first)."""
+    tenant = _caller_tenant(request)
+    return {"config": profiles.config(tenant), "profiles": profiles.list(tenant)}
+
+@router.get("/admin/profiles/config", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_profiles_config(request: Request):
+    return profiles.config(_caller_tenant(request))
+
+@router.put("/admin/profiles/config", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_profiles_configure(request: Request, cfg: dict = Body(...)):
+    """Switch profiling of the caller's tenant / its path prefixes, without a redeploy."""
+    try:
+        return profiles.configure(cfg.get("tenants"), cfg.get("routes"), cfg.get("allow_header"),
+                                  tenant=_caller_tenant(request))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_profile_get(request: Request, profile_id: str, top: int = 50):
+    tr = profiles.get(profile_id, _caller_tenant(request))
+    if tr is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return tr.to_dict(top=top)
+
+@router.delete("/admin/profiles", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_profiles_clear(request: Request):
+    return {"cleared": profiles.clear(_caller_tenant(request))}
+
+from app.services import report_batch
+
+@router.post("/admin/reports/batch", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_reports_batch(request: Request, cfg: dict = Body(default={}), db=Depends(get_db),
+                              rdb=Depends(get_reporting_db)):
+    """
+    Start (or resume, with `job_id`) a batch Kavach report run for the caller's
+    tenant in a background thread. Body: {pdf?: bool, chunk_size?: int (max 200), job_id?: str}.
+    Runs across tenants are for operators: `python -m scripts.batch_reports`.
+    """
+    tenant = _caller_tenant(request)
+    if cfg.get("tenants") not in (None, [tenant]):
+        raise HTTPException(status_code=403, detail="can only report on the caller's tenant")
+    try:
+        size = report_batch.clamp_chunk(cfg.get("chunk_size"))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    job_id = cfg.get("job_id")
+    if job_id and report_batch.get_job(db, job_id) and not report_batch.get_job(db, job_id, tenant):
+        raise HTTPException(status_code=404, detail="job not found")  # another tenant's run
+    job = report_batch.BatchReportJob(db, rdb, job_id=job_id, tenants=[tenant],
+                                      pdf=bool(cfg.get("pdf", False)), chunk_size=size)
+    if not report_batch.start_in_background(job):
+        return {"job_id": job.job_id, "status": job.state["status"]}
+    return {"job_id": job.job_id, "status": "started"}
+
+@router.get("/admin/reports/batch/{job_id}", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_reports_batch_status(request: Request, job_id: str, db=Depends(get_db)):
+    state = report_batch.get_job(db, job_id, _caller_tenant(request))
+    if state is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return state
+
+from app.common import cache as memo_cache
+
+@router.get("/admin/cache", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_cache_stats():
+    """Hit/miss/coalesced counts of this worker's in-process caches (forecasts, ...)."""
+    return {"caches": memo_cache.all_stats()}
+
+@router.delete("/admin/cache/{name}", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_cache_clear(name: str):
+    c = memo_cache.get(name)
+    if c is None:
+        raise HTTPException(status_code=404, detail="cache not found")
+    c.clear()
+    return {"cleared": name}
+
+from app.services import cost_forecast
+
+@router.post("/admin/costs/forecast/refresh", dependencies=[Depends(require_roles(["owner"]))])
+def admin_costs_forecast_refresh(request: Request, months: int = 6, db=Depends(get_db)):
+    """Run the forecast + budget alert refresh for the caller's tenant now (the hourly job covers all)."""
+    return cost_forecast.refresh_all(db, months=max(1, min(months, cost_forecast.MAX_MONTHS)),
+                                     tenants=[_caller_tenant(request)])
+
+from app.services import cost_anomaly
+
+@router.get("/admin/anomaly/stats", dependencies=[Depends(require_roles(["owner"]))])
+def admin_anomaly_stats():
+    """Series tracked by this worker's streaming cost-anomaly detector."""
+    return cost_anomaly.detector.stats()
+
+from app.services import trinetra_pool
+
+@router.get("/admin/trinetra/pool", dependencies=[Depends(require_roles(["owner"]))])
+def admin_trinetra_pool():
+    """Queue depth, batch sizes and restarts of this worker's Trinetra model pool."""
+    pool = trinetra_pool.current_pool()
+    return pool.stats() if pool is not None else {"started": False}
+
+from app.services import thumbnails
+
+@router.get("/admin/trinetra/thumbnails", dependencies=[Depends(require_roles(["owner"]))])
+def admin_trinetra_thumbnails():
+    """Size and hit ratio of this worker's thumbnail/overlay disk cache."""
+    cache = thumbnails.current_cache()
+    return cache.stats() if cache is not None else {"started": False}
+
+from app.common import jobqueue
+
+@router.get("/admin/jobs/queue", dependencies=[Depends(require_roles(["owner"]))])
+def admin_jobs_queue():
+    """Queue depth, running jobs and wait percentiles per class/tenant of this worker's job scheduler."""
+    from app.common import jobevents, jobprogress, jobregistry
+    sched = jobqueue.current_scheduler()
+    out = sched.stats() if sched is not None else {"started": False}
+    return {**out, "notifications": jobevents.hub.stats(), "registry": jobregistry.registry.stats(),
+            "progress": jobprogress.hub.stats()}
+
+from app.auth import credentials
+
+@router.get("/admin/auth/logins", dependencies=[Depends(require_roles(["owner"]))])
+def admin_auth_logins():
+    """Logins, failures, throttling, hashing pool and verified-login cache of this worker."""
+    return credentials.store.stats()
+
+@router.get("/admin/users", dependencies=[Depends(require_roles(["owner"]))])
+def admin_users_list(request: Request, db=Depends(get_db)):
+    tenant = getattr(request.state, "tenant", None)
+    if not tenant:
+        raise HTTPException(status_code=400, detail="missing tenant")
+    return {"users": list(db[f"{tenant}{credentials.USERS}"].find({}, {"hash": 0}))}
+
+@router.put("/admin/users/{username}", dependencies=[Depends(require_roles(["owner"]))])
+async def admin_user_put(username: str, request: Request, body: dict = Body(...), db=Depends(get_db)):
+    """Create or update a tenant user: {"password", "role", "disabled"}; the password is bcrypt-hashed."""
+    tenant = getattr(request.state, "tenant", None)
+    if not tenant:
+        raise HTTPException(status_code=400, detail="missing tenant")
+    try:
+        # hashing costs as much as a login check, so it runs on the same bounded pool
+        return await credentials.store.pool.run(credentials.store.set_user, db, tenant, username,
+                                                body.get("password"), body.get("role"), body.get("disabled"))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except credentials.LoginBusy:
+        raise HTTPException(status_code=503, detail="busy", headers={"Retry-After": "1"})
+
+@router.delete("/admin/users/{username}", dependencies=[Depends(require_roles(["owner"]))])
+def admin_user_delete(username: str, request: Request, db=Depends(get_db)):
+    tenant = getattr(request.state, "tenant", None)
+    if not tenant or not credentials.store.delete_user(db, tenant, username):
+        raise HTTPException(status_code=404, detail="user not found")
+    return {"deleted": username}
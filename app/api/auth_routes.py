@@ -1,39 +1,41 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from jose import jwt
 
-from app.core.config import settings
+from app.auth import credentials, keyring
+from app.deps import get_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-# Minimal in-memory users for tests / local dev
-_USERS = {
-    # username: (password, role)
-    "analyst": ("secret123", "analyst"),
-    "owner": ("secret123", "owner"),
-}
-
 class LoginIn(BaseModel):
     username: str
     password: str
 
 @router.post("/login")
-async def login(body: LoginIn, request: Request):
-    # Validate user
-    rec = _USERS.get(body.username)
-    if not rec or rec[0] != body.password:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid credentials")
-
-    role = rec[1]
+async def login(body: LoginIn, request: Request, db=Depends(get_db)):
     tenant: Optional[str] = getattr(request.state, "tenant", None)
     if not tenant:
         # For safety, require tenant on login so we can bind tid into JWT
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="missing tenant")
 
+    # Validate user against the tenant's hashed store (app/auth/credentials.py);
+    # bcrypt runs on a bounded pool, never on the event loop
+    try:
+        user = await credentials.store.authenticate(db, tenant, body.username, body.password,
+                                                    ip=request.client.host if request.client else None)
+    except credentials.InvalidCredentials:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid credentials")
+    except credentials.LoginThrottled as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+    except credentials.LoginBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="login busy, retry",
+                            headers={"Retry-After": "1"})
+
+    role = user["role"]
     now = datetime.utcnow()
     exp = now + timedelta(hours=4)
 
@@ -45,5 +47,5 @@ async def login(body: LoginIn, request: Request):
         "exp": int(exp.timestamp()),
     }
 
-    token = jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    token = keyring.sign(claims)
     return JSONResponse({"access_token": token, "token_type": "bearer"})
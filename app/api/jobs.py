@@ -1,37 +1,65 @@
 ﻿# app/api/jobs.py
-from fastapi import APIRouter, HTTPException, Request, status
-from typing import Any, Dict
-from uuid import uuid4
-from app.common.worker import scheduler
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from typing import Any, Dict, Optional
+from app.common import jobcancel, jobevents, jobqueue, jobregistry
+from app.deps import get_db
 from app.jobs import run_kavach_scan, run_trinetra_inference
-import time, logging, traceback, asyncio, json
+from app.services import job_dedupe
+import time, logging, json
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
-JOBS: Dict[str, Dict[str, Any]] = {}
+# bounded, shared with jobs_api (app/common/jobregistry.py); publishes every change
+REGISTRY = jobregistry.registry
 
-def _run_and_capture(job_id: str, func, *args, **kwargs):
-    rec = JOBS.get(job_id, {"status": "queued"})
-    rec["status"] = "running"
-    JOBS[job_id] = rec
-    try:
-        # support both sync and async task functions
-        if asyncio.iscoroutinefunction(func):
-            result = asyncio.run(func(*args, **kwargs))
+def _tenant(request: Request) -> str:
+    return (getattr(request.state, "tenant", None) or request.headers.get("Host", "default")).split(".")[0]
+
+def _owned(job_id: str, tenant: str) -> Dict[str, Any]:
+    """Status of a job of `tenant`; another tenant's job looks like an unknown one."""
+    rec = REGISTRY.record(job_id)
+    if rec is None or rec.tenant != tenant:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job not found or expired")
+    return rec.to_dict()
+
+def _capture(job_id: str):
+    """Scheduler state callback: mirror running / succeeded / failed / cancelled / timeout into the registry."""
+    def cb(state: str, value: Any) -> None:
+        if state == "running":
+            REGISTRY.update(job_id, state)
+        elif state == "succeeded":
+            REGISTRY.update(job_id, state, value)
         else:
-            result = func(*args, **kwargs)
-        rec["status"] = "succeeded"
-        rec["result"] = result
-    except Exception as e:
-        logging.error("Job %s failed: %s", job_id, e)
-        traceback.print_exc()
-        rec["status"] = "failed"
-        rec["error"] = str(e)
-    finally:
-        JOBS[job_id] = rec
+            logging.error("Job %s %s: %s", job_id, state, value)
+            REGISTRY.update(job_id, state, {"error": str(value)})
+    return cb
+
+def _enqueue(request: Request, db, module: str, payload: Dict[str, Any], func, *args,
+             target: Optional[str] = None) -> Dict[str, Any]:
+    """Run through the tenant-fair scheduler (app/common/jobqueue.py) instead of APScheduler's FIFO;
+    repeated submissions coalesce onto one job (app/services/job_dedupe.py)."""
+    tenant = _tenant(request)
+    priority = "batch" if module == "kavach" else "interactive"
+
+    def submit(job_id: str) -> None:
+        REGISTRY.create(job_id, tenant, module, payload, priority)
+        try:
+            jobqueue.get_scheduler().submit(tenant, func, *args, job_id=job_id, priority=priority,
+                                            module=module, on_state=_capture(job_id))
+        except jobqueue.QueueFull as e:
+            REGISTRY.discard(job_id)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+    try:
+        job_id, created = job_dedupe.submit_once(
+            db, tenant, module, payload, submit, idempotency_key=request.headers.get("Idempotency-Key"),
+            target=target, is_dead=lambda j: REGISTRY.status(j) in ("failed", "cancelled", "timeout"))
+    except job_dedupe.KeyReused as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return {"job_id": job_id} if created else {"job_id": job_id, "deduplicated": True}
 
 def _echo_task(payload: Any):
-    time.sleep(2)  # simulate work
+    jobcancel.sleep(2)  # simulate work
     return {"echo": payload, "processed_at": time.time()}
 
 def _require_json(request: Request):
@@ -52,37 +80,41 @@ async def _read_json(request: Request) -> Dict[str, Any]:
         )
 
 @router.post("/echo")
-async def submit_echo(request: Request):
+async def submit_echo(request: Request, db=Depends(get_db)):
     _require_json(request)
     payload = await _read_json(request)
-    job_id = str(uuid4())
-    JOBS[job_id] = {"status": "queued"}
-    scheduler.add_job(_run_and_capture, id=job_id, replace_existing=True, args=[job_id, _echo_task, payload])
-    return {"job_id": job_id}
+    return _enqueue(request, db, "echo", {"payload": payload}, _echo_task, payload)
 
 @router.post("/kavach-scan")
-async def submit_kavach(request: Request):
+async def submit_kavach(request: Request, db=Depends(get_db)):
     _require_json(request)
     body = await _read_json(request)
     target = (body.get("target") or "127.0.0.1").strip()
-    job_id = str(uuid4())
-    JOBS[job_id] = {"status": "queued", "target": target}
-    scheduler.add_job(_run_and_capture, id=job_id, replace_existing=True, args=[job_id, run_kavach_scan, target])
-    return {"job_id": job_id}
+    return _enqueue(request, db, "kavach", {"target": target}, run_kavach_scan, target, target=target)
 
 @router.post("/trinetra-infer")
-async def submit_trinetra(request: Request):
+async def submit_trinetra(request: Request, db=Depends(get_db)):
     _require_json(request)
     body = await _read_json(request)
     filename = (body.get("filename") or "qc_demo.csv").strip()
-    job_id = str(uuid4())
-    JOBS[job_id] = {"status": "queued", "filename": filename}
-    scheduler.add_job(_run_and_capture, id=job_id, replace_existing=True, args=[job_id, run_trinetra_inference, filename])
-    return {"job_id": job_id}
+    return _enqueue(request, db, "trinetra", {"filename": filename}, run_trinetra_inference, filename)
 
 @router.get("/{job_id}")
-def job_status(job_id: str):
-    rec = JOBS.get(job_id)
-    if not rec:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job not found")
-    return {"job_id": job_id, **rec}
\ No newline at end of file
+async def job_status(request: Request, job_id: str, wait: float = 0):
+    rec = _owned(job_id, _tenant(request))
+    if wait > 0 and rec["status"] not in jobevents.TERMINAL:
+        # long-poll: park until the job finishes (at most 60 s)
+        await jobevents.hub.wait(job_id, min(wait, 60.0), lambda: REGISTRY.status(job_id) in jobevents.TERMINAL)
+        rec = REGISTRY.get(job_id) or rec
+    return rec
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(request: Request, job_id: str):
+    rec = _owned(job_id, _tenant(request))
+    if rec["status"] in jobevents.TERMINAL:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"job already {rec['status']}")
+    sched = jobqueue.current_scheduler()
+    state = sched.cancel(job_id) if sched is not None else None
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="job is not queued or running in this worker")
+    return {"job_id": job_id, "status": state}
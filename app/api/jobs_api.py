@@ -1,47 +1,47 @@
 # app/api/jobs_api.py
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from uuid import uuid4
-import threading
+import json
 import time
 
 # Import your actual job functions
 from app.jobs import run_kavach_scan, run_trinetra_inference
+from app.common.ranged import ranged_response
+from app.deps import get_db
+from app.services import job_dedupe
+from app.common import jobcancel, jobevents, jobprogress, jobqueue, jobregistry
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
 # ------------------------------------------------------------------
-# In-memory job registry (thread-safe)
+# Job registry (app/common/jobregistry.py)
 # ------------------------------------------------------------------
-_JOBS: Dict[str, Dict[str, Any]] = {}
-_LOCK = threading.Lock()
-
-def _new_job(payload: Dict[str, Any]) -> str:
-    job_id = str(uuid4())
-    with _LOCK:
-        _JOBS[job_id] = {
-            "job_id": job_id,
-            "status": "queued",
-            "submitted_at": time.time(),
-            "result": None,
-            "payload": payload,
-        }
+# Bounded: finished jobs expire after JOB_TTL_SECONDS and large results live
+# in the artifact store. Every state change is published to long-pollers /
+# stream subscribers (app/common/jobevents.py).
+_REGISTRY = jobregistry.registry
+
+def _new_job(payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+    job_id = job_id or str(uuid4())
+    _REGISTRY.create(job_id, payload.get("tenant"), payload.get("module"), payload, payload.get("priority"))
     return job_id
 
 def _set_status(job_id: str, status_: str, result: Any = None) -> None:
-    with _LOCK:
-        if job_id in _JOBS:
-            _JOBS[job_id]["status"] = status_
-            if result is not None:
-                _JOBS[job_id]["result"] = result
-
-def _get_job(job_id: str) -> Dict[str, Any]:
-    with _LOCK:
-        j = _JOBS.get(job_id)
-        if not j:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job not found")
-        return j
+    _REGISTRY.update(job_id, status_, result)
+
+def _owned(job_id: str, tenant: str) -> Optional[Dict[str, Any]]:
+    """Status of a job of `tenant`; another tenant's job looks like an unknown one."""
+    rec = _REGISTRY.record(job_id)
+    return rec.to_dict() if rec is not None and rec.tenant == tenant else None
+
+def _get_job(job_id: str, tenant: str) -> Dict[str, Any]:
+    j = _owned(job_id, tenant)
+    if not j:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job not found or expired")
+    return j
 
 # ------------------------------------------------------------------
 # Request models
@@ -57,68 +57,198 @@ class EchoReq(BaseModel):
     delay_seconds: float = Field(0, ge=0, le=30)
 
 # ------------------------------------------------------------------
-# Background runners (wrappers)
+# Job functions & submission (tenant-fair scheduler, app/common/jobqueue.py)
 # ------------------------------------------------------------------
-def _bg_kavach(job_id: str, req: KavachScanReq) -> None:
-    try:
-        _set_status(job_id, "running")
-        result = run_kavach_scan(req.target)
-        _set_status(job_id, "succeeded", result)
-    except Exception as e:
-        _set_status(job_id, "failed", {"error": str(e)})
-
-def _bg_trinetra(job_id: str, req: TrinetraInferReq) -> None:
-    try:
-        _set_status(job_id, "running")
-        result = run_trinetra_inference(req.filename)
-        _set_status(job_id, "succeeded", result)
-    except Exception as e:
-        _set_status(job_id, "failed", {"error": str(e)})
+# interactive jobs skip ahead of bulk work; ?priority= overrides per call
+DEFAULT_PRIORITY = {"kavach": "batch", "trinetra": "interactive", "echo": "interactive"}
+PriorityParam = Query(None, pattern="^(interactive|batch)$", description="Scheduling class")
+# running-time limit; unset means the module default (app/common/jobcancel.py DEFAULT_DEADLINES)
+TimeoutParam = Query(None, gt=0, le=86400, description="Deadline in seconds of running time")
+
+def _echo(message: str, delay_seconds: float) -> Dict[str, Any]:
+    if delay_seconds:
+        jobcancel.sleep(float(delay_seconds))  # returns early when the job is cancelled
+    return {"echo": message, "processed_at": time.time()}
+
+def _tenant(request: Request) -> str:
+    return (getattr(request.state, "tenant", None) or request.headers.get("Host", "default")).split(".")[0]
+
+_DEAD = {"failed", "cancelled", "timeout"}
+
+def _on_state(job_id: str):
+    def cb(state: str, value: Any) -> None:
+        if state in _DEAD:
+            value = {"error": str(value)}
+        _set_status(job_id, state, value)
+    return cb
+
+def _submit(request: Request, module: str, payload: Dict[str, Any], priority: Optional[str], func, *args,
+            db, target: Optional[str] = None, timeout: Optional[float] = None):
+    """
+    Queue a job. An `Idempotency-Key` header, or a recent job for the same
+    target (app/services/job_dedupe.py), returns the existing job instead.
+    """
+    tenant = _tenant(request)
+    priority = priority or DEFAULT_PRIORITY[module]
+
+    def enqueue(jid: str) -> None:
+        _new_job({"module": module, "tenant": tenant, "priority": priority, **payload}, jid)
+        try:
+            jobqueue.get_scheduler().submit(tenant, func, *args, job_id=jid, priority=priority,
+                                            module=module, on_state=_on_state(jid), timeout=timeout)
+        except jobqueue.QueueFull as e:
+            _REGISTRY.discard(jid)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                                headers={"Retry-After": "5"})
 
-def _bg_echo(job_id: str, req: EchoReq) -> None:
     try:
-        _set_status(job_id, "running")
-        if req.delay_seconds:
-            time.sleep(float(req.delay_seconds))
-        _set_status(job_id, "succeeded", {"echo": req.message, "processed_at": time.time()})
-    except Exception as e:
-        _set_status(job_id, "failed", {"error": str(e)})
+        jid, created = job_dedupe.submit_once(db, tenant, module, payload, enqueue,
+                                              idempotency_key=request.headers.get("Idempotency-Key"),
+                                              target=target, is_dead=lambda j: _REGISTRY.status(j) in _DEAD)
+    except job_dedupe.KeyReused as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if created:
+        return {"job_id": jid, "status": "queued", "priority": priority}
+    return {"job_id": jid, "status": _REGISTRY.status(jid), "priority": priority, "deduplicated": True}
 
 # ------------------------------------------------------------------
 # Endpoints
 # ------------------------------------------------------------------
 
 @router.post("/kavach/scan")
-def start_kavach_scan(req: KavachScanReq, bg: BackgroundTasks):
+def start_kavach_scan(req: KavachScanReq, request: Request, priority: Optional[str] = PriorityParam,
+                      timeout: Optional[float] = TimeoutParam, db=Depends(get_db)):
     """
     Start a Kavach scan as a background job.
-    Returns a job_id you can poll at /jobs/status/{job_id}.
+    Returns a job_id you can poll at /jobs/status/{job_id}. A retry with the
+    same `Idempotency-Key`, or a scan of the same target within
+    JOB_DEDUPE_WINDOW, returns the existing job (`deduplicated: true`).
     """
-    jid = _new_job({"module": "kavach", "target": req.target})
-    bg.add_task(_bg_kavach, jid, req)
-    return {"job_id": jid, "status": "queued"}
+    return _submit(request, "kavach", {"target": req.target}, priority, run_kavach_scan, req.target,
+                   db=db, target=req.target, timeout=timeout)
 
 @router.post("/trinetra/infer")
-def start_trinetra_inference(req: TrinetraInferReq, bg: BackgroundTasks):
+def start_trinetra_inference(req: TrinetraInferReq, request: Request, priority: Optional[str] = PriorityParam,
+                             timeout: Optional[float] = TimeoutParam, db=Depends(get_db)):
     """
     Start a Trinetra inference as a background job.
     """
-    jid = _new_job({"module": "trinetra", "filename": req.filename})
-    bg.add_task(_bg_trinetra, jid, req)
-    return {"job_id": jid, "status": "queued"}
+    return _submit(request, "trinetra", {"filename": req.filename}, priority, run_trinetra_inference, req.filename,
+                   db=db, timeout=timeout)
 
 @router.post("/echo")
-def start_echo(req: EchoReq, bg: BackgroundTasks):
+def start_echo(req: EchoReq, request: Request, priority: Optional[str] = PriorityParam,
+               timeout: Optional[float] = TimeoutParam, db=Depends(get_db)):
     """
     Small test job; useful to validate the background pipeline.
     """
-    jid = _new_job({"module": "echo", "message": req.message, "delay": req.delay_seconds})
-    bg.add_task(_bg_echo, jid, req)
-    return {"job_id": jid, "status": "queued"}
+    return _submit(request, "echo", {"message": req.message, "delay": req.delay_seconds}, priority,
+                   _echo, req.message, req.delay_seconds, db=db, timeout=timeout)
+
+@router.post("/cancel/{job_id}", status_code=status.HTTP_202_ACCEPTED)
+def cancel_job(job_id: str, request: Request):
+    """
+    Cancel a job of this tenant. A queued job is dropped at once
+    (`cancelled`); a running one is stopped (`cancelling`) and ends as
+    `cancelled`. Its worker is freed as soon as the job stops, or after
+    JOB_CANCEL_GRACE_MS if it ignores the request.
+    """
+    rec = _REGISTRY.record(job_id)
+    if rec is None or rec.tenant != _tenant(request):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job not found or expired")
+    if rec.status in jobevents.TERMINAL:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"job already {rec.status}")
+    sched = jobqueue.current_scheduler()
+    state = sched.cancel(job_id) if sched is not None else None
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="job is not queued or running in this worker")
+    return {"job_id": job_id, "status": state}
+
+MAX_WAIT = 60
+MAX_BATCH = 500
 
 @router.get("/status/{job_id}")
-def job_status(job_id: str):
+async def job_status(job_id: str, request: Request, wait: float = Query(0, ge=0, le=MAX_WAIT)):
+    """
+    Check status/result for any job this tenant started through this API. With
+    `?wait=N` the request is held until the job finishes or N seconds pass (long-poll).
+    """
+    tenant = _tenant(request)
+    rec = _get_job(job_id, tenant)
+    if wait and rec["status"] not in jobevents.TERMINAL:
+        await jobevents.hub.wait(job_id, wait, lambda: _REGISTRY.status(job_id) in jobevents.TERMINAL)
+        rec = _get_job(job_id, tenant)
+    return rec
+
+@router.post("/status")
+def job_status_batch(request: Request, job_ids: List[str] = Body(..., embed=True, max_length=MAX_BATCH)):
+    """
+    Status of many jobs in one call; unknown ids and other tenants' jobs map to null.
+    """
+    tenant = _tenant(request)
+    return {"jobs": {jid: _owned(jid, tenant) for jid in job_ids}}
+
+@router.get("/status/{job_id}/result")
+def job_result(job_id: str, request: Request):
+    """
+    Full result of a job whose result was too large to keep inline
+    (`result_ref` in the status); supports ranged downloads.
+    """
+    _get_job(job_id, _tenant(request))
+    found = _REGISTRY.offloaded_result(job_id)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="job has no offloaded result")
+    store, tenant, meta = found
+    return ranged_response(request, meta["size"], f'"{meta["sha256"]}"', meta["content_type"],
+                           lambda start, end: store.iter_bytes(tenant, meta, start, end))
+
+@router.get("/progress/{job_id}")
+def job_progress(job_id: str, request: Request, since: int = Query(0, ge=0)):
+    """
+    Percent, stage and partial findings of a job (findings from index `since`
+    on, so pollers only fetch what is new). Also answers for jobs running on
+    another worker or already evicted, from the persisted progress.
+    """
+    snap = jobprogress.hub.snapshot(_tenant(request), job_id, since)
+    if snap is None:
+        rec = _get_job(job_id, _tenant(request))
+        return {"job_id": job_id, "percent": None, "stage": None, "findings": 0, "findings_kept": 0,
+                "new_findings": [], "live": rec["status"] not in jobevents.TERMINAL}
+    return snap
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/stream")
+async def job_stream(request: Request, max_events: int = Query(0, ge=0),
+                     heartbeat: float = Query(15, ge=1, le=120)):
     """
-    Check status/result for any job started by this API.
+    Server-sent events: every state transition of this tenant's jobs
+    (`event: job`), coalesced progress with new findings (`event: progress`), `: ping` comments as keep-alive, and `event: lagged` if the
+    client fell too far behind and should re-read statuses. `max_events` closes
+    the stream after that many events.
     """
-    return _get_job(job_id)
+    tenant = _tenant(request)
+    sub = jobevents.hub.subscribe(tenant)
+
+    async def gen():
+        sent = 0
+        with sub:
+            yield ": connected\n\n"
+            while not max_events or sent < max_events:
+                event = await sub.get(timeout=heartbeat)
+                if event is None:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                if event["type"] == "lagged":
+                    yield _sse("lagged", {"tenant": tenant})
+                elif event["type"] == "progress":
+                    yield _sse("progress", event["progress"])
+                else:
+                    yield _sse("job", event["job"])
+                sent += 1
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
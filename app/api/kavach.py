@@ -1,11 +1,12 @@
-﻿from xhtml2pdf import pisa
-from io import BytesIO
-from fastapi import Response
+﻿from fastapi import Response
 from fastapi import APIRouter, Depends, Request
 from app.deps import get_db
 from bson.json_util import dumps
 from starlette.responses import Response
 from app.middleware.ratelimit import limiter
+from fastapi.responses import JSONResponse
+from app.services import artifacts, kavach_report, scan_diff
+from app.common.ranged import ranged_response
 
 router = APIRouter()
 
@@ -20,6 +21,7 @@ async def kavach_profile(request: Request, db = Depends(get_db)):
     doc = db[f"{tenant}_users"].find_one({"role": "owner"}) or {"tenant": tenant, "role": "owner"}
     return Response(dumps(doc), media_type="application/json")
 from fastapi import Body
+from bson import ObjectId
 from bson.json_util import dumps
 from starlette.responses import Response
 from fastapi import Depends, Request
@@ -31,39 +33,74 @@ async def kavach_scans_seed(request: Request, db=Depends(get_db), scans: list[di
     col = db[f"{tenant}_scans"]
     if isinstance(scans, dict):
         scans = [scans]
+    # raw nmap output goes to the artifact store; the scan keeps a reference
+    store = artifacts.get_store(db)
+    raw = {}
+    for s in scans:
+        if isinstance(s.get("raw_xml"), str):
+            s.setdefault("_id", ObjectId())
+            raw[id(s)] = s.pop("raw_xml")
+            meta = store.put(tenant, raw[id(s)], "raw_xml", "application/xml", artifact_id=f"{s['_id']}.xml")
+            s["raw_xml_artifact"] = artifacts.summary(meta)
     res = col.insert_many(scans)
-    return Response(dumps({"inserted": len(res.inserted_ids)}), media_type="application/json")
+    # scans that carry nmap output also update the per-port state and change log
+    diffs = []
+    for s, sid in zip(scans, res.inserted_ids):
+        if raw.get(id(s)) and s.get("target"):
+            try:
+                diffs.append(scan_diff.ingest(db, tenant, s["target"], raw[id(s)], scan_id=sid, ts=s.get("ts")))
+            except ValueError as e:
+                diffs.append({"target": s["target"], "error": str(e)})
+    return Response(dumps({"inserted": len(res.inserted_ids), "diffs": diffs}), media_type="application/json")
 from datetime import datetime
+from typing import Optional
 from fastapi import Request, Depends
-from app.deps import get_db
+from fastapi.responses import StreamingResponse
+from app.deps import get_db, get_reporting_db
 
 def _tenant_from_req(request: Request) -> str:
     return (getattr(getattr(request, "state", None), "tenant", None) or request.headers.get("Host","default")).split(".")[0]
 
 @router.post("/kavach/report/generate")
-async def kavach_report_generate(request: Request, db=Depends(get_db)):
+async def kavach_report_generate(request: Request, db=Depends(get_db), rdb=Depends(get_reporting_db)):
     tenant = _tenant_from_req(request)
-    scans = db[f"{tenant}_scans"].count_documents({})
-    qc = db[f"{tenant}_qc_results"].count_documents({})
+    # aggregate reads can be served by a secondary
+    scans = rdb[f"{tenant}_scans"].count_documents({})
+    qc = rdb[f"{tenant}_qc_results"].count_documents({})
     # last forecast from rudra collection if present
-    lastdoc = db[f"{tenant}_rudra_forecasts"].find_one(sort=[("ts",-1)])
+    lastdoc = rdb[f"{tenant}_rudra_forecasts"].find_one(sort=[("ts",-1)])
     last_forecast = float(lastdoc.get("value", 0.0)) if lastdoc else 0.0
+    # only what changed since the previous report, not the full scan history
+    prev = rdb[f"{tenant}_kavach_reports"].find_one({}, {"ts": 1}, sort=[("ts",-1)])
+    since = prev.get("ts") if prev else None
+    changes = scan_diff.changes_since(rdb, tenant, since=since, limit=50)  # listed items only
+    delta = scan_diff.count_changes(rdb, tenant, since=since)
+    html = kavach_report.render_html(tenant, scans, qc, last_forecast, delta, changes)
 
-    html = f"""<!doctype html>
-<html><head><meta charset="utf-8"><title>Kavach Report - {tenant}</title></head>
-<body style="font-family:Arial, sans-serif">
-<h2>Kavach Security Report — {tenant}</h2>
-<ul>
-  <li>Total scans: {scans}</li>
-  <li>QC results: {qc}</li>
-  <li>Last forecast: {last_forecast}</li>
-  <li>Generated at: {datetime.utcnow().isoformat()}Z</li>
-</ul>
-</body></html>"""
-
-    doc = {"tenant": tenant, "kind":"kavach_report", "html": html, "ts": datetime.utcnow().isoformat()+"Z"}
+    report_id = ObjectId()
+    # the hot collection keeps metadata only; html/pdf bodies live in the artifact store
+    meta = artifacts.get_store(db).put(tenant, html, "report_html", "text/html; charset=utf-8",
+                                       artifact_id=f"{report_id}.html", report_id=str(report_id))
+    doc = {"_id": report_id, "tenant": tenant, "kind":"kavach_report", "html_artifact": artifacts.summary(meta),
+           "ts": datetime.utcnow().isoformat()+"Z"}
     res = db[f"{tenant}_kavach_reports"].insert_one(doc)
-    return {"ok": True, "report_id": str(res.inserted_id), "last_forecast": last_forecast, "scans": scans, "qc_results": qc}
+    return {"ok": True, "report_id": str(res.inserted_id), "last_forecast": last_forecast, "scans": scans,
+            "qc_results": qc, "changes": delta}
+
+def _report_html(db, tenant: str, doc: dict) -> Optional[str]:
+    if doc.get("html_artifact"):
+        store = artifacts.get_store(db)
+        meta = store.get(tenant, doc["html_artifact"]["id"])
+        return store.read_text(tenant, meta) if meta else None
+    html = doc.get("html")  # reports written before the artifact store
+    return html if html is None or isinstance(html, str) else str(html)
+
+def _artifact_response(request: Request, db, tenant: str, meta: dict, filename: Optional[str] = None):
+    """Stream an artifact, honouring `If-None-Match` and a single `Range: bytes=` header."""
+    store = artifacts.get_store(db)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else None
+    return ranged_response(request, meta["size"], f'"{meta["sha256"]}"', meta["content_type"],
+                           lambda start, end: store.iter_bytes(tenant, meta, start, end), headers)
 
 @router.get("/kavach/report/latest")
 async def kavach_report_latest(request: Request, db=Depends(get_db)):
@@ -72,19 +109,107 @@ async def kavach_report_latest(request: Request, db=Depends(get_db)):
     if not latest:
         return {"ok": False, "detail": "no report"}
     # return html inline so you can screenshot proof
-    return {"ok": True, "ts": latest.get("ts"), "preview": latest.get("html")}
+    return {"ok": True, "ts": latest.get("ts"), "preview": _report_html(db, tenant, latest)}
 
 @router.get("/kavach/report/pdf")
 async def kavach_report_pdf(request: Request, db=Depends(get_db)):
     tenant = (getattr(getattr(request, "state", None), "tenant", None) or request.headers.get("Host","default")).split(".")[0]
-    doc = db[f"{tenant}_kavach_reports"].find_one(sort=[("ts",-1)])
-    if not doc or "html" not in doc:
+    col = db[f"{tenant}_kavach_reports"]
+    doc = col.find_one(sort=[("ts",-1)])
+    if not doc or not (doc.get("html_artifact") or "html" in doc):
         return JSONResponse({"detail": "no report"}, status_code=404)
-    html = doc["html"] if isinstance(doc["html"], str) else str(doc["html"])
-    buf = BytesIO()
-    pdf_ok = pisa.CreatePDF(html, dest=buf)
-    if pdf_ok.err:
-        return JSONResponse({"detail": "pdf generation failed"}, status_code=500)
-    return Response(content=buf.getvalue(),
-                    media_type="application/pdf",
-                    headers={"Content-Disposition": f'attachment; filename="kavach_{tenant}.pdf"'})
+    filename = f"kavach_{tenant}.pdf"
+    store = artifacts.get_store(db)
+    meta = store.get(tenant, doc["pdf_artifact"]["id"]) if doc.get("pdf_artifact") else None
+    if meta is None and doc.get("pdf"):
+        # inline pdf written before the artifact store
+        return Response(content=bytes(doc["pdf"]), media_type="application/pdf",
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    if meta is None:
+        html = _report_html(db, tenant, doc)
+        if html is None:
+            return JSONResponse({"detail": "no report"}, status_code=404)
+        try:
+            pdf = kavach_report.render_pdf(html)
+        except RuntimeError:
+            return JSONResponse({"detail": "pdf generation failed"}, status_code=500)
+        # rendered once, then served (and range-requested) from the store
+        meta = store.put(tenant, pdf, "report_pdf", "application/pdf", artifact_id=f"{doc['_id']}.pdf",
+                         report_id=str(doc["_id"]))
+        col.update_one({"_id": doc["_id"]}, {"$set": {"pdf_artifact": artifacts.summary(meta)}})
+    return _artifact_response(request, db, tenant, meta, filename)
+
+@router.get("/kavach/artifacts/{artifact_id}")
+async def kavach_artifact_download(request: Request, artifact_id: str, db=Depends(get_db)):
+    """Report html/pdf or raw scan xml of this tenant; supports ranged downloads."""
+    tenant = _tenant_from_req(request)
+    meta = artifacts.get_store(db).get(tenant, artifact_id)
+    if meta is None:
+        return JSONResponse({"detail": "artifact not found"}, status_code=404)
+    return _artifact_response(request, db, tenant, meta)
+
+# --- recurring scan schedules ---------------------------------------------------
+from typing import Optional
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from app.core.security import require_roles
+from app.services import scan_schedule
+
+class ScanScheduleReq(BaseModel):
+    target: str = Field(..., min_length=1, description="Scan target (host/IP/domain)")
+    cron: Optional[str] = Field(None, description="Crontab expression in UTC, e.g. '0 2 * * *'")
+    interval_minutes: Optional[int] = Field(None, ge=5)
+    jitter_minutes: int = Field(60, ge=0, le=1440, description="Window the run is spread over")
+    enabled: bool = True
+
+@router.post("/kavach/schedules", dependencies=[Depends(require_roles(["owner"]))])
+async def kavach_schedule_create(request: Request, req: ScanScheduleReq, db=Depends(get_db)):
+    tenant = _tenant_from_req(request)
+    try:
+        doc = scan_schedule.create(db, tenant, req.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return doc
+
+@router.get("/kavach/schedules", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def kavach_schedule_list(request: Request, db=Depends(get_db)):
+    tenant = _tenant_from_req(request)
+    return {"schedules": scan_schedule.list_schedules(db, tenant), "slots": scan_schedule.slots.snapshot()}
+
+@router.get("/kavach/schedules/simulate", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def kavach_schedule_simulate(request: Request, hours: float = 24, bucket_minutes: int = 15,
+                                   scan_minutes: float = 10, jitter: bool = True, db=Depends(get_db)):
+    """Projected load curve of this tenant's enabled schedules."""
+    tenant = _tenant_from_req(request)
+    docs = [d for d in scan_schedule.list_schedules(db, tenant) if d.get("enabled", True)]
+    return scan_schedule.simulate(docs, hours=min(hours, 24 * 31), bucket_minutes=max(1, bucket_minutes),
+                                  scan_minutes=scan_minutes, jitter=jitter)
+
+@router.delete("/kavach/schedules/{schedule_id}", dependencies=[Depends(require_roles(["owner"]))])
+async def kavach_schedule_delete(request: Request, schedule_id: str, db=Depends(get_db)):
+    tenant = _tenant_from_req(request)
+    if not scan_schedule.delete(db, tenant, schedule_id):
+        raise HTTPException(status_code=404, detail="schedule not found")
+    return {"deleted": schedule_id}
+
+# --- incremental results ---------------------------------------------------------
+
+@router.get("/kavach/changes")
+async def kavach_changes(request: Request, since: Optional[str] = None, target: Optional[str] = None,
+                         baseline: bool = False, limit: int = 100, db=Depends(get_reporting_db)):
+    """Port/service changes, newest first; `since` is an ISO timestamp."""
+    tenant = _tenant_from_req(request)
+    changes = scan_diff.changes_since(db, tenant, since=since, target=target,
+                                      include_baseline=baseline, limit=max(1, min(limit, 1000)))
+    summary = scan_diff.count_changes(db, tenant, since=since, target=target, include_baseline=baseline)
+    return {"summary": summary, "changes": changes}
+
+@router.get("/kavach/ports")
+async def kavach_ports(request: Request, target: str, state: Optional[str] = "open", db=Depends(get_reporting_db)):
+    """Current per-port state of a target from the normalized snapshot."""
+    tenant = _tenant_from_req(request)
+    filt = {"target": target}
+    if state:
+        filt["state"] = state
+    ports = list(db[f"{tenant}{scan_diff.PORTS}"].find(filt, {"_id": 0}).sort([("host", 1), ("port", 1)]))
+    return {"target": target, "ports": ports}
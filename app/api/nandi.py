@@ -1,5 +1,4 @@
-﻿import httpx
-import os
+﻿import os
 import json
 from bson import json_util
 from fastapi import APIRouter, Depends, Request, Body
@@ -61,6 +60,7 @@ async def nandi_email_send(request: Request, db=Depends(get_db), msg: dict = Bod
                 "subject": doc["subject"],
                 "content": [ { "type": "text/plain", "value": doc["body"] } ]
             }
+            import httpx
             async with httpx.AsyncClient(timeout=10.0) as client:
                 resp = await client.post(
                     "https://api.sendgrid.com/v3/mail/send",
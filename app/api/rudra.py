@@ -1,7 +1,9 @@
-﻿from fastapi import APIRouter, Request, Depends
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+﻿from fastapi import APIRouter, Request, Response, Depends, HTTPException
+from typing import Optional
+from datetime import datetime, timezone
+from app.core.security import require_roles
 from app.deps import get_db
+from app.services import cost_anomaly, cost_forecast, rudra_forecast, rudra_usage
 
 router = APIRouter()
 
@@ -12,10 +14,7 @@ def _tenant_from(request: Request) -> str:
 async def mock_usage(request: Request, payload: Optional[dict] = None, db = Depends(get_db)):
     tenant = _tenant_from(request)
     payload = payload or {}
-    usage = payload.get("usage") or [
-        {"service":"ec2","hours":120,"rate":0.12},
-        {"service":"s3","gb":500,"rate":0.023},
-    ]
+    usage = payload.get("usage") or rudra_forecast.DEFAULT_USAGE
     try:
         coll = db["rudra_usage"]
         coll.insert_one({
@@ -26,79 +25,72 @@ async def mock_usage(request: Request, payload: Optional[dict] = None, db = Depe
     except Exception:
         # non-fatal for demo / in-memory case
         pass
+    # also append to the per-service time-series
+    now = datetime.now(timezone.utc)
+    points = []
+    for item in usage:
+        try:
+            points.append(rudra_usage.to_point(item, default_ts=now))
+        except (TypeError, ValueError):
+            continue
+    rudra_usage.ingest_points(db, tenant, points)
+    if not points:
+        rudra_usage.bump_version(db, tenant)  # the snapshot changed even if no item was a valid point
     return {"usage": usage}
 
-@router.get("/rudra/cloud/forecast")
-async def forecast(request: Request, db = Depends(get_db)):
+@router.post("/rudra/usage/ingest", dependencies=[Depends(require_roles(["owner"]))])
+async def usage_ingest(request: Request, format: Optional[str] = None, db = Depends(get_db)):
+    """Bulk import of a billing export (CSV or NDJSON request body)."""
     tenant = _tenant_from(request)
-    usage: List[Dict[str, Any]] = []
+    ctype = request.headers.get("content-type", "")
+    fmt = (format or ("ndjson" if "ndjson" in ctype or "jsonl" in ctype else "csv")).lower()
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    text = (await request.body()).decode("utf-8-sig", errors="replace")
+    return rudra_usage.ingest_text(db, tenant, text, fmt)
+
+def _parse_dt(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
     try:
-        # pick latest usage for this tenant if available
-        cur = db["rudra_usage"].find({"tenant": tenant}).sort([("_id", -1)]).limit(1)
-        docs = list(cur)
-        if docs:
-            usage = docs[0].get("usage", [])
-    except Exception:
-        pass
+        return rudra_usage.parse_ts(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid {name}")
 
-    if not usage:
-        usage = [
-            {"service":"ec2","hours":120,"rate":0.12},
-            {"service":"s3","gb":500,"rate":0.023},
-        ]
-
-    forecast_vals: List[float] = []
-    for item in usage:
-        if "hours" in item:
-            cost = float(item.get("hours", 0)) * float(item.get("rate", 0))
-        elif "gb" in item:
-            cost = float(item.get("gb", 0)) * float(item.get("rate", 0))
-        else:
-            cost = 0.0
-        forecast_vals.append(max(0.0, cost))
-
-    if not forecast_vals:
-        forecast_vals = [0.0]
+@router.get("/rudra/usage/series", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def usage_series(request: Request, service: str, start: Optional[str] = None, end: Optional[str] = None,
+                       db = Depends(get_db)):
+    tenant = _tenant_from(request)
+    s = rudra_usage.series(db, tenant, service, _parse_dt(start, "start"), _parse_dt(end, "end"))
+    qty = s["qty"]
+    return {"service": service, "ts": s["ts"].astype(str).tolist(), "cost": s["cost"].tolist(),
+            "qty": [None if q != q else q for q in qty.tolist()]}
+
+@router.get("/rudra/usage/daily", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def usage_daily(request: Request, start: Optional[str] = None, end: Optional[str] = None,
+                      db = Depends(get_db)):
+    tenant = _tenant_from(request)
+    d = rudra_usage.daily(db, tenant, _parse_dt(start, "start"), _parse_dt(end, "end"))
+    return {"days": d["days"].astype(str).tolist(),
+            "services": {s: d["cost"][i].tolist() for i, s in enumerate(d["services"])}}
 
-    total = float(sum(forecast_vals))
-    return {"forecast": forecast_vals, "total": total}
+@router.get("/rudra/cloud/forecast")
+def forecast(request: Request, response: Response, db = Depends(get_db)):
+    # sync route: runs in the threadpool, so concurrent misses coalesce in the cache
+    tenant = _tenant_from(request)
+    result, hit = rudra_forecast.current_forecast(db, tenant)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return {"forecast": list(result["forecast"]), "total": result["total"]}
 
 @router.post("/rudra/cloud/forecast/save")
-async def cloud_forecast_save(request: Request, payload: Optional[dict] = None, db = Depends(get_db)):
+def cloud_forecast_save(request: Request, payload: Optional[dict] = None, db = Depends(get_db)):
     tenant = _tenant_from(request)
     payload = payload or {}
 
-    # use provided series or recompute from latest usage
+    # use provided series or the (cached) forecast of the latest usage
     series = payload.get("series")
     if series is None:
-        # recompute via forecast logic (DRY-ish)
-        usage: List[Dict[str, Any]] = []
-        try:
-            cur = db["rudra_usage"].find({"tenant": tenant}).sort([("_id", -1)]).limit(1)
-            docs = list(cur)
-            if docs:
-                usage = docs[0].get("usage", [])
-        except Exception:
-            pass
-
-        if not usage:
-            usage = [
-                {"service":"ec2","hours":120,"rate":0.12},
-                {"service":"s3","gb":500,"rate":0.023},
-            ]
-
-        series = []
-        for item in usage:
-            if "hours" in item:
-                cost = float(item.get("hours", 0)) * float(item.get("rate", 0))
-            elif "gb" in item:
-                cost = float(item.get("gb", 0)) * float(item.get("rate", 0))
-            else:
-                cost = 0.0
-            series.append(max(0.0, cost))
-
-        if not series:
-            series = [0.0]
+        series = rudra_forecast.current_forecast(db, tenant)[0]["forecast"]
 
     avg = (sum(series) / len(series)) if series else 0.0
 
@@ -113,3 +105,37 @@ async def cloud_forecast_save(request: Request, payload: Optional[dict] = None,
         pass
 
     return {"ok": True, "avg": float(avg)}
+
+# --- monthly forecast (prototype schema: GET /costs/forecast) ---------------------
+from fastapi import Body, Query
+
+@router.get("/costs/forecast", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def costs_forecast(request: Request, response: Response, months: int = Query(6, ge=1, le=cost_forecast.MAX_MONTHS),
+                   db = Depends(get_db)):
+    """Per-month predicted cost from the stored usage history, plus budget alerts."""
+    tenant = _tenant_from(request)
+    today = cost_forecast.utc_today()
+    predicted, hit = rudra_forecast.cached(db, tenant, ("monthly", months, today.isoformat()),
+                                           lambda: cost_forecast.predict(db, [tenant], months, today)[0].tolist())
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    # budgets are evaluated per request, so a budget change never waits for the cache
+    return cost_forecast.tenant_forecast(db, tenant, months, predicted, today)
+
+@router.get("/costs/budget", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def costs_budget_get(request: Request, db = Depends(get_db)):
+    tenant = _tenant_from(request)
+    return cost_forecast.get_budget(db, tenant) or {"_id": tenant, "monthly": None, "currency": cost_forecast.currency()}
+
+@router.put("/costs/budget", dependencies=[Depends(require_roles(["owner"]))])
+def costs_budget_put(request: Request, body: dict = Body(...), db = Depends(get_db)):
+    """Body: {"monthly": 200, "currency"?: "USD"}."""
+    tenant = _tenant_from(request)
+    try:
+        return cost_forecast.set_budget(db, tenant, float(body.get("monthly") or 0), body.get("currency"))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/rudra/anomalies", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def rudra_anomalies(request: Request, limit: int = Query(50, ge=1, le=500), db = Depends(get_db)):
+    """Cost spikes flagged by the streaming detector (newest first)."""
+    return {"anomalies": cost_anomaly.recent(db, _tenant_from(request), limit)}
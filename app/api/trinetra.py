@@ -1,10 +1,13 @@
-﻿from datetime import datetime, timezone
+﻿import asyncio
+import os
+from datetime import datetime, timezone
 from typing import Dict, Any, List
 
 from bson.json_util import dumps
 from starlette.responses import Response
 from fastapi import (
     APIRouter,
+    Query,
     File,
     UploadFile,
     Request,
@@ -15,6 +18,9 @@ from fastapi import (
 
 from app.deps import get_qc_repo, get_db
 from app.common.params import LimitParam, SkipParam, clamp_limit_skip
+from app.core.security import require_roles
+from app.services import artifacts, thumbnails, trinetra_infer, trinetra_pool
+from app.common.ranged import file_reader, ranged_response
 
 router = APIRouter()
 
@@ -38,22 +44,26 @@ async def qc_upload(
     request: Request,
     file: UploadFile = File(...),
     repo=Depends(get_qc_repo),
+    db=Depends(get_db),
 ):
     """
-    Upload a QC file. Metadata is stored in repo (in-memory or Mongo).
+    Upload a QC file. Metadata is stored in repo (in-memory or Mongo); the
+    bytes are stored once per digest for thumbnails and review.
     """
     tenant = _tenant_from(request)
     content = await file.read()
+    image = thumbnails.store_image(db, tenant, content, file.content_type, file.filename)
     doc: Dict[str, Any] = {
         "tenant": tenant,
         "filename": file.filename,
         "size": len(content),
         "mime": file.content_type,
+        "digest": image["digest"],
         "qc": {"ok": True, "reason": "dummy-pass"},
         "ts": datetime.utcnow().isoformat() + "Z",
     }
     repo.store(tenant, doc)
-    return {"stored": True}
+    return {"stored": True, "digest": image["digest"]}
 
 @router.get("/trinetra/qc/results")
 async def qc_results(
@@ -121,4 +131,134 @@ async def trinetra_qc_seed(
     return Response(
         dumps({"inserted": len(res.inserted_ids)}),
         media_type="application/json",
-    )
\ No newline at end of file
+    )
+
+# --- inference records & reviewer decisions (prototype ERD) ----------------
+@router.post("/trinetra/infer", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def trinetra_infer_image(
+    request: Request,
+    file: UploadFile = File(...),
+    db=Depends(get_db),
+):
+    """
+    Run the QC model on one image (through the micro-batching model pool) and
+    persist the inference. 503 + Retry-After when the pool's queue is full.
+    """
+    tenant = _tenant_from(request)
+    content = await file.read()
+    pool = trinetra_pool.get_pool()
+    try:
+        fut = pool.submit(content)
+    except trinetra_pool.PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        detections = await asyncio.wrap_future(fut)
+    except trinetra_infer.InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image = thumbnails.store_image(db, tenant, content, file.content_type, file.filename)
+    return trinetra_infer.record(db, tenant, pool.model_id, detections, source_path=file.filename,
+                                 image_digest=image["digest"])
+
+@router.post("/trinetra/decision", status_code=201,
+             dependencies=[Depends(require_roles(["owner", "analyst"]))])
+async def trinetra_decision(
+    request: Request,
+    body: dict = Body(...),
+    db=Depends(get_db),
+):
+    """
+    Record a reviewer's decision on an inference; clears it from the review queue.
+    """
+    tenant = _tenant_from(request)
+    inference_id = body.get("inferenceId")
+    if not isinstance(inference_id, str) or not inference_id:
+        raise HTTPException(status_code=400, detail="inferenceId is required")
+    notes = body.get("notes")
+    if notes is not None and not isinstance(notes, str):
+        raise HTTPException(status_code=400, detail="notes must be a string")
+    user = (getattr(request.state, "claims", None) or {}).get("sub")
+    try:
+        out = trinetra_infer.decide(db, tenant, inference_id, str(body.get("decision") or "").lower(), notes, user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if out is None:
+        raise HTTPException(status_code=404, detail="inference not found")
+    return out
+
+@router.get("/trinetra/review", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def trinetra_review(
+    request: Request,
+    suggested: str = Query("fail", pattern="^(pass|fail|warn)$"),
+    limit: int = Query(50, ge=1, le=500),
+    before: str = Query(None, description="processedAt of the last item on the previous page"),
+    db=Depends(get_db),
+):
+    """
+    Unreviewed inferences with the given suggested decision, newest first.
+    """
+    tenant = _tenant_from(request)
+    items = trinetra_infer.review_queue(db, tenant, suggested, limit, before)
+    return {
+        "items": items,
+        "pending": trinetra_infer.queue_counts(db, tenant),
+        "next": items[-1]["processedAt"] if len(items) == limit else None,
+    }
+
+@router.get("/trinetra/inferences/{inference_id}",
+            dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def trinetra_inference_get(request: Request, inference_id: str, db=Depends(get_db)):
+    doc = trinetra_infer.get(db, _tenant_from(request), inference_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="inference not found")
+    return doc
+
+# --- images, thumbnails & overlays for review ------------------------------
+_IMMUTABLE = {"Cache-Control": "private, max-age=31536000, immutable"}
+
+def _derived_response(request: Request, make):
+    for _ in range(2):
+        try:
+            out = make()
+        except trinetra_infer.InvalidImage as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        if out is None:
+            raise HTTPException(status_code=404, detail="image not found")
+        try:
+            size = os.path.getsize(out["path"])
+            return ranged_response(request, size, out["etag"], out["content_type"], file_reader(out["path"]),
+                                   {**_IMMUTABLE, "X-Cache": "HIT" if out["hit"] else "MISS"})
+        except FileNotFoundError:
+            continue  # evicted between lookup and open; render again
+    raise HTTPException(status_code=503, detail="thumbnail cache is thrashing", headers={"Retry-After": "1"})
+
+@router.get("/trinetra/images/{digest}", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def trinetra_image(request: Request, digest: str, db=Depends(get_db)):
+    """Original upload, by sha256 digest."""
+    tenant = _tenant_from(request)
+    meta = thumbnails.image_meta(db, tenant, digest)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="image not found")
+    store = artifacts.get_store(db)
+    return ranged_response(request, meta["size"], f'"{meta["sha256"]}"', meta["content_type"],
+                           lambda start, end: store.iter_bytes(tenant, meta, start, end), _IMMUTABLE)
+
+@router.get("/trinetra/images/{digest}/thumb", dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def trinetra_image_thumb(request: Request, digest: str, size: int = Query(256, ge=16, le=4096),
+                         db=Depends(get_db)):
+    """JPEG thumbnail; size snaps up to THUMB_SIZES."""
+    tenant = _tenant_from(request)
+    return _derived_response(request, lambda: thumbnails.derived(db, tenant, digest, size))
+
+@router.get("/trinetra/inferences/{inference_id}/overlay",
+            dependencies=[Depends(require_roles(["owner", "analyst"]))])
+def trinetra_inference_overlay(request: Request, inference_id: str, size: int = Query(512, ge=16, le=4096),
+                               db=Depends(get_db)):
+    """The inference's image with its detection boxes drawn."""
+    tenant = _tenant_from(request)
+    doc = trinetra_infer.get(db, tenant, inference_id)
+    if doc is None or not doc.get("imageDigest"):
+        raise HTTPException(status_code=404, detail="inference image not found")
+    return _derived_response(request, lambda: thumbnails.derived(db, tenant, doc["imageDigest"], size,
+                                                                 doc["detections"]))
@@ -1,4 +0,0 @@
-import os
-
-JWT_SECRET = os.getenv("JWT_SECRET", "dev-change-me")
-JWT_ALG = "HS256"
@@ -0,0 +1,328 @@
+# app/auth/credentials.py
+"""
+Per-tenant password store and login verification.
+
+Users live in `{tenant}_users`, one document per user:
+{_id: username, hash, role, disabled, updatedAt}. Passwords are stored as
+bcrypt hashes (cost AUTH_BCRYPT_ROUNDS, 12).
+
+A bcrypt check takes about 100-250 ms of CPU, so login never runs it on the
+event loop:
+- checks run on a small thread pool (AUTH_HASH_WORKERS, half the cores);
+  bcrypt releases the GIL, so the rest of the app keeps its share of the CPU;
+- at most AUTH_HASH_QUEUE checks may wait for that pool. Beyond that,
+  login answers 503 + Retry-After at once instead of queueing without bound;
+- a login that succeeded is remembered for AUTH_SESSION_CACHE_SECONDS (300).
+  The same user, password and stored hash then skip bcrypt. The cache key
+  is an HMAC under a per-process random key, so it cannot be matched
+  against the password offline;
+- failed logins are throttled before any hashing. An account is limited to
+  AUTH_MAX_FAILURES (5) and a client IP to AUTH_IP_MAX_FAILURES (50) per
+  AUTH_FAILURE_WINDOW (900 s). Both limits are per process.
+
+Unknown users are checked against a dummy hash so that the response time
+does not reveal which usernames exist. AUTH_DEV_USERS
+("user:password:role,...") are accepted in tenants whose store has no such
+user. Unset, it means the two built-in dev accounts in dev mode (in-memory
+DB, i.e. tests and USE_INMEMORY_DB=1, or AUTH_DEV_MODE=1) and none otherwise.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import bcrypt
+
+USERS = "_users"
+ROLES = ("analyst", "owner", "admin")
+_DEFAULT_DEV_USERS = "analyst:secret123:analyst,owner:secret123:owner"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def dev_users() -> str:
+    configured = os.getenv("AUTH_DEV_USERS")
+    if configured is not None:
+        return configured
+    from app.deps import using_inmemory_db
+    return _DEFAULT_DEV_USERS if using_inmemory_db() or os.getenv("AUTH_DEV_MODE") == "1" else ""
+
+
+class InvalidCredentials(Exception):
+    """Unknown user, wrong password or disabled account (deliberately not told apart)."""
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__("too many failed logins")
+
+
+class LoginBusy(Exception):
+    """The hashing pool's wait queue is full; the client should retry shortly."""
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    raw = password.encode("utf-8")
+    if len(raw) > 72:
+        raise ValueError("password longer than 72 bytes")  # bcrypt ignores the rest
+    salt = bcrypt.gensalt(rounds or _env_int("AUTH_BCRYPT_ROUNDS", 12))
+    return bcrypt.hashpw(raw, salt).decode("ascii")
+
+
+def check_password(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("ascii"))
+    except ValueError:
+        return False
+
+
+# --- bounded hashing pool ---------------------------------------------------------------
+
+class HashPool:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or _env_int("AUTH_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+        self.max_pending = max_pending if max_pending is not None else _env_int("AUTH_HASH_QUEUE", 32)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak = 0
+        self.done = 0
+        self.shed = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="auth-hash")
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        with self._lock:
+            if self.pending >= self.workers + self.max_pending:
+                self.shed += 1
+                raise LoginBusy()
+            self.pending += 1
+            self.peak = max(self.peak, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.done += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "max_pending": self.max_pending, "pending": self.pending,
+                "peak": self.peak, "done": self.done, "shed": self.shed}
+
+
+# --- failed-login throttle ---------------------------------------------------------------
+
+class Throttle:
+    def __init__(self, max_failures: Optional[int] = None, ip_max_failures: Optional[int] = None,
+                 window: Optional[float] = None, max_keys: int = 100_000):
+        self.max_failures = max_failures or _env_int("AUTH_MAX_FAILURES", 5)
+        self.ip_max_failures = ip_max_failures or _env_int("AUTH_IP_MAX_FAILURES", 50)
+        self.window = window or float(_env_int("AUTH_FAILURE_WINDOW", 900))
+        self.max_keys = max_keys
+        self._fails: "OrderedDict[Tuple[str, ...], Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _recent(self, key: Tuple[str, ...], now: float) -> Deque[float]:
+        q = self._fails.get(key)
+        if q is None:
+            return deque()
+        while q and q[0] <= now - self.window:
+            q.popleft()
+        if not q:
+            del self._fails[key]
+        return q
+
+    def check(self, tenant: str, username: str, ip: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, limit in (((tenant, username.lower()), self.max_failures), (("ip", ip or ""), self.ip_max_failures)):
+                q = self._recent(key, now)
+                if len(q) >= limit:
+                    self.throttled += 1
+                    raise LoginThrottled(max(1, int(q[-limit] + self.window - now) + 1))
+
+    def failed(self, tenant: str, username: str, ip: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for key in ((tenant, username.lower()), ("ip", ip or "")):
+                q = self._fails.pop(key, None) or deque(maxlen=max(self.max_failures, self.ip_max_failures))
+                q.append(now)
+                self._fails[key] = q  # re-inserted last: the oldest keys are dropped first
+            while len(self._fails) > self.max_keys:
+                self._fails.popitem(last=False)
+
+    def succeeded(self, tenant: str, username: str) -> None:
+        with self._lock:
+            self._fails.pop((tenant, username.lower()), None)
+
+
+# --- verified-login cache ---------------------------------------------------------------
+
+class SessionCache:
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(_env_int("AUTH_SESSION_CACHE_SECONDS", 300))
+        self.max_entries = max_entries or _env_int("AUTH_SESSION_CACHE_MAX", 10_000)
+        self._key = os.urandom(32)
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _id(self, tenant: str, username: str, password: str) -> bytes:
+        msg = "\0".join((tenant, username, password)).encode("utf-8")
+        return hmac.new(self._key, msg, hashlib.sha256).digest()
+
+    def hit(self, tenant: str, username: str, password: str, hashed: str) -> bool:
+        """True if this exact login was verified recently against the same stored hash."""
+        if self.ttl <= 0:
+            return False
+        k = self._id(tenant, username, password)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None and entry[1] > time.monotonic() and hmac.compare_digest(entry[0], hashed):
+                self.hits += 1
+                return True
+            if entry is not None:
+                del self._entries[k]
+            self.misses += 1
+            return False
+
+    def put(self, tenant: str, username: str, password: str, hashed: str) -> None:
+        if self.ttl <= 0:
+            return
+        k = self._id(tenant, username, password)
+        with self._lock:
+            self._entries.pop(k, None)
+            self._entries[k] = (hashed, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# --- store ---------------------------------------------------------------
+
+class CredentialStore:
+    def __init__(self, pool: Optional[HashPool] = None, throttle: Optional[Throttle] = None,
+                 cache: Optional[SessionCache] = None):
+        self.pool = pool or HashPool()
+        self.throttle = throttle or Throttle()
+        self.cache = cache or SessionCache()
+        self._lock = threading.Lock()
+        self._dummy: Optional[str] = None
+        self._dev: Dict[str, Dict[str, Any]] = {}
+        self.logins = 0
+        self.failures = 0
+
+    # hashes below are computed lazily, on the pool, the first time they are needed
+
+    def _dummy_hash(self) -> str:
+        if self._dummy is None:
+            with self._lock:
+                if self._dummy is None:
+                    self._dummy = hash_password(os.urandom(16).hex())
+        return self._dummy
+
+    def _dev_user(self, username: str) -> Optional[Dict[str, Any]]:
+        for part in dev_users().split(","):
+            name, _, rest = part.strip().partition(":")
+            password, _, role = rest.rpartition(":")
+            if name != username or not password:
+                continue
+            with self._lock:
+                if username not in self._dev:
+                    self._dev[username] = {"_id": username, "hash": hash_password(password), "role": role}
+                return self._dev[username]
+        return None
+
+    def get_user(self, db, tenant: str, username: str) -> Optional[Dict[str, Any]]:
+        return db[f"{tenant}{USERS}"].find_one({"_id": username})
+
+    def set_user(self, db, tenant: str, username: str, password: Optional[str] = None,
+                 role: Optional[str] = None, disabled: Optional[bool] = None) -> Dict[str, Any]:
+        """Create or update a user (hashes `password`; call it off the event loop)."""
+        fields: Dict[str, Any] = {"updatedAt": datetime.now(timezone.utc).isoformat()}
+        if password is not None:
+            fields["hash"] = hash_password(password)
+        if role is not None:
+            if role not in ROLES:
+                raise ValueError(f"unknown role {role!r}")
+            fields["role"] = role
+        if disabled is not None:
+            fields["disabled"] = bool(disabled)
+        col = db[f"{tenant}{USERS}"]
+        if col.find_one({"_id": username}) is None:
+            if "hash" not in fields:
+                raise ValueError("a new user needs a password")
+            col.insert_one({"_id": username, "role": fields.pop("role", "analyst"), "disabled": False, **fields})
+        else:
+            col.update_one({"_id": username}, {"$set": fields})
+        return {k: v for k, v in col.find_one({"_id": username}).items() if k != "hash"}
+
+    def delete_user(self, db, tenant: str, username: str) -> bool:
+        return db[f"{tenant}{USERS}"].delete_one({"_id": username}).deleted_count > 0
+
+    def _verify(self, rec: Optional[Dict[str, Any]], username: str, password: str) -> Optional[Dict[str, Any]]:
+        # runs on the hashing pool
+        if rec is None:
+            rec = self._dev_user(username)
+        if rec is None or rec.get("disabled"):
+            check_password(password, self._dummy_hash())  # same cost as a real check
+            return None
+        return rec if check_password(password, rec["hash"]) else None
+
+    async def authenticate(self, db, tenant: str, username: str, password: str,
+                           ip: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Returns the user record for a correct password. Raises LoginThrottled
+        (429), LoginBusy (503) or InvalidCredentials (401).
+        """
+        self.throttle.check(tenant, username, ip)
+        rec = self.get_user(db, tenant, username)
+        if rec is not None and not rec.get("disabled") and self.cache.hit(tenant, username, password, rec["hash"]):
+            self.logins += 1
+            return rec
+        dev = self._dev.get(username) if rec is None else None
+        if dev is not None and self.cache.hit(tenant, username, password, dev["hash"]):
+            self.logins += 1
+            return dev
+
+        verified = await self.pool.run(self._verify, rec, username, password)
+        if verified is None:
+            self.failures += 1
+            self.throttle.failed(tenant, username, ip)
+            raise InvalidCredentials()
+        self.logins += 1
+        self.throttle.succeeded(tenant, username)
+        self.cache.put(tenant, username, password, verified["hash"])
+        return verified
+
+    def stats(self) -> Dict[str, Any]:
+        return {"logins": self.logins, "failures": self.failures, "throttled": self.throttle.throttled,
+                "pool": self.pool.stats(), "cache": self.cache.stats()}
+
+
+store = CredentialStore()
@@ -1,13 +1,14 @@
-from fastapi import Header, HTTPException
-from typing import Optional
-from app.auth.tokens import verify_token
+from fastapi import HTTPException, Request
 
-def get_current_claims(authorization: Optional[str] = Header(None)):
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing bearer token")
-    token = authorization.split(" ", 1)[1]
+from app.auth import keyring
+
+
+def get_current_claims(request: Request):
+    # reuses the claims TenancyMiddleware already verified for this request
     try:
-        claims = verify_token(token)
-    except ValueError as e:
+        claims = keyring.request_claims(request)
+    except keyring.InvalidToken as e:
         raise HTTPException(status_code=401, detail=str(e))
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
     return claims
@@ -1,17 +1,7 @@
 from datetime import datetime, timedelta, timezone
-import os
 from typing import Any, Dict, Optional
 
-import jwt  # PyJWT
-
-ALGORITHM = "HS256"
-
-def _get_secret() -> str:
-    secret = os.getenv("JWT_SECRET")
-    if not secret:
-        # Safe default for dev; rotate in 2.2
-        secret = "dev-secret"
-    return secret
+from app.auth import keyring
 
 def create_access_token(
     subject: str,
@@ -34,17 +24,11 @@ def create_access_token(
     }
     if extra:
         payload.update(extra)
-    token = jwt.encode(payload, _get_secret(), algorithm=ALGORITHM)
-    # PyJWT returns str on modern versions
-    return token
+    return keyring.sign(payload)
 
 def decode_token(token: str) -> Dict[str, Any]:
     """
-    Decode and validate the JWT. Raises jwt exceptions on invalid tokens.
+    Decode and validate the JWT. Raises keyring.InvalidToken on invalid tokens.
     Ensures required claims exist.
     """
-    claims = jwt.decode(token, _get_secret(), algorithms=[ALGORITHM])
-    for required in ("sub", "tid", "role", "exp"):
-        if required not in claims:
-            raise jwt.InvalidTokenError(f"missing claim: {required}")
-    return claims
+    return keyring.verify(token, require=("sub", "tid", "role", "exp"))
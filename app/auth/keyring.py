@@ -0,0 +1,255 @@
+# app/auth/keyring.py
+"""
+The one place tokens are signed and verified.
+
+Keys are indexed by `kid`. JWT_KEYS="k2:secret2,k1:secret1" adds keys next
+to SECRET_KEY, which is always present as kid "default".
+- JWT_ACTIVE_KID (else the first JWT_KEYS entry, else "default") signs new
+  tokens.
+- Every key in the ring verifies. Tokens without a `kid` use "default".
+Rotating is three steps: add the new key, make it active, then drop the
+old key once its tokens have expired.
+
+Verification is HS256/384/512 only ("none" and asymmetric algorithms are
+rejected) and is done inline rather than through a JWT library:
+- each key keeps a precomputed HMAC whose inner/outer pads are reused via
+  copy();
+- the header segment, identical for every token of a key, is parsed once
+  and cached.
+request_claims() verifies the bearer token once per request and caches the
+result on request.state, so the middleware and the routes share it.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+DEFAULT_KID = "default"
+
+
+class InvalidToken(ValueError):
+    """Malformed, wrongly signed, expired or otherwise unacceptable token."""
+
+
+def _b64d(seg: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(seg + "=" * (-len(seg) % 4))
+    except (ValueError, TypeError):
+        raise InvalidToken("Invalid token encoding")
+
+
+def _b64e(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _json(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+class Key:
+    __slots__ = ("kid", "alg", "_mac")
+
+    def __init__(self, kid: str, secret: str, alg: str = "HS256"):
+        if alg not in ALGORITHMS:
+            raise ValueError(f"unsupported algorithm {alg}")
+        self.kid = kid
+        self.alg = alg
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=ALGORITHMS[alg])
+
+    def sign(self, data: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(data)
+        return mac.digest()
+
+    def fingerprint(self) -> str:
+        """Non-secret identifier of the key material (for diagnostics)."""
+        return hashlib.sha256(self.sign(b"keyring-fingerprint")).hexdigest()[:16]
+
+
+class Keyring:
+    def __init__(self, keys: Iterable[Key] = (), active: Optional[str] = None, leeway: int = 0):
+        self._keys: Dict[str, Key] = {k.kid: k for k in keys}
+        self.active = active or next(iter(self._keys), None)
+        self.leeway = leeway
+        self._headers: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Keyring":
+        from app.core.config import settings
+
+        alg = settings.ALGORITHM or "HS256"
+        keys = {DEFAULT_KID: Key(DEFAULT_KID, settings.SECRET_KEY, alg)}
+        ordered = []
+        for part in (os.getenv("JWT_KEYS") or "").split(","):
+            kid, sep, secret = part.strip().partition(":")
+            if sep and kid and secret:
+                keys[kid] = Key(kid, secret, alg)
+                ordered.append(kid)
+        active = os.getenv("JWT_ACTIVE_KID") or (ordered[0] if ordered else DEFAULT_KID)
+        if active not in keys:
+            raise RuntimeError(f"JWT_ACTIVE_KID {active!r} is not in the keyring")
+        try:
+            leeway = int(os.getenv("JWT_VERIFY_LEEWAY", "0"))
+        except ValueError:
+            leeway = 0
+        return cls(keys.values(), active, leeway)
+
+    # --- rotation -----------------------------------------------------------------
+    def add(self, key: Key, activate: bool = False) -> None:
+        with self._lock:
+            keys = dict(self._keys)
+            keys[key.kid] = key
+            self._keys = keys  # replaced, not mutated: verify() reads without the lock
+            if activate or self.active is None:
+                self.active = key.kid
+
+    def remove(self, kid: str) -> None:
+        with self._lock:
+            if kid == self.active:
+                raise ValueError("cannot remove the active signing key")
+            keys = dict(self._keys)
+            keys.pop(kid, None)
+            self._keys = keys
+            self._headers = {}
+
+    def kids(self) -> Dict[str, str]:
+        return {kid: k.fingerprint() for kid, k in self._keys.items()}
+
+    # --- tokens ---------------------------------------------------------------
+    def sign(self, claims: Dict[str, Any], kid: Optional[str] = None) -> str:
+        key = self._keys[kid or self.active]
+        head = _b64e(_json({"alg": key.alg, "typ": "JWT", "kid": key.kid}))
+        signing_input = f"{head}.{_b64e(_json(claims))}"
+        return f"{signing_input}.{_b64e(key.sign(signing_input.encode('ascii')))}"
+
+    def _header(self, seg: str) -> Tuple[str, Optional[str]]:
+        hit = self._headers.get(seg)
+        if hit is not None:
+            return hit
+        try:
+            header = json.loads(_b64d(seg))
+        except ValueError:
+            raise InvalidToken("Invalid header")
+        if not isinstance(header, dict):
+            raise InvalidToken("Invalid header")
+        # the kid is used as a dict key before the signature is checked
+        if not all(isinstance(header.get(f), str) for f in ("alg", "kid", "typ") if f in header):
+            raise InvalidToken("Invalid header")
+        parsed = (header.get("alg"), header.get("kid"))
+        if len(self._headers) < 256:
+            self._headers[seg] = parsed
+        return parsed
+
+    def verify(self, token: str, leeway: Optional[int] = None,
+               require: Iterable[str] = ()) -> Dict[str, Any]:
+        """Signature, `exp` / `nbf` (with leeway) and required claims; returns the claims."""
+        if not isinstance(token, str) or token.count(".") != 2 or not token.isascii():
+            raise InvalidToken("Not enough segments")
+        head, body, sig = token.split(".")
+        alg, kid = self._header(head)
+        key = self._keys.get(kid or DEFAULT_KID)
+        if key is None:
+            raise InvalidToken("Unknown key id")
+        if alg != key.alg:
+            raise InvalidToken("The specified alg value is not allowed")
+        if not hmac.compare_digest(key.sign(f"{head}.{body}".encode("ascii")), _b64d(sig)):
+            raise InvalidToken("Signature verification failed")
+        try:
+            claims = json.loads(_b64d(body))
+        except ValueError:
+            raise InvalidToken("Invalid payload")
+        if not isinstance(claims, dict):
+            raise InvalidToken("Invalid payload")
+        now = time.time()
+        skew = self.leeway if leeway is None else leeway
+        for name in require:
+            if name not in claims:
+                raise InvalidToken(f'Token is missing the "{name}" claim')
+        try:
+            exp = float(claims["exp"]) if "exp" in claims else None
+            nbf = float(claims["nbf"]) if "nbf" in claims else None
+        except (TypeError, ValueError):
+            raise InvalidToken("Invalid exp or nbf claim")
+        if exp is not None and exp <= now - skew:
+            raise InvalidToken("Signature has expired")
+        if nbf is not None and nbf > now + skew:
+            raise InvalidToken("The token is not yet valid (nbf)")
+        return claims
+
+
+def check_audience(claims: Dict[str, Any], audience: str, required: bool = False) -> None:
+    """Case-insensitive `aud` check; a token without `aud` passes unless `required`."""
+    aud = claims.get("aud")
+    if aud is None:
+        if required:
+            raise InvalidToken('Token is missing the "aud" claim')
+        return
+    values = aud if isinstance(aud, (list, tuple)) else [aud]
+    if not any(isinstance(a, str) and a.lower() == audience.lower() for a in values):
+        raise InvalidToken("Invalid audience")
+
+
+_ring: Optional[Keyring] = None
+_ring_lock = threading.Lock()
+
+
+def get_keyring() -> Keyring:
+    global _ring
+    if _ring is None:
+        with _ring_lock:
+            if _ring is None:
+                _ring = Keyring.from_env()
+    return _ring
+
+
+def reload() -> Keyring:
+    """Re-read SECRET_KEY / JWT_KEYS / JWT_ACTIVE_KID (after a rotation)."""
+    global _ring
+    with _ring_lock:
+        _ring = Keyring.from_env()
+    return _ring
+
+
+def sign(claims: Dict[str, Any], kid: Optional[str] = None) -> str:
+    return get_keyring().sign(claims, kid)
+
+
+def verify(token: str, leeway: Optional[int] = None, require: Iterable[str] = ()) -> Dict[str, Any]:
+    return get_keyring().verify(token, leeway, require)
+
+
+def bearer(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip() or None
+    return None
+
+
+def request_claims(request, audience: Optional[str] = None, require: Iterable[str] = (),
+                   leeway: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Verified claims of the request's bearer token (None without one), decoded
+    once per request and cached on request.state. Audience and required
+    claims are checked on every call, since callers differ in what they
+    demand; `leeway` only applies when this call does the decoding.
+    """
+    token = bearer(request.headers.get("authorization"))
+    if token is None:
+        return None
+    cached = getattr(request.state, "jwt", None)
+    if cached is not None and cached[0] == token:
+        claims = cached[1]
+    else:
+        claims = verify(token, leeway)
+        request.state.jwt = (token, claims)
+    for name in require:
+        if name not in claims:
+            raise InvalidToken(f'Token is missing the "{name}" claim')
+    if audience:
+        check_audience(claims, audience, required="aud" in require)
+    return claims
@@ -0,0 +1,117 @@
+# app/common/cache.py
+"""
+In-process memo cache: LRU bound, TTL and single-flight.
+
+Concurrent misses on the same key wait for the first caller's computation
+instead of repeating it. Values are shared between callers, so treat them as
+read-only. Every cache registers itself so /api/admin/cache reports hit/miss
+counts for all of them.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+_registry: Dict[str, "MemoCache"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class MemoCache:
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 3600.0):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = self.expired = self.errors = 0
+        with _registry_lock:
+            _registry[name] = self
+
+    def get_or_compute(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (value, hit). Errors are not cached and are re-raised to every waiter."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], True
+                del self._data[key]
+                self.expired += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            flight.done.set()
+            raise
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, flight.value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._inflight.pop(key, None)
+        flight.done.set()
+        return flight.value, False
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "name": self.name, "size": len(self._data), "maxsize": self.maxsize, "ttl_seconds": self.ttl,
+                "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "evictions": self.evictions, "expired": self.expired, "errors": self.errors,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.coalesced = self.evictions = self.expired = self.errors = 0
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    with _registry_lock:
+        caches = list(_registry.values())
+    return [c.stats() for c in caches]
+
+
+def get(name: str) -> Optional[MemoCache]:
+    return _registry.get(name)
@@ -0,0 +1,287 @@
+# app/common/jobcancel.py
+"""
+Cancellation tokens and deadlines for background jobs.
+
+Every job gets a CancelToken. cancel() and the job's deadline both fire it.
+How a job stops depends on what it is:
+- async job: the runner cancels its task, so it stops at its next await;
+- sync job: it calls check() / sleep() at safe points;
+- subprocess: run_subprocess() kills the whole process group (SIGTERM, then
+  SIGKILL after JOB_KILL_GRACE_MS).
+Deadlines default per module (DEFAULT_DEADLINES, overridden by JOB_DEADLINES
+"kavach=600,echo=30", with JOB_DEFAULT_DEADLINE for unlisted modules). They
+are armed on one shared timer thread rather than a thread per job.
+"""
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# seconds a job of each module may run before it is stopped with status "timeout"
+DEFAULT_DEADLINES = {"kavach": 900.0, "trinetra": 120.0, "echo": 60.0}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def deadline_for(module: Optional[str]) -> float:
+    for part in (os.getenv("JOB_DEADLINES") or "").split(","):
+        key, _, val = part.partition("=")
+        if key.strip() == module:
+            try:
+                return float(val)
+            except ValueError:
+                break
+    return DEFAULT_DEADLINES.get(module or "", float(_env_int("JOB_DEFAULT_DEADLINE", 3600)))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled (reason "cancelled") or ran past its deadline ("timeout")."""
+
+    def __init__(self, reason: str = "cancelled"):
+        self.reason = reason
+        super().__init__("deadline exceeded" if reason == "timeout" else "cancelled")
+
+
+# --- shared timer thread ---------------------------------------------------------------
+
+class _Timers:
+    def __init__(self):
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> list:
+        entry = [time.monotonic() + delay, next(self._seq), fn]
+        with self._cv:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="job-timers", daemon=True)
+                self._thread.start()
+            self._cv.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry: list) -> None:
+        entry[2] = None  # lazily dropped when it reaches the top of the heap
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cv.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, fn = heapq.heappop(self._heap)
+            if fn is not None:
+                try:
+                    fn()
+                except Exception:
+                    logger.exception("job timer callback failed")
+
+
+_timers = _Timers()
+
+
+def call_later(delay: float, fn: Callable[[], None]) -> list:
+    return _timers.call_later(max(0.0, delay), fn)
+
+
+# --- tokens -------------------------------------------------------------------
+
+class CancelToken:
+    __slots__ = ("job_id", "timeout", "deadline", "reason", "_event", "_callbacks", "_lock", "_timer")
+
+    def __init__(self, job_id: Optional[str] = None, timeout: Optional[float] = None):
+        self.job_id = job_id
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[list] = None
+
+    def start(self) -> "CancelToken":
+        """Arm the deadline; called when the job starts running, not when it is queued."""
+        if self.timeout and self._timer is None:
+            self.deadline = time.monotonic() + self.timeout
+            self._timer = call_later(self.timeout, lambda: self.cancel("timeout"))
+        return self
+
+    def finish(self) -> None:
+        if self._timer is not None:
+            _timers.cancel(self._timer)
+        with self._lock:
+            self._callbacks.clear()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Fire the token; only the first call counts. Returns True if this call fired it."""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        self._event.set()
+        for cb in callbacks:
+            try:
+                cb(reason)
+            except Exception:
+                logger.exception("cancel callback of job %s failed", self.job_id)
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def check(self) -> None:
+        if self.reason is not None:
+            raise JobCancelled(self.reason)
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to `seconds`; True as soon as the token fires."""
+        return self._event.wait(seconds)
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def on_cancel(self, cb: Callable[[str], None]) -> Callable[[], None]:
+        """Run cb(reason) when the token fires (at once if it already has); returns an unregister function."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(cb)
+                fired = None
+            else:
+                fired = self.reason
+        if fired is not None:
+            cb(fired)
+
+        def remove() -> None:
+            with self._lock:
+                if cb in self._callbacks:
+                    self._callbacks.remove(cb)
+        return remove
+
+
+_current: "contextvars.ContextVar[Optional[CancelToken]]" = contextvars.ContextVar("job_cancel", default=None)
+
+
+def current() -> Optional[CancelToken]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def bind(token: CancelToken) -> Iterator[CancelToken]:
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check() -> None:
+    """Raise JobCancelled if the current job was cancelled or timed out (no-op outside a job)."""
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep that returns early, raising JobCancelled, when the current job is cancelled."""
+    token = _current.get()
+    if token is None:
+        time.sleep(seconds)
+    elif token.wait(seconds):
+        token.check()
+
+
+async def run_async(func: Callable, args: tuple, kwargs: Dict[str, Any], token: CancelToken) -> Any:
+    """Await func(*args, **kwargs), cancelling its task (from any thread) when the token fires."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(func(*args, **kwargs))
+
+    def stop(_reason: str) -> None:
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            pass  # loop already closed: the job has finished
+
+    remove = token.on_cancel(stop)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if token.reason is not None:
+            raise JobCancelled(token.reason) from None
+        raise
+    finally:
+        remove()
+
+
+# --- subprocesses ---------------------------------------------------------------
+
+def _kill(proc: subprocess.Popen, grace: float) -> None:
+    def send(sig) -> None:
+        if proc.poll() is not None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, sig)
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    send(signal.SIGTERM)
+    if os.name == "posix":
+        call_later(grace, lambda: send(signal.SIGKILL))
+
+
+def run_subprocess(args: List[str], timeout: float, check: bool = False, text: bool = True,
+                   grace: Optional[float] = None) -> subprocess.CompletedProcess:
+    """
+    subprocess.run(capture_output=True) that is bounded by the current job's
+    deadline as well as `timeout`. Cancelling the job kills the process group.
+    Raises JobCancelled when the job was stopped, TimeoutExpired on `timeout`.
+    """
+    grace = grace if grace is not None else _env_int("JOB_KILL_GRACE_MS", 3000) / 1000.0
+    token = _current.get()
+    if token is not None:
+        token.check()
+        left = token.remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text,
+                            start_new_session=os.name == "posix")
+    remove = token.on_cancel(lambda _r: _kill(proc, grace)) if token is not None else None
+    try:
+        try:
+            out, err = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(proc, grace)
+            proc.communicate()
+            if token is not None and token.remaining() == 0.0:
+                token.cancel("timeout")
+            if token is not None and token.reason is not None:
+                raise JobCancelled(token.reason)
+            raise
+    finally:
+        if remove is not None:
+            remove()
+    if token is not None and token.reason is not None:
+        raise JobCancelled(token.reason)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, out, err)
+    return subprocess.CompletedProcess(args, proc.returncode, out, err)
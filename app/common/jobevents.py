@@ -0,0 +1,145 @@
+# app/common/jobevents.py
+"""
+Job state notifications for long-polling and streaming clients.
+
+Job state changes on scheduler threads. Waiters and subscribers live on the
+event loop, so everything crosses over with call_soon_threadsafe.
+- wait() parks a request on a per-job asyncio.Event until the job finishes.
+- subscribe() gives a per-tenant queue of every state transition.
+
+A subscriber that cannot keep up (JOB_STREAM_BUFFER events behind) is
+marked lagged. It gets one `lagged` event and should re-read the statuses
+it cares about.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+TERMINAL = {"succeeded", "failed", "cancelled", "timeout"}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class Subscription:
+    def __init__(self, hub: "JobEvents", tenant: str, loop: asyncio.AbstractEventLoop, size: int):
+        self.hub = hub
+        self.tenant = tenant
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=size)
+        self.lagged = False
+
+    def _push(self, event: Dict[str, Any]) -> None:
+        # runs on the loop thread
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({"type": "lagged"})
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None after `timeout` seconds of silence."""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event.get("type") == "lagged":
+            self.lagged = False
+        return event
+
+    def close(self) -> None:
+        self.hub._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class JobEvents:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._subs: Dict[str, Set[Subscription]] = {}
+
+    def publish(self, tenant: Optional[str], job_id: str, record: Dict[str, Any]) -> None:
+        """Called (from any thread) after a job's record changed."""
+        with self._lock:
+            waiters = self._waiters.pop(job_id, []) if record.get("status") in TERMINAL else []
+            subs = list(self._subs.get(tenant or "", ()))
+        for loop, ev in waiters:
+            loop.call_soon_threadsafe(ev.set)
+        if subs:
+            self._fan_out(subs, {"type": "job", "job_id": job_id, "status": record.get("status"), "job": record})
+
+    def publish_event(self, tenant: Optional[str], event: Dict[str, Any]) -> None:
+        """Push any other event (e.g. `progress`) to the tenant's stream subscribers."""
+        with self._lock:
+            subs = list(self._subs.get(tenant or "", ()))
+        if subs:
+            self._fan_out(subs, event)
+
+    @staticmethod
+    def _fan_out(subs: List[Subscription], event: Dict[str, Any]) -> None:
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._push, event)
+            except RuntimeError:
+                pass  # loop already closed; the subscriber is going away
+
+    async def wait(self, job_id: str, timeout: float, is_done: Callable[[], bool]) -> bool:
+        """Park until the job is finished or `timeout` passes; True if it finished."""
+        if is_done():
+            return True
+        loop = asyncio.get_running_loop()
+        ev = asyncio.Event()
+        entry = (loop, ev)
+        with self._lock:
+            self._waiters.setdefault(job_id, []).append(entry)
+        try:
+            # re-check after registering: the job may have finished in between
+            if is_done():
+                return True
+            try:
+                await asyncio.wait_for(ev.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return is_done()
+        finally:
+            with self._lock:
+                lst = self._waiters.get(job_id)
+                if lst and entry in lst:
+                    lst.remove(entry)
+                    if not lst:
+                        del self._waiters[job_id]
+
+    def subscribe(self, tenant: str) -> Subscription:
+        sub = Subscription(self, tenant, asyncio.get_running_loop(), _env_int("JOB_STREAM_BUFFER", 1000))
+        with self._lock:
+            self._subs.setdefault(tenant, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            s = self._subs.get(sub.tenant)
+            if s is not None:
+                s.discard(sub)
+                if not s:
+                    del self._subs[sub.tenant]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"waiting_requests": sum(len(v) for v in self._waiters.values()),
+                    "stream_subscribers": sum(len(v) for v in self._subs.values())}
+
+
+hub = JobEvents()
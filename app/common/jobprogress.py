@@ -0,0 +1,214 @@
+# app/common/jobprogress.py
+"""
+Progress reporting for running jobs.
+
+A job function calls report(percent=, stage=, findings=[...]) as it goes. The
+scheduler binds the current job through a context variable, so job functions
+need no extra argument; outside a job, report() does nothing.
+
+Reports only touch memory. A flusher thread writes every dirty job at most
+once per JOB_PROGRESS_FLUSH_MS (500), however often the job reports. A flush:
+- updates the job's registry record (percent, stage, findings count);
+- pushes one `progress` event with the new findings to stream subscribers;
+- upserts `{tenant}_job_progress`, appending only the findings added since
+  the last write.
+A job's last progress is flushed before its terminal status is published.
+Findings beyond JOB_PROGRESS_MAX_FINDINGS (500) are counted but not kept.
+Progress documents expire after JOB_TTL_SECONDS, like the registry records.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import ASCENDING
+
+from app.common import jobevents, jobregistry
+
+logger = logging.getLogger(__name__)
+
+PROGRESS = "_job_progress"
+
+INDEXES = {
+    PROGRESS: [("by_expires", [("expires", ASCENDING)], False)],
+}
+
+_PRUNE_EVERY = 60.0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class Reporter:
+    __slots__ = ("hub", "job_id", "tenant", "module", "percent", "stage", "findings", "count",
+                 "written", "published", "dirty", "reports", "flush_lock")
+
+    def __init__(self, hub: "ProgressHub", job_id: str, tenant: str, module: Optional[str]):
+        self.hub = hub
+        self.job_id = job_id
+        self.tenant = tenant
+        self.module = module
+        self.percent: Optional[float] = None
+        self.stage: Optional[str] = None
+        self.findings: List[Any] = []
+        self.count = 0  # findings reported, including the ones not kept
+        self.written = 0  # findings already appended to the progress document
+        self.published = 0  # findings already sent to stream subscribers
+        self.dirty = False
+        self.reports = 0
+        self.flush_lock = threading.Lock()  # one writer per job, so appends are never duplicated
+
+    def summary(self) -> Dict[str, Any]:
+        return {"percent": self.percent, "stage": self.stage, "findings": self.count}
+
+
+_current: "contextvars.ContextVar[Optional[Reporter]]" = contextvars.ContextVar("job_progress", default=None)
+
+
+class ProgressHub:
+    def __init__(self, interval_ms: Optional[int] = None, max_findings: Optional[int] = None,
+                 registry: Optional[jobregistry.JobRegistry] = None, db_factory=None):
+        self.interval = (interval_ms or _env_int("JOB_PROGRESS_FLUSH_MS", 500)) / 1000.0
+        self.max_findings = max_findings or _env_int("JOB_PROGRESS_MAX_FINDINGS", 500)
+        self.registry = registry or jobregistry.registry
+        self._db_factory = db_factory
+        self._live: Dict[str, Reporter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pruned: Dict[str, float] = {}
+        self.reports = self.writes = 0
+
+    def _db(self):
+        if self._db_factory is not None:
+            return self._db_factory()
+        from app.deps import get_db
+        return get_db()
+
+    # --- job side -----------------------------------------------------------------
+    @contextlib.contextmanager
+    def tracking(self, job_id: str, tenant: str, module: Optional[str] = None) -> Iterator[Reporter]:
+        """Bind report() to this job for the duration of the block; flushes on exit."""
+        rep = Reporter(self, job_id, tenant, module)
+        with self._lock:
+            self._live[job_id] = rep
+        token = _current.set(rep)
+        try:
+            yield rep
+        finally:
+            _current.reset(token)
+            self._flush_one(rep)
+            with self._lock:
+                self._live.pop(job_id, None)
+
+    def report(self, rep: Reporter, percent: Optional[float] = None, stage: Optional[str] = None,
+               findings: Optional[List[Any]] = None) -> None:
+        with self._lock:
+            if percent is not None:
+                rep.percent = round(max(0.0, min(100.0, float(percent))), 1)
+            if stage is not None:
+                rep.stage = stage
+            for f in findings or ():
+                rep.count += 1
+                if len(rep.findings) < self.max_findings:
+                    rep.findings.append(f)
+            rep.dirty = True
+            rep.reports += 1
+            self.reports += 1
+        self._ensure_flusher()
+
+    # --- flushing -------------------------------------------------------------------
+    def _ensure_flusher(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="job-progress", daemon=True)
+                    self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                dirty = [r for r in self._live.values() if r.dirty]
+            for rep in dirty:
+                self._flush_one(rep)
+
+    def _flush_one(self, rep: Reporter) -> None:
+        with rep.flush_lock:
+            with self._lock:
+                if not rep.dirty:
+                    return
+                rep.dirty = False
+                summary = rep.summary()
+                new = rep.findings[rep.written:]
+                fresh = rep.findings[rep.published:]
+                rep.written = rep.published = len(rep.findings)
+            self.registry.set_progress(rep.job_id, summary)
+            jobevents.hub.publish_event(rep.tenant, {
+                "type": "progress", "job_id": rep.job_id,
+                "progress": {"job_id": rep.job_id, **summary, "new_findings": fresh}})
+            self._persist(rep, summary, new)
+
+    def _persist(self, rep: Reporter, summary: Dict[str, Any], new: List[Any]) -> None:
+        now = time.time()
+        update: Dict[str, Any] = {"$set": {
+            "module": rep.module, "percent": summary["percent"], "stage": summary["stage"],
+            "findingsCount": summary["findings"], "expires": now + _env_int("JOB_TTL_SECONDS", 3600),
+            "updatedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")}}
+        if new:
+            update["$push"] = {"findings": {"$each": new}}
+        try:
+            db = self._db()
+            db[f"{rep.tenant}{PROGRESS}"].update_one({"_id": rep.job_id}, update, upsert=True)
+            self.writes += 1
+            if now - self._pruned.get(rep.tenant, 0.0) > _PRUNE_EVERY:
+                self._pruned[rep.tenant] = now
+                db[f"{rep.tenant}{PROGRESS}"].delete_many({"expires": {"$lt": now}})
+        except Exception as e:
+            logger.warning("could not persist progress of job %s: %s", rep.job_id, e)
+
+    # --- reads ----------------------------------------------------------------------
+    def snapshot(self, tenant: str, job_id: str, since: int = 0) -> Optional[Dict[str, Any]]:
+        """Percent, stage and findings[since:] of a job: live if it runs here, else from storage."""
+        with self._lock:
+            rep = self._live.get(job_id)
+            if rep is not None:
+                if rep.tenant != tenant:
+                    return None
+                return {"job_id": job_id, **rep.summary(), "findings_kept": len(rep.findings),
+                        "new_findings": rep.findings[since:], "live": True}
+        try:
+            doc = self._db()[f"{tenant}{PROGRESS}"].find_one({"_id": job_id})
+        except Exception as e:
+            logger.warning("could not read progress of job %s: %s", job_id, e)
+            return None
+        if doc is None:
+            return None
+        findings = doc.get("findings") or []
+        return {"job_id": job_id, "percent": doc.get("percent"), "stage": doc.get("stage"),
+                "findings": doc.get("findingsCount", len(findings)), "findings_kept": len(findings),
+                "new_findings": findings[since:], "live": False}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = len(self._live)
+        return {"live_jobs": live, "reports": self.reports, "writes": self.writes,
+                "flush_interval_ms": int(self.interval * 1000)}
+
+
+hub = ProgressHub()
+
+
+def report(percent: Optional[float] = None, stage: Optional[str] = None,
+           findings: Optional[List[Any]] = None) -> None:
+    """Record progress of the job running in this context (no-op outside a job)."""
+    rep = _current.get()
+    if rep is not None:
+        rep.hub.report(rep, percent, stage, findings)
@@ -0,0 +1,365 @@
+# app/common/jobqueue.py
+"""
+Tenant-fair job scheduler shared by both job routers.
+
+Jobs are queued per (tenant, priority class) and run on JOB_WORKERS threads.
+How the next job is picked:
+- Interactive jobs always go first.
+- Batch jobs may use at most JOB_WORKERS - JOB_INTERACTIVE_RESERVED threads.
+  Jobs are not preemptible, so this reserve is what keeps a short
+  interactive job from waiting behind a flood of ten-minute scans.
+- Within a class, tenants share the workers by start-time fair queuing.
+  Each job gets the tag max(V, tenant's last finish tag); the tenant's
+  finish tag then grows by cost / weight. Whichever eligible head has the
+  smallest tag runs next. A tenant that submits 10,000 scans only pushes its
+  own tags forward.
+- A tenant never has more than its concurrency quota running.
+
+cancel() drops a queued job or fires a running job's token (app/common/jobcancel.py).
+Each job also has a per-module deadline. A running job that ignores its
+token for JOB_CANCEL_GRACE_MS is detached: its slot and quota are released
+at once, a replacement worker thread starts, and whatever the old thread
+returns later is discarded.
+
+Per-tenant weights and quotas come from JOB_TENANT_WEIGHTS / JOB_TENANT_LIMITS
+("acme=2,beta=0.5"). stats() reports queue depth, running jobs and wait
+percentiles per class.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from app.common import jobcancel, jobprogress
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "batch")
+# relative cost of a job per module, in "echo" units; used for fair-share accounting
+DEFAULT_COSTS = {"kavach": 10.0, "trinetra": 2.0, "echo": 1.0}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_map(name: str) -> Dict[str, float]:
+    out = {}
+    for part in (os.getenv(name) or "").split(","):
+        key, _, val = part.partition("=")
+        try:
+            out[key.strip()] = float(val)
+        except ValueError:
+            continue
+    return out
+
+
+class QueueFull(RuntimeError):
+    """The tenant already has JOB_MAX_QUEUED jobs waiting."""
+
+
+class Ticket:
+    __slots__ = ("job_id", "tenant", "priority", "module", "func", "args", "kwargs", "cost",
+                 "start_tag", "enqueued_at", "started_at", "on_state", "token", "state")
+
+    def __init__(self, job_id, tenant, priority, module, func, args, kwargs, cost, on_state, timeout):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.priority = priority
+        self.module = module
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.on_state = on_state
+        self.start_tag = 0.0
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.token = jobcancel.CancelToken(job_id, timeout)
+        self.state = "queued"  # -> running -> done, or detached if it outlived its cancellation
+
+
+class _Tenant:
+    __slots__ = ("name", "weight", "limit", "queues", "finish", "running")
+
+    def __init__(self, name: str, weight: float, limit: int):
+        self.name = name
+        self.weight = weight
+        self.limit = limit
+        self.queues: Dict[str, Deque[Ticket]] = {p: deque() for p in PRIORITIES}
+        self.finish = {p: 0.0 for p in PRIORITIES}
+        self.running = 0
+
+
+class FairScheduler:
+    def __init__(self, workers: Optional[int] = None, reserved: Optional[int] = None,
+                 tenant_limit: Optional[int] = None, max_queued: Optional[int] = None,
+                 weights: Optional[Dict[str, float]] = None, limits: Optional[Dict[str, float]] = None):
+        self.workers = max(1, workers or _env_int("JOB_WORKERS", 4))
+        reserved = reserved if reserved is not None else _env_int("JOB_INTERACTIVE_RESERVED", 1)
+        self.reserved = min(max(0, reserved), self.workers - 1)
+        self.tenant_limit = max(1, tenant_limit or _env_int("JOB_TENANT_CONCURRENCY", 2))
+        self.max_queued = max_queued or _env_int("JOB_MAX_QUEUED", 10000)
+        self.weights = weights if weights is not None else _env_map("JOB_TENANT_WEIGHTS")
+        self.limits = limits if limits is not None else _env_map("JOB_TENANT_LIMITS")
+        self._tenants: Dict[str, _Tenant] = {}
+        self._active: Dict[str, set] = {p: set() for p in PRIORITIES}
+        self._vtime = {p: 0.0 for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=2000) for p in PRIORITIES}
+        self.grace = _env_int("JOB_CANCEL_GRACE_MS", 5000) / 1000.0
+        self._tickets: Dict[str, Ticket] = {}
+        self._counts = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0,
+                        "timeout": 0, "detached": 0}
+        self._cv = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._names = itertools.count()
+        self._stopping = False
+
+    # --- lifecycle ---------------------------------------------------------------
+    def start(self) -> "FairScheduler":
+        with self._cv:
+            if self._threads:
+                return self
+            self._stopping = False
+            self._threads = [self._thread() for _ in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def _thread(self) -> threading.Thread:
+        return threading.Thread(target=self._work, name=f"job-worker-{next(self._names)}", daemon=True)
+
+    def shutdown(self, wait: bool = False, timeout: float = 5.0) -> None:
+        with self._cv:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+            self._cv.notify_all()
+        if wait:
+            for t in threads:
+                t.join(timeout)
+
+    # --- submission ---------------------------------------------------------------
+    def _tenant(self, name: str) -> _Tenant:
+        t = self._tenants.get(name)
+        if t is None:
+            t = self._tenants[name] = _Tenant(name, max(1e-3, self.weights.get(name, 1.0)),
+                                              int(self.limits.get(name, self.tenant_limit)))
+        return t
+
+    def submit(self, tenant: str, func: Callable, *args: Any, job_id: Optional[str] = None,
+               priority: str = "batch", module: Optional[str] = None, cost: Optional[float] = None,
+               on_state: Optional[Callable[[str, Any], None]] = None, timeout: Optional[float] = None,
+               **kwargs: Any) -> Ticket:
+        """
+        Queue func(*args, **kwargs); on_state(state, value) sees running, then
+        succeeded / failed / cancelled / timeout. `timeout` (seconds of running
+        time) defaults to the module's deadline.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        cost = float(cost if cost is not None else DEFAULT_COSTS.get(module or "", 1.0))
+        ticket = Ticket(job_id, tenant, priority, module, func, args, kwargs, cost, on_state,
+                        timeout or jobcancel.deadline_for(module))
+        if not self._threads:
+            self.start()
+        with self._cv:
+            t = self._tenant(tenant)
+            if sum(len(q) for q in t.queues.values()) >= self.max_queued:
+                self._counts["rejected"] += 1
+                raise QueueFull(f"tenant {tenant} has {self.max_queued} jobs queued")
+            ticket.start_tag = max(self._vtime[priority], t.finish[priority])
+            t.finish[priority] = ticket.start_tag + cost / t.weight
+            t.queues[priority].append(ticket)
+            if job_id is not None:
+                self._tickets[job_id] = ticket
+            self._active[priority].add(tenant)
+            self._counts["submitted"] += 1
+            self._cv.notify()
+        return ticket
+
+    # --- dispatch ---------------------------------------------------------------
+    def _pick(self) -> Optional[Ticket]:
+        for prio in PRIORITIES:
+            if prio == "batch" and self._running["batch"] >= self.workers - self.reserved:
+                continue
+            best: Optional[Ticket] = None
+            for name in self._active[prio]:
+                t = self._tenants[name]
+                if t.running >= t.limit:
+                    continue
+                head = t.queues[prio][0]
+                if best is None or head.start_tag < best.start_tag:
+                    best = head
+            if best is not None:
+                t = self._tenants[best.tenant]
+                t.queues[prio].popleft()
+                if not t.queues[prio]:
+                    self._active[prio].discard(best.tenant)
+                t.running += 1
+                self._running[prio] += 1
+                self._vtime[prio] = max(self._vtime[prio], best.start_tag)
+                best.state = "running"
+                best.started_at = time.monotonic()
+                self._waits[prio].append(best.started_at - best.enqueued_at)
+                return best
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cv:
+                ticket = None
+                while not self._stopping and (ticket := self._pick()) is None:
+                    self._cv.wait()
+                if ticket is None:
+                    return
+            self._run(ticket)
+            with self._cv:
+                if ticket.state == "detached":
+                    # a replacement thread already took this one's place
+                    me = threading.current_thread()
+                    self._threads = [t for t in self._threads if t is not me]
+                    return
+                self._release(ticket)
+
+    def _release(self, ticket: Ticket) -> None:
+        # under self._cv
+        ticket.state = "done"
+        if self._tickets.get(ticket.job_id) is ticket:
+            del self._tickets[ticket.job_id]
+        self._tenants[ticket.tenant].running -= 1
+        self._running[ticket.priority] -= 1
+        self._cv.notify_all()
+
+    def _run(self, ticket: Ticket) -> None:
+        token = ticket.token
+        remove = token.on_cancel(lambda _r: jobcancel.call_later(self.grace, lambda: self._detach(ticket)))
+        token.start()
+        self._notify(ticket, "running", None)
+        try:
+            # binds jobprogress.report() / jobcancel.check() to this job; progress is flushed before the outcome
+            with jobprogress.hub.tracking(ticket.job_id, ticket.tenant, ticket.module), jobcancel.bind(token):
+                if asyncio.iscoroutinefunction(ticket.func):
+                    result = asyncio.run(jobcancel.run_async(ticket.func, ticket.args, ticket.kwargs, token))
+                else:
+                    result = ticket.func(*ticket.args, **ticket.kwargs)
+            state, value = "succeeded", result
+        except jobcancel.JobCancelled as e:
+            logger.info("job %s (%s/%s) stopped: %s", ticket.job_id, ticket.tenant, ticket.module, e)
+            state, value = e.reason, e
+        except Exception as e:
+            logger.error("job %s (%s/%s) failed: %s", ticket.job_id, ticket.tenant, ticket.module, e)
+            state, value = "failed", e
+        finally:
+            remove()
+            token.finish()
+        with self._cv:
+            if ticket.state == "detached":
+                return  # its outcome was already reported
+            ticket.state = "finishing"
+            self._counts[state] += 1
+        self._notify(ticket, state, value)
+
+    def _detach(self, ticket: Ticket) -> None:
+        """Give up on a cancelled job that is still running after the grace period."""
+        with self._cv:
+            if ticket.state != "running" or self._stopping:
+                return
+            self._release(ticket)
+            ticket.state = "detached"
+            reason = ticket.token.reason or "cancelled"
+            self._counts[reason] += 1
+            self._counts["detached"] += 1
+            replacement = self._thread()
+            self._threads.append(replacement)
+        logger.warning("job %s (%s/%s) ignored cancellation; detached its worker thread",
+                       ticket.job_id, ticket.tenant, ticket.module)
+        replacement.start()
+        self._notify(ticket, reason, jobcancel.JobCancelled(reason))
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """"cancelled" if the job was still queued, "cancelling" if it was running, None if unknown here."""
+        with self._cv:
+            ticket = self._tickets.get(job_id)
+            if ticket is None:
+                return None
+            if ticket.state == "queued":
+                t = self._tenants[ticket.tenant]
+                t.queues[ticket.priority].remove(ticket)
+                if not t.queues[ticket.priority]:
+                    self._active[ticket.priority].discard(ticket.tenant)
+                ticket.state = "done"
+                del self._tickets[job_id]
+                self._counts["cancelled"] += 1
+                queued = True
+            else:
+                queued = False
+        if queued:
+            ticket.token.cancel()
+            self._notify(ticket, "cancelled", jobcancel.JobCancelled())
+            return "cancelled"
+        ticket.token.cancel()
+        return "cancelling"
+
+    @staticmethod
+    def _notify(ticket: Ticket, state: str, value: Any) -> None:
+        if ticket.on_state is None:
+            return
+        try:
+            ticket.on_state(state, value)
+        except Exception:
+            logger.exception("job %s state callback failed", ticket.job_id)
+
+    # --- metrics ---------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        def pct(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1) if values else None
+
+        with self._cv:
+            tenants = {
+                t.name: {"queued": {p: len(q) for p, q in t.queues.items()}, "running": t.running,
+                         "weight": t.weight, "limit": t.limit}
+                for t in self._tenants.values() if t.running or any(t.queues.values())
+            }
+            classes = {}
+            for p in PRIORITIES:
+                waits = sorted(self._waits[p])
+                classes[p] = {"queued": sum(len(self._tenants[n].queues[p]) for n in self._active[p]),
+                              "running": self._running[p], "wait_p50_ms": pct(waits, 0.5),
+                              "wait_p95_ms": pct(waits, 0.95)}
+            return {"workers": self.workers, "interactive_reserved": self.reserved, "threads": len(self._threads),
+                    "tenant_concurrency": self.tenant_limit, **self._counts,
+                    "classes": classes, "tenants": tenants}
+
+
+_scheduler: Optional[FairScheduler] = None
+_lock = threading.Lock()
+
+
+def get_scheduler() -> FairScheduler:
+    """The process-wide job scheduler; its worker threads start on the first submit."""
+    global _scheduler
+    if _scheduler is None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = FairScheduler()
+    return _scheduler
+
+
+def current_scheduler() -> Optional[FairScheduler]:
+    return _scheduler
+
+
+def shutdown(wait: bool = False) -> None:
+    global _scheduler
+    with _lock:
+        sched, _scheduler = _scheduler, None
+    if sched is not None:
+        sched.shutdown(wait=wait)
@@ -0,0 +1,231 @@
+# app/common/jobregistry.py
+"""
+Bounded in-process job registry shared by both job routers.
+
+Each job is a small __slots__ record. Records are replaced on every state
+change, never mutated, so readers take no lock and always see a consistent
+snapshot.
+
+Finished jobs are forgotten after JOB_TTL_SECONDS, oldest first, and also
+once more than JOB_REGISTRY_MAX finished jobs are held. Eviction is
+amortized into the writes, so there is no sweeper thread. Queued and running
+jobs are never evicted.
+
+A result larger than JOB_RESULT_MAX_KB is not kept in memory. It is written
+to the artifact store as `job-<id>` and the record keeps only a reference.
+Memory therefore stays proportional to the live window rather than to
+every job ever submitted.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.common import jobevents
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size (Linux), for the registry's memory metrics."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class JobRecord:
+    __slots__ = ("job_id", "tenant", "module", "priority", "status", "payload", "result", "result_ref",
+                 "progress", "submitted_at", "started_at", "finished_at")
+
+    def __init__(self, job_id: str, tenant: Optional[str], module: Optional[str], priority: Optional[str],
+                 payload: Dict[str, Any], status: str = "queued", result: Any = None,
+                 result_ref: Optional[Dict[str, Any]] = None, progress: Optional[Dict[str, Any]] = None,
+                 submitted_at: Optional[float] = None,
+                 started_at: Optional[float] = None, finished_at: Optional[float] = None):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.module = module
+        self.priority = priority
+        self.status = status
+        self.payload = payload
+        self.result = result
+        self.result_ref = result_ref
+        self.progress = progress
+        self.submitted_at = submitted_at or time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    def replace(self, **changes: Any) -> "JobRecord":
+        fields = {k: getattr(self, k) for k in self.__slots__}
+        fields.update(changes)
+        return JobRecord(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"job_id": self.job_id, "status": self.status, "submitted_at": self.submitted_at,
+               "result": self.result, "payload": self.payload}
+        if self.started_at:
+            out["started_at"] = self.started_at
+        if self.finished_at:
+            out["finished_at"] = self.finished_at
+        if self.result_ref:
+            out["result_ref"] = self.result_ref
+        if self.progress:
+            out["progress"] = self.progress
+        return out
+
+
+class JobRegistry:
+    def __init__(self, ttl: Optional[float] = None, max_finished: Optional[int] = None,
+                 max_result_bytes: Optional[int] = None, db_factory=None):
+        self.ttl = float(ttl if ttl is not None else _env_int("JOB_TTL_SECONDS", 3600))
+        self.max_finished = max_finished or _env_int("JOB_REGISTRY_MAX", 100_000)
+        self.max_result_bytes = max_result_bytes or _env_int("JOB_RESULT_MAX_KB", 64) * 1024
+        self._db_factory = db_factory
+        self._jobs: Dict[str, JobRecord] = {}
+        self._finished: "OrderedDict[str, float]" = OrderedDict()  # job_id -> finished (monotonic)
+        self._lock = threading.Lock()
+        self.evicted = self.offloaded = 0
+
+    # --- reads (lock-free) --------------------------------------------------------
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rec = self._jobs.get(job_id)
+        return rec.to_dict() if rec is not None else None
+
+    def status(self, job_id: str) -> Optional[str]:
+        rec = self._jobs.get(job_id)
+        return rec.status if rec is not None else None
+
+    def record(self, job_id: str) -> Optional[JobRecord]:
+        return self._jobs.get(job_id)
+
+    # --- writes ---------------------------------------------------------------
+    def create(self, job_id: str, tenant: Optional[str], module: Optional[str], payload: Dict[str, Any],
+               priority: Optional[str] = None) -> Dict[str, Any]:
+        rec = JobRecord(job_id, tenant, module, priority, payload)
+        with self._lock:
+            self._jobs[job_id] = rec
+            evicted = self._evict()
+        self._cleanup(evicted)
+        snap = rec.to_dict()
+        jobevents.hub.publish(tenant, job_id, snap)
+        return snap
+
+    def update(self, job_id: str, status: str, result: Any = None) -> Optional[Dict[str, Any]]:
+        done = status in jobevents.TERMINAL
+        ref = None
+        if done and result is not None:
+            result, ref = self._maybe_offload(job_id, result)
+        with self._lock:
+            old = self._jobs.get(job_id)
+            if old is None:
+                return None
+            changes: Dict[str, Any] = {"status": status}
+            if result is not None:
+                changes["result"] = result
+            if ref is not None:
+                changes["result_ref"] = ref
+            if status == "running" and old.started_at is None:
+                changes["started_at"] = time.time()
+            if done:
+                changes["finished_at"] = time.time()
+                self._finished[job_id] = time.monotonic()
+            rec = self._jobs[job_id] = old.replace(**changes)
+            evicted = self._evict()
+        self._cleanup(evicted)
+        snap = rec.to_dict()
+        jobevents.hub.publish(rec.tenant, job_id, snap)
+        return snap
+
+    def set_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        """Attach a progress summary (app/common/jobprogress.py); published separately as a progress event."""
+        with self._lock:
+            old = self._jobs.get(job_id)
+            if old is not None and old.status not in jobevents.TERMINAL:
+                self._jobs[job_id] = old.replace(progress=progress)
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._finished.pop(job_id, None)
+
+    # --- eviction / offload -----------------------------------------------------
+    def _evict(self) -> List[JobRecord]:
+        """Drop expired / surplus finished jobs (called under the lock)."""
+        out = []
+        cutoff = time.monotonic() - self.ttl
+        while self._finished:
+            job_id, finished = next(iter(self._finished.items()))
+            if finished > cutoff and len(self._finished) <= self.max_finished:
+                break
+            self._finished.popitem(last=False)
+            rec = self._jobs.pop(job_id, None)
+            if rec is not None:
+                out.append(rec)
+        self.evicted += len(out)
+        return out
+
+    def _store(self):
+        if self._db_factory is not None:
+            db = self._db_factory()
+        else:
+            from app.deps import get_db
+            db = get_db()
+        from app.services import artifacts
+        return artifacts.get_store(db)
+
+    def _maybe_offload(self, job_id: str, result: Any):
+        try:
+            body = json.dumps(result, default=str)
+        except (TypeError, ValueError):
+            body = json.dumps(str(result))
+        if len(body) <= self.max_result_bytes:
+            return result, None
+        rec = self._jobs.get(job_id)
+        tenant = (rec.tenant if rec else None) or "default"
+        try:
+            meta = self._store().put(tenant, body, "job_result", "application/json", artifact_id=f"job-{job_id}")
+        except Exception as e:
+            logger.warning("could not offload result of job %s (%d bytes): %s", job_id, len(body), e)
+            return {"truncated": True, "size": len(body)}, None
+        self.offloaded += 1
+        from app.services import artifacts
+        return None, {**artifacts.summary(meta), "tenant": tenant}
+
+    def _cleanup(self, evicted: List[JobRecord]) -> None:
+        for rec in evicted:
+            if rec.result_ref:
+                try:
+                    self._store().delete(rec.result_ref["tenant"], rec.result_ref["id"])
+                except Exception as e:
+                    logger.warning("could not delete offloaded result of job %s: %s", rec.job_id, e)
+
+    def offloaded_result(self, job_id: str) -> Optional[Tuple[Any, str, Dict[str, Any]]]:
+        """(store, tenant, meta) of an offloaded result, or None."""
+        rec = self._jobs.get(job_id)
+        if rec is None or not rec.result_ref:
+            return None
+        store = self._store()
+        meta = store.get(rec.result_ref["tenant"], rec.result_ref["id"])
+        return (store, rec.result_ref["tenant"], meta) if meta else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total, finished = len(self._jobs), len(self._finished)
+        return {"jobs": total, "active": total - finished, "finished": finished, "evicted": self.evicted,
+                "offloaded": self.offloaded, "ttl_seconds": self.ttl, "max_finished": self.max_finished,
+                "max_result_bytes": self.max_result_bytes, "rss_bytes": rss_bytes()}
+
+
+registry = JobRegistry()
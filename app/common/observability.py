@@ -78,3 +78,248 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
             req.method, req.url.path, resp.status_code, int((time.perf_counter()-t)*1000)
         )
         return resp
+
+# --- opt-in request profiling ------------------------------------------------
+# A request is profiled when an owner sends `X-Profile: 1`, or when its tenant /
+# path prefix is in the runtime targets (PROFILE_TENANTS, PROFILE_ROUTES or
+# PUT /api/admin/profiles/config). Profiled requests get a sampled stack
+# profile plus span timings (mongo.*, pdf.render, json.encode) and are kept in a
+# bounded ring buffer served by /api/admin/profiles. The store is shared by all
+# tenants, so every admin read/write is scoped to the caller's tenant.
+import sys, threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from itertools import count
+from pymongo import monitoring
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+
+def _env_list(name):
+    return [p.strip() for p in os.getenv(name, "").split(",") if p.strip()]
+
+_trace=ContextVar("profile_trace", default=None)
+_APP_ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MAX_SPANS=500; _MAX_STACKS=2000; _MAX_DEPTH=64
+
+class ProfileTrace:
+    __slots__=("id","tenant","method","path","reason","started","t0","duration_ms","status",
+               "spans","stacks","samples","overlapped","pending","_lock")
+    def __init__(self, tid, tenant, method, path, reason):
+        self.id=tid; self.tenant=tenant; self.method=method; self.path=path; self.reason=reason
+        self.started=time.time(); self.t0=time.perf_counter(); self.duration_ms=None; self.status=None
+        self.spans=[]; self.stacks=Counter(); self.samples=0; self.overlapped=False; self.pending={}
+        self._lock=threading.Lock()
+
+    def add_span(self, name, start, end, meta=None):
+        if len(self.spans)>=_MAX_SPANS: return
+        s={"name":name, "start_ms":round((start-self.t0)*1000,3), "ms":round((end-start)*1000,3)}
+        if meta: s.update(meta)
+        with self._lock: self.spans.append(s)
+
+    def add_stack(self, folded):
+        with self._lock:
+            self.samples+=1
+            if folded in self.stacks or len(self.stacks)<_MAX_STACKS: self.stacks[folded]+=1
+
+    def summary(self):
+        return {"id":self.id, "tenant":self.tenant, "method":self.method, "path":self.path,
+                "reason":self.reason, "started":self.started, "duration_ms":self.duration_ms,
+                "status":self.status, "spans":len(self.spans), "samples":self.samples}
+
+    def to_dict(self, top=50):
+        totals={}
+        for s in self.spans:
+            t=totals.setdefault(s["name"], {"count":0, "ms":0.0}); t["count"]+=1; t["ms"]=round(t["ms"]+s["ms"],3)
+        leaf=Counter()
+        for stack, n in self.stacks.items(): leaf[stack.rsplit(";",1)[-1]]+=n
+        d=self.summary()
+        d.update({"overlapped":self.overlapped, "span_totals":totals, "spans":list(self.spans),
+                  "top_functions":[{"frame":f, "samples":n} for f,n in leaf.most_common(top)],
+                  "stacks":[{"stack":s, "samples":n} for s,n in self.stacks.most_common(top)]})
+        return d
+
+class _Sampler:
+    """One daemon thread that samples app frames while any profiled request is active."""
+    def __init__(self):
+        self._lock=threading.Lock(); self._active=set(); self._thread=None
+    def interval(self):
+        try: return max(0.001, float(os.getenv("PROFILE_INTERVAL_MS", "5"))/1000.0)
+        except ValueError: return 0.005
+    def start(self, tr):
+        with self._lock:
+            self._active.add(tr)
+            if len(self._active)>1:
+                for t in self._active: t.overlapped=True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread=threading.Thread(target=self._run, name="profile-sampler", daemon=True); self._thread.start()
+    def stop(self, tr):
+        with self._lock: self._active.discard(tr)
+    def _run(self):
+        me=threading.get_ident(); step=self.interval()
+        while True:
+            with self._lock:
+                active=list(self._active)
+                if not active: self._thread=None; return
+            for ident, frame in sys._current_frames().items():
+                if ident==me: continue
+                folded=_fold(frame)
+                if folded:
+                    for tr in active: tr.add_stack(folded)
+            time.sleep(step)
+
+def _fold(frame):
+    # root->leaf "module:function" chain; stacks without app code are idle workers
+    parts=[]; in_app=False; depth=0
+    while frame is not None and depth<_MAX_DEPTH:
+        co=frame.f_code; fn=co.co_filename
+        if fn.startswith(_APP_ROOT): in_app=True
+        parts.append(f"{os.path.basename(fn)}:{co.co_name}:{frame.f_lineno}")
+        frame=frame.f_back; depth+=1
+    return ";".join(reversed(parts)) if in_app else None
+
+class ProfileStore:
+    """
+    Bounded ring buffer of finished traces plus the runtime trigger config.
+    `tenant=None` means "all tenants" (env config, tests); the admin API always
+    passes the caller's tenant. Route triggers set at runtime are per tenant;
+    PROFILE_ROUTES applies to every tenant.
+    """
+    def __init__(self, size=None):
+        self._lock=threading.Lock(); self._ids=count(1)
+        self._buf=deque(maxlen=size or int(os.getenv("PROFILE_BUFFER_SIZE", "50")))
+        self.tenants=set(_env_list("PROFILE_TENANTS")); self.routes=_env_list("PROFILE_ROUTES")
+        self.tenant_routes={}
+        self.allow_header=os.getenv("PROFILE_ALLOW_HEADER", "1")=="1"
+    def next_id(self):
+        return f"p{int(time.time())}-{next(self._ids)}"
+    def add(self, tr):
+        with self._lock: self._buf.append(tr)
+    def _mine(self, t, tenant):
+        return tenant is None or t.tenant==tenant
+    def list(self, tenant=None):
+        with self._lock: return [t.summary() for t in reversed(self._buf) if self._mine(t, tenant)]
+    def get(self, tid, tenant=None):
+        with self._lock:
+            for t in self._buf:
+                if t.id==tid and self._mine(t, tenant): return t
+        return None
+    def clear(self, tenant=None):
+        with self._lock:
+            keep=[t for t in self._buf if not self._mine(t, tenant)]
+            n=len(self._buf)-len(keep); self._buf.clear(); self._buf.extend(keep); return n
+    def routes_for(self, tenant):
+        return self.routes+self.tenant_routes.get(tenant, [])
+    def config(self, tenant=None):
+        if tenant is None:
+            tenants=sorted(self.tenants); routes=list(self.routes)
+        else:
+            tenants=[tenant] if tenant in self.tenants else []; routes=self.routes_for(tenant)
+        return {"tenants":tenants, "routes":routes, "allow_header":self.allow_header,
+                "buffer_size":self._buf.maxlen, "interval_ms":round(_sampler.interval()*1000,3)}
+    def configure(self, tenants=None, routes=None, allow_header=None, tenant=None):
+        """With `tenant`, only that tenant's own profiling can be switched; anything else raises PermissionError."""
+        if tenant is None:
+            if tenants is not None: self.tenants=set(tenants)
+            if routes is not None: self.routes=list(routes)
+            if allow_header is not None: self.allow_header=bool(allow_header)
+            return self.config()
+        if tenants is not None and not set(tenants)<={tenant}:
+            raise PermissionError("can only profile your own tenant")
+        if allow_header is not None:
+            raise PermissionError("allow_header is set per deployment (PROFILE_ALLOW_HEADER)")
+        if tenants is not None:
+            (self.tenants.add if tenant in tenants else self.tenants.discard)(tenant)
+        if routes is not None:
+            if routes: self.tenant_routes[tenant]=list(routes)
+            else: self.tenant_routes.pop(tenant, None)
+        return self.config(tenant)
+
+_sampler=_Sampler()
+profiles=ProfileStore()
+
+def current_trace():
+    return _trace.get()
+
+@contextmanager
+def span(name, **meta):
+    """Time a block into the active profile; a no-op for unprofiled requests."""
+    tr=_trace.get()
+    if tr is None:
+        yield; return
+    t0=time.perf_counter()
+    try: yield
+    finally: tr.add_span(name, t0, time.perf_counter(), meta)
+
+class MongoSpanListener(monitoring.CommandListener):
+    """Records every Mongo command issued while a profiled request is active."""
+    def started(self, event):
+        tr=_trace.get()
+        if tr is not None:
+            tr.pending[event.request_id]=(time.perf_counter(), event.command.get(event.command_name))
+    def _finish(self, event, ok):
+        tr=_trace.get()
+        if tr is None: return
+        t0, coll=tr.pending.pop(event.request_id, (None, None))
+        end=time.perf_counter()
+        if t0 is None: t0=end-event.duration_micros/1e6
+        meta={"collection":coll} if isinstance(coll, str) else {}
+        if not ok: meta["failed"]=True
+        tr.add_span(f"mongo.{event.command_name}", t0, end, meta)
+    def succeeded(self, event): self._finish(event, True)
+    def failed(self, event): self._finish(event, False)
+
+mongo_spans=MongoSpanListener()
+
+class JSONResponse(_StarletteJSONResponse):
+    """Default response class; times serialization under the json.encode span."""
+    def render(self, content):
+        with span("json.encode"):
+            return super().render(content)
+
+def _is_owner(claims):
+    if not isinstance(claims, dict): return False
+    roles=claims.get("roles") if isinstance(claims.get("roles"), list) else []
+    return str(claims.get("role") or "").lower()=="owner" or "owner" in [str(r).lower() for r in roles]
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware (no per-request task) so unprofiled requests only pay
+    a few dict lookups. Mount it inside TenancyMiddleware so claims are set.
+    """
+    def __init__(self, app, store=None):
+        self.app=app; self.store=store or profiles
+
+    def _reason(self, scope):
+        st=scope.get("state") or {}
+        tn=st.get("tenant") or parse_tenant(dict(scope.get("headers") or []).get(b"host", b"").decode("latin-1"))
+        path=scope.get("path", "")
+        if self.store.tenants and tn in self.store.tenants: return tn, "tenant"
+        routes=self.store.routes_for(tn)
+        if routes and any(path.startswith(r) for r in routes): return tn, "route"
+        if self.store.allow_header:
+            for k, v in scope.get("headers") or []:
+                if k==b"x-profile" and v.strip() in (b"1", b"true"):
+                    return tn, ("header" if _is_owner(st.get("claims")) else None)
+        return tn, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http":
+            return await self.app(scope, receive, send)
+        tn, reason=self._reason(scope)
+        if not reason:
+            return await self.app(scope, receive, send)
+        tr=ProfileTrace(self.store.next_id(), tn, scope.get("method"), scope.get("path"), reason)
+
+        async def send_wrapper(message):
+            if message["type"]=="http.response.start":
+                tr.status=message["status"]
+                message.setdefault("headers", [])
+                message["headers"]=list(message["headers"])+[(b"x-profile-id", tr.id.encode())]
+            await send(message)
+
+        token=_trace.set(tr); _sampler.start(tr)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _sampler.stop(tr); _trace.reset(token)
+            tr.duration_ms=round((time.perf_counter()-tr.t0)*1000, 3)
+            self.store.add(tr)
@@ -0,0 +1,67 @@
+# app/common/ranged.py
+"""
+Conditional / ranged responses for immutable bodies (artifacts, image derivatives).
+
+The caller supplies the size, a strong validator and a reader for an
+inclusive byte range. `If-None-Match` returns 304, a single `Range: bytes=`
+returns 206 (or 416), and anything else streams the whole body.
+"""
+from typing import Callable, Dict, Iterable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.services.artifacts import parse_range
+
+Reader = Callable[[int, Optional[int]], Iterable[bytes]]
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # strong comparison: weak validators never match an immutable body
+    return etag in (t.strip() for t in header.split(","))
+
+
+def ranged_response(request: Request, size: int, etag: str, media_type: str, read: Reader,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, **(headers or {})}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    rng_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if rng_header and if_range and if_range.strip() != etag:
+        rng_header = None  # the client's copy is stale: send the full body
+    try:
+        rng = parse_range(rng_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if rng is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(read(0, None), media_type=media_type, headers=headers)
+    start, end = rng
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(read(start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+def file_reader(path: str, chunk: int = 64 * 1024) -> Reader:
+    """Reader over a file; the file is opened when the response is built, so a
+    concurrent eviction (unlink) cannot break a response that is already streaming."""
+    def read(start: int, end: Optional[int]):
+        f = open(path, "rb")
+
+        def body():
+            with f:
+                f.seek(start)
+                left = None if end is None else end - start + 1
+                while left is None or left > 0:
+                    buf = f.read(chunk if left is None else min(chunk, left))
+                    if not buf:
+                        return
+                    if left is not None:
+                        left -= len(buf)
+                    yield buf
+        return body()
+    return read
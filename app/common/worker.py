@@ -1,48 +1,138 @@
-﻿from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-import logging, traceback, os
+﻿import asyncio, logging, threading, traceback, os, uuid
 
-scheduler = BackgroundScheduler()
+from app.common import jobcancel
 
-# Only start scheduler if not in CI or if explicitly enabled
-if os.getenv("USE_INMEMORY_DB") != "1" and os.getenv("DISABLE_SCHEDULER") != "1":
+# APScheduler is imported and started on first use (or from the app lifespan),
+# not at import time, so workers boot fast and tests never spawn its thread.
+_scheduler = None
+_lock = threading.Lock()
+
+def _env_float(name: str, default: float) -> float:
     try:
-        scheduler.start()
-        logging.info("Background scheduler started")
-    except Exception as e:
-        logging.warning(f"Failed to start scheduler: {e}")
-else:
-    logging.info("Background scheduler disabled for CI/testing environment")
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def scheduler_enabled() -> bool:
+    return os.getenv("USE_INMEMORY_DB") != "1" and os.getenv("DISABLE_SCHEDULER") != "1"
+
+def get_scheduler():
+    """
+    The process-wide BackgroundScheduler, created lazily.
+    It is started unless disabled for CI/testing (USE_INMEMORY_DB=1 / DISABLE_SCHEDULER=1).
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    with _lock:
+        if _scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            sched = BackgroundScheduler()
+            if scheduler_enabled():
+                try:
+                    sched.start()
+                    logging.info("Background scheduler started")
+                except Exception as e:
+                    logging.warning(f"Failed to start scheduler: {e}")
+            else:
+                logging.info("Background scheduler disabled for CI/testing environment")
+            _scheduler = sched
+    return _scheduler
+
+def current_scheduler():
+    """The scheduler if one was already created, without creating it."""
+    return _scheduler
+
+def shutdown(wait: bool = False) -> None:
+    """Stop the scheduler if it was ever started; called from the app lifespan."""
+    global _scheduler
+    with _lock:
+        sched, _scheduler = _scheduler, None
+    if sched is not None and sched.running:
+        try:
+            sched.shutdown(wait=wait)
+        except Exception as e:
+            logging.warning(f"Failed to stop scheduler: {e}")
+
+# cancel tokens of jobs submitted through submit_job, by job id (app/common/jobcancel.py)
+_tokens = {}
+
+def run_with_retries(func, args, kwargs, token, retries: int = 2, backoff: float = 1.0):
+    """
+    Call func until it succeeds, at most `retries` extra times, backing off
+    exponentially between attempts. All attempts share the token's deadline;
+    cancellation or the deadline ends the loop (JobCancelled) even mid-backoff.
+    """
+    token.start()
+    attempt = 0
+    try:
+        with jobcancel.bind(token):
+            while True:
+                token.check()
+                try:
+                    if asyncio.iscoroutinefunction(func):
+                        return asyncio.run(jobcancel.run_async(func, args, kwargs, token))
+                    return func(*args, **kwargs)
+                except jobcancel.JobCancelled:
+                    raise
+                except Exception as e:
+                    attempt += 1
+                    logging.error("Job %s failed (attempt %d): %s", token.job_id, attempt, e)
+                    traceback.print_exc()
+                    if attempt > retries:
+                        raise
+                    token.wait(backoff * 2 ** (attempt - 1))
+    finally:
+        token.finish()
 
 def submit_job(func, *args, **kwargs):
     """
-    Submit a background job with timeout and retry.
+    Submit a background job with a deadline and retry.
+    `timeout` (seconds, default per `module`, see jobcancel.DEFAULT_DEADLINES)
+    bounds all attempts together; cancel_job() stops it.
     Returns the job id.
     """
+    scheduler = get_scheduler()
     # Skip job submission if scheduler is not running
     if not scheduler.running:
         logging.warning("Scheduler not running, skipping job submission")
         return None
-        
+
     retries = kwargs.pop("retries", 2)
-    job_id = kwargs.pop("job_id", None)
+    job_id = kwargs.pop("job_id", None) or uuid.uuid4().hex
+    module = kwargs.pop("module", None)
+    timeout = kwargs.pop("timeout", None) or jobcancel.deadline_for(module)
+    backoff = _env_float("JOB_RETRY_BACKOFF_SECONDS", 1.0)
+    token = _tokens[job_id] = jobcancel.CancelToken(job_id, timeout)
 
     def wrapper(*a, **k):
-        attempt = 0
-        while attempt <= retries:
-            try:
-                return func(*a, **k)
-            except Exception as e:
-                attempt += 1
-                logging.error("Job %s failed (attempt %d): %s", job_id, attempt, e)
-                traceback.print_exc()
-                if attempt > retries:
-                    raise
+        try:
+            return run_with_retries(func, a, k, token, retries, backoff)
+        finally:
+            if _tokens.get(job_id) is token:
+                del _tokens[job_id]
 
     try:
+        from apscheduler.triggers.date import DateTrigger
         trigger = DateTrigger()
         job = scheduler.add_job(wrapper, trigger, args=args, kwargs=kwargs, id=job_id, replace_existing=True)
         return job.id
     except Exception as e:
+        _tokens.pop(job_id, None)
         logging.error(f"Failed to submit job: {e}")
         return None
+
+def cancel_job(job_id: str) -> bool:
+    """Drop a pending submit_job job, or stop it if it is running. False if unknown."""
+    removed = False
+    sched = current_scheduler()
+    if sched is not None:
+        try:
+            sched.remove_job(job_id)
+            removed = True
+        except Exception:
+            pass
+    token = _tokens.pop(job_id, None) if removed else _tokens.get(job_id)
+    if token is not None:
+        token.cancel()
+    return removed or token is not None
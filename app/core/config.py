@@ -32,11 +32,9 @@ def _coalesce_secret() -> str:
         return legacy
     raise RuntimeError("SECRET_KEY (or JWT_SECRET) is required")
 
-# Instantiate, but coerce SECRET_KEY if only JWT_SECRET exists
-tmp = Settings()
-if not os.getenv("SECRET_KEY") and tmp.JWT_SECRET:
-    # reconstruct with SECRET_KEY taken from JWT_SECRET
-    os.environ["SECRET_KEY"] = tmp.JWT_SECRET
-    tmp = Settings()
+# load_dotenv() above already copied .env into os.environ, so the legacy
+# JWT_SECRET fallback can be applied before the single Settings() instance
+if not os.getenv("SECRET_KEY") and os.getenv("JWT_SECRET"):
+    os.environ["SECRET_KEY"] = os.environ["JWT_SECRET"]
 
-settings = tmp
+settings = Settings()
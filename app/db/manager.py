@@ -1,21 +1,218 @@
+import logging
 import os
-from typing import Optional
-from pymongo import MongoClient
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+from app.common.observability import mongo_spans
+
+logger = logging.getLogger(__name__)
 
 _client: Optional[MongoClient] = None
 _db = None
+_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Connection pool listener that tracks how long requests wait for a socket.
+    A steadily growing wait time means MONGO_MAX_POOL_SIZE is too small
+    for the number of concurrent requests handled by this worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checked_in = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.pool_cleared = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+
+    def _wait_ms(self, event) -> float:
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return float(duration) * 1000.0
+        started = getattr(self._started, "t", None)
+        return (time.perf_counter() - started) * 1000.0 if started else 0.0
+
+    # --- listener callbacks ---------------------------------------------
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event): pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        self._started.t = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._wait_ms(event)
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_total_ms += waited
+            self.wait_max_ms = max(self.wait_max_ms, waited)
+
+    def connection_checked_out(self, event):
+        waited = self._wait_ms(event)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += waited
+            self.wait_max_ms = max(self.wait_max_ms, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_in += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "in_use": max(0, self.checkouts - self.checked_in),
+                "connections_open": max(0, self.connections_created - self.connections_closed),
+                "pool_cleared": self.pool_cleared,
+                "wait_avg_ms": round(self.wait_total_ms / attempts, 3) if attempts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    MongoClient keyword arguments built from the environment.
+    Pool sizes are per process, so size them per uvicorn worker.
+    """
+    opts: Dict[str, Any] = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_MS", 300_000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2_000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5_000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30_000),
+        "retryReads": True,
+        "retryWrites": True,
+        "appname": os.getenv("MONGO_APP_NAME", "trishul-api"),
+        "event_listeners": [pool_metrics, mongo_spans],
+    }
+    # zstd/snappy need optional packages; zlib is always available
+    compressors = os.getenv("MONGO_COMPRESSORS", "zlib").strip()
+    if compressors:
+        opts["compressors"] = compressors
+    return opts
+
+
+def get_client() -> MongoClient:
+    """
+    Lazy singleton client shared by every DB handle in this process.
+    Uses MONGO_URI (or mongodb://localhost:27017).
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+            # instantiate lazily, at first call (NOT at import)
+            _client = MongoClient(uri, **client_options())
+    return _client
+
 
 def get_db():
     """
     Lazy singleton DB handle.
     Uses MONGO_URI (or mongodb://localhost:27017), DB_NAME=trishul by default.
     """
-    global _client, _db
+    global _db
     if _db is not None:
         return _db
-    uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-    db_name = os.getenv("DB_NAME", "trishul")
-    # instantiate lazily, at first call (NOT at import)
-    _client = MongoClient(uri)
-    _db = _client[db_name]
+    _db = get_client()[os.getenv("DB_NAME", "trishul")]
     return _db
+
+
+def get_reporting_db():
+    """
+    Same database as get_db() but reads prefer secondaries.
+    Use it for dashboards and reports that can tolerate replication lag;
+    writes still go to the primary.
+    """
+    return get_client().get_database(
+        os.getenv("DB_NAME", "trishul"),
+        read_preference=ReadPreference.SECONDARY_PREFERRED,
+    )
+
+
+def get_core_db():
+    """Core (tenant registry) database, CORE_DB or DB_NAME."""
+    return get_client()[os.getenv("CORE_DB") or os.getenv("DB_NAME", "trishul")]
+
+
+def get_tenant_db(tenant: str):
+    """Per-tenant database for deployments that use database-per-tenant."""
+    return get_client()[f"{os.getenv('TENANT_DB_PREFIX', 'tenant_')}{tenant}"]
+
+
+def startup() -> None:
+    """
+    Called from the FastAPI lifespan: create the pool and verify the server
+    is reachable. A failed ping is logged, not raised, so the API can still
+    serve routes that do not touch Mongo.
+    """
+    client = get_client()
+    try:
+        client.admin.command("ping")
+        logger.info("Mongo connection pool ready (maxPoolSize=%s)", client.options.pool_options.max_pool_size)
+    except Exception as e:
+        logger.warning("Mongo ping failed at startup: %s", e)
+
+
+def shutdown() -> None:
+    """Close the pool on application shutdown."""
+    global _client, _db
+    with _lock:
+        if _client is not None:
+            try:
+                _client.close()
+            finally:
+                _client = None
+                _db = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    stats = pool_metrics.snapshot()
+    stats["max_pool_size"] = _client.options.pool_options.max_pool_size if _client is not None else None
+    stats["connected"] = _client is not None
+    return stats
@@ -0,0 +1,899 @@
+# app/db/memory.py
+"""
+Embedded in-memory stand-in for a Mongo database.
+
+Implements the subset of the PyMongo collection API the routers use
+(find/find_one/insert/update/delete/count/distinct/indexes) with:
+  - O(1) lookups by _id and through hash indexes on the leading index field
+  - sorted indexes for range filters and index-ordered sort + limit
+  - cursors with sort/skip/limit/projection, and aggregate() via app.db.pipeline
+  - a per-collection RLock so it is safe to share between worker threads
+"""
+from __future__ import annotations
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from itertools import count
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+_MISSING = object()
+_INF = float("inf")
+
+
+# ---------------------------------------------------------------------------
+# value helpers
+# ---------------------------------------------------------------------------
+def _copy(v: Any) -> Any:
+    """Cheap structural copy: only dicts/lists are duplicated."""
+    if isinstance(v, dict):
+        return {k: _copy(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_copy(x) for x in v]
+    return v
+
+
+def _order_key(v: Any) -> tuple:
+    """Total ordering across types, following Mongo's BSON comparison order."""
+    if v is None or v is _MISSING:
+        return (0,)
+    if isinstance(v, bool):
+        return (7, v)
+    if isinstance(v, (int, float)):
+        return (1, v)
+    if isinstance(v, str):
+        return (2, v)
+    if isinstance(v, dict):
+        return (3, repr(v))
+    if isinstance(v, (list, tuple)):
+        return (4, repr(v))
+    if isinstance(v, bytes):
+        return (5, v)
+    if isinstance(v, ObjectId):
+        return (6, v.binary)
+    if isinstance(v, datetime):
+        if v.tzinfo is None:
+            v = v.replace(tzinfo=timezone.utc)
+        return (8, v.timestamp())
+    return (9, repr(v))
+
+
+def _hkey(v: Any) -> Any:
+    """Hashable key for equality indexes (keeps True distinct from 1)."""
+    if isinstance(v, bool):
+        return ("b", v)
+    if isinstance(v, dict):
+        return ("d", tuple((k, _hkey(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple)):
+        return ("l", tuple(_hkey(x) for x in v))
+    if v is _MISSING:
+        return None
+    return v
+
+
+def _eq(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    try:
+        return a == b
+    except Exception:
+        return False
+
+
+def _get(doc: Any, path: str) -> Any:
+    """Resolve a dotted path; arrays of sub-documents fan out like Mongo."""
+    cur = doc
+    for part in path.split("."):
+        if isinstance(cur, dict):
+            cur = cur.get(part, _MISSING)
+        elif isinstance(cur, list):
+            if part.isdigit():
+                i = int(part)
+                cur = cur[i] if i < len(cur) else _MISSING
+            else:
+                vals = [_get(x, part) for x in cur if isinstance(x, dict)]
+                vals = [x for x in vals if x is not _MISSING]
+                cur = vals if vals else _MISSING
+        else:
+            return _MISSING
+        if cur is _MISSING:
+            return _MISSING
+    return cur
+
+
+def _candidates(v: Any) -> List[Any]:
+    """A value matches a condition if it, or any array element, matches."""
+    if isinstance(v, list):
+        return [v, *v]
+    return [v]
+
+
+def _cmp(a: Any, op: str, b: Any) -> bool:
+    ka, kb = _order_key(a), _order_key(b)
+    if ka[0] != kb[0]:
+        return False
+    if op == "$gt":
+        return ka > kb
+    if op == "$gte":
+        return ka >= kb
+    if op == "$lt":
+        return ka < kb
+    return ka <= kb
+
+
+def _is_op_dict(cond: Any) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(str(k).startswith("$") for k in cond)
+
+
+def _match_value(v: Any, cond: Any) -> bool:
+    if not _is_op_dict(cond):
+        if v is _MISSING:
+            return cond is None
+        if isinstance(cond, re.Pattern):
+            return any(isinstance(c, str) and cond.search(c) for c in _candidates(v))
+        if not isinstance(v, list):
+            return _eq(v, cond)
+        return any(_eq(c, cond) for c in _candidates(v))
+
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = _match_value(v, arg)
+        elif op == "$ne":
+            ok = not _match_value(v, arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if isinstance(v, list):
+                ok = any(_cmp(c, op, arg) for c in v)
+            else:
+                ok = v is not _MISSING and _cmp(v, op, arg)
+        elif op == "$in":
+            ok = any(_match_value(v, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(_match_value(v, a) for a in arg)
+        elif op == "$exists":
+            ok = (v is not _MISSING) == bool(arg)
+        elif op == "$regex":
+            flags = re.I if "i" in cond.get("$options", "") else 0
+            rx = arg if isinstance(arg, re.Pattern) else re.compile(arg, flags)
+            ok = any(isinstance(c, str) and rx.search(c) for c in _candidates(v))
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not _match_value(v, arg)
+        elif op == "$all":
+            ok = isinstance(v, list) and all(any(_eq(x, a) for x in v) for a in arg)
+        elif op == "$size":
+            ok = isinstance(v, list) and len(v) == arg
+        elif op == "$elemMatch":
+            ok = isinstance(v, list) and any(
+                match(x, arg) if isinstance(x, dict) else _match_value(x, arg) for x in v
+            )
+        else:
+            raise ValueError(f"unsupported query operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def match(doc: Dict[str, Any], filt: Optional[Dict[str, Any]]) -> bool:
+    """True if ``doc`` satisfies the Mongo-style filter ``filt``."""
+    if not filt:
+        return True
+    for key, cond in filt.items():
+        if key == "$and":
+            if not all(match(doc, f) for f in cond):
+                return False
+        elif key == "$or":
+            if not any(match(doc, f) for f in cond):
+                return False
+        elif key == "$nor":
+            if any(match(doc, f) for f in cond):
+                return False
+        else:
+            v = doc.get(key, _MISSING) if "." not in key else _get(doc, key)
+            if not _match_value(v, cond):
+                return False
+    return True
+
+
+def _normalize_keys(keys: Any, direction: Any = None) -> List[Tuple[str, Any]]:
+    if isinstance(keys, str):
+        return [(keys, 1 if direction is None else direction)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    out = []
+    for k in keys:
+        out.append((k, 1) if isinstance(k, str) else (k[0], k[1]))
+    return out
+
+
+def _project(doc: Dict[str, Any], projection: Any) -> Dict[str, Any]:
+    if not projection:
+        return _copy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {k: 1 for k in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and any(bool(v) for v in fields.values()):
+        out = {}
+        for k in fields:
+            top = k.split(".", 1)[0]
+            if top in doc:
+                out[top] = _copy(doc[top])
+    else:
+        out = {k: _copy(v) for k, v in doc.items() if k not in fields}
+    if include_id and "_id" in doc:
+        out["_id"] = doc["_id"]
+    elif not include_id:
+        out.pop("_id", None)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# update helpers
+# ---------------------------------------------------------------------------
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    cur = doc
+    for p in parts[:-1]:
+        nxt = cur.get(p)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            cur[p] = nxt
+        cur = nxt
+    cur[parts[-1]] = value
+
+
+def _unset_path(doc: Dict[str, Any], path: str) -> None:
+    parts = path.split(".")
+    cur = doc
+    for p in parts[:-1]:
+        cur = cur.get(p)
+        if not isinstance(cur, dict):
+            return
+    cur.pop(parts[-1], None)
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False) -> Dict[str, Any]:
+    if not any(str(k).startswith("$") for k in update):
+        # full replacement keeps the _id
+        new = _copy(update)
+        if "_id" in doc:
+            new["_id"] = doc["_id"]
+        return new
+
+    new = _copy(doc)
+    for op, spec in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in spec.items():
+            cur = _get(new, path)
+            if op in ("$set", "$setOnInsert"):
+                _set_path(new, path, _copy(arg))
+            elif op == "$unset":
+                _unset_path(new, path)
+            elif op == "$inc":
+                _set_path(new, path, (0 if cur is _MISSING else cur) + arg)
+            elif op == "$mul":
+                _set_path(new, path, (0 if cur is _MISSING else cur) * arg)
+            elif op == "$max":
+                if cur is _MISSING or _cmp(arg, "$gt", cur):
+                    _set_path(new, path, arg)
+            elif op == "$min":
+                if cur is _MISSING or _cmp(arg, "$lt", cur):
+                    _set_path(new, path, arg)
+            elif op in ("$push", "$addToSet"):
+                lst = [] if cur is _MISSING else list(cur)
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                for it in items:
+                    if op == "$push" or not any(_eq(x, it) for x in lst):
+                        lst.append(_copy(it))
+                if op == "$push" and isinstance(arg, dict) and "$slice" in arg:
+                    n = arg["$slice"]
+                    lst = lst[n:] if n < 0 else lst[:n]
+                _set_path(new, path, lst)
+            elif op == "$pull":
+                if isinstance(cur, list):
+                    _set_path(new, path, [x for x in cur if not _match_value(x, arg)])
+            else:
+                raise ValueError(f"unsupported update operator: {op}")
+    return new
+
+
+def _upsert_seed(filt: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    seed: Dict[str, Any] = {}
+    for k, v in (filt or {}).items():
+        if k.startswith("$"):
+            continue
+        if _is_op_dict(v):
+            if "$eq" in v:
+                _set_path(seed, k, _copy(v["$eq"]))
+            continue
+        _set_path(seed, k, _copy(v))
+    return seed
+
+
+# ---------------------------------------------------------------------------
+# results (same attribute names as pymongo.results)
+# ---------------------------------------------------------------------------
+class InsertOneResult:
+    __slots__ = ("inserted_id", "acknowledged")
+
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    __slots__ = ("inserted_ids", "acknowledged")
+
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    __slots__ = ("matched_count", "modified_count", "upserted_id", "acknowledged")
+
+    def __init__(self, matched, modified, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    __slots__ = ("deleted_count", "acknowledged")
+
+    def __init__(self, deleted):
+        self.deleted_count = deleted
+        self.acknowledged = True
+
+
+# ---------------------------------------------------------------------------
+# indexes
+# ---------------------------------------------------------------------------
+class _Index:
+    """
+    Secondary index. ``eq`` maps the leading field value to _ids (hash lookup);
+    ``ordered`` keeps (order_key, seq, _id) sorted for range scans and sort.
+    Array values are multikey: every element is indexed. Once an index has
+    seen an array, a range condition may be met by different elements for
+    each bound, so lookups only narrow and never answer a condition exactly.
+    """
+
+    __slots__ = ("name", "keys", "field", "unique", "sparse", "hashed", "multikey", "eq", "ordered", "uniq")
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False, sparse: bool = False):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.sparse = sparse
+        self.hashed = keys[0][1] == "hashed"
+        self.multikey = False
+        self.eq: Dict[Any, Set[Any]] = {}
+        self.ordered: List[tuple] = []
+        self.uniq: Dict[Any, Any] = {}
+
+    def _unique_key(self, doc):
+        vals = tuple(_get(doc, f) for f, _ in self.keys)
+        if self.sparse and all(v is _MISSING for v in vals):
+            return _MISSING
+        return tuple(_hkey(None if v is _MISSING else v) for v in vals)
+
+    def check(self, doc, _id) -> None:
+        if not self.unique:
+            return
+        k = self._unique_key(doc)
+        if k is _MISSING:
+            return
+        owner = self.uniq.get(k, _MISSING)
+        if owner is not _MISSING and owner != _id:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: {self.name} dup key: {k}")
+
+    def add(self, doc, _id, seq) -> None:
+        v = _get(doc, self.field)
+        if self.sparse and v is _MISSING:
+            return
+        if isinstance(v, list):
+            self.multikey = True
+        for c in _candidates(v):
+            self.eq.setdefault(_hkey(c), set()).add(_id)
+            if not self.hashed:
+                insort(self.ordered, (_order_key(c), seq, _id))
+        if self.unique:
+            k = self._unique_key(doc)
+            if k is not _MISSING:
+                self.uniq[k] = _id
+
+    def remove(self, doc, _id, seq) -> None:
+        v = _get(doc, self.field)
+        for c in _candidates(v):
+            ids = self.eq.get(_hkey(c))
+            if ids is not None:
+                ids.discard(_id)
+                if not ids:
+                    del self.eq[_hkey(c)]
+            if not self.hashed:
+                entry = (_order_key(c), seq, _id)
+                i = bisect_left(self.ordered, entry[:2])
+                while i < len(self.ordered) and self.ordered[i][:2] == entry[:2]:
+                    if self.ordered[i][2] == _id:
+                        del self.ordered[i]
+                        break
+                    i += 1
+        if self.unique:
+            k = self._unique_key(doc)
+            if k is not _MISSING and self.uniq.get(k) == _id:
+                del self.uniq[k]
+
+    def lookup(self, cond: Any) -> Optional[Set[Any]]:
+        """Candidate _ids for a condition on the leading field, or None if unusable."""
+        if not _is_op_dict(cond):
+            if isinstance(cond, (dict, re.Pattern)):
+                return None
+            return self.eq.get(_hkey(cond), set())  # read-only view, callers never mutate
+        if "$eq" in cond and len(cond) == 1:
+            return self.lookup(cond["$eq"])
+        if "$in" in cond and len(cond) == 1:
+            out: Set[Any] = set()
+            for v in cond["$in"]:
+                if isinstance(v, (dict, re.Pattern)):
+                    return None
+                out |= self.eq.get(_hkey(v), set())
+            return out
+        ranges = {k: v for k, v in cond.items() if k in ("$gt", "$gte", "$lt", "$lte")}
+        if ranges and not self.hashed and len(ranges) == len(cond):
+            if self.multikey:
+                # {"$gt": 1, "$lt": 5} matches [0, 10]: each bound may hold for a different element
+                ranges = dict([next(iter(ranges.items()))])
+            return {e[2] for e in self._range(ranges)}
+        return None
+
+    def _range(self, ranges: Dict[str, Any]) -> List[tuple]:
+        rank = _order_key(next(iter(ranges.values())))[0]
+        lo = bisect_left(self.ordered, ((rank,),))
+        hi = bisect_left(self.ordered, ((rank + 1,),))
+        for op, v in ranges.items():
+            k = _order_key(v)
+            if k[0] != rank:
+                return []
+            if op == "$gt":
+                lo = max(lo, bisect_right(self.ordered, (k, _INF)))
+            elif op == "$gte":
+                lo = max(lo, bisect_left(self.ordered, (k,)))
+            elif op == "$lt":
+                hi = min(hi, bisect_left(self.ordered, (k,)))
+            else:
+                hi = min(hi, bisect_right(self.ordered, (k, _INF)))
+        return self.ordered[lo:hi] if lo < hi else []
+
+    def info(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"key": list(self.keys), "v": 2}
+        if self.unique:
+            out["unique"] = True
+        if self.sparse:
+            out["sparse"] = True
+        return out
+
+
+# ---------------------------------------------------------------------------
+# cursor / collection / database
+# ---------------------------------------------------------------------------
+class MemoryCursor:
+    """Lazy cursor; the query runs on first iteration."""
+
+    def __init__(self, collection: "MemoryCollection", filt, projection=None,
+                 sort=None, skip: int = 0, limit: int = 0):
+        self._col = collection
+        self._filter = filt or {}
+        self._projection = projection
+        self._sort: Optional[List[Tuple[str, Any]]] = _normalize_keys(sort) if sort else None
+        self._skip = skip or 0
+        self._limit = limit or 0
+        self._it: Optional[Iterator[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _normalize_keys(key_or_list, direction)
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = int(n)
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = int(n)
+        return self
+
+    def batch_size(self, n: int) -> "MemoryCursor":
+        return self
+
+    def close(self) -> None:
+        self._it = iter(())
+
+    def __iter__(self) -> "MemoryCursor":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._it is None:
+            self._it = iter(self._col._run(self._filter, self._projection, self._sort, self._skip, self._limit))
+        return next(self._it)
+
+
+class MemoryCollection:
+    def __init__(self, name: str = "", database: "MemoryDB | None" = None):
+        self.name = name
+        self.database = database
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._seq: Dict[Any, int] = {}
+        self._counter = count()
+        self._indexes: Dict[str, _Index] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def full_name(self) -> str:
+        return f"{getattr(self.database, 'name', 'memory')}.{self.name}"
+
+    # --- query planning ---------------------------------------------------
+    def _candidate_ids(self, filt: Dict[str, Any]) -> Optional[Iterable[Any]]:
+        """Smallest candidate _id set from _id/index lookups; None means full scan."""
+        return self._plan(filt)[0]
+
+    def _plan(self, filt: Dict[str, Any]) -> Tuple[Optional[Iterable[Any]], Optional[str]]:
+        """(candidate ids or None for a full scan, filter key the lookup fully answered)."""
+        if "_id" in filt:
+            cond = filt["_id"]
+            try:
+                if not _is_op_dict(cond):
+                    return ([cond] if cond in self._docs else []), "_id"
+                if set(cond) == {"$in"}:
+                    return [i for i in cond["$in"] if i in self._docs], "_id"
+            except TypeError:
+                pass  # unhashable _id condition: fall through to a scan
+        best: Optional[Set[Any]] = None
+        best_key: Optional[str] = None
+        usable = [ix for ix in self._indexes.values() if ix.field in filt]
+        # equality lookups are O(1); only fall back to range scans without one
+        for ranged in (False, True):
+            for ix in usable:
+                cond = filt[ix.field]
+                is_range = _is_op_dict(cond) and not ({"$eq", "$in"} >= set(cond))
+                if is_range != ranged:
+                    continue
+                ids = ix.lookup(cond)
+                if ids is not None and (best is None or len(ids) < len(best)):
+                    # sparse and multikey indexes only narrow; the condition stays in the residual filter
+                    best, best_key = ids, (None if ix.sparse or ix.multikey else ix.field)
+                    if not best:
+                        return best, best_key
+            if best is not None:
+                break
+        return best, best_key
+
+    def _iter_matches(self, filt: Dict[str, Any], ordered: bool = True) -> Iterator[Any]:
+        ids, answered = self._plan(filt) if filt else (None, None)
+        if ids is None:
+            for _id, doc in self._docs.items():
+                if match(doc, filt):
+                    yield _id
+            return
+        if answered is not None:
+            # the index lookup already applied this condition exactly
+            filt = {k: v for k, v in filt.items() if k != answered}
+        # keep natural (insertion) order for candidate sets
+        if ordered and not isinstance(ids, list):
+            ids = sorted(ids, key=self._seq.__getitem__)
+        for _id in ids:
+            doc = self._docs.get(_id)
+            if doc is not None and match(doc, filt):
+                yield _id
+
+    def _sort_index(self, sort: List[Tuple[str, Any]]) -> Optional[_Index]:
+        if len(sort) != 1:
+            return None
+        field, _ = sort[0]
+        for ix in self._indexes.values():
+            if ix.field == field and not ix.hashed and not ix.sparse:
+                return ix
+        return None
+
+    def _select(self, filt, sort, skip, limit) -> List[Any]:
+        """Matching _ids after sort/skip/limit (called under the lock)."""
+        want = skip + limit if limit else 0
+        if sort:
+            ix = self._sort_index(sort)
+            ids, answered = self._plan(filt) if filt else (None, None)
+            if ix is not None and (ids is None or (want and len(ids) > 4 * want)):
+                # walk the sorted index and stop as soon as we have enough rows;
+                # a large candidate set from another index becomes a membership test
+                cand = None if ids is None else (ids if isinstance(ids, set) else set(ids))
+                residual = {k: v for k, v in filt.items() if k != answered} if answered else filt
+                entries = ix.ordered if sort[0][1] in (1, "asc") else reversed(ix.ordered)
+                out, seen = [], set()
+                for _, _, _id in entries:
+                    if _id in seen or (cand is not None and _id not in cand):
+                        continue
+                    seen.add(_id)
+                    if match(self._docs[_id], residual):
+                        out.append(_id)
+                        if want and len(out) >= want:
+                            break
+                return out[skip:]
+
+            ids = list(self._iter_matches(filt))
+            if len(sort) == 1:
+                field, direction = sort[0]
+                key = lambda i: _order_key(_get(self._docs[i], field))  # noqa: E731
+                desc = direction in (-1, "desc")
+                if want and want < len(ids):
+                    ids = heapq.nlargest(want, ids, key=key) if desc else heapq.nsmallest(want, ids, key=key)
+                else:
+                    ids.sort(key=key, reverse=desc)
+            else:
+                for field, direction in reversed(sort):
+                    ids.sort(key=lambda i, f=field: _order_key(_get(self._docs[i], f)),
+                             reverse=direction in (-1, "desc"))
+            return ids[skip:want or None]
+
+        out = []
+        for _id in self._iter_matches(filt):
+            out.append(_id)
+            if want and len(out) >= want:
+                break
+        return out[skip:]
+
+    def _run(self, filt, projection, sort, skip, limit) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [_project(self._docs[i], projection) for i in self._select(filt, sort, skip, limit)]
+
+    # --- reads --------------------------------------------------------------
+    @staticmethod
+    def _filter_arg(filt) -> Dict[str, Any]:
+        if filt is None:
+            return {}
+        if not isinstance(filt, dict):
+            return {"_id": filt}
+        return filt
+
+    def find(self, filter=None, projection=None, skip: int = 0, limit: int = 0, sort=None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, self._filter_arg(filter), projection, sort, skip, limit)
+
+    def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs) -> Optional[Dict[str, Any]]:
+        for doc in MemoryCursor(self, self._filter_arg(filter), projection, sort, 0, 1):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        filt = self._filter_arg(filter)
+        with self._lock:
+            if not skip and not limit:
+                if not filt:
+                    return len(self._docs)
+                if len(filt) == 1:
+                    # a single equality answered entirely by a non-sparse index
+                    (key, cond), = filt.items()
+                    if not isinstance(cond, (dict, re.Pattern)) and key != "_id":
+                        for ix in self._indexes.values():
+                            if ix.field == key and not ix.sparse:
+                                return len(ix.eq.get(_hkey(cond), ()))
+                return sum(1 for _ in self._iter_matches(filt, ordered=False))
+            return len(self._select(filt, None, skip, limit))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        from app.db import pipeline as _pipeline
+        return _pipeline.run(self, pipeline)
+
+    def distinct(self, key: str, filter=None, **kwargs) -> List[Any]:
+        out: List[Any] = []
+        seen: Set[Any] = set()
+        with self._lock:
+            for _id in self._iter_matches(self._filter_arg(filter)):
+                v = _get(self._docs[_id], key)
+                for c in (v if isinstance(v, list) else [v]):
+                    if c is _MISSING or _hkey(c) in seen:
+                        continue
+                    seen.add(_hkey(c))
+                    out.append(c)
+        return out
+
+    # --- writes -------------------------------------------------------------
+    def _insert(self, doc: Dict[str, Any]) -> Any:
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()  # pymongo also sets _id on the caller's dict
+        _id = doc["_id"]
+        if _id in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {_id!r}")
+        stored = _copy(doc)
+        for ix in self._indexes.values():
+            ix.check(stored, _id)
+        seq = next(self._counter)
+        self._docs[_id] = stored
+        self._seq[_id] = seq
+        for ix in self._indexes.values():
+            ix.add(stored, _id, seq)
+        return _id
+
+    def _replace(self, _id: Any, new: Dict[str, Any]) -> None:
+        old = self._docs[_id]
+        seq = self._seq[_id]
+        for ix in self._indexes.values():
+            ix.check(new, _id)
+        for ix in self._indexes.values():
+            ix.remove(old, _id, seq)
+        self._docs[_id] = new
+        for ix in self._indexes.values():
+            ix.add(new, _id, seq)
+
+    def _delete(self, _id: Any) -> None:
+        doc = self._docs.pop(_id)
+        seq = self._seq.pop(_id)
+        for ix in self._indexes.values():
+            ix.remove(doc, _id, seq)
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        with self._lock:
+            return InsertOneResult(self._insert(document))
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids = []
+        with self._lock:
+            for d in documents:
+                try:
+                    ids.append(self._insert(d))
+                except DuplicateKeyError:
+                    if ordered:
+                        raise
+        return InsertManyResult(ids)
+
+    def _update(self, filt, update, upsert: bool, many: bool, sort=None) -> Tuple[UpdateResult, Any, Any]:
+        """Returns (result, before, after) for the first touched document."""
+        filt = self._filter_arg(filt)
+        with self._lock:
+            ids = self._select(filt, _normalize_keys(sort) if sort else None, 0, 0 if many else 1)
+            if not ids:
+                if not upsert:
+                    return UpdateResult(0, 0), None, None
+                new = _apply_update(_upsert_seed(filt), update, inserting=True)
+                _id = self._insert(new)
+                return UpdateResult(0, 0, _id), None, self._docs[_id]
+            matched = modified = 0
+            before = after = None
+            for _id in ids:
+                old = self._docs[_id]
+                new = _apply_update(old, update)
+                matched += 1
+                if new != old:
+                    self._replace(_id, new)
+                    modified += 1
+                if before is None:
+                    before, after = old, self._docs[_id]
+            return UpdateResult(matched, modified), before, after
+
+    def update_one(self, filter, update, upsert: bool = False, sort=None, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert, many=False, sort=sort)[0]
+
+    def update_many(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert, many=True)[0]
+
+    def replace_one(self, filter, replacement, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update(filter, replacement, upsert, many=False)[0]
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert: bool = False,
+                            return_document: bool = False, **kwargs) -> Optional[Dict[str, Any]]:
+        _, before, after = self._update(filter, update, upsert, many=False, sort=sort)
+        doc = after if return_document else before
+        return _project(doc, projection) if doc is not None else None
+
+    def delete_one(self, filter, **kwargs) -> DeleteResult:
+        with self._lock:
+            ids = self._select(self._filter_arg(filter), None, 0, 1)
+            for _id in ids:
+                self._delete(_id)
+            return DeleteResult(len(ids))
+
+    def delete_many(self, filter, **kwargs) -> DeleteResult:
+        with self._lock:
+            ids = self._select(self._filter_arg(filter), None, 0, 0)
+            for _id in ids:
+                self._delete(_id)
+            return DeleteResult(len(ids))
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ids = self._select(self._filter_arg(filter), _normalize_keys(sort) if sort else None, 0, 1)
+            if not ids:
+                return None
+            doc = self._docs[ids[0]]
+            self._delete(ids[0])
+            return _project(doc, projection)
+
+    def drop(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._seq.clear()
+            self._indexes.clear()
+
+    # --- indexes ------------------------------------------------------------
+    def create_index(self, keys, unique: bool = False, name: Optional[str] = None,
+                     sparse: bool = False, **kwargs) -> str:
+        norm = _normalize_keys(keys)
+        name = name or "_".join(f"{f}_{d}" for f, d in norm)
+        with self._lock:
+            if name in self._indexes:
+                return name
+            ix = _Index(name, norm, unique=unique, sparse=sparse)
+            for _id, doc in self._docs.items():
+                ix.check(doc, _id)
+                ix.add(doc, _id, self._seq[_id])
+            self._indexes[name] = ix
+        return name
+
+    def create_indexes(self, indexes: Sequence[Any], **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            doc = getattr(model, "document", model)
+            keys = list(doc["key"].items()) if isinstance(doc["key"], dict) else doc["key"]
+            opts = {k: v for k, v in doc.items() if k != "key"}
+            names.append(self.create_index(keys, **opts))
+        return names
+
+    def drop_index(self, name: str) -> None:
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    def drop_indexes(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        with self._lock:
+            info.update({name: ix.info() for name, ix in self._indexes.items()})
+        return info
+
+    def list_indexes(self) -> Iterator[Dict[str, Any]]:
+        return iter([{"name": n, **i} for n, i in self.index_information().items()])
+
+
+class MemoryDB:
+    """Dict-of-collections database; collections are created on first access."""
+
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._cols: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        col = self._cols.get(name)
+        if col is None:
+            with self._lock:
+                col = self._cols.get(name)
+                if col is None:
+                    col = self._cols[name] = MemoryCollection(name, self)
+        return col
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._cols)
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._cols.pop(name, None)
+
+    def command(self, cmd, *args, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
@@ -0,0 +1,201 @@
+# app/db/pipeline.py
+"""
+Aggregation pipelines for the embedded stores (memory, sqlite).
+
+Supports the stages the services use: $match, $sort, $skip, $limit,
+$project, $addFields/$set, $group ($sum, $avg, $min, $max, $first, $last,
+$push, $addToSet), $count and $unionWith. Leading $match/$sort/$skip/$limit
+stages are pushed down into find() so they use the collection's indexes.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List
+
+from app.db.memory import _MISSING, _copy, _get, _hkey, _normalize_keys, _order_key, match
+
+_PUSHDOWN = ("$match", "$sort", "$skip", "$limit")
+
+
+def _eval(doc: Dict[str, Any], expr: Any) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        v = _get(doc, expr[1:])
+        return None if v is _MISSING else v
+    if isinstance(expr, dict):
+        if len(expr) == 1:
+            (op, arg), = expr.items()
+            if op == "$literal":
+                return arg
+            if op in ("$ifNull",):
+                for a in arg:
+                    v = _eval(doc, a)
+                    if v is not None:
+                        return v
+                return None
+            if op == "$size":
+                v = _eval(doc, arg)
+                return len(v) if isinstance(v, list) else 0
+            if op in ("$add", "$subtract", "$multiply", "$divide"):
+                vals = [_eval(doc, a) for a in arg]
+                if any(v is None for v in vals):
+                    return None
+                if op == "$add":
+                    return sum(vals)
+                if op == "$multiply":
+                    out = 1
+                    for v in vals:
+                        out *= v
+                    return out
+                if op == "$subtract":
+                    return vals[0] - vals[1]
+                return vals[0] / vals[1] if vals[1] else None
+        return {k: _eval(doc, v) for k, v in expr.items()}
+    return expr
+
+
+def _project(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    include = any(v in (1, True) for k, v in spec.items() if k != "_id")
+    computed = {k: v for k, v in spec.items() if v not in (0, 1, True, False)}
+    if include or computed:
+        out: Dict[str, Any] = {}
+        if spec.get("_id", 1) not in (0, False) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        for k, v in spec.items():
+            if k == "_id" and v in (0, 1, True, False):
+                continue
+            if v in (1, True):
+                val = _get(doc, k)
+                if val is not _MISSING:
+                    out[k] = _copy(val)
+            else:
+                out[k] = _eval(doc, v)
+        return out
+    return {k: _copy(v) for k, v in doc.items() if spec.get(k, 1) not in (0, False)}
+
+
+def _group(docs: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    key_expr = spec.get("_id")
+    groups: Dict[Any, Dict[str, Any]] = {}
+    order: List[Any] = []
+    accs = {k: v for k, v in spec.items() if k != "_id"}
+    for doc in docs:
+        key = _eval(doc, key_expr)
+        hk = _hkey(key)
+        g = groups.get(hk)
+        if g is None:
+            g = groups[hk] = {"_id": key, "__n": {}}
+            order.append(hk)
+        for name, acc in accs.items():
+            (op, arg), = acc.items()
+            v = _eval(doc, arg)
+            if op == "$sum":
+                g[name] = g.get(name, 0) + (v if isinstance(v, (int, float)) and not isinstance(v, bool) else 0)
+            elif op == "$avg":
+                if isinstance(v, (int, float)):
+                    g[name] = g.get(name, 0) + v
+                    g["__n"][name] = g["__n"].get(name, 0) + 1
+            elif op == "$min":
+                if v is not None and (name not in g or _order_key(v) < _order_key(g[name])):
+                    g[name] = v
+            elif op == "$max":
+                if v is not None and (name not in g or _order_key(v) > _order_key(g[name])):
+                    g[name] = v
+            elif op == "$first":
+                g.setdefault(name, v)
+            elif op == "$last":
+                g[name] = v
+            elif op == "$push":
+                g.setdefault(name, []).append(v)
+            elif op == "$addToSet":
+                lst = g.setdefault(name, [])
+                if all(_hkey(x) != _hkey(v) for x in lst):
+                    lst.append(v)
+            else:
+                raise ValueError(f"unsupported accumulator {op}")
+    out = []
+    for hk in order:
+        g = groups[hk]
+        n = g.pop("__n")
+        for name, acc in accs.items():
+            op = next(iter(acc))
+            if op == "$avg":
+                g[name] = g[name] / n[name] if n.get(name) else None
+            elif name not in g:
+                g[name] = [] if op in ("$push", "$addToSet") else (0 if op == "$sum" else None)
+        out.append(g)
+    return out
+
+
+def _sort(docs: List[Dict[str, Any]], spec) -> List[Dict[str, Any]]:
+    for field, direction in reversed(_normalize_keys(spec)):
+        docs.sort(key=lambda d: _order_key(_get(d, field)), reverse=direction == -1)
+    return docs
+
+
+def run(collection, pipeline: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Run `pipeline` against any collection exposing find() and .database."""
+    filt: Dict[str, Any] = {}
+    sort = None
+    skip = limit = 0
+    i = 0
+    # push a leading $match [$sort] [$skip] [$limit] into the indexed find()
+    while i < len(pipeline):
+        (stage, arg), = pipeline[i].items()
+        if stage not in _PUSHDOWN or (stage == "$match" and (sort or skip or limit or filt)) \
+                or (stage == "$sort" and (sort or skip or limit)) or (stage == "$skip" and limit):
+            break
+        if stage == "$match":
+            filt = arg
+        elif stage == "$sort":
+            sort = list(arg.items()) if isinstance(arg, dict) else arg
+        elif stage == "$skip":
+            skip = int(arg)
+        else:
+            limit = int(arg)
+        i += 1
+    cur = collection.find(filt)
+    if sort:
+        cur = cur.sort(sort)
+    if skip:
+        cur = cur.skip(skip)
+    if limit:
+        cur = cur.limit(limit)
+    docs: List[Dict[str, Any]] = list(cur)
+
+    for stage_doc in pipeline[i:]:
+        (stage, arg), = stage_doc.items()
+        if stage == "$match":
+            docs = [d for d in docs if match(d, arg)]
+        elif stage == "$sort":
+            docs = _sort(docs, list(arg.items()) if isinstance(arg, dict) else arg)
+        elif stage == "$skip":
+            docs = docs[int(arg):]
+        elif stage == "$limit":
+            docs = docs[:int(arg)]
+        elif stage == "$project":
+            docs = [_project(d, arg) for d in docs]
+        elif stage in ("$addFields", "$set"):
+            docs = [{**d, **{k: _eval(d, v) for k, v in arg.items()}} for d in docs]
+        elif stage == "$group":
+            docs = _group(docs, arg)
+        elif stage == "$count":
+            docs = [{arg: len(docs)}] if docs else []
+        elif stage == "$unionWith":
+            spec = {"coll": arg} if isinstance(arg, str) else arg
+            other = collection.database[spec["coll"]]
+            docs.extend(run(other, spec.get("pipeline") or []))
+        else:
+            raise ValueError(f"unsupported pipeline stage {stage}")
+    return iter(docs)
+
+
+def union(db, parts: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Run several (collection, pipeline) branches as one aggregate() call: the
+    first branch on its own collection, the rest via $unionWith. Works on
+    Mongo and on the embedded stores.
+    """
+    if not parts:
+        return []
+    (first_coll, first_stages), rest = parts[0], parts[1:]
+    pipeline = list(first_stages) + [{"$unionWith": {"coll": c, "pipeline": st}} for c, st in rest]
+    return list(db[first_coll].aggregate(pipeline))
@@ -0,0 +1,524 @@
+# app/db/sqlite_store.py
+"""
+Embedded on-disk backend for single-node deployments (DB_BACKEND=sqlite).
+
+Each collection is a table ``(id TEXT UNIQUE, doc TEXT)`` holding the document
+as JSON (ObjectId/datetime in Extended JSON form). ``create_index`` builds an
+expression index on ``json_extract(doc, '$.field')`` and conditions on indexed
+fields are pushed down to SQL; everything else is checked in Python with the
+same matcher the in-memory store uses, so results are identical either way.
+Sorts are pushed down only for indexed fields that have held nothing but
+strings and numbers: SQL orders Extended JSON dates as text, which is wrong
+(whole seconds drop the ".mmm" part), so datetime fields sort in Python.
+
+The database runs in WAL mode (readers never block the writer), uses one
+connection per thread and relies on sqlite3's prepared-statement cache, so
+every query is built from a fixed set of parameterised SQL strings.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo.errors import DuplicateKeyError
+
+from app.db.memory import (
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    MemoryCursor,
+    UpdateResult,
+    _MISSING,
+    _apply_update,
+    _get,
+    _is_op_dict,
+    _normalize_keys,
+    _order_key,
+    _project,
+    _upsert_seed,
+    match,
+)
+
+_FIELD_RE = re.compile(r"^[A-Za-z0-9_\-]+$")
+_META = "__trishul_indexes"
+
+
+def _encode(v: Any) -> str:
+    return json.dumps(v, default=json_util.default, separators=(",", ":"))
+
+
+def _hook(d: Dict[str, Any]) -> Any:
+    if len(d) <= 2 and any(k.startswith("$") for k in d):
+        return json_util.object_hook(d)
+    return d
+
+
+def _decode(text: str) -> Any:
+    return json.loads(text, object_hook=_hook)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _path(field: str) -> Optional[str]:
+    parts = field.split(".")
+    if not all(_FIELD_RE.match(p) for p in parts):
+        return None
+    return "$." + ".".join(f'"{p}"' for p in parts)
+
+
+def _expr(field: str) -> str:
+    return f"json_extract(doc, '{_path(field)}')"
+
+
+def _sql_scalar(v: Any) -> bool:
+    # values that json_extract returns unchanged (bools come back as 0/1)
+    return isinstance(v, (str, int, float)) and not isinstance(v, bool)
+
+
+def _unsortable(v: Any) -> bool:
+    # anything json_extract would not order like Mongo: Extended JSON objects, bools, subdocuments
+    return v is not _MISSING and v is not None and not _sql_scalar(v) and not isinstance(v, list)
+
+
+_RANGE_SQL = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _kinds(v: Any) -> str:
+    # keep Mongo's type bracketing: numbers only match numbers (json_extract turns
+    # true/false into 1/0), strings only strings
+    return "'text'" if isinstance(v, str) else "'integer','real'"
+
+
+class SQLiteCollection:
+    def __init__(self, database: "SQLiteDB", name: str):
+        self.database = database
+        self.name = name
+        self._table = _quote(name)
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        with database._write() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (id TEXT NOT NULL UNIQUE, doc TEXT NOT NULL)")
+        for name_, keys, unique, multikey, mixed in database._conn().execute(
+            f"SELECT name, keys, uniq, multikey, mixed FROM {_META} WHERE coll = ?", (name,)
+        ):
+            self._indexes[name_] = {"keys": [tuple(k) for k in json.loads(keys)],
+                                    "unique": bool(unique), "multikey": bool(multikey), "mixed": bool(mixed)}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # --- query compilation ----------------------------------------------
+    def _pushable_fields(self) -> Dict[str, bool]:
+        """Leading/compound index fields that never held arrays."""
+        out: Dict[str, bool] = {}
+        for ix in self._indexes.values():
+            if not ix["multikey"]:
+                for f, _ in ix["keys"]:
+                    out[f] = True
+        return out
+
+    def _compile(self, filt: Dict[str, Any]) -> Tuple[str, List[Any], bool]:
+        """
+        Translate the SQL-safe part of ``filt`` into a WHERE clause.
+        Returns (where, params, exact); exact=False means rows must still be
+        verified in Python.
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        exact = True
+        fields = self._pushable_fields()
+        for key, cond in filt.items():
+            if key == "_id":
+                if not _is_op_dict(cond):
+                    clauses.append("id = ?")
+                    params.append(_encode(cond))
+                    continue
+                if set(cond) == {"$in"}:
+                    clauses.append(f"id IN ({','.join('?' * len(cond['$in']))})" if cond["$in"] else "0")
+                    params.extend(_encode(v) for v in cond["$in"])
+                    continue
+                exact = False
+                continue
+            if key.startswith("$") or key not in fields or _path(key) is None:
+                exact = False
+                continue
+            expr, jtype = _expr(key), f"json_type(doc, '{_path(key)}')"
+            if not _is_op_dict(cond):
+                cond = {"$eq": cond}
+            for op, arg in cond.items():
+                if op == "$eq" and _sql_scalar(arg):
+                    clauses.append(f"{expr} = ? AND {jtype} IN ({_kinds(arg)})")
+                    params.append(arg)
+                elif op == "$in" and arg and all(_sql_scalar(a) for a in arg):
+                    groups: Dict[str, List[Any]] = {}
+                    for a in arg:
+                        groups.setdefault(_kinds(a), []).append(a)
+                    clauses.append("(" + " OR ".join(
+                        f"({expr} IN ({','.join('?' * len(vs))}) AND {jtype} IN ({kinds}))"
+                        for kinds, vs in groups.items()) + ")")
+                    for vs in groups.values():
+                        params.extend(vs)
+                elif op in _RANGE_SQL and _sql_scalar(arg):
+                    clauses.append(f"{expr} {_RANGE_SQL[op]} ? AND {jtype} IN ({_kinds(arg)})")
+                    params.append(arg)
+                else:
+                    exact = False
+        return (" AND ".join(clauses) or "1"), params, exact
+
+    def _sortable_fields(self) -> Dict[str, bool]:
+        """Pushable fields whose values SQL orders the way Mongo does (numbers, strings, null)."""
+        out: Dict[str, bool] = {}
+        for ix in self._indexes.values():
+            if not ix["multikey"] and not ix["mixed"]:
+                for f, _ in ix["keys"]:
+                    out[f] = True
+        return out
+
+    def _order_by(self, sort: Optional[List[Tuple[str, Any]]]) -> Optional[str]:
+        if not sort:
+            return "rowid"
+        fields = self._sortable_fields()
+        parts = []
+        for f, d in sort:
+            if f == "_id":
+                parts.append(f"rowid {'DESC' if d in (-1, 'desc') else 'ASC'}")
+                continue
+            if f not in fields:
+                return None
+            parts.append(f"{_expr(f)} {'DESC' if d in (-1, 'desc') else 'ASC'}")
+        return ", ".join(parts + ["rowid"])
+
+    def _rows(self, filt, sort, skip, limit) -> List[Tuple[int, Dict[str, Any]]]:
+        where, params, exact = self._compile(filt)
+        order = self._order_by(sort)
+        conn = self.database._conn()
+        if order is not None and exact:
+            sql = f"SELECT rowid, doc FROM {self._table} WHERE {where} ORDER BY {order}"
+            if limit or skip:
+                sql += " LIMIT ? OFFSET ?"
+                params = [*params, limit or -1, skip]
+            return [(r, _decode(d)) for r, d in conn.execute(sql, params)]
+
+        want = skip + limit if limit else 0
+        out: List[Tuple[int, Dict[str, Any]]] = []
+        sql = f"SELECT rowid, doc FROM {self._table} WHERE {where} ORDER BY {order or 'rowid'}"
+        for rowid, text in conn.execute(sql, params):
+            doc = _decode(text)
+            if exact or match(doc, filt):
+                out.append((rowid, doc))
+                if order is not None and want and len(out) >= want:
+                    break
+        if order is None:
+            for field, direction in reversed(sort):
+                out.sort(key=lambda r, f=field: _order_key(_get(r[1], f)), reverse=direction in (-1, "desc"))
+        return out[skip:want or None]
+
+    def _run(self, filt, projection, sort, skip, limit) -> List[Dict[str, Any]]:
+        return [_project(doc, projection) for _, doc in self._rows(filt, sort, skip, limit)]
+
+    # --- reads --------------------------------------------------------------
+    @staticmethod
+    def _filter_arg(filt) -> Dict[str, Any]:
+        if filt is None:
+            return {}
+        if not isinstance(filt, dict):
+            return {"_id": filt}
+        return filt
+
+    def find(self, filter=None, projection=None, skip: int = 0, limit: int = 0, sort=None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, self._filter_arg(filter), projection, sort, skip, limit)
+
+    def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs) -> Optional[Dict[str, Any]]:
+        for doc in MemoryCursor(self, self._filter_arg(filter), projection, sort, 0, 1):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        filt = self._filter_arg(filter)
+        where, params, exact = self._compile(filt)
+        if exact and not skip and not limit:
+            return self.database._conn().execute(f"SELECT COUNT(*) FROM {self._table} WHERE {where}", params).fetchone()[0]
+        return len(self._rows(filt, None, skip, limit))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return self.database._conn().execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        from app.db import pipeline as _pipeline
+        return _pipeline.run(self, pipeline)
+
+    def distinct(self, key: str, filter=None, **kwargs) -> List[Any]:
+        out: List[Any] = []
+        for _, doc in self._rows(self._filter_arg(filter), None, 0, 0):
+            v = _get(doc, key)
+            for c in (v if isinstance(v, list) else [v]):
+                if c is not _MISSING and c not in out:
+                    out.append(c)
+        return out
+
+    # --- writes -------------------------------------------------------------
+    def _note_multikey(self, conn, doc: Dict[str, Any]) -> None:
+        for name, ix in self._indexes.items():
+            if not ix["multikey"] and any(isinstance(_get(doc, f), list) for f, _ in ix["keys"]):
+                ix["multikey"] = True
+                conn.execute(f"UPDATE {_META} SET multikey = 1 WHERE coll = ? AND name = ?", (self.name, name))
+            if not ix["mixed"] and any(_unsortable(_get(doc, f)) for f, _ in ix["keys"]):
+                ix["mixed"] = True
+                conn.execute(f"UPDATE {_META} SET mixed = 1 WHERE coll = ? AND name = ?", (self.name, name))
+
+    def _insert(self, conn, doc: Dict[str, Any]) -> Any:
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        self._note_multikey(conn, doc)
+        try:
+            conn.execute(f"INSERT INTO {self._table} (id, doc) VALUES (?, ?)", (_encode(doc["_id"]), _encode(doc)))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}")
+        return doc["_id"]
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        with self.database._write() as conn:
+            return InsertOneResult(self._insert(conn, document))
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids = []
+        with self.database._write() as conn:
+            for d in documents:
+                try:
+                    ids.append(self._insert(conn, d))
+                except DuplicateKeyError:
+                    if ordered:
+                        raise
+        return InsertManyResult(ids)
+
+    def _update(self, filt, update, upsert: bool, many: bool, sort=None):
+        filt = self._filter_arg(filt)
+        with self.database._write() as conn:
+            rows = self._rows(filt, _normalize_keys(sort) if sort else None, 0, 0 if many else 1)
+            if not rows:
+                if not upsert:
+                    return UpdateResult(0, 0), None, None
+                new = _apply_update(_upsert_seed(filt), update, inserting=True)
+                _id = self._insert(conn, new)
+                return UpdateResult(0, 0, _id), None, new
+            matched = modified = 0
+            before = after = None
+            for rowid, old in rows:
+                new = _apply_update(old, update)
+                matched += 1
+                if new != old:
+                    self._note_multikey(conn, new)
+                    try:
+                        conn.execute(f"UPDATE {self._table} SET doc = ? WHERE rowid = ?", (_encode(new), rowid))
+                    except sqlite3.IntegrityError as e:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}")
+                    modified += 1
+                if before is None:
+                    before, after = old, new
+            return UpdateResult(matched, modified), before, after
+
+    def update_one(self, filter, update, upsert: bool = False, sort=None, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert, many=False, sort=sort)[0]
+
+    def update_many(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert, many=True)[0]
+
+    def replace_one(self, filter, replacement, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update(filter, replacement, upsert, many=False)[0]
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert: bool = False,
+                            return_document: bool = False, **kwargs) -> Optional[Dict[str, Any]]:
+        _, before, after = self._update(filter, update, upsert, many=False, sort=sort)
+        doc = after if return_document else before
+        return _project(doc, projection) if doc is not None else None
+
+    def _delete(self, filt, many: bool, sort=None) -> List[Dict[str, Any]]:
+        with self.database._write() as conn:
+            rows = self._rows(self._filter_arg(filt), _normalize_keys(sort) if sort else None, 0, 0 if many else 1)
+            conn.executemany(f"DELETE FROM {self._table} WHERE rowid = ?", [(r,) for r, _ in rows])
+            return [d for _, d in rows]
+
+    def delete_one(self, filter, **kwargs) -> DeleteResult:
+        return DeleteResult(len(self._delete(filter, many=False)))
+
+    def delete_many(self, filter, **kwargs) -> DeleteResult:
+        return DeleteResult(len(self._delete(filter, many=True)))
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs) -> Optional[Dict[str, Any]]:
+        docs = self._delete(filter, many=False, sort=sort)
+        return _project(docs[0], projection) if docs else None
+
+    def drop(self) -> None:
+        with self.database._write() as conn:
+            conn.execute(f"DELETE FROM {self._table}")
+            for name in list(self._indexes):
+                conn.execute(f"DROP INDEX IF EXISTS {_quote(self.name + '.' + name)}")
+            conn.execute(f"DELETE FROM {_META} WHERE coll = ?", (self.name,))
+        self._indexes.clear()
+
+    # --- indexes ------------------------------------------------------------
+    def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        norm = _normalize_keys(keys)
+        name = name or "_".join(f"{f}_{d}" for f, d in norm)
+        if name in self._indexes:
+            return name
+        if any(_path(f) is None for f, _ in norm):
+            raise ValueError(f"unsupported index field in {norm}")
+        cols = ", ".join(f"{_expr(f)}{' DESC' if d in (-1, 'desc') else ''}" for f, d in norm)
+        with self.database._write() as conn:
+            try:
+                conn.execute(
+                    f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "
+                    f"{_quote(self.name + '.' + name)} ON {self._table} ({cols})"
+                )
+            except sqlite3.IntegrityError as e:
+                raise DuplicateKeyError(f"E11000 cannot build unique index {name}: {e}")
+            # any array along the path makes json_extract unusable for matching
+            prefixes = {".".join(f.split(".")[:i]) for f, _ in norm for i in range(1, f.count(".") + 2)}
+            multikey = any(
+                conn.execute(
+                    f"SELECT 1 FROM {self._table} WHERE json_type(doc, '{_path(p)}') = 'array' LIMIT 1"
+                ).fetchone()
+                for p in sorted(prefixes)
+            )
+            # dates, ObjectIds and bools are stored as JSON objects / true / false
+            mixed = any(
+                conn.execute(
+                    f"SELECT 1 FROM {self._table} WHERE json_type(doc, '{_path(f)}') IN ('object', 'true', 'false')"
+                    " LIMIT 1"
+                ).fetchone()
+                for f, _ in norm
+            )
+            conn.execute(
+                f"INSERT OR REPLACE INTO {_META} (coll, name, keys, uniq, multikey, mixed) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, name, json.dumps(norm), int(unique), int(multikey), int(mixed)),
+            )
+        self._indexes[name] = {"keys": norm, "unique": unique, "multikey": multikey, "mixed": mixed}
+        return name
+
+    def drop_index(self, name: str) -> None:
+        with self.database._write() as conn:
+            conn.execute(f"DROP INDEX IF EXISTS {_quote(self.name + '.' + name)}")
+            conn.execute(f"DELETE FROM {_META} WHERE coll = ? AND name = ?", (self.name, name))
+        self._indexes.pop(name, None)
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        info: Dict[str, Dict[str, Any]] = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        for name, ix in self._indexes.items():
+            info[name] = {"key": list(ix["keys"]), "v": 2, **({"unique": True} if ix["unique"] else {})}
+        return info
+
+    def list_indexes(self) -> Iterator[Dict[str, Any]]:
+        return iter([{"name": n, **i} for n, i in self.index_information().items()])
+
+
+class SQLiteDB:
+    """A file-backed database; collections are tables created on first access."""
+
+    def __init__(self, path: str, name: str = "trishul"):
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._cols: Dict[str, SQLiteCollection] = {}
+        self._all: List[sqlite3.Connection] = []
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {_META} (coll TEXT NOT NULL, name TEXT NOT NULL, keys TEXT NOT NULL,"
+                " uniq INTEGER NOT NULL DEFAULT 0, multikey INTEGER NOT NULL DEFAULT 0,"
+                " mixed INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (coll, name))"
+            )
+            if "mixed" not in {r[1] for r in conn.execute(f"PRAGMA table_info({_META})")}:
+                # files from before value types were tracked: no sort pushdown until the index is recreated
+                conn.execute(f"ALTER TABLE {_META} ADD COLUMN mixed INTEGER NOT NULL DEFAULT 1")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode; writes open explicit transactions in _write()
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=256, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))}")
+            self._local.conn = conn
+            self._all.append(conn)
+        return conn
+
+    class _Tx:
+        def __init__(self, db: "SQLiteDB"):
+            self.db = db
+
+        def __enter__(self) -> sqlite3.Connection:
+            self.db._write_lock.acquire()
+            try:
+                self.conn = self.db._conn()
+                self.nested = self.conn.in_transaction
+                if not self.nested:
+                    self.conn.execute("BEGIN IMMEDIATE")
+            except Exception:
+                self.db._write_lock.release()
+                raise
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                if not self.nested:
+                    self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+            finally:
+                self.db._write_lock.release()
+            return False
+
+    def _write(self) -> "SQLiteDB._Tx":
+        """Serialised write transaction (one writer per process, WAL for readers)."""
+        return SQLiteDB._Tx(self)
+
+    def __getitem__(self, name: str) -> SQLiteCollection:
+        col = self._cols.get(name)
+        if col is None:
+            with self._write_lock:
+                col = self._cols.get(name)
+                if col is None:
+                    col = self._cols[name] = SQLiteCollection(self, name)
+        return col
+
+    def __getattr__(self, name: str) -> SQLiteCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> SQLiteCollection:
+        return self[name]
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        rows = self._conn().execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != ?", (_META,))
+        return [r[0] for r in rows]
+
+    def drop_collection(self, name: str) -> None:
+        self[name].drop()
+        with self._write() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        self._cols.pop(name, None)
+
+    def command(self, cmd, *args, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
+
+    def close(self) -> None:
+        for conn in self._all:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._all.clear()
+        self._local = threading.local()
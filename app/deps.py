@@ -1,44 +1,79 @@
 import os
+import threading
 from typing import Any, Dict
 
-class _DummyCollection:
-    def __init__(self): self._docs=[]
-    def count_documents(self, filt=None):
-        filt = filt or {}
-        return sum(all(d.get(k)==v for k,v in filt.items()) for d in self._docs)
-    def insert_one(self, doc):
-        self._docs.append(dict(doc))
-        return type("InsertOneResult", (), {"inserted_id": len(self._docs)})()
-    def find_one(self, filt=None):
-        filt = filt or {}
-        for d in reversed(self._docs):
-            if all(d.get(k)==v for k,v in filt.items()):
-                return d
-        return None
-    def find(self, filt=None):
-        filt = filt or {}
-        return [d for d in self._docs if all(d.get(k)==v for k,v in filt.items())]
+from app.db.memory import MemoryDB
 
-class _DummyDB:
-    def __init__(self): self._cols={}
-    def __getitem__(self, name):
-        if name not in self._cols:
-            self._cols[name] = _DummyCollection()
-        return self._cols[name]
+# Shared singleton used in tests and USE_INMEMORY_DB=1 mode (indexed, thread-safe)
+_TEST_DB = MemoryDB("trishul")
 
-# Shared singleton used in tests
-_TEST_DB = _DummyDB()
+_SQLITE_DB = None
+_SQLITE_LOCK = threading.Lock()
 
-def get_db():
+def using_inmemory_db() -> bool:
     # Use the singleton when running under pytest or when explicitly requested.
-    if "PYTEST_CURRENT_TEST" in os.environ or os.getenv("USE_INMEMORY_DB") == "1":
+    return "PYTEST_CURRENT_TEST" in os.environ or os.getenv("USE_INMEMORY_DB") == "1"
+
+def db_backend() -> str:
+    """Storage backend: "memory", "sqlite" (single-node, DB_BACKEND=sqlite) or "mongo"."""
+    if using_inmemory_db():
+        return "memory"
+    return (os.getenv("DB_BACKEND") or "mongo").strip().lower()
+
+def _sqlite_db():
+    global _SQLITE_DB
+    if _SQLITE_DB is None:
+        with _SQLITE_LOCK:
+            if _SQLITE_DB is None:
+                from app.db.sqlite_store import SQLiteDB
+                _SQLITE_DB = SQLiteDB(os.getenv("SQLITE_PATH", "data/trishul.db"))
+    return _SQLITE_DB
+
+def get_db():
+    backend = db_backend()
+    if backend == "memory":
         return _TEST_DB
+    if backend == "sqlite":
+        return _sqlite_db()
     # Otherwise try the real DB manager; if it fails, fall back to the singleton
     try:
         from app.db.manager import get_db as real_get_db
         return real_get_db()
     except Exception:
         return _TEST_DB
+
+def get_reporting_db():
+    """
+    Read-mostly handle for reports/dashboards: secondary-preferred reads on Mongo,
+    the same handle as get_db() on the embedded backends.
+    """
+    if db_backend() != "mongo":
+        return get_db()
+    try:
+        from app.db.manager import get_reporting_db as real_get_reporting_db
+        return real_get_reporting_db()
+    except Exception:
+        return _TEST_DB
+
+def startup_db() -> None:
+    """Lifespan hook: open the connection pool / database file for this worker."""
+    backend = db_backend()
+    if backend == "mongo":
+        from app.db import manager
+        manager.startup()
+    elif backend == "sqlite":
+        _sqlite_db()
+
+def shutdown_db() -> None:
+    """Lifespan hook: close pooled connections."""
+    global _SQLITE_DB
+    backend = db_backend()
+    if backend == "mongo":
+        from app.db import manager
+        manager.shutdown()
+    elif backend == "sqlite" and _SQLITE_DB is not None:
+        _SQLITE_DB.close()
+        _SQLITE_DB = None
 # -------- QC Repo provider (test-safe) ---------------------------------
 def get_qc_repo(db=None):
     """
@@ -65,7 +100,7 @@ def get_qc_repo(db=None):
         def list(self, tenant: str):
             # return newest-first like many UIs expect
             try:
-                return list(self._col(tenant).find({}))[-50:][::-1]
+                return list(self._col(tenant).find({}).sort("_id", -1).limit(50))
             except Exception:
                 return []
 
@@ -2,17 +2,39 @@
 import asyncio
 import logging
 
+from app.common.jobprogress import report
+
 logger = logging.getLogger(__name__)
 
+# simulated scan phases: (stage, checks run in that stage)
+KAVACH_STAGES = [
+    ("discovery", ["dns", "ping"]),
+    ("port scan", ["tcp-top-100", "tcp-top-1000", "udp-top-20"]),
+    ("service checks", ["tls", "http-headers", "ssh"]),
+    ("report", ["summary", "export"]),
+]
+TRINETRA_STAGES = ["load", "preprocess", "inference", "postprocess", "store"]
+
 
 async def run_kavach_scan(target: str) -> dict:
     """
     Simulated long-running Kavach vulnerability scan.
     In real implementation, hook into Nmap/OpenVAS or similar.
+    Each finished check is reported as a partial finding.
     """
     logger.info("Starting Kavach scan for target=%s", target)
-    await asyncio.sleep(10)  # simulate time-consuming work
-    result = {"target": target, "status": "done", "issues": []}
+    checks = [c for _, cs in KAVACH_STAGES for c in cs]
+    done = 0
+    findings = []
+    for stage, stage_checks in KAVACH_STAGES:
+        report(percent=100.0 * done / len(checks), stage=stage)
+        for check in stage_checks:
+            await asyncio.sleep(1)  # simulate time-consuming work
+            done += 1
+            finding = {"check": check, "target": target, "ok": True}
+            findings.append(finding)
+            report(percent=100.0 * done / len(checks), findings=[finding])
+    result = {"target": target, "status": "done", "issues": [f for f in findings if not f["ok"]]}
     logger.info("Completed Kavach scan for target=%s", target)
     return result
 
@@ -23,7 +45,10 @@ async def run_trinetra_inference(filename: str) -> dict:
     In real implementation, call ML model / service.
     """
     logger.info("Starting Trinetra inference for file=%s", filename)
-    await asyncio.sleep(5)  # simulate ML processing
+    for i, stage in enumerate(TRINETRA_STAGES):
+        report(percent=100.0 * i / len(TRINETRA_STAGES), stage=stage)
+        await asyncio.sleep(1)  # simulate ML processing
+    report(percent=100.0)
     result = {"filename": filename, "qc_passed": True}
     logger.info("Completed Trinetra inference for file=%s", filename)
-    return result
\ No newline at end of file
+    return result
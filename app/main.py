@@ -1,7 +1,7 @@
 ﻿# app/main.py - CLEAN VERSION FOR GITHUB ACTIONS
 import os
-from dotenv import load_dotenv
-load_dotenv()
+# loads .env (once) before the CI flags below are read
+from app.core.config import settings  # noqa: F401
 
 CI_MODE = os.getenv("USE_INMEMORY_DB") == "1"
 GITHUB_ACTIONS = os.getenv("GITHUB_ACTIONS") == "true" or os.getenv("CI") == "true"
@@ -61,11 +61,43 @@ if CI_MODE:
         keepalive_thread.start()
         print("[CI-DEBUG] Aggressive keep-alive system activated", flush=True)
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.middleware.tenancy_middleware import TenancyMiddleware
+from app.common.observability import JSONResponse, ProfilingMiddleware
+from app.deps import startup_db, shutdown_db
 
-app = FastAPI(title="Trishul Multi-Tenant Security Platform", version="2.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the DB pool once per worker and close it on shutdown
+    startup_db()
+    # recurring Kavach scans; a no-op when the scheduler is disabled (CI/tests)
+    from app.deps import get_db
+    from app.services import scan_schedule
+    scan_schedule.load_all(get_db())
+    # hourly all-tenant cost forecast / budget alert refresh (same condition)
+    from app.services import cost_forecast
+    cost_forecast.register_refresh()
+    # warm Trinetra model workers (none in CI/tests: the model runs in-process there)
+    from app.services import trinetra_pool
+    trinetra_pool.warm()
+    try:
+        yield
+    finally:
+        # stop background services only if something started them
+        from app.common import worker
+        worker.shutdown()
+        from app.common import jobqueue
+        jobqueue.shutdown()
+        trinetra_pool.shutdown()
+        # persist the streaming cost-anomaly state before the pool closes
+        from app.services import cost_anomaly
+        cost_anomaly.detector.flush(get_db(), force=True)
+        shutdown_db()
+
+app = FastAPI(title="Trishul Multi-Tenant Security Platform", version="2.0.0", lifespan=lifespan,
+              default_response_class=JSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -75,6 +107,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# added first so it runs inside TenancyMiddleware and sees request claims
+app.add_middleware(ProfilingMiddleware)
 app.add_middleware(TenancyMiddleware)
 
 from app.api import auth_routes, kavach, rudra, trinetra, nandi, admin, jobs_api
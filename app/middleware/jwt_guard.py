@@ -1,18 +1,9 @@
 ﻿from typing import Callable
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-import jwt
 import re
-import os
 
-# SECRET from settings or env (fallback for dev)
-try:
-    from app.core.config import settings  # type: ignore
-    SECRET = getattr(settings, "SECRET_KEY", None)
-except Exception:
-    SECRET = None
-if not SECRET:
-    SECRET = os.getenv("SECRET_KEY", "changeme")
+from app.auth import keyring
 
 def _tenant_from_host(host: str) -> str | None:
     # expect "<tenant>.lvh.me" or "<tenant>.<domain>"
@@ -43,24 +34,15 @@ class JWTGuardMiddleware:
 
         # only guard tenant subdomains; skip if we can't parse a tenant
         if tenant:
-            auth = request.headers.get("authorization", "")
-            if auth.startswith("Bearer "):
-                token = auth.split(" ", 1)[1].strip()
-                try:
-                    # require exp & aud; HS256 by default
-                    jwt.decode(
-                        token,
-                        SECRET,
-                        algorithms=["HS256"],
-                        audience=tenant, leeway=60,
-                        options={"require": ["exp", "aud"]},
-                    )
-                except Exception:
-                    res = JSONResponse(
-                        status_code=401,
-                        content={"detail": "invalid token: audience/expiry check failed"},
-                    )
-                    return await res(scope, receive, send)
+            try:
+                # require exp & aud; the verified claims are cached on scope["state"] for the routes
+                keyring.request_claims(request, audience=tenant, require=("exp", "aud"), leeway=60)
+            except keyring.InvalidToken:
+                res = JSONResponse(
+                    status_code=401,
+                    content={"detail": "invalid token: audience/expiry check failed"},
+                )
+                return await res(scope, receive, send)
 
         return await self.app(scope, receive, send)
 
@@ -1,25 +1,11 @@
 ﻿from fastapi import Request, status, HTTPException
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from jose import jwt, JWTError
 
-from app.core.config import settings
+from app.auth import keyring
 from app.auth.rbac import ensure_role
 
 
-def decode_token(token: str, expected_aud: str | None = None):
-    try:
-        return jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM],
-            audience=expected_aud if expected_aud else None,
-            options={"verify_aud": expected_aud is not None}
-        )
-    except JWTError as exc:
-        raise Exception(f"invalid token: {exc}")
-
-
 def _extract_tenant_from_host(host: str, local_domain: str) -> str | None:
     if not host:
         return None
@@ -44,18 +30,14 @@ class TenancyMiddleware(BaseHTTPMiddleware):
         # Default: no claims
         request.state.claims = None
 
-        # Decode JWT if provided
-        auth = request.headers.get("authorization", "")
-        if auth.lower().startswith("bearer "):
-            token = auth.split(" ", 1)[1].strip()
-            try:
-                claims = decode_token(token, tenant)
-                request.state.claims = claims
-            except Exception as exc:
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": f"invalid token: {exc}"},
-                )
+        # Decode JWT if provided: once per request, cached on request.state for the routes
+        try:
+            request.state.claims = keyring.request_claims(request, audience=tenant)
+        except keyring.InvalidToken as exc:
+            return JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={"detail": f"invalid token: {exc}"},
+            )
 
         # Enforce tenant match ONLY if token has a non-empty 'tid'
         if tenant and request.state.claims:
@@ -0,0 +1,249 @@
+# app/services/artifacts.py
+"""
+Compressed, chunked storage for large artifacts (report HTML/PDF, raw nmap XML).
+
+The hot collections only keep a small reference (`summary()`); the bytes are
+split into fixed-size chunks that are compressed independently (zstd when
+`zstandard` is installed, gzip otherwise). Because every chunk decompresses on
+its own, a ranged download only touches the chunks that cover the range.
+
+Chunks live either in `{tenant}_artifact_chunks` (GridFS-style, one document per
+chunk; works on every DB backend) or on local disk under ARTIFACT_DIR
+(ARTIFACT_BACKEND=local). Metadata is kept in `{tenant}_artifacts`.
+"""
+import gzip
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+META = "_artifacts"
+CHUNKS = "_artifact_chunks"
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,127}$")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+# --- codecs ---------------------------------------------------------------------
+
+def _zstd():
+    try:
+        import zstandard  # optional; gzip is used when it is missing
+    except ImportError:
+        return None
+    return zstandard
+
+
+def default_codec() -> str:
+    name = (os.getenv("ARTIFACT_CODEC") or "").strip().lower()
+    if name in ("zstd", "gzip", "none"):
+        return name if name != "zstd" or _zstd() else "gzip"
+    return "zstd" if _zstd() else "gzip"
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=_env_int("ARTIFACT_ZSTD_LEVEL", 3)).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=_env_int("ARTIFACT_GZIP_LEVEL", 6), mtime=0)
+    return data
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        mod = _zstd()
+        if mod is None:
+            raise RuntimeError("artifact is zstd-compressed but zstandard is not installed")
+        return mod.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+# --- chunk backends -------------------------------------------------------------
+
+class DBChunks:
+    """GridFS-style chunk documents in `{tenant}_artifact_chunks`."""
+
+    name = "db"
+
+    def __init__(self, db):
+        self.db = db
+
+    def _col(self, tenant: str):
+        return self.db[f"{tenant}{CHUNKS}"]
+
+    def write(self, tenant: str, artifact_id: str, chunks: List[bytes]) -> None:
+        col = self._col(tenant)
+        col.delete_many({"files_id": artifact_id})
+        if chunks:
+            col.insert_many([{"_id": f"{artifact_id}:{n}", "files_id": artifact_id, "n": n, "data": c}
+                             for n, c in enumerate(chunks)])
+
+    def read(self, tenant: str, artifact_id: str, n: int) -> bytes:
+        doc = self._col(tenant).find_one({"_id": f"{artifact_id}:{n}"})
+        if doc is None:
+            raise FileNotFoundError(f"artifact {artifact_id} chunk {n} missing")
+        return bytes(doc["data"])
+
+    def delete(self, tenant: str, artifact_id: str) -> None:
+        self._col(tenant).delete_many({"files_id": artifact_id})
+
+
+class LocalChunks:
+    """One file per chunk under `<root>/<tenant>/<artifact_id>/`."""
+
+    name = "local"
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def _dir(self, tenant: str, artifact_id: str) -> Path:
+        return self.root / tenant / artifact_id
+
+    def write(self, tenant: str, artifact_id: str, chunks: List[bytes]) -> None:
+        d = self._dir(tenant, artifact_id)
+        d.mkdir(parents=True, exist_ok=True)
+        for old in d.glob("*.chunk"):
+            old.unlink()
+        for n, c in enumerate(chunks):
+            tmp = d / f"{n:06d}.tmp"
+            tmp.write_bytes(c)
+            os.replace(tmp, d / f"{n:06d}.chunk")
+
+    def read(self, tenant: str, artifact_id: str, n: int) -> bytes:
+        return (self._dir(tenant, artifact_id) / f"{n:06d}.chunk").read_bytes()
+
+    def delete(self, tenant: str, artifact_id: str) -> None:
+        d = self._dir(tenant, artifact_id)
+        if d.is_dir():
+            for f in d.iterdir():
+                f.unlink()
+            d.rmdir()
+
+
+# --- store ----------------------------------------------------------------------
+
+class ArtifactStore:
+    def __init__(self, db, chunks=None, codec: Optional[str] = None, chunk_size: Optional[int] = None):
+        self.db = db
+        self.chunks = chunks or DBChunks(db)
+        self.codec = codec or default_codec()
+        self.chunk_size = max(1024, chunk_size or _env_int("ARTIFACT_CHUNK_KB", 255) * 1024)
+
+    @staticmethod
+    def _check(tenant: str, artifact_id: str) -> None:
+        # both end up in collection names / file paths
+        if not _SAFE_NAME.match(tenant or "") or not _SAFE_NAME.match(artifact_id or ""):
+            raise ValueError("invalid tenant or artifact id")
+
+    def _meta(self, tenant: str):
+        return self.db[f"{tenant}{META}"]
+
+    def put(self, tenant: str, data: Union[bytes, str], kind: str, content_type: str,
+            artifact_id: Optional[str] = None, **extra: Any) -> Dict[str, Any]:
+        """Store (or overwrite) an artifact and return its metadata document."""
+        artifact_id = artifact_id or uuid.uuid4().hex
+        self._check(tenant, artifact_id)
+        raw = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        cs = self.chunk_size
+        chunks = [compress(self.codec, raw[i:i + cs]) for i in range(0, len(raw), cs)]
+        self.chunks.write(tenant, artifact_id, chunks)
+        meta = {
+            "_id": artifact_id, "kind": kind, "content_type": content_type,
+            "size": len(raw), "stored_size": sum(len(c) for c in chunks),
+            "codec": self.codec, "chunk_size": cs, "chunks": len(chunks),
+            "sha256": hashlib.sha256(raw).hexdigest(), "backend": self.chunks.name,
+            "created_at": _now_iso(), **extra,
+        }
+        self._meta(tenant).replace_one({"_id": artifact_id}, meta, upsert=True)
+        return meta
+
+    def get(self, tenant: str, artifact_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            self._check(tenant, artifact_id)
+        except ValueError:
+            return None
+        return self._meta(tenant).find_one({"_id": artifact_id})
+
+    def iter_bytes(self, tenant: str, meta: Dict[str, Any], start: int = 0,
+                   end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield bytes [start, end] (inclusive), decompressing only the chunks involved."""
+        size = meta["size"]
+        end = size - 1 if end is None else min(end, size - 1)
+        if size == 0 or start > end:
+            return
+        cs = meta["chunk_size"]
+        for n in range(start // cs, end // cs + 1):
+            raw = decompress(meta["codec"], self.chunks.read(tenant, meta["_id"], n))
+            lo = max(start - n * cs, 0)
+            hi = min(end - n * cs + 1, len(raw))
+            yield raw[lo:hi]
+
+    def read(self, tenant: str, meta: Dict[str, Any]) -> bytes:
+        return b"".join(self.iter_bytes(tenant, meta))
+
+    def read_text(self, tenant: str, meta: Dict[str, Any]) -> str:
+        return self.read(tenant, meta).decode("utf-8")
+
+    def delete(self, tenant: str, artifact_id: str) -> bool:
+        if self.get(tenant, artifact_id) is None:
+            return False
+        self.chunks.delete(tenant, artifact_id)
+        self._meta(tenant).delete_one({"_id": artifact_id})
+        return True
+
+
+def get_store(db, codec: Optional[str] = None) -> ArtifactStore:
+    """Store configured by ARTIFACT_BACKEND (db | local) / ARTIFACT_DIR; pass codec="none" for
+    bodies that are already compressed (images)."""
+    backend = (os.getenv("ARTIFACT_BACKEND") or "db").strip().lower()
+    if backend == "local":
+        return ArtifactStore(db, LocalChunks(os.getenv("ARTIFACT_DIR", "data/artifacts")), codec=codec)
+    return ArtifactStore(db, codec=codec)
+
+
+def summary(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """The reference embedded in hot documents."""
+    return {"id": meta["_id"], "size": meta["size"], "stored_size": meta["stored_size"],
+            "content_type": meta["content_type"]}
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single `bytes=` range -> inclusive (start, end); None serves the whole body.
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None  # multipart ranges are answered with the full body
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0:
+                raise ValueError
+            start, end = max(size - n, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError("invalid range")
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
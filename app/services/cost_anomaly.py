@@ -0,0 +1,218 @@
+# app/services/cost_anomaly.py
+"""
+Streaming anomaly detection over ingested Rudra usage.
+
+Each (tenant, service) series keeps four numbers in flat arrays: an EWMA of
+cost, an EWMA of the absolute deviation (a robust spread estimate), the point
+count and the last timestamp. A new point is scored and folded in with O(1)
+work; the residual used for the update is clipped, so a spike does not drag
+the baseline along with it. A point whose robust z-score exceeds ANOMALY_Z
+(after ANOMALY_MIN_POINTS of warm-up) becomes a `rudra.cost_anomaly` event in
+the tenant's Nandi feed.
+
+The state lives in this worker's memory, is loaded per tenant on first use
+and is written to `rudra_anomaly_state` every ANOMALY_FLUSH_SECONDS and on
+shutdown. History is never re-scanned. Several workers share a tenant's
+document: a flush merges with what is stored (per series, the state with the
+newer last point wins) and writes back only if the document's `rev` has not
+moved in the meantime, retrying otherwise.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATE = "rudra_anomaly_state"
+_MAD_TO_SIGMA = 1.2533  # mean absolute deviation -> standard deviation (normal)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _pack(typecode: str, values) -> bytes:
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack(typecode: str, data) -> array:
+    a = array(typecode)
+    a.frombytes(bytes(data or b""))
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+class AnomalyDetector:
+    """Per-series EWMA / robust z-score state in flat arrays (~32 bytes a series)."""
+
+    def __init__(self, alpha: Optional[float] = None, z: Optional[float] = None,
+                 min_points: Optional[int] = None, min_cost: Optional[float] = None):
+        self.alpha = alpha if alpha is not None else _env_float("ANOMALY_ALPHA", 0.1)
+        self.z = z if z is not None else _env_float("ANOMALY_Z", 4.0)
+        self.min_points = min_points if min_points is not None else int(_env_float("ANOMALY_MIN_POINTS", 12))
+        self.min_cost = min_cost if min_cost is not None else _env_float("ANOMALY_MIN_COST", 1.0)
+        self.rel_floor = _env_float("ANOMALY_REL_FLOOR", 0.05)
+        self._index: Dict[Tuple[str, str], int] = {}
+        self._by_tenant: Dict[str, List[str]] = {}
+        self.mean = array("d")
+        self.dev = array("d")
+        self.n = array("q")
+        self.last = array("d")
+        self._loaded: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _slot(self, tenant: str, service: str) -> int:
+        key = (tenant, service)
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self.mean)
+            self._by_tenant.setdefault(tenant, []).append(service)
+            self.mean.append(0.0)
+            self.dev.append(0.0)
+            self.n.append(0)
+            self.last.append(0.0)
+        return i
+
+    def update(self, tenant: str, service: str, ts: float, value: float, alert: bool = True) -> Optional[Dict[str, Any]]:
+        """Score and absorb one point; returns the anomaly (if any). Late points are ignored."""
+        with self._lock:
+            i = self._slot(tenant, service)
+            n = self.n[i]
+            if n and ts <= self.last[i]:
+                return None
+            self.last[i] = ts
+            self._dirty.add(tenant)
+            if n == 0:
+                self.mean[i], self.dev[i], self.n[i] = value, 0.0, 1
+                return None
+            m, d = self.mean[i], self.dev[i]
+            sigma = max(_MAD_TO_SIGMA * d, self.rel_floor * abs(m), 1e-9)
+            score = (value - m) / sigma
+            r = max(-self.z * sigma, min(self.z * sigma, value - m))
+            self.mean[i] = m + self.alpha * r
+            self.dev[i] = d + self.alpha * (abs(r) - d)
+            self.n[i] = n + 1
+        if alert and n >= self.min_points and score >= self.z and value - m >= self.min_cost:
+            return {"service": service, "value": round(value, 4), "expected": round(m, 4), "z": round(score, 2)}
+        return None
+
+    # --- persistence ------------------------------------------------------------
+    def state_doc(self, tenant: str) -> Dict[str, Any]:
+        with self._lock:
+            services = list(self._by_tenant.get(tenant, []))
+            idx = [self._index[(tenant, s)] for s in services]
+            return {"_id": tenant, "services": services,
+                    "mean": _pack("d", (self.mean[i] for i in idx)), "dev": _pack("d", (self.dev[i] for i in idx)),
+                    "n": _pack("q", (self.n[i] for i in idx)), "last": _pack("d", (self.last[i] for i in idx)),
+                    "updated_at": datetime.utcnow().isoformat() + "Z"}
+
+    def load_doc(self, doc: Dict[str, Any], newer_only: bool = False) -> None:
+        """Adopt stored series; with `newer_only`, only those whose last point is newer than ours."""
+        tenant = doc["_id"]
+        mean, dev, n, last = (_unpack(tc, doc.get(f)) for tc, f in (("d", "mean"), ("d", "dev"), ("q", "n"), ("d", "last")))
+        with self._lock:
+            for k, service in enumerate(doc.get("services", [])):
+                i = self._slot(tenant, service)
+                if newer_only and self.n[i] and last[k] <= self.last[i]:
+                    continue
+                self.mean[i], self.dev[i], self.n[i], self.last[i] = mean[k], dev[k], n[k], last[k]
+
+    def ensure_loaded(self, db, tenant: str) -> None:
+        if tenant in self._loaded:
+            return
+        doc = db[STATE].find_one({"_id": tenant})
+        if doc:
+            self.load_doc(doc)
+        self._loaded.add(tenant)
+
+    def flush(self, db, force: bool = False) -> int:
+        """Persist the tenants touched since the last flush (every ANOMALY_FLUSH_SECONDS)."""
+        if not force and time.monotonic() - self._flushed_at < _env_float("ANOMALY_FLUSH_SECONDS", 60):
+            return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._flushed_at = time.monotonic()
+        for tenant in dirty:
+            self._write(db, tenant)
+        return len(dirty)
+
+    def _write(self, db, tenant: str, attempts: int = 5) -> bool:
+        """Merge with the stored document and replace it unless another worker wrote first."""
+        col = db[STATE]
+        for _ in range(attempts):
+            stored = col.find_one({"_id": tenant})
+            if stored is None:
+                try:
+                    col.insert_one({**self.state_doc(tenant), "rev": 1})
+                    return True
+                except DuplicateKeyError:
+                    continue
+            self.load_doc(stored, newer_only=True)
+            doc = {**self.state_doc(tenant), "rev": (stored.get("rev") or 0) + 1}
+            if col.replace_one({"_id": tenant, "rev": stored.get("rev")}, doc).matched_count:
+                return True
+        logger.warning("anomaly state for %s not saved: concurrent writers", tenant)
+        with self._lock:
+            self._dirty.add(tenant)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"series": len(self._index), "tenants": len(self._by_tenant), "dirty_tenants": len(self._dirty),
+                    "array_bytes": sum(a.itemsize * len(a) for a in (self.mean, self.dev, self.n, self.last)),
+                    "alpha": self.alpha, "z": self.z, "min_points": self.min_points}
+
+
+detector = AnomalyDetector()
+
+
+def observe(db, tenant: str, points: Iterable[Tuple[str, datetime, float, float]],
+            now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Feed freshly ingested points (service, ts, cost, qty) through the detector and
+    publish anomalies. Points older than ANOMALY_MAX_AGE_HOURS (backfilled exports)
+    train the state without alerting.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(hours=_env_float("ANOMALY_MAX_AGE_HOURS", 48))).timestamp()
+    detector.ensure_loaded(db, tenant)
+    found = []
+    for service, ts, cost, _qty in sorted(points, key=lambda p: p[1]):
+        epoch = ts.timestamp()
+        hit = detector.update(tenant, service, epoch, cost, alert=epoch >= cutoff)
+        if hit:
+            found.append({**hit, "ts": ts.isoformat().replace("+00:00", "Z")})
+    if found:
+        stamp = now.isoformat().replace("+00:00", "Z")
+        db[f"{tenant}_nandi"].insert_many([
+            {"type": "rudra.cost_anomaly", "severity": 5 if a["z"] >= 2 * detector.z else 4, "timestamp": stamp,
+             "message": f"{a['service']} cost {a['value']:.2f} vs expected {a['expected']:.2f}", **a}
+            for a in found
+        ])
+        logger.info("rudra anomalies for %s: %d", tenant, len(found))
+    detector.flush(db)
+    return found
+
+
+def recent(db, tenant: str, limit: int = 50) -> List[Dict[str, Any]]:
+    return list(db[f"{tenant}_nandi"].find({"type": "rudra.cost_anomaly"}, {"_id": 0})
+                .sort("timestamp", -1).limit(limit))
@@ -0,0 +1,294 @@
+# app/services/cost_forecast.py
+"""
+Monthly Rudra cost forecasts (`GET /costs/forecast`) and budget alerts.
+
+Per tenant, daily cost totals from the usage buckets are modelled as
+
+    cost(day) = trend(day) * weekday_factor * month_of_year_factor
+
+- trend: least-squares line over the last COST_FORECAST_TREND_DAYS (90) days
+- weekday factors: mean actual/trend ratio per weekday, once two weeks of data exist
+- month-of-year factors: mean ratio per calendar month, once a year of data exists
+
+Every step works on a (tenants x days) matrix, so the hourly refresh of all
+tenants is a few numpy operations per chunk instead of a model fit per tenant.
+Its results and the budget alerts go to `rudra_cost_forecasts`, and newly
+raised alerts are published to the tenant's Nandi feed.
+"""
+import calendar
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo.errors import DuplicateKeyError
+
+from app.db.pipeline import union
+from app.services import rudra_usage
+
+logger = logging.getLogger(__name__)
+
+FORECASTS = "rudra_cost_forecasts"
+BUDGETS = "rudra_budgets"
+LEASES = "rudra_cost_forecast_leases"
+MAX_MONTHS = 24
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def currency() -> str:
+    return os.getenv("COST_CURRENCY", "USD")
+
+
+def month_labels(today: date, months: int) -> List[str]:
+    y, m = today.year, today.month
+    out = []
+    for _ in range(months):
+        out.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+# --- model ------------------------------------------------------------------------
+
+def _factors(ratio, valid, index, n: int, enabled):
+    """Mean ratio per bucket of `index` (weekday / month), normalised to mean 1; 1 where disabled."""
+    import numpy as np
+
+    onehot = np.eye(n)[index]                                  # (days, n)
+    sums = np.where(valid, ratio, 0.0) @ onehot                 # (tenants, n)
+    counts = valid.astype(float) @ onehot
+    f = np.divide(sums, counts, out=np.ones_like(sums), where=counts > 0)
+    seen = counts > 0
+    mean = np.divide((f * seen).sum(1), seen.sum(1), out=np.ones(len(f)), where=seen.sum(1) > 0)
+    f = np.divide(f, mean[:, None], out=np.ones_like(f), where=mean[:, None] > 0)
+    f = np.where(seen, f, 1.0)
+    return np.where(enabled[:, None], f, 1.0)
+
+
+def _linfit(Y, W, t):
+    """Closed-form least squares y = a + b*t per row, over the days where W is set."""
+    import numpy as np
+
+    S0, S1, S2 = W.sum(1), (W * t).sum(1), (W * t * t).sum(1)
+    Sy, Sty = (W * Y).sum(1), (W * t * Y).sum(1)
+    den = S0 * S2 - S1 ** 2
+    b = np.divide(S0 * Sty - S1 * Sy, den, out=np.zeros(len(Y)), where=den > 0)
+    a = np.divide(Sy - b * S1, S0, out=np.zeros(len(Y)), where=S0 > 0)
+    return a, b
+
+
+def fit_predict(Y, first_day: date, today: date, months: int):
+    """
+    Y: (tenants, days) daily costs for [first_day, today). Returns (tenants, months)
+    predicted totals for the current month (month-to-date actuals included) onwards.
+    """
+    import numpy as np
+
+    Y = np.asarray(Y, dtype=float)
+    T, D = Y.shape
+    trend_days = _env_int("COST_FORECAST_TREND_DAYS", 90)
+    day0 = np.datetime64(first_day, "D")
+    days = day0 + np.arange(D)
+    t = np.arange(D, dtype=float)
+
+    has = Y > 0
+    started = np.where(has.any(axis=1), has.argmax(axis=1), D)
+    M = t[None, :] >= started[:, None]                          # days inside each tenant's history
+    history = D - started
+
+    # month-of-year seasonality against the long-run trend of the whole history
+    moy = days.astype("datetime64[M]").astype(int) % 12
+    a, b = _linfit(Y, M, t)
+    long_run = a[:, None] + b[:, None] * t
+    yearly_ratio = np.divide(Y, long_run, out=np.zeros_like(Y), where=long_run > 0)
+    mf = _factors(yearly_ratio, M & (long_run > 0), moy, 12, history >= 365)
+    Yd = Y / mf[:, moy]
+
+    # linear trend on the recent, de-seasonalised window
+    W = M & (t[None, :] >= D - trend_days)
+    a, b = _linfit(Yd, W, t)
+
+    # weekday seasonality of the residual (1970-01-01 was a Thursday -> Monday = 0)
+    wd = (days.astype(int) + 3) % 7
+    fit = a[:, None] + b[:, None] * t
+    ratio = np.divide(Yd, fit, out=np.zeros_like(Yd), where=fit > 0)
+    wf = _factors(ratio, W & (fit > 0), wd, 7, W.sum(1) >= 14)
+
+    # project every remaining day of the horizon and sum per month
+    labels = month_labels(today, months)
+    cur = np.datetime64(labels[0], "M")
+    end = (cur + months).astype("datetime64[D]")
+    fdays = np.arange(np.datetime64(today, "D"), end)
+    ft = D + (fdays - np.datetime64(today, "D")).astype(float)
+    fmoy = fdays.astype("datetime64[M]").astype(int) % 12
+    fwd = (fdays.astype(int) + 3) % 7
+    daily = np.clip((a[:, None] + b[:, None] * ft) * wf[:, fwd] * mf[:, fmoy], 0.0, None)
+    month_idx = (fdays.astype("datetime64[M]") - cur).astype(int)
+    out = np.zeros((T, months))
+    if len(fdays):
+        starts = np.flatnonzero(np.r_[True, month_idx[1:] != month_idx[:-1]])
+        out[:, month_idx[starts]] = np.add.reduceat(daily, starts, axis=1)
+    out[:, 0] += Y[:, days >= cur.astype("datetime64[D]")].sum(1)
+    return out
+
+
+# --- data -------------------------------------------------------------------------
+
+def discover_tenants(db) -> List[str]:
+    suffix = rudra_usage.USAGE
+    return sorted(n[: -len(suffix)] for n in db.list_collection_names() if n.endswith(suffix) and len(n) > len(suffix))
+
+
+def load_daily(db, tenants: Sequence[str], first_day: date, today: date):
+    """(tenants, days) matrix of daily totals for [first_day, today) from the yearly rollups."""
+    import numpy as np
+
+    D = (today - first_day).days
+    Y = np.zeros((len(tenants), D))
+    if not tenants or D <= 0:
+        return Y
+    years = list(range(first_day.year, today.year + 1))
+    stages = lambda i: [{"$match": {"year": {"$in": years}}},  # noqa: E731
+                        {"$project": {"_id": 0, "tenant": {"$literal": i}, "year": 1, "cost": 1}}]
+    for row in union(db, [(f"{t}{rudra_usage.DAILY}", stages(i)) for i, t in enumerate(tenants)]):
+        year = int(row["year"])
+        totals = np.frombuffer(bytes(row["cost"]), dtype="<f8")[: (date(year + 1, 1, 1) - date(year, 1, 1)).days]
+        offset = (date(year, 1, 1) - first_day).days
+        lo, hi = max(0, -offset), min(len(totals), D - offset)
+        if lo < hi:
+            Y[row["tenant"], offset + lo:offset + hi] = totals[lo:hi]
+    return Y
+
+
+def predict(db, tenants: Sequence[str], months: int, today: Optional[date] = None):
+    today = today or utc_today()
+    first = today - timedelta(days=_env_int("COST_FORECAST_WINDOW_DAYS", 730))
+    return fit_predict(load_daily(db, tenants, first, today), first, today, months)
+
+
+# --- budgets --------------------------------------------------------------------
+
+def get_budget(db, tenant: str) -> Optional[Dict[str, Any]]:
+    return db[BUDGETS].find_one({"_id": tenant})
+
+
+def set_budget(db, tenant: str, monthly: float, currency_code: Optional[str] = None) -> Dict[str, Any]:
+    if monthly <= 0:
+        raise ValueError("monthly budget must be positive")
+    doc = {"_id": tenant, "monthly": float(monthly), "currency": currency_code or currency(),
+           "updated_at": datetime.utcnow().isoformat() + "Z"}
+    db[BUDGETS].replace_one({"_id": tenant}, doc, upsert=True)
+    return doc
+
+
+def _money(amount: float) -> str:
+    return f"${amount:,.0f}" if float(amount).is_integer() else f"${amount:,.2f}"
+
+
+def alerts(labels: Sequence[str], predicted: Sequence[float], budget: Optional[float]) -> List[Dict[str, Any]]:
+    if not budget:
+        return []
+    out = []
+    for label, value in zip(labels, predicted):
+        if value > budget:
+            month = calendar.month_abbr[int(label[5:7])]
+            out.append({"type": "budget", "month": label, "predicted": round(float(value), 2), "budget": budget,
+                        "message": f"Likely to exceed {_money(budget)} in {month}"})
+    return out
+
+
+def tenant_forecast(db, tenant: str, months: int, predicted: Sequence[float],
+                    today: Optional[date] = None) -> Dict[str, Any]:
+    """Response body in the prototype schema (json_schemas.md, Rudra)."""
+    labels = month_labels(today or utc_today(), months)
+    budget = get_budget(db, tenant)
+    return {
+        "currency": (budget or {}).get("currency") or currency(),
+        "forecast": [{"month": m, "predicted": round(float(v), 2)} for m, v in zip(labels, predicted)],
+        "alerts": alerts(labels, predicted, (budget or {}).get("monthly")),
+    }
+
+
+# --- scheduled refresh ---------------------------------------------------------
+
+def _acquire_lease(db, seconds: int) -> bool:
+    """One refresh per period across all workers."""
+    now = time.time()
+    try:
+        db[LEASES].find_one_and_update({"_id": "refresh", "until": {"$lt": now}},
+                                       {"$set": {"until": now + seconds, "pid": os.getpid()}}, upsert=True)
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def refresh_all(db, months: int = 6, today: Optional[date] = None, tenants: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Recompute every tenant's forecast, evaluate budgets in bulk and publish new alerts."""
+    import numpy as np
+
+    started = time.perf_counter()
+    today = today or utc_today()
+    labels = month_labels(today, months)
+    tenants = tenants if tenants is not None else discover_tenants(db)
+    chunk = max(1, _env_int("COST_FORECAST_CHUNK", 500))
+    ts = datetime.utcnow().isoformat() + "Z"
+    n_alerts = n_new = 0
+    for i in range(0, len(tenants), chunk):
+        part = tenants[i:i + chunk]
+        preds = predict(db, part, months, today)
+        budgets = {d["_id"]: d for d in db[BUDGETS].find({"_id": {"$in": part}})}
+        limit = np.array([budgets.get(t, {}).get("monthly") or np.inf for t in part])
+        over = preds > limit[:, None]                            # bulk budget check
+        previous = {d["_id"]: d for d in db[FORECASTS].find({"_id": {"$in": part}}, {"alerts": 1})}
+        for row, t in enumerate(part):
+            doc_alerts = alerts(labels, preds[row], budgets[t]["monthly"]) if over[row].any() else []
+            n_alerts += len(doc_alerts)
+            known = {a["month"] for a in previous.get(t, {}).get("alerts", [])}
+            fresh = [a for a in doc_alerts if a["month"] not in known]
+            if fresh:
+                n_new += len(fresh)
+                db[f"{t}_nandi"].insert_many([{**a, "type": "rudra.budget_alert", "severity": 3, "timestamp": ts}
+                                              for a in fresh])
+            db[FORECASTS].replace_one({"_id": t}, {
+                "_id": t, "currency": (budgets.get(t) or {}).get("currency") or currency(),
+                "forecast": [{"month": m, "predicted": round(float(v), 2)} for m, v in zip(labels, preds[row])],
+                "alerts": doc_alerts, "computed_at": ts,
+            }, upsert=True)
+    elapsed = time.perf_counter() - started
+    stats = {"tenants": len(tenants), "alerts": n_alerts, "new_alerts": n_new, "seconds": round(elapsed, 3),
+             "tenants_per_sec": round(len(tenants) / elapsed, 1) if elapsed else None}
+    logger.info("cost forecast refresh: %s", stats)
+    return stats
+
+
+def _scheduled_refresh() -> None:
+    from app.deps import get_db
+    db = get_db()
+    period = _env_int("COST_FORECAST_REFRESH_MINUTES", 60) * 60
+    if _acquire_lease(db, max(60, period - 60)):
+        refresh_all(db, months=_env_int("COST_FORECAST_MONTHS", 6))
+
+
+def register_refresh() -> bool:
+    """Hourly (COST_FORECAST_REFRESH_MINUTES) refresh job; no-op when scheduling is disabled."""
+    from app.common import worker
+    if not worker.scheduler_enabled():
+        return False
+    sched = worker.get_scheduler()
+    if not sched.running:
+        return False
+    from apscheduler.triggers.interval import IntervalTrigger
+    sched.add_job(_scheduled_refresh, IntervalTrigger(minutes=_env_int("COST_FORECAST_REFRESH_MINUTES", 60)),
+                  id="rudra-cost-forecast-refresh", replace_existing=True, coalesce=True, max_instances=1)
+    return True
@@ -0,0 +1,170 @@
+# app/services/job_dedupe.py
+"""
+Idempotent job submission.
+
+A submission may claim up to two keys in `{tenant}_job_claims`. Each key
+maps to the id of the job that holds it.
+- `key:<sha256(Idempotency-Key)>` is the client's retry key. It is held for
+  JOB_IDEMPOTENCY_TTL (24 h). Reusing it with a different request body
+  raises KeyReused.
+- `target:<module>:<sha256(target)>` is the content dedupe key. It is held
+  for JOB_DEDUPE_WINDOW seconds (300; 0 disables) for the modules in
+  JOB_DEDUPE_MODULES ("kavach"). A holder that already failed or was
+  cancelled does not block a new scan.
+
+A claim is a find_one_and_update upsert on `_id`, guarded by
+`expires < now`. The cost-forecast refresh lease uses the same trick. Of
+any number of concurrent submitters, on any number of workers, exactly one
+inserts the claim. The others hit DuplicateKeyError and read back the
+winner's job id.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+CLAIMS = "_job_claims"
+
+INDEXES = {
+    CLAIMS: [("by_expires", [("expires", ASCENDING)], False)],
+}
+
+_PRUNE_EVERY = 60.0  # seconds between sweeps of expired claims, per tenant
+_indexed = set()
+_pruned: Dict[Tuple[int, str], float] = {}
+_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class KeyReused(ValueError):
+    """The Idempotency-Key was already used for a different request."""
+
+
+def dedupe_modules() -> List[str]:
+    return [m.strip() for m in os.getenv("JOB_DEDUPE_MODULES", "kavach").split(",") if m.strip()]
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def key_id(idempotency_key: str) -> str:
+    return f"key:{_sha(idempotency_key)}"
+
+
+def target_id(module: str, target: str) -> str:
+    return f"target:{module}:{_sha(target.strip().lower().rstrip('.'))}"
+
+
+def fingerprint(module: str, payload: Dict[str, Any]) -> str:
+    return _sha(json.dumps({"module": module, **payload}, sort_keys=True, default=str))
+
+
+def ensure_indexes(db, tenant: str) -> None:
+    key = (id(db), tenant)
+    if key in _indexed:
+        return
+    with _lock:
+        if key in _indexed:
+            return
+        for suffix, specs in INDEXES.items():
+            col = db[f"{tenant}{suffix}"]
+            for name, keys, unique in specs:
+                col.create_index(keys, name=name, unique=unique)
+        _indexed.add(key)
+
+
+def _prune(db, tenant: str, now: float) -> None:
+    key = (id(db), tenant)
+    with _lock:
+        if now - _pruned.get(key, 0.0) < _PRUNE_EVERY:
+            return
+        _pruned[key] = now
+    db[f"{tenant}{CLAIMS}"].delete_many({"expires": {"$lt": now}})
+
+
+def claim(db, tenant: str, claim_id: str, job_id: str, ttl: float, fp: Optional[str] = None,
+          takeover: Optional[Callable[[str], bool]] = None) -> Tuple[str, bool]:
+    """
+    (job_id, True) if this call now holds `claim_id`, else (holder's job id, False).
+    `takeover(holder)` returning True lets a dead holder's claim be replaced.
+    """
+    col = db[f"{tenant}{CLAIMS}"]
+    for _ in range(5):
+        now = time.time()
+        doc = {"job_id": job_id, "expires": now + ttl, "fingerprint": fp, "created": now}
+        try:
+            col.find_one_and_update({"_id": claim_id, "expires": {"$lt": now}}, {"$set": doc}, upsert=True)
+            return job_id, True
+        except DuplicateKeyError:
+            held = col.find_one({"_id": claim_id})
+        if held is None:
+            continue  # pruned between the upsert and the read
+        if fp and held.get("fingerprint") and held["fingerprint"] != fp:
+            raise KeyReused("Idempotency-Key was already used for a different request")
+        if takeover is not None and takeover(held["job_id"]):
+            # compare-and-swap on the holder, so only one of several retries replaces it
+            if col.update_one({"_id": claim_id, "job_id": held["job_id"]}, {"$set": doc}).modified_count:
+                return job_id, True
+            continue
+        return held["job_id"], False
+    raise RuntimeError(f"could not settle job claim {claim_id}")
+
+
+def release(db, tenant: str, claim_id: str, job_id: str) -> None:
+    db[f"{tenant}{CLAIMS}"].delete_one({"_id": claim_id, "job_id": job_id})
+
+
+def submit_once(db, tenant: str, module: str, payload: Dict[str, Any], submit: Callable[[str], None],
+                idempotency_key: Optional[str] = None, target: Optional[str] = None,
+                is_dead: Optional[Callable[[str], bool]] = None) -> Tuple[str, bool]:
+    """
+    Call submit(job_id) unless an equivalent job already exists.
+    Returns (job_id, created). If submit raises, every claim this call took is released.
+    """
+    window = _env_int("JOB_DEDUPE_WINDOW", 300)
+    use_target = bool(target) and window > 0 and module in dedupe_modules()
+    job_id = str(uuid.uuid4())
+    if not idempotency_key and not use_target:
+        submit(job_id)
+        return job_id, True
+
+    ensure_indexes(db, tenant)
+    _prune(db, tenant, time.time())
+    taken: List[str] = []
+    try:
+        if idempotency_key:
+            kid = key_id(idempotency_key)
+            holder, created = claim(db, tenant, kid, job_id, _env_int("JOB_IDEMPOTENCY_TTL", 86400),
+                                    fp=fingerprint(module, payload))
+            if not created:
+                return holder, False
+            taken.append(kid)
+        if use_target:
+            tid = target_id(module, target)
+            holder, created = claim(db, tenant, tid, job_id, window, takeover=is_dead)
+            if not created:
+                if taken:
+                    # later retries with this key should land on the coalesced job directly
+                    db[f"{tenant}{CLAIMS}"].update_one({"_id": taken[0], "job_id": job_id},
+                                                       {"$set": {"job_id": holder}})
+                return holder, False
+            taken.append(tid)
+        submit(job_id)
+        return job_id, True
+    except BaseException:
+        for cid in taken:
+            release(db, tenant, cid, job_id)
+        raise
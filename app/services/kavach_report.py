@@ -0,0 +1,48 @@
+# app/services/kavach_report.py
+"""Kavach report rendering shared by the per-tenant route and the batch job."""
+from datetime import datetime
+from html import escape
+from io import BytesIO
+from typing import Any, Dict, Iterable, Optional
+
+from app.common.observability import span
+
+
+def _e(value: Any) -> str:
+    # targets and hosts come from clients and scan output
+    return escape(str(value))
+
+
+def render_html(tenant: str, scans: int, qc: int, last_forecast: float, delta: Dict[str, int],
+                changes: Iterable[Dict[str, Any]] = (), generated_at: Optional[str] = None) -> str:
+    generated_at = generated_at or datetime.utcnow().isoformat() + "Z"
+    change_items = "".join(
+        f"<li>{_e(c['change'])}: {_e(c['target'])} {_e(c['host'])}:{_e(c['port'])}/{_e(c['protocol'])}</li>"
+        for c in list(changes)[:20]
+    )
+    tenant = _e(tenant)
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>Kavach Report - {tenant}</title></head>
+<body style="font-family:Arial, sans-serif">
+<h2>Kavach Security Report — {tenant}</h2>
+<ul>
+  <li>Total scans: {_e(scans)}</li>
+  <li>QC results: {_e(qc)}</li>
+  <li>Last forecast: {_e(last_forecast)}</li>
+  <li>Generated at: {_e(generated_at)}</li>
+</ul>
+<h3>Changes since last report</h3>
+<p>Opened: {_e(delta.get('opened', 0))} · Closed: {_e(delta.get('closed', 0))} · Service changes: {_e(delta.get('service_changed', 0))}</p>
+<ul>{change_items}</ul>
+</body></html>"""
+
+
+def render_pdf(html: str) -> bytes:
+    """HTML -> PDF with xhtml2pdf. Raises RuntimeError when rendering fails."""
+    from xhtml2pdf import pisa  # heavy (reportlab, pyhanko); loaded on first pdf
+    buf = BytesIO()
+    with span("pdf.render", engine="xhtml2pdf"):
+        status = pisa.CreatePDF(html, dest=buf)
+    if status.err:
+        raise RuntimeError("pdf generation failed")
+    return buf.getvalue()
@@ -1,16 +1,22 @@
 # app/services/kavach_runner.py
-import base64
 import io
 import shutil
-import subprocess
 from datetime import datetime, timezone
 from typing import Tuple
 
-from reportlab.lib.pagesizes import LETTER
-from reportlab.pdfgen import canvas
+from app.common import jobcancel
+from app.common.observability import span
 
 
 def _gen_pdf_bytes(target: str, summary: str) -> bytes:
+    with span("pdf.render", engine="reportlab"):
+        return _draw_pdf(target, summary)
+
+
+def _draw_pdf(target: str, summary: str) -> bytes:
+    from reportlab.lib.pagesizes import LETTER
+    from reportlab.pdfgen import canvas
+
     buf = io.BytesIO()
     c = canvas.Canvas(buf, pagesize=LETTER)
     c.setTitle("Kavach Scan Report")
@@ -35,26 +41,28 @@ def _gen_pdf_bytes(target: str, summary: str) -> bytes:
     return buf.getvalue()
 
 
-def run_nmap_or_mock(target: str) -> Tuple[str, str, str]:
+def run_nmap_or_mock(target: str) -> Tuple[str, str, bytes]:
     """
-    Returns (status, raw_xml, pdf_b64)
+    Returns (status, raw_xml, pdf_bytes)
     - status: 'completed' if real nmap ran, 'mocked' if fallback used
+    - pdf_bytes: raw PDF; store it with app.services.artifacts, not inline (base64 adds ~33%)
     """
     nmap_path = shutil.which("nmap")
     if nmap_path:
         try:
             # -oX - : write XML to stdout ; -T4 faster ; -Pn skip host discovery to avoid firewall drop
-            proc = subprocess.run(
+            # inside a job, cancelling it or its deadline kills nmap instead of waiting the full 180 s
+            proc = jobcancel.run_subprocess(
                 [nmap_path, "-oX", "-", "-T4", "-Pn", target],
-                capture_output=True,
-                text=True,
                 timeout=180,
                 check=True,
             )
             raw_xml = proc.stdout
             summary = f"Nmap executed at {datetime.now(timezone.utc).isoformat()}\nTarget: {target}\nBytes: {len(raw_xml)}"
             pdf_bytes = _gen_pdf_bytes(target, summary)
-            return "completed", raw_xml, base64.b64encode(pdf_bytes).decode("ascii")
+            return "completed", raw_xml, pdf_bytes
+        except jobcancel.JobCancelled:
+            raise
         except Exception as e:
             # fall through to mock
             err = str(e)
@@ -67,4 +75,4 @@ def run_nmap_or_mock(target: str) -> Tuple[str, str, str]:
 </nmaprun>"""
     summary = f"Mock scan at {datetime.now(timezone.utc).isoformat()} for {target}"
     pdf_bytes = _gen_pdf_bytes(target, summary)
-    return "mocked", raw_xml, base64.b64encode(pdf_bytes).decode("ascii")
+    return "mocked", raw_xml, pdf_bytes
@@ -0,0 +1,281 @@
+# app/services/report_batch.py
+"""
+Batch Kavach report generation for many tenants.
+
+Tenants are processed in sorted chunks. For each chunk the metrics of every
+tenant come from two aggregation pipelines ($unionWith across the per-tenant
+collections) instead of four queries per tenant. PDFs are rendered in a
+process pool; HTML/PDF bodies go to the artifact store and the report
+documents (metadata only) are written with one insert_many per collection.
+After every chunk the job document in `kavach_report_jobs` records the last
+finished tenant and the throughput, so a crashed run resumes where it stopped.
+Report ids are deterministic (`batch-<job_id>`), which makes re-writing a
+chunk that was written but not checkpointed harmless.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.db.pipeline import union
+from app.services import artifacts, kavach_report
+
+logger = logging.getLogger(__name__)
+
+JOBS = "kavach_report_jobs"
+# every tenant adds $unionWith stages to the metrics pipelines, which must stay
+# well under MongoDB's per-pipeline stage limit
+MAX_CHUNK = 200
+_TENANT_SUFFIXES = ("_scans", "_qc_results", "_rudra_forecasts", "_kavach_reports")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def discover_tenants(db) -> List[str]:
+    """Tenants that own at least one Kavach/Rudra/Trinetra collection."""
+    tenants = set()
+    for name in db.list_collection_names():
+        for suffix in _TENANT_SUFFIXES:
+            if name.endswith(suffix) and len(name) > len(suffix):
+                tenants.add(name[: -len(suffix)])
+    return sorted(tenants)
+
+
+# --- aggregation ----------------------------------------------------------------
+
+def _tag(tenant: str, metric: Any, value: str = "$value") -> Dict[str, Any]:
+    metric = metric if isinstance(metric, str) and metric.startswith("$") else {"$literal": metric}
+    return {"$project": {"_id": 0, "tenant": {"$literal": tenant}, "metric": metric, "value": value}}
+
+
+def collect_metrics(db, tenants: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Scan/QC counts, last forecast and change summary for every tenant in two pipelines."""
+    out = {t: {"scans": 0, "qc_results": 0, "last_forecast": 0.0, "prev_report_ts": None,
+               "changes": {"opened": 0, "closed": 0, "service_changed": 0}} for t in tenants}
+    count = [{"$group": {"_id": None, "value": {"$sum": 1}}}]
+    latest = [{"$sort": {"ts": -1}}, {"$limit": 1}]
+    parts = []
+    for t in tenants:
+        parts += [
+            (f"{t}_scans", count + [_tag(t, "scans")]),
+            (f"{t}_qc_results", count + [_tag(t, "qc_results")]),
+            (f"{t}_rudra_forecasts", latest + [_tag(t, "last_forecast")]),
+            (f"{t}_kavach_reports", latest + [_tag(t, "prev_report_ts", "$ts")]),
+        ]
+    for row in union(db, parts):
+        if row.get("value") is not None:
+            out[row["tenant"]][row["metric"]] = row["value"]
+    for m in out.values():
+        m["last_forecast"] = float(m["last_forecast"] or 0.0)
+
+    parts = []
+    for t in tenants:
+        filt: Dict[str, Any] = {"baseline": {"$ne": True}}
+        if out[t]["prev_report_ts"]:
+            filt["ts"] = {"$gt": out[t]["prev_report_ts"]}
+        parts.append((f"{t}_kavach_changes", [{"$match": filt},
+                                               {"$group": {"_id": "$change", "value": {"$sum": 1}}},
+                                               _tag(t, "$_id")]))
+    for row in union(db, parts):
+        out[row["tenant"]]["changes"][row["metric"]] = row["value"]
+    return out
+
+
+# --- rendering ------------------------------------------------------------------
+
+def _render_pdf_job(html: str) -> Optional[bytes]:
+    """Process-pool entry point; returns None when a report fails to render."""
+    try:
+        return kavach_report.render_pdf(html)
+    except Exception:
+        return None
+
+
+def _pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    if workers <= 0:
+        return None
+    # spawn: forking a threaded API worker is not safe
+    ctx = multiprocessing.get_context(os.getenv("REPORT_POOL_START_METHOD", "spawn"))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+
+
+def _write(db, docs: Iterable[Dict[str, Any]]) -> int:
+    """insert_many per collection; duplicates from a resumed chunk are skipped."""
+    by_coll: Dict[str, List[Dict[str, Any]]] = {}
+    for d in docs:
+        by_coll.setdefault(f"{d['tenant']}_kavach_reports", []).append(d)
+    written = 0
+    for coll, batch in by_coll.items():
+        try:
+            written += len(db[coll].insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            written += e.details.get("nInserted", 0)
+        except DuplicateKeyError:
+            pass
+    return written
+
+
+def clamp_chunk(value: Any = None) -> int:
+    """Tenants per chunk: `value` or REPORT_BATCH_CHUNK, capped at MAX_CHUNK. Raises ValueError."""
+    if value is None:
+        value = max(1, _env_int("REPORT_BATCH_CHUNK", 100))
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    return min(value, MAX_CHUNK)
+
+# --- job ----------------------------------------------------------------------
+
+class BatchReportJob:
+    """One resumable batch run; state lives in `kavach_report_jobs`."""
+
+    def __init__(self, db, rdb=None, job_id: Optional[str] = None, tenants: Optional[List[str]] = None,
+                 pdf: bool = False, chunk_size: Optional[int] = None, workers: Optional[int] = None,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.db = db
+        self.rdb = rdb if rdb is not None else db
+        self.on_progress = on_progress
+        if workers is None:
+            # a pool only pays off with spare cores; on one core render inline
+            cpus = os.cpu_count() or 1
+            workers = _env_int("REPORT_PDF_WORKERS", cpus if cpus > 1 else 0)
+        self.workers = workers
+        jobs = db[JOBS]
+        state = jobs.find_one({"_id": job_id}) if job_id else None
+        if state is None:
+            state = {
+                "_id": job_id or uuid.uuid4().hex,
+                "status": "pending",
+                "tenants": sorted(tenants) if tenants else None,
+                "pdf": bool(pdf),
+                "chunk_size": clamp_chunk(chunk_size),
+                "cursor": None, "done": 0, "failed": 0, "written": 0, "total": None,
+                "created_at": _now_iso(), "elapsed_seconds": 0.0,
+            }
+            jobs.insert_one(state)
+        self.state = state
+
+    @property
+    def job_id(self) -> str:
+        return self.state["_id"]
+
+    def _save(self, **fields) -> None:
+        self.state.update(fields)
+        self.db[JOBS].update_one({"_id": self.job_id}, {"$set": fields})
+
+    def _remaining(self) -> List[str]:
+        tenants = self.state.get("tenants") or discover_tenants(self.rdb)
+        cursor = self.state.get("cursor")
+        return [t for t in tenants if cursor is None or t > cursor]
+
+    def run(self) -> Dict[str, Any]:
+        remaining = self._remaining()
+        total = self.state["done"] + self.state["failed"] + len(remaining)
+        started = time.perf_counter()
+        base_elapsed = float(self.state.get("elapsed_seconds") or 0.0)
+        self._save(status="running", total=total, resumed_at=_now_iso() if self.state["cursor"] else None)
+        size = min(max(1, int(self.state["chunk_size"])), MAX_CHUNK)
+        pool = _pool(self.workers) if self.state["pdf"] else None
+        try:
+            for i in range(0, len(remaining), size):
+                chunk = remaining[i:i + size]
+                done, failed, written = self._process(chunk, pool)
+                elapsed = base_elapsed + time.perf_counter() - started
+                processed = self.state["done"] + done + self.state["failed"] + failed
+                rate = processed / elapsed if elapsed else 0.0
+                self._save(cursor=chunk[-1], done=self.state["done"] + done,
+                           failed=self.state["failed"] + failed, written=self.state["written"] + written,
+                           elapsed_seconds=round(elapsed, 3), tenants_per_sec=round(rate, 2),
+                           eta_seconds=round((total - processed) / rate, 1) if rate else None,
+                           updated_at=_now_iso())
+                logger.info("batch report %s: %d/%d tenants (%.1f/s)", self.job_id, processed, total, rate)
+                if self.on_progress:
+                    self.on_progress(dict(self.state))
+        except Exception as e:
+            self._save(status="failed", error=str(e), updated_at=_now_iso())
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self._save(status="completed", finished_at=_now_iso(), eta_seconds=0)
+        return dict(self.state)
+
+    def _process(self, chunk: List[str], pool) -> tuple:
+        metrics = collect_metrics(self.rdb, chunk)
+        ts = _now_iso()
+        rid = f"batch-{self.job_id}"
+        docs, htmls = [], []
+        for t in chunk:
+            m = metrics[t]
+            htmls.append(kavach_report.render_html(t, m["scans"], m["qc_results"], m["last_forecast"], m["changes"],
+                                                   generated_at=ts))
+            docs.append({"_id": rid, "tenant": t, "kind": "kavach_report", "ts": ts, "batch_id": self.job_id,
+                         "scans": m["scans"], "qc_results": m["qc_results"],
+                         "last_forecast": m["last_forecast"], "changes": m["changes"]})
+        pdfs: Iterable[Optional[bytes]] = [None] * len(docs)
+        if self.state["pdf"]:
+            pdfs = pool.map(_render_pdf_job, htmls, chunksize=max(1, len(htmls) // (self.workers * 4))) \
+                if pool is not None else map(_render_pdf_job, htmls)
+        # bodies go to the artifact store (fixed ids, so a re-run overwrites); reports keep references
+        store = artifacts.get_store(self.db)
+        kept, failed = [], 0
+        for d, html, pdf in zip(docs, htmls, pdfs):
+            if self.state["pdf"] and pdf is None:
+                failed += 1
+                continue
+            t = d["tenant"]
+            d["html_artifact"] = artifacts.summary(
+                store.put(t, html, "report_html", "text/html; charset=utf-8", artifact_id=f"{rid}.html", report_id=rid))
+            if pdf is not None:
+                d["pdf_artifact"] = artifacts.summary(
+                    store.put(t, pdf, "report_pdf", "application/pdf", artifact_id=f"{rid}.pdf", report_id=rid))
+            kept.append(d)
+        written = _write(self.db, kept)
+        return len(kept), failed, written
+
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+def start_in_background(job: BatchReportJob) -> bool:
+    """Run the job on a daemon thread unless this process is already running it."""
+    with _active_lock:
+        if job.job_id in _active or job.state["status"] == "completed":
+            return False
+        _active.add(job.job_id)
+
+    def target():
+        try:
+            job.run()
+        except Exception:
+            logger.exception("batch report %s failed", job.job_id)
+        finally:
+            with _active_lock:
+                _active.discard(job.job_id)
+
+    threading.Thread(target=target, name=f"report-batch-{job.job_id}", daemon=True).start()
+    return True
+
+
+def get_job(db, job_id: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Job state; with `tenant`, only a run over that one tenant."""
+    filt: Dict[str, Any] = {"_id": job_id}
+    if tenant is not None:
+        filt["tenants"] = [tenant]
+    return db[JOBS].find_one(filt, {"tenants": 0})
@@ -1,8 +1,29 @@
 # app/services/rudra_forecast.py
-from typing import List, Tuple
+import os
+from typing import Any, Callable, Dict, Hashable, List, Tuple
 from datetime import datetime, timezone
-from sklearn.linear_model import LinearRegression
-import numpy as np
+
+from app.common.cache import MemoCache
+from app.services import rudra_usage
+
+DEFAULT_USAGE = [
+    {"service": "ec2", "hours": 120, "rate": 0.12},
+    {"service": "s3", "gb": 500, "rate": 0.023},
+]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# forecasts per (tenant, horizon, usage version); a new ingest bumps the
+# version, so stale entries are never read and simply age out
+forecast_cache = MemoCache("rudra_forecast", maxsize=_env_int("FORECAST_CACHE_SIZE", 1024),
+                           ttl=_env_int("FORECAST_CACHE_TTL", 3600))
+
 
 def train_and_predict(usage: List[float]) -> Tuple[float, float]:
     """
@@ -11,6 +32,9 @@ def train_and_predict(usage: List[float]) -> Tuple[float, float]:
     """
     if len(usage) < 2:
         return float(usage[-1] if usage else 0.0), 0.0
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+
     X = np.arange(len(usage)).reshape(-1, 1)
     y = np.array(usage, dtype=float)
     model = LinearRegression().fit(X, y)
@@ -18,5 +42,43 @@ def train_and_predict(usage: List[float]) -> Tuple[float, float]:
     pred = float(model.predict(next_x)[0])
     return pred, float(model.coef_[0])
 
+
+def latest_usage(db, tenant: str) -> List[Dict[str, Any]]:
+    """Items of the tenant's latest mock-usage snapshot (demo defaults when none)."""
+    usage: List[Dict[str, Any]] = []
+    try:
+        docs = list(db["rudra_usage"].find({"tenant": tenant}).sort([("_id", -1)]).limit(1))
+        if docs:
+            usage = docs[0].get("usage", [])
+    except Exception:
+        pass
+    return usage or DEFAULT_USAGE
+
+
+def snapshot_forecast(usage: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-item cost (hours or gb × rate) of one usage snapshot."""
+    series: List[float] = []
+    for item in usage:
+        if "hours" in item:
+            cost = float(item.get("hours", 0)) * float(item.get("rate", 0))
+        elif "gb" in item:
+            cost = float(item.get("gb", 0)) * float(item.get("rate", 0))
+        else:
+            cost = 0.0
+        series.append(max(0.0, cost))
+    series = series or [0.0]
+    return {"forecast": series, "total": float(sum(series))}
+
+
+def cached(db, tenant: str, horizon: Hashable, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Memoize `compute` per (tenant, horizon) until the tenant's usage changes."""
+    key = (tenant, horizon, rudra_usage.usage_version(db, tenant))
+    return forecast_cache.get_or_compute(key, compute)
+
+
+def current_forecast(db, tenant: str) -> Tuple[Dict[str, Any], bool]:
+    return cached(db, tenant, "snapshot", lambda: snapshot_forecast(latest_usage(db, tenant)))
+
+
 def utcnow():
     return datetime.now(timezone.utc)
@@ -0,0 +1,331 @@
+# app/services/rudra_usage.py
+"""
+Rudra usage time-series.
+
+Usage points (service, timestamp, cost, quantity) are stored in
+`{tenant}_rudra_usage` as one bucket document per service and UTC day.
+A bucket holds packed little-endian arrays instead of one document per row:
+
+    {"_id": "ec2:2025-01-31", "service": "ec2", "day": "2025-01-31", "n": 24,
+     "ts": <uint32 seconds since midnight>, "cost": <float64>, "qty": <float64>,
+     "cost_sum": 41.2, "rev": 3}
+
+Range queries concatenate the buffers with numpy.frombuffer, so reading a
+year of hourly data never builds a Python object per point. Daily totals
+come straight from `cost_sum` without decoding the arrays at all.
+
+`{tenant}_rudra_usage_daily` additionally keeps one rollup per year with the
+tenant's total cost per day (float64[366], all services), maintained at
+ingest; whole-tenant history (forecasting) is then a couple of documents.
+"""
+import csv
+import io
+import json
+import logging
+import math
+import sys
+from array import array
+from datetime import date, datetime, time as dtime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.services import cost_anomaly
+
+logger = logging.getLogger(__name__)
+
+USAGE = "_rudra_usage"
+DAILY = "_rudra_usage_daily"
+VERSIONS = "rudra_usage_versions"
+INDEXES = {
+    USAGE: [
+        ("by_service_day", [("service", ASCENDING), ("day", ASCENDING)], True),
+        ("by_day", [("day", ASCENDING)], False),
+    ],
+}
+
+# column names used by the common billing exports (AWS CUR, Azure, GCP, our own)
+_TS_KEYS = ("timestamp", "ts", "time", "date", "usage_date", "usage_start_time", "usagedatetime",
+            "lineitem/usagestartdate")
+_SERVICE_KEYS = ("service", "service_name", "service_description", "product", "metercategory",
+                 "product/productname", "lineitem/productcode")
+_COST_KEYS = ("cost", "amount", "unblended_cost", "pretaxcost", "cost_usd", "costinbillingcurrency",
+              "lineitem/unblendedcost")
+_QTY_KEYS = ("quantity", "usage_quantity", "usage_amount", "hours", "gb", "lineitem/usageamount")
+
+_MAX_RETRIES = 5
+
+Point = Tuple[str, datetime, float, float]
+
+
+# --- parsing --------------------------------------------------------------------
+
+def _first(row: Dict[str, Any], keys: Iterable[str]) -> Any:
+    for k in keys:
+        v = row.get(k)
+        if v not in (None, ""):
+            return v
+    return None
+
+
+def parse_ts(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(float(value), tz=timezone.utc)
+    else:
+        s = str(value).strip().replace("Z", "+00:00")
+        if len(s) == 10:
+            s += "T00:00:00"
+        dt = datetime.fromisoformat(s)
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def to_point(row: Dict[str, Any], default_ts: Optional[datetime] = None) -> Point:
+    """One billing row -> (service, ts, cost, qty). Raises ValueError on unusable rows."""
+    if not isinstance(row, dict):
+        raise ValueError("row is not an object")
+    row = {str(k).strip().lower(): v for k, v in row.items()}
+    service = _first(row, _SERVICE_KEYS)
+    if not service:
+        raise ValueError("row has no service column")
+    ts_raw = _first(row, _TS_KEYS)
+    if ts_raw is None and default_ts is None:
+        raise ValueError("row has no timestamp column")
+    ts = parse_ts(ts_raw) if ts_raw is not None else default_ts
+    qty = _first(row, _QTY_KEYS)
+    if qty is not None:
+        qty = float(qty)
+        if not math.isfinite(qty):
+            raise ValueError("quantity is not a finite number")
+    else:
+        qty = float("nan")  # missing quantity
+    cost = _first(row, _COST_KEYS)
+    if cost is None:
+        rate = row.get("rate")
+        if rate in (None, "") or qty != qty:
+            raise ValueError("row has no cost column")
+        cost = qty * float(rate)
+    cost = float(cost)
+    # a NaN/inf cost would poison the bucket sums and daily rollups for good
+    if not math.isfinite(cost):
+        raise ValueError("cost is not a finite number")
+    return str(service).strip(), ts, cost, qty
+
+
+def parse_rows(text: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Rows of a CSV or NDJSON export."""
+    if fmt == "csv":
+        yield from csv.DictReader(io.StringIO(text))
+    elif fmt == "ndjson":
+        for line in text.splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield line  # rejected (and counted) by to_point
+    else:
+        raise ValueError(f"unsupported format {fmt!r}")
+
+
+# --- packing --------------------------------------------------------------------
+
+def _pack(typecode: str, values: List[Any]) -> bytes:
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack(typecode: str, data: Optional[bytes]) -> List[Any]:
+    a = array(typecode)
+    if data:
+        a.frombytes(bytes(data))
+        if sys.byteorder == "big":
+            a.byteswap()
+    return a.tolist()
+
+
+def _day_start(day: str) -> datetime:
+    return datetime.combine(date.fromisoformat(day), dtime.min, tzinfo=timezone.utc)
+
+
+# --- version ----------------------------------------------------------------------
+# Bumped on every ingest; caches derived from usage (forecasts) key on it, so
+# they are invalidated in every worker without any messaging.
+
+def usage_version(db, tenant: str) -> int:
+    doc = db[VERSIONS].find_one({"_id": tenant})
+    return int(doc.get("version", 0)) if doc else 0
+
+
+def bump_version(db, tenant: str) -> None:
+    db[VERSIONS].update_one({"_id": tenant}, {"$inc": {"version": 1}}, upsert=True)
+
+
+# --- writes ---------------------------------------------------------------------
+
+def ingest_points(db, tenant: str, points: Iterable[Point]) -> Dict[str, int]:
+    """
+    Fold points into their day buckets. A point at an existing timestamp
+    replaces the old value, so re-importing an export is idempotent.
+    """
+    points = list(points)
+    groups: Dict[Tuple[str, str], Dict[int, Tuple[float, float]]] = {}
+    n = 0
+    for service, ts, cost, qty in points:
+        day = ts.date().isoformat()
+        offset = ts.hour * 3600 + ts.minute * 60 + ts.second
+        groups.setdefault((service, day), {})[offset] = (cost, qty)
+        n += 1
+    col = db[f"{tenant}{USAGE}"]
+    deltas: Dict[str, float] = {}
+    for (service, day), new in groups.items():
+        deltas[day] = deltas.get(day, 0.0) + _merge_bucket(col, service, day, new)
+    if groups:
+        _apply_daily(db, tenant, deltas)
+        bump_version(db, tenant)
+        cost_anomaly.observe(db, tenant, points)
+    return {"points": n, "buckets": len(groups)}
+
+
+def _merge_bucket(col, service: str, day: str, new: Dict[int, Tuple[float, float]]) -> float:
+    """Merge points into one bucket; returns the change of its cost_sum."""
+    bid = f"{service}:{day}"
+    for _ in range(_MAX_RETRIES):
+        doc = col.find_one({"_id": bid})
+        merged: Dict[int, Tuple[float, float]] = {}
+        if doc:
+            merged = dict(zip(_unpack("I", doc.get("ts")),
+                              zip(_unpack("d", doc.get("cost")), _unpack("d", doc.get("qty")))))
+        merged.update(new)
+        offsets = sorted(merged)
+        costs = [merged[o][0] for o in offsets]
+        fields = {"n": len(offsets), "ts": _pack("I", offsets), "cost": _pack("d", costs),
+                  "qty": _pack("d", [merged[o][1] for o in offsets]), "cost_sum": float(sum(costs))}
+        if doc is None:
+            try:
+                col.insert_one({"_id": bid, "service": service, "day": day, "rev": 1, **fields})
+                return fields["cost_sum"]
+            except DuplicateKeyError:
+                continue  # a concurrent ingest created it first
+        # optimistic concurrency: only replace the revision we merged with
+        res = col.update_one({"_id": bid, "rev": doc.get("rev", 0)}, {"$set": fields, "$inc": {"rev": 1}})
+        if res.matched_count:
+            return fields["cost_sum"] - float(doc.get("cost_sum") or 0.0)
+    raise RuntimeError(f"usage bucket {bid} kept changing during ingest")
+
+
+def _apply_daily(db, tenant: str, deltas: Dict[str, float]) -> None:
+    """Add per-day cost changes to the tenant's yearly rollups (all services summed)."""
+    by_year: Dict[int, Dict[int, float]] = {}
+    for day, delta in deltas.items():
+        d = date.fromisoformat(day)
+        by_year.setdefault(d.year, {})[d.timetuple().tm_yday - 1] = delta
+    col = db[f"{tenant}{DAILY}"]
+    for year, changes in by_year.items():
+        for _ in range(_MAX_RETRIES):
+            doc = col.find_one({"_id": str(year)})
+            totals = _unpack("d", doc.get("cost")) if doc else [0.0] * 366
+            for idx, delta in changes.items():
+                totals[idx] += delta
+            fields = {"cost": _pack("d", totals)}
+            if doc is None:
+                try:
+                    col.insert_one({"_id": str(year), "year": year, "rev": 1, **fields})
+                    break
+                except DuplicateKeyError:
+                    continue
+            if col.update_one({"_id": str(year), "rev": doc.get("rev", 0)},
+                              {"$set": fields, "$inc": {"rev": 1}}).matched_count:
+                break
+        else:
+            raise RuntimeError(f"usage rollup {tenant}/{year} kept changing during ingest")
+
+
+def ingest_text(db, tenant: str, text: str, fmt: str) -> Dict[str, Any]:
+    """Bulk-ingest a CSV/NDJSON billing export; unusable rows are counted, not fatal."""
+    points: List[Point] = []
+    skipped = 0
+    errors: List[str] = []
+    for i, row in enumerate(parse_rows(text, fmt), start=1):
+        try:
+            points.append(to_point(row))
+        except (TypeError, ValueError) as e:
+            skipped += 1
+            if len(errors) < 10:
+                errors.append(f"row {i}: {e}")
+    out = ingest_points(db, tenant, points)
+    return {**out, "skipped": skipped, "errors": errors}
+
+
+# --- reads ----------------------------------------------------------------------
+
+def _day_filter(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    rng: Dict[str, Any] = {}
+    if start is not None:
+        rng["$gte"] = start.date().isoformat()
+    if end is not None:
+        rng["$lte"] = end.date().isoformat()
+    return {"day": rng} if rng else {}
+
+
+def series(db, tenant: str, service: str, start: Optional[datetime] = None,
+           end: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Points of one service in [start, end) as numpy arrays:
+    {"ts": datetime64[s], "cost": float64, "qty": float64 (NaN when unknown)}.
+    """
+    import numpy as np
+
+    filt = {"service": service, **_day_filter(start, end)}
+    docs = list(db[f"{tenant}{USAGE}"].find(filt, {"day": 1, "ts": 1, "cost": 1, "qty": 1}).sort("day", ASCENDING))
+    if not docs:
+        return {"ts": np.array([], dtype="datetime64[s]"), "cost": np.array([]), "qty": np.array([])}
+    base = np.array([int(_day_start(d["day"]).timestamp()) for d in docs], dtype=np.int64)
+    offsets = [np.frombuffer(bytes(d["ts"]), dtype="<u4") for d in docs]
+    ts = np.concatenate([b + o.astype(np.int64) for b, o in zip(base, offsets)])
+    cost = np.concatenate([np.frombuffer(bytes(d["cost"]), dtype="<f8") for d in docs])
+    qty = np.concatenate([np.frombuffer(bytes(d["qty"]), dtype="<f8") for d in docs])
+    mask = np.ones(len(ts), dtype=bool)
+    if start is not None:
+        mask &= ts >= int(start.timestamp())
+    if end is not None:
+        mask &= ts < int(end.timestamp())
+    return {"ts": ts[mask].astype("datetime64[s]"), "cost": cost[mask], "qty": qty[mask]}
+
+
+def daily(db, tenant: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+          services: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Daily cost matrix from the bucket totals:
+    {"days": datetime64[D] (n_days,), "services": [...], "cost": float64 (n_services, n_days)}.
+    Days without data are 0.
+    """
+    import numpy as np
+
+    filt = _day_filter(start, end)
+    if services:
+        filt["service"] = {"$in": list(services)}
+    docs = list(db[f"{tenant}{USAGE}"].find(filt, {"service": 1, "day": 1, "cost_sum": 1}))
+    if not docs:
+        return {"days": np.array([], dtype="datetime64[D]"), "services": [], "cost": np.zeros((0, 0))}
+    names = sorted({d["service"] for d in docs})
+    days = np.array([d["day"] for d in docs], dtype="datetime64[D]")
+    first = days.min() if start is None else np.datetime64(start.date())
+    last = days.max() if end is None else np.datetime64(end.date())
+    first, last = min(first, days.min()), max(last, days.max())
+    axis = np.arange(first, last + np.timedelta64(1, "D"))
+    row = {s: i for i, s in enumerate(names)}
+    out = np.zeros((len(names), len(axis)))
+    np.add.at(out, ([row[d["service"]] for d in docs], (days - first).astype(np.int64)),
+              [d.get("cost_sum", 0.0) for d in docs])
+    return {"days": axis, "services": names, "cost": out}
+
+
+def ensure_indexes(db, tenant: str) -> None:
+    for suffix, specs in INDEXES.items():
+        for name, keys, unique in specs:
+            db[f"{tenant}{suffix}"].create_index(keys, name=name, unique=unique)
@@ -0,0 +1,209 @@
+# app/services/scan_diff.py
+"""
+Incremental Kavach results.
+
+Every ingested scan is normalized into one state record per
+(target, host, protocol, port) in `{tenant}_kavach_ports` and compared with
+the previous snapshot of the same target. Only the differences (port opened,
+port closed, service/version changed) are written to `{tenant}_kavach_changes`,
+so reports and alerts read a handful of change records instead of every raw
+scan of a host.
+"""
+import logging
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+PORTS = "_kavach_ports"
+CHANGES = "_kavach_changes"
+SERVICE_FIELDS = ("service", "product", "version")
+
+# the collection is already per tenant, so (target, host, port, protocol)
+# is the (tenant, target, port) key of the snapshot
+INDEXES = {
+    PORTS: [
+        ("by_target_port", [("target", ASCENDING), ("host", ASCENDING), ("port", ASCENDING), ("protocol", ASCENDING)], True),
+        ("by_state", [("state", ASCENDING), ("target", ASCENDING)], False),
+    ],
+    CHANGES: [
+        ("by_target_ts", [("target", ASCENDING), ("ts", DESCENDING)], False),
+        ("by_ts", [("ts", DESCENDING)], False),
+    ],
+}
+
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+Key = Tuple[str, str, int]
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def ensure_indexes(db, tenant: str) -> None:
+    """Create the snapshot/change-log indexes once per process and tenant."""
+    key = (id(db), tenant)
+    if key in _indexed:
+        return
+    with _indexed_lock:
+        if key in _indexed:
+            return
+        for suffix, specs in INDEXES.items():
+            col = db[f"{tenant}{suffix}"]
+            for name, keys, unique in specs:
+                col.create_index(keys, name=name, unique=unique)
+        _indexed.add(key)
+
+
+def parse_nmap_xml(raw_xml: str, target: str) -> Dict[Key, Dict[str, Any]]:
+    """
+    Port states keyed by (host, protocol, port). Ports outside a <host>
+    element (the mock runner's output) are attributed to the target itself.
+    """
+    try:
+        root = ET.fromstring(raw_xml)
+    except ET.ParseError as e:
+        raise ValueError(f"invalid nmap xml: {e}")
+
+    out: Dict[Key, Dict[str, Any]] = {}
+
+    def collect(host: str, ports_el):
+        if ports_el is None:
+            return
+        for p in ports_el.findall("port"):
+            try:
+                port = int(p.get("portid"))
+            except (TypeError, ValueError):
+                continue
+            proto = p.get("protocol", "tcp")
+            state_el = p.find("state")
+            svc = p.find("service")
+            out[(host, proto, port)] = {
+                "state": state_el.get("state", "unknown") if state_el is not None else "unknown",
+                "service": svc.get("name") if svc is not None else None,
+                "product": svc.get("product") if svc is not None else None,
+                "version": svc.get("version") if svc is not None else None,
+            }
+
+    hosts = root.findall("host")
+    for h in hosts:
+        addr = h.find("address[@addrtype='ipv4']")
+        if addr is None:
+            addr = h.find("address")
+        collect(addr.get("addr") if addr is not None else target, h.find("ports"))
+    if not hosts:
+        collect(target, root.find("ports"))
+    return out
+
+
+def diff(previous: Dict[Key, Dict[str, Any]], current: Dict[Key, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Changes between two snapshots; only open ports count as exposed."""
+    changes = []
+    for key in sorted(set(previous) | set(current)):
+        host, proto, port = key
+        old, new = previous.get(key), current.get(key)
+        was_open = bool(old) and old["state"] == "open"
+        is_open = bool(new) and new["state"] == "open"
+        base = {"host": host, "protocol": proto, "port": port}
+        if is_open and not was_open:
+            changes.append({**base, "change": "opened", "to": {f: new.get(f) for f in SERVICE_FIELDS}})
+        elif was_open and not is_open:
+            changes.append({**base, "change": "closed", "from": {f: old.get(f) for f in SERVICE_FIELDS},
+                            "state": new["state"] if new else "absent"})
+        elif is_open:
+            before = {f: old.get(f) for f in SERVICE_FIELDS}
+            after = {f: new.get(f) for f in SERVICE_FIELDS}
+            if before != after:
+                changes.append({**base, "change": "service_changed", "from": before, "to": after})
+    return changes
+
+
+def snapshot(db, tenant: str, target: str) -> Dict[Key, Dict[str, Any]]:
+    cur = db[f"{tenant}{PORTS}"].find({"target": target})
+    return {(d["host"], d["protocol"], d["port"]): d for d in cur}
+
+
+def ingest(db, tenant: str, target: str, raw_xml: str, scan_id: Any = None,
+           ts: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fold one scan into the per-port state and append its change log.
+    The first scan of a target is recorded as a baseline (changes flagged
+    `baseline: true`) so alerting can ignore it.
+    """
+    ensure_indexes(db, tenant)
+    ts = ts or _iso(datetime.now(timezone.utc))
+    scan_id = str(scan_id) if scan_id is not None else uuid.uuid4().hex
+    current = parse_nmap_xml(raw_xml, target)
+    previous = snapshot(db, tenant, target)
+    baseline = not previous
+    changes = diff(previous, current)
+
+    ports = db[f"{tenant}{PORTS}"]
+    changed_keys = {(c["host"], c["protocol"], c["port"]) for c in changes}
+    for key, state in current.items():
+        host, proto, port = key
+        sel = {"target": target, "host": host, "port": port, "protocol": proto}
+        if key in changed_keys or key not in previous or previous[key].get("state") != state["state"]:
+            ports.update_one(sel, {"$set": {**state, "last_seen": ts, "scan_id": scan_id},
+                                   "$setOnInsert": {"first_seen": ts}}, upsert=True)
+    # ports that vanished from the scan are kept as history, marked absent
+    for key in set(previous) - set(current):
+        if previous[key].get("state") != "absent":
+            host, proto, port = key
+            ports.update_one({"target": target, "host": host, "port": port, "protocol": proto},
+                             {"$set": {"state": "absent", "last_seen": ts, "scan_id": scan_id}})
+    # one write stamps every unchanged port of the target
+    ports.update_many({"target": target, "scan_id": {"$ne": scan_id}, "state": {"$ne": "absent"}},
+                      {"$set": {"last_seen": ts, "scan_id": scan_id}})
+
+    if changes:
+        db[f"{tenant}{CHANGES}"].insert_many([
+            {**c, "target": target, "ts": ts, "scan_id": scan_id, "baseline": baseline} for c in changes
+        ])
+    if changes and not baseline:
+        # surface exposure changes in the Nandi event feed
+        db[f"{tenant}_nandi"].insert_many([
+            {"type": f"kavach.port_{c['change']}", "severity": 4 if c["change"] == "opened" else 2,
+             "target": target, "host": c["host"], "port": c["port"], "protocol": c["protocol"],
+             "timestamp": ts, "scan_id": scan_id}
+            for c in changes
+        ])
+    counts: Dict[str, int] = {}
+    for c in changes:
+        counts[c["change"]] = counts.get(c["change"], 0) + 1
+    return {"target": target, "baseline": baseline, "ports": len(current), "changes": counts}
+
+
+def _changes_filter(since: Optional[str], target: Optional[str], include_baseline: bool) -> Dict[str, Any]:
+    filt: Dict[str, Any] = {}
+    if target:
+        filt["target"] = target
+    if since:
+        filt["ts"] = {"$gt": since}
+    if not include_baseline:
+        filt["baseline"] = {"$ne": True}
+    return filt
+
+
+def changes_since(db, tenant: str, since: Optional[str] = None, target: Optional[str] = None,
+                  include_baseline: bool = False, limit: int = 100) -> List[Dict[str, Any]]:
+    filt = _changes_filter(since, target, include_baseline)
+    return list(db[f"{tenant}{CHANGES}"].find(filt, {"_id": 0}).sort("ts", DESCENDING).limit(limit))
+
+
+def count_changes(db, tenant: str, since: Optional[str] = None, target: Optional[str] = None,
+                  include_baseline: bool = False) -> Dict[str, int]:
+    """Totals per kind of change, over all of them (changes_since only lists the newest)."""
+    out = {"opened": 0, "closed": 0, "service_changed": 0}
+    pipeline = [{"$match": _changes_filter(since, target, include_baseline)},
+                {"$group": {"_id": "$change", "value": {"$sum": 1}}}]
+    for row in db[f"{tenant}{CHANGES}"].aggregate(pipeline):
+        out[row["_id"]] = row["value"]
+    return out
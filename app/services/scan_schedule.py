@@ -0,0 +1,417 @@
+# app/services/scan_schedule.py
+"""
+Recurring Kavach scans.
+
+Schedules are stored per tenant in `{tenant}_scan_schedules` and registered as
+APScheduler jobs (cron or interval) when the background scheduler is enabled.
+Every target gets a deterministic offset inside its jitter window, derived
+from a hash of (tenant, target), so "daily at midnight" for a thousand targets
+turns into an even spread instead of a spike, and the same target always runs
+at the same minute. At most SCAN_TENANT_MAX_CONCURRENT scans per tenant run at
+once; a run that finds its tenant saturated waits for a free slot, and repeat
+fires of a schedule that is already waiting are coalesced into that one run.
+
+Every worker process registers every schedule, so each fire (and each startup
+catch-up run) first claims a lease in `kavach_scan_leases` keyed by schedule
+and fire time; only the worker that wins it runs the scan. The concurrency cap
+is counted per worker process.
+"""
+import hashlib
+import heapq
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.services import artifacts, scan_diff
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = "_scan_schedules"
+LEASES = "kavach_scan_leases"
+MAX_JITTER_MINUTES = 24 * 60
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse(ts: str) -> datetime:
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def jitter_offset(tenant: str, target: str, window_seconds: int) -> int:
+    """Stable offset in [0, window_seconds) for a tenant/target pair."""
+    if window_seconds <= 0:
+        return 0
+    digest = hashlib.blake2b(f"{tenant}|{target}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % window_seconds
+
+
+def trigger(doc: Dict[str, Any]):
+    from app.services import scan_triggers
+    return scan_triggers.build(doc.get("cron"), doc.get("interval_minutes"), doc.get("offset_seconds", 0))
+
+
+def next_run(doc: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+    return trigger(doc).get_next_fire_time(None, now or _now())
+
+
+def fire_times(doc: Dict[str, Any], start: datetime, end: datetime, limit: int = 100_000) -> List[datetime]:
+    """All fire times in [start, end)."""
+    trig = trigger(doc)
+    out: List[datetime] = []
+    prev, now = None, start
+    while len(out) < limit:
+        nxt = trig.get_next_fire_time(prev, now)
+        if nxt is None or nxt >= end:
+            break
+        out.append(nxt)
+        prev, now = nxt, nxt + timedelta(microseconds=1)
+    return out
+
+
+def normalize(tenant: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a schedule request and build the stored document. Raises ValueError."""
+    target = str(spec.get("target") or "").strip()
+    if not target:
+        raise ValueError("target is required")
+    cron = (spec.get("cron") or "").strip() or None
+    interval = int(spec.get("interval_minutes") or 0) or None
+    if bool(cron) == bool(interval):
+        raise ValueError("set exactly one of cron or interval_minutes")
+    if interval is not None and interval < 5:
+        raise ValueError("interval_minutes must be at least 5")
+
+    jitter = int(spec.get("jitter_minutes", _env_int("SCAN_JITTER_MINUTES", 60)))
+    jitter = max(0, min(jitter, MAX_JITTER_MINUTES, interval or MAX_JITTER_MINUTES))
+    doc = {
+        "_id": spec.get("_id") or uuid.uuid4().hex,
+        "tenant": tenant,
+        "target": target,
+        "cron": cron,
+        "interval_minutes": interval,
+        "jitter_minutes": jitter,
+        "offset_seconds": jitter_offset(tenant, target, jitter * 60),
+        "enabled": bool(spec.get("enabled", True)),
+        "created_at": _iso(_now()),
+        "runs": 0,
+        "coalesced_runs": 0,
+    }
+    trigger(doc)  # surfaces a bad cron expression as ValueError
+    return doc
+
+
+# --- persistence --------------------------------------------------------------
+
+def collection(db, tenant: str):
+    return db[f"{tenant}{SUFFIX}"]
+
+
+def create(db, tenant: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    doc = normalize(tenant, spec)
+    nxt = next_run(doc)
+    doc["next_run_at"] = _iso(nxt) if nxt else None
+    collection(db, tenant).insert_one(doc)
+    if doc["enabled"]:
+        register(doc)
+    return doc
+
+
+def list_schedules(db, tenant: str) -> List[Dict[str, Any]]:
+    return list(collection(db, tenant).find({}).sort("created_at", 1))
+
+
+def delete(db, tenant: str, schedule_id: str) -> bool:
+    res = collection(db, tenant).delete_one({"_id": schedule_id})
+    unregister(tenant, schedule_id)
+    return res.deleted_count > 0
+
+
+# --- execution ----------------------------------------------------------------
+
+class TenantSlots:
+    """Per-tenant running-scan counter with a coalescing wait queue."""
+
+    def __init__(self, cap: Optional[int] = None):
+        self.cap = cap or _env_int("SCAN_TENANT_MAX_CONCURRENT", 2)
+        self._lock = threading.Lock()
+        self._running: Dict[str, int] = defaultdict(int)
+        self._waiting: Dict[str, deque] = defaultdict(deque)
+
+    def acquire(self, tenant: str) -> bool:
+        with self._lock:
+            if self._running[tenant] >= self.cap:
+                return False
+            self._running[tenant] += 1
+            return True
+
+    def release(self, tenant: str) -> Optional[str]:
+        """Free a slot; returns the next waiting schedule id for the tenant, if any."""
+        with self._lock:
+            self._running[tenant] = max(0, self._running[tenant] - 1)
+            q = self._waiting.get(tenant)
+            return q.popleft() if q else None
+
+    def defer(self, tenant: str, schedule_id: str) -> bool:
+        """Queue a run; False when that schedule is already waiting (coalesced)."""
+        with self._lock:
+            q = self._waiting[tenant]
+            if schedule_id in q:
+                return False
+            q.append(schedule_id)
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cap": self.cap,
+                    "running": {t: n for t, n in self._running.items() if n},
+                    "waiting": {t: len(q) for t, q in self._waiting.items() if q}}
+
+
+slots = TenantSlots()
+
+
+def _claim(db, tenant: str, schedule_id: str, fire_at: str) -> bool:
+    """One run per schedule and fire time across all workers."""
+    try:
+        db[LEASES].find_one_and_update({"_id": f"{tenant}:{schedule_id}", "fire_at": {"$lt": fire_at}},
+                                       {"$set": {"fire_at": fire_at, "pid": os.getpid()}}, upsert=True)
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _fire_slot(doc: Dict[str, Any], now: datetime) -> str:
+    """The fire time a scheduler job started at `now` belongs to (at most the misfire grace ago)."""
+    grace = timedelta(seconds=_env_int("SCAN_MISFIRE_GRACE_SECONDS", 3600) + 60)
+    fires = fire_times(doc, now - grace, now + timedelta(seconds=1), limit=1000)
+    return _iso(fires[-1] if fires else now)
+
+
+def run_scheduled_scan(tenant: str, schedule_id: str, db=None, fire_at: Optional[str] = None,
+                       leased: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Job body for one fire of a schedule. `fire_at` defaults to the fire time the
+    job was started for; `leased` skips the claim for a run this worker already owns.
+    """
+    if db is None:
+        from app.deps import get_db
+        db = get_db()
+    col = collection(db, tenant)
+    if not leased:
+        doc = col.find_one({"_id": schedule_id})
+        if not doc:
+            return None
+        if not _claim(db, tenant, schedule_id, fire_at or _fire_slot(doc, _now())):
+            logger.info("scan schedule %s/%s: run claimed by another worker", tenant, schedule_id)
+            return None
+    if not slots.acquire(tenant):
+        if not slots.defer(tenant, schedule_id):
+            col.update_one({"_id": schedule_id}, {"$inc": {"coalesced_runs": 1}})
+        logger.info("scan schedule %s/%s deferred: tenant at concurrency cap", tenant, schedule_id)
+        return None
+
+    try:
+        doc = col.find_one({"_id": schedule_id})
+        if not doc or not doc.get("enabled", True):
+            return None
+        from app.services.kavach_runner import run_nmap_or_mock
+        status, raw_xml, pdf = run_nmap_or_mock(doc["target"])
+        now = _now()
+        scan = {"_id": ObjectId(), "tenant": tenant, "target": doc["target"], "status": status,
+                "ts": _iso(now), "schedule_id": schedule_id, "source": "schedule"}
+        store = artifacts.get_store(db)
+        scan["raw_xml_artifact"] = artifacts.summary(
+            store.put(tenant, raw_xml, "raw_xml", "application/xml", artifact_id=f"{scan['_id']}.xml"))
+        if pdf:
+            scan["pdf_artifact"] = artifacts.summary(
+                store.put(tenant, pdf, "scan_pdf", "application/pdf", artifact_id=f"{scan['_id']}.pdf"))
+        try:
+            scan["diff"] = scan_diff.ingest(db, tenant, doc["target"], raw_xml, scan_id=scan["_id"], ts=scan["ts"])
+        except ValueError as e:
+            logger.warning("scan %s/%s: could not diff results: %s", tenant, schedule_id, e)
+        db[f"{tenant}_scans"].insert_one(scan)
+        nxt = next_run(doc, now)
+        col.update_one({"_id": schedule_id}, {
+            "$set": {"last_run_at": scan["ts"], "last_status": status, "next_run_at": _iso(nxt) if nxt else None},
+            "$inc": {"runs": 1},
+        })
+        return scan
+    finally:
+        waiting = slots.release(tenant)
+        if waiting:
+            _dispatch(tenant, waiting, db)
+
+
+def _dispatch(tenant: str, schedule_id: str, db) -> None:
+    from app.common.worker import submit_job
+    if submit_job(run_scheduled_scan, tenant, schedule_id, module="kavach", leased=True) is None:
+        # no background scheduler in this process: run the waiting scan inline
+        run_scheduled_scan(tenant, schedule_id, db, leased=True)
+
+
+def _job_id(tenant: str, schedule_id: str) -> str:
+    return f"kavach-scan:{tenant}:{schedule_id}"
+
+
+def register(doc: Dict[str, Any]) -> bool:
+    """Add (or replace) the APScheduler job for a schedule; no-op when scheduling is disabled."""
+    from app.common import worker
+    if not worker.scheduler_enabled():
+        return False
+    sched = worker.get_scheduler()
+    if not sched.running:
+        return False
+    sched.add_job(run_scheduled_scan, trigger(doc), args=[doc["tenant"], doc["_id"]],
+                  id=_job_id(doc["tenant"], doc["_id"]), replace_existing=True,
+                  coalesce=True, max_instances=1,
+                  misfire_grace_time=_env_int("SCAN_MISFIRE_GRACE_SECONDS", 3600))
+    return True
+
+
+def unregister(tenant: str, schedule_id: str) -> None:
+    from app.common import worker
+    sched = worker.current_scheduler()
+    if sched is None:
+        return
+    try:
+        sched.remove_job(_job_id(tenant, schedule_id))
+    except Exception:
+        pass
+
+
+def missed_fires(doc: Dict[str, Any], now: Optional[datetime] = None) -> List[datetime]:
+    since = doc.get("last_run_at") or doc.get("created_at")
+    if not since:
+        return []
+    return fire_times(doc, _parse(since) + timedelta(microseconds=1), now or _now(), limit=1000)
+
+
+def missed_runs(doc: Dict[str, Any], now: Optional[datetime] = None) -> int:
+    return len(missed_fires(doc, now))
+
+
+def load_all(db, now: Optional[datetime] = None) -> int:
+    """
+    Register every enabled schedule at startup. Fires missed while no worker
+    was running are coalesced into a single catch-up run per schedule, claimed
+    under the last missed fire time so one worker runs it.
+    """
+    from app.common import worker
+    if not worker.scheduler_enabled():
+        return 0
+    count = 0
+    try:
+        names = db.list_collection_names()
+    except Exception as e:
+        logger.warning("Could not load scan schedules: %s", e)
+        return 0
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        tenant = name[: -len(SUFFIX)]
+        for doc in db[name].find({"enabled": True}):
+            if not register(doc):
+                continue
+            count += 1
+            missed = missed_fires(doc, now)
+            if missed and _claim(db, tenant, doc["_id"], _iso(missed[-1])):
+                db[name].update_one({"_id": doc["_id"]}, {"$inc": {"coalesced_runs": len(missed) - 1}})
+                worker.submit_job(run_scheduled_scan, tenant, doc["_id"], module="kavach", leased=True,
+                                  job_id=_job_id(tenant, doc["_id"]) + ":catchup")
+    if count:
+        logger.info("Registered %d recurring Kavach scan schedules", count)
+    return count
+
+
+# --- load simulation ----------------------------------------------------------
+
+def simulate(schedules: Iterable[Dict[str, Any]], start: Optional[datetime] = None, hours: float = 24,
+             bucket_minutes: int = 15, scan_minutes: float = 10, tenant_cap: Optional[int] = None,
+             jitter: bool = True) -> Dict[str, Any]:
+    """
+    Replay a set of schedules over a window and report the resulting load:
+    scans started and scans running per bucket, peak concurrency, and how many
+    runs were deferred by the tenant cap or coalesced while waiting.
+    """
+    start = start or _now().replace(minute=0, second=0, microsecond=0)
+    end = start + timedelta(hours=hours)
+    cap = tenant_cap or slots.cap
+    duration = timedelta(minutes=scan_minutes)
+
+    fires = []
+    for i, doc in enumerate(schedules):
+        d = doc if jitter else {**doc, "offset_seconds": 0}
+        fires.extend((t, i, d["tenant"]) for t in fire_times(d, start, end))
+    fires.sort(key=lambda f: (f[0], f[1]))
+
+    running: Dict[str, list] = defaultdict(list)   # tenant -> heap of end times
+    waiting: Dict[str, deque] = defaultdict(deque)
+    intervals = []
+    deferred = coalesced = 0
+
+    def drain(tenant, until):
+        heap, q = running[tenant], waiting[tenant]
+        while heap and heap[0] <= until:
+            free_at = heapq.heappop(heap)
+            if q:
+                q.popleft()
+                heapq.heappush(heap, free_at + duration)
+                intervals.append((free_at, free_at + duration))
+
+    for t, i, tenant in fires:
+        drain(tenant, t)
+        if len(running[tenant]) < cap:
+            heapq.heappush(running[tenant], t + duration)
+            intervals.append((t, t + duration))
+        elif i in waiting[tenant]:
+            coalesced += 1
+        else:
+            waiting[tenant].append(i)
+            deferred += 1
+    for tenant in list(waiting):
+        drain(tenant, datetime.max.replace(tzinfo=timezone.utc))
+
+    width = timedelta(minutes=bucket_minutes)
+    n = max(1, int((end - start) / width))
+    starts, busy = [0] * n, [0] * n
+    for s, e in intervals:
+        first = int((s - start) / width)
+        if 0 <= first < n:
+            starts[first] += 1
+        last = min(n - 1, int((e - start - timedelta(microseconds=1)) / width))
+        for b in range(max(0, first), last + 1):
+            busy[b] += 1
+
+    events = sorted([(s, 1) for s, _ in intervals] + [(e, -1) for _, e in intervals])
+    peak = cur = 0
+    for _, delta in events:
+        cur += delta
+        peak = max(peak, cur)
+
+    return {
+        "start": _iso(start), "hours": hours, "bucket_minutes": bucket_minutes,
+        "scan_minutes": scan_minutes, "tenant_cap": cap, "jitter": jitter,
+        "runs": len(intervals), "fires": len(fires), "deferred": deferred, "coalesced": coalesced,
+        "peak_concurrency": peak, "peak_starts_per_bucket": max(starts) if starts else 0,
+        "buckets": [{"start": _iso(start + k * width), "starts": starts[k], "running": busy[k]} for k in range(n)],
+    }
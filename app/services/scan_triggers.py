@@ -0,0 +1,42 @@
+# app/services/scan_triggers.py
+# APScheduler triggers for recurring scans. Imported lazily by scan_schedule so
+# `import app.main` does not pull in APScheduler.
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# fixed anchor so interval schedules land on the same grid after every restart
+INTERVAL_ANCHOR = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class OffsetTrigger(BaseTrigger):
+    """Fires `offset_seconds` after every fire time of the wrapped trigger."""
+
+    def __init__(self, base: BaseTrigger, offset_seconds: int):
+        self.base = base
+        self.offset = timedelta(seconds=int(offset_seconds))
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        prev = previous_fire_time - self.offset if previous_fire_time else None
+        nxt = self.base.get_next_fire_time(prev, now - self.offset)
+        return nxt + self.offset if nxt else None
+
+    def __str__(self):
+        return f"offset[{self.base}, +{int(self.offset.total_seconds())}s]"
+
+
+def base_trigger(cron: str | None, interval_minutes: int | None) -> BaseTrigger:
+    if cron:
+        try:
+            return CronTrigger.from_crontab(cron, timezone=timezone.utc)
+        except ValueError as e:
+            raise ValueError(f"invalid cron expression: {e}")
+    if interval_minutes:
+        return IntervalTrigger(minutes=int(interval_minutes), start_date=INTERVAL_ANCHOR, timezone=timezone.utc)
+    raise ValueError("either cron or interval_minutes is required")
+
+
+def build(cron: str | None, interval_minutes: int | None, offset_seconds: int) -> BaseTrigger:
+    return OffsetTrigger(base_trigger(cron, interval_minutes), offset_seconds)
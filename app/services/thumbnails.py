@@ -0,0 +1,244 @@
+# app/services/thumbnails.py
+"""
+QC images and their derived thumbnails / detection overlays.
+
+Uploaded images are stored once in the artifact store, content-addressed as
+`img-<sha256>` and uncompressed, since they are already compressed. Derived
+images are made on demand by Pillow on a small thread pool (decode and
+resize release the GIL). They are cached on disk under THUMB_CACHE_DIR:
+- keyed by (tenant, digest, variant);
+- variant = size, plus the overlay boxes' hash when there is an overlay;
+- evicted least-recently-used once THUMB_CACHE_MB is exceeded.
+
+Sizes snap up to THUMB_SIZES, so clients cannot fill the cache with
+one-pixel variations. The same key always renders the same bytes, which is
+what makes `"<digest>-<variant>"` a valid strong ETag.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services import artifacts
+from app.services.trinetra_infer import InvalidImage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREFIX = "img-"
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+THUMB_TYPE = "image/jpeg"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def sizes() -> List[int]:
+    raw = os.getenv("THUMB_SIZES", "64,128,256,512,1024")
+    return sorted({int(s) for s in raw.split(",") if s.strip().isdigit() and int(s) > 0}) or [256]
+
+
+def snap_size(size: int) -> int:
+    allowed = sizes()
+    return next((s for s in allowed if s >= size), allowed[-1])
+
+
+# --- originals ------------------------------------------------------------------
+
+def image_id(digest: str) -> str:
+    return f"{IMAGE_PREFIX}{digest}"
+
+
+def store_image(db, tenant: str, data: bytes, content_type: Optional[str] = None,
+                filename: Optional[str] = None) -> Dict[str, Any]:
+    """Persist an uploaded image once (by digest) and return its artifact summary + digest."""
+    digest = hashlib.sha256(data).hexdigest()
+    store = artifacts.get_store(db, codec="none")
+    meta = store.get(tenant, image_id(digest))
+    if meta is None:
+        meta = store.put(tenant, data, "qc_image", content_type or "application/octet-stream",
+                         artifact_id=image_id(digest), filename=filename)
+    return {**artifacts.summary(meta), "digest": digest}
+
+
+def image_meta(db, tenant: str, digest: str) -> Optional[Dict[str, Any]]:
+    return artifacts.get_store(db).get(tenant, image_id(digest))
+
+
+def load_image(db, tenant: str, meta: Dict[str, Any]) -> bytes:
+    return artifacts.get_store(db).read(tenant, meta)
+
+
+# --- rendering ------------------------------------------------------------------
+
+def overlay_key(boxes: List[Dict[str, Any]]) -> str:
+    canon = json.dumps([[d["label"], d["bbox"]["x"], d["bbox"]["y"], d["bbox"]["w"], d["bbox"]["h"]]
+                        for d in boxes], separators=(",", ":"))
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()[:12]
+
+
+def render(data: bytes, size: int, boxes: Optional[List[Dict[str, Any]]] = None) -> bytes:
+    """JPEG no larger than size x size (never upscaled), optionally with detection boxes drawn.
+
+    Raises InvalidImage when the stored bytes are not something Pillow can decode.
+    """
+    from PIL import Image, ImageDraw, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            w0, h0 = im.size
+            im.draft("RGB", (size, size))  # JPEG: decode at a reduced scale directly
+            im = im.convert("RGB")
+            im.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if boxes:
+                sx, sy = im.width / w0, im.height / h0
+                draw = ImageDraw.Draw(im)
+                width = max(1, round(min(im.size) / 128))
+                for d in boxes:
+                    b = d["bbox"]
+                    x, y = b["x"] * sx, b["y"] * sy
+                    draw.rectangle([x, y, x + b["w"] * sx, y + b["h"] * sy], outline=(255, 48, 48), width=width)
+                    draw.text((x + 2, max(0, y - 11)), f"{d['label']} {d['score']:.2f}", fill=(255, 48, 48))
+            out = io.BytesIO()
+            im.save(out, format="JPEG", quality=_env_int("THUMB_JPEG_QUALITY", 80), optimize=True)
+            return out.getvalue()
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImage("file is not a readable image") from e
+
+
+# --- disk cache -----------------------------------------------------------------
+
+class ThumbnailCache:
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None,
+                 workers: Optional[int] = None):
+        self.root = os.path.abspath(root or os.getenv("THUMB_CACHE_DIR", "data/thumbnails"))
+        self.max_bytes = max_bytes or _env_int("THUMB_CACHE_MB", 512) * 1024 * 1024
+        self._pool = ThreadPoolExecutor(max_workers=workers or _env_int("THUMB_WORKERS", 2),
+                                        thread_name_prefix="thumbs")
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = 0
+        self._scan()
+
+    def _scan(self) -> None:
+        """Rebuild the LRU order from the files a previous process left (oldest mtime first)."""
+        found = []
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                p = os.path.join(dirpath, name)
+                if name.endswith(".tmp"):
+                    os.unlink(p)
+                    continue
+                st = os.stat(p)
+                found.append((st.st_mtime, p, st.st_size))
+        for _, p, size in sorted(found):
+            self._lru[p] = size
+            self._bytes += size
+        self._evict()
+
+    def path(self, tenant: str, digest: str, variant: str) -> str:
+        return os.path.join(self.root, tenant, digest[:2], f"{digest}-{variant}.jpg")
+
+    def get(self, tenant: str, digest: str, variant: str, make: Callable[[], bytes]) -> Tuple[str, bool]:
+        """(path, hit). `make` renders the bytes on the worker pool on a miss; concurrent misses share it."""
+        p = self.path(tenant, digest, variant)
+        with self._lock:
+            if p in self._lru and os.path.exists(p):
+                self._lru.move_to_end(p)
+                self.hits += 1
+                return p, True
+            fut = self._inflight.get(p)
+            if fut is None:
+                self.misses += 1
+                fut = self._inflight[p] = self._pool.submit(self._build, p, make)
+            else:
+                self.coalesced += 1
+        return fut.result(), False
+
+    def _build(self, p: str, make: Callable[[], bytes]) -> str:
+        try:
+            data = make()
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            tmp = f"{p}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+            with self._lock:
+                self._bytes += len(data) - self._lru.pop(p, 0)
+                self._lru[p] = len(data)
+                self._evict(keep=p)
+            return p
+        finally:
+            with self._lock:
+                self._inflight.pop(p, None)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._bytes > self.max_bytes and len(self._lru) > (1 if keep else 0):
+            p, size = self._lru.popitem(last=False)
+            if p == keep:
+                self._lru[p] = size
+                continue
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {"root": self.root, "files": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "evictions": self.evictions,
+                    "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else None}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ThumbnailCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache()
+    return _cache
+
+
+def current_cache() -> Optional[ThumbnailCache]:
+    return _cache
+
+
+def derived(db, tenant: str, digest: str, size: int,
+            boxes: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """Cached thumbnail (or overlay when `boxes` is given) of a stored image; None if the image is unknown."""
+    if not _DIGEST.match(digest or ""):
+        return None
+    size = snap_size(size)
+    variant = f"{size}-ov{overlay_key(boxes)}" if boxes is not None else str(size)
+    cache = get_cache()
+    p = cache.path(tenant, digest, variant)
+    meta = None
+    if not os.path.exists(p):
+        meta = image_meta(db, tenant, digest)
+        if meta is None:
+            return None
+    path, hit = cache.get(tenant, digest, variant,
+                          lambda: render(load_image(db, tenant, meta or image_meta(db, tenant, digest)), size, boxes))
+    return {"path": path, "hit": hit, "etag": f'"{digest}-{variant}"', "content_type": THUMB_TYPE}
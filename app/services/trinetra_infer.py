@@ -0,0 +1,229 @@
+# app/services/trinetra_infer.py
+"""
+Trinetra inference records and reviewer decisions (prototype ERD: INFERENCES).
+
+One document per inference in `{tenant}_trinetra_inferences`. Detections are
+stored column-wise: a label list plus packed float32 scores and packed int32
+boxes (x, y, w, h), about 20 bytes a detection instead of a sub-document each.
+
+While an inference waits for a human, `queue` holds its suggested decision;
+recording a decision clears it. Reviewer queues ("unreviewed failures, newest
+first") are then a prefix of the (queue, processedAt) index instead of a scan
+over every QC result, and pagination is keyset on processedAt.
+"""
+import hashlib
+import io
+import logging
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+INFERENCES = "_trinetra_inferences"
+DECISIONS = ("pass", "fail", "warn")
+OVERLAY_HINT = "bbox"
+
+INDEXES = {
+    INFERENCES: [
+        ("review_queue", [("queue", ASCENDING), ("processedAt", DESCENDING)], False),
+        ("by_decision_ts", [("decision", ASCENDING), ("processedAt", DESCENDING)], False),
+        ("by_ts", [("processedAt", DESCENDING)], False),
+    ],
+}
+
+_indexed = set()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+
+def _pack(typecode: str, values) -> bytes:
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack(typecode: str, data) -> array:
+    a = array(typecode)
+    a.frombytes(bytes(data or b""))
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def image_size(data: bytes):
+    """(width, height) of an uploaded image; raises InvalidImage if Pillow cannot read it."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return im.size
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImage("file is not a readable image") from e
+
+
+class MockDetector:
+    """
+    Stand-in for the QC model: deterministic detections derived from the image
+    digest, so the same image always yields the same result. Takes a batch so a
+    real model can be dropped in behind the same call. `batch_ms`/`image_ms`
+    simulate a model's fixed per-call and per-image cost for benchmarks.
+    """
+
+    LABELS = ("scratch", "dent", "crack", "stain")
+
+    def __init__(self, model_id: Optional[str] = None, batch_ms: float = 0.0, image_ms: float = 0.0):
+        self.model_id = model_id or os.getenv("TRINETRA_MODEL_ID", "mdl_yolov8_s1")
+        self.batch_ms = batch_ms
+        self.image_ms = image_ms
+
+    def predict(self, images: Sequence[bytes]) -> List[List[Dict[str, Any]]]:
+        if self.batch_ms or self.image_ms:
+            time.sleep((self.batch_ms + self.image_ms * len(images)) / 1000.0)
+        out = []
+        for data in images:
+            w, h = image_size(data)
+            d = hashlib.sha256(data).digest()
+            dets = []
+            for k in range(d[0] % 3):
+                b = d[1 + 6 * k: 7 + 6 * k]
+                bw, bh = max(1, w * (b[3] % 40 + 5) // 100), max(1, h * (b[4] % 40 + 5) // 100)
+                dets.append({
+                    "label": self.LABELS[b[0] % len(self.LABELS)],
+                    "score": round(0.3 + 0.69 * b[5] / 255, 4),
+                    "bbox": {"x": b[1] * (w - bw) // 255, "y": b[2] * (h - bh) // 255, "w": bw, "h": bh},
+                })
+            out.append(sorted(dets, key=lambda x: -x["score"]))
+        return out
+
+
+def suggest(detections: List[Dict[str, Any]]) -> str:
+    """fail above TRINETRA_FAIL_SCORE, warn above TRINETRA_WARN_SCORE, else pass."""
+    top = max((d["score"] for d in detections), default=0.0)
+    if top >= _env_float("TRINETRA_FAIL_SCORE", 0.6):
+        return "fail"
+    if top >= _env_float("TRINETRA_WARN_SCORE", 0.4):
+        return "warn"
+    return "pass"
+
+
+def encode_detections(detections: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "labels": [d["label"] for d in detections],
+        "scores": _pack("f", [d["score"] for d in detections]),
+        "boxes": _pack("i", [v for d in detections for v in (d["bbox"]["x"], d["bbox"]["y"],
+                                                               d["bbox"]["w"], d["bbox"]["h"])]),
+    }
+
+
+def decode_detections(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    scores, boxes = _unpack("f", results.get("scores")), _unpack("i", results.get("boxes"))
+    return [{"label": label, "score": round(scores[i], 4),
+             "bbox": dict(zip(("x", "y", "w", "h"), boxes[4 * i: 4 * i + 4]))}
+            for i, label in enumerate(results.get("labels", []))]
+
+
+def ensure_indexes(db, tenant: str) -> None:
+    key = (id(db), tenant)
+    if key in _indexed:
+        return
+    for suffix, specs in INDEXES.items():
+        for name, keys, unique in specs:
+            db[f"{tenant}{suffix}"].create_index(keys, name=name, unique=unique)
+    _indexed.add(key)
+
+
+def record(db, tenant: str, model_id: str, detections: List[Dict[str, Any]], source_path: Optional[str] = None,
+           input_type: str = "image", now: Optional[datetime] = None,
+           image_digest: Optional[str] = None) -> Dict[str, Any]:
+    """Persist one inference and return it in the API shape."""
+    ensure_indexes(db, tenant)
+    suggested = suggest(detections)
+    doc = {
+        "_id": f"inf_{ObjectId()}",
+        "modelId": model_id,
+        "inputType": input_type,
+        "sourcePath": source_path,
+        "imageDigest": image_digest,
+        "results": encode_detections(detections),
+        "score": max((d["score"] for d in detections), default=0.0),
+        "suggestedDecision": suggested,
+        "queue": suggested,
+        "decision": None,
+        "processedAt": _iso(now or datetime.now(timezone.utc)),
+    }
+    db[f"{tenant}{INFERENCES}"].insert_one(doc)
+    return to_api(doc)
+
+
+def to_api(doc: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "inferenceId": doc["_id"],
+        "modelId": doc["modelId"],
+        "detections": decode_detections(doc.get("results") or {}),
+        "overlayHint": OVERLAY_HINT,
+        "suggestedDecision": doc["suggestedDecision"],
+        "sourcePath": doc.get("sourcePath"),
+        "imageDigest": doc.get("imageDigest"),
+        "processedAt": doc["processedAt"],
+        "decision": doc.get("decision"),
+    }
+    if doc.get("decision"):
+        out.update({k: doc.get(k) for k in ("notes", "decidedBy", "decidedAt")})
+    return out
+
+
+def decide(db, tenant: str, inference_id: str, decision: str, notes: Optional[str] = None,
+           user: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Record a reviewer decision; returns the updated record or None if it does not exist."""
+    if decision not in DECISIONS:
+        raise ValueError(f"decision must be one of {', '.join(DECISIONS)}")
+    ensure_indexes(db, tenant)
+    fields = {"decision": decision, "notes": notes, "decidedBy": user,
+              "decidedAt": _iso(datetime.now(timezone.utc))}
+    res = db[f"{tenant}{INFERENCES}"].update_one({"_id": inference_id}, {"$set": fields, "$unset": {"queue": ""}})
+    if not res.matched_count:
+        return None
+    return {"inferenceId": inference_id, **fields}
+
+
+def get(db, tenant: str, inference_id: str) -> Optional[Dict[str, Any]]:
+    doc = db[f"{tenant}{INFERENCES}"].find_one({"_id": inference_id})
+    return to_api(doc) if doc else None
+
+
+def review_queue(db, tenant: str, suggested: str = "fail", limit: int = 50,
+                 before: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Unreviewed inferences with the given suggestion, newest first; page with `before`."""
+    ensure_indexes(db, tenant)
+    filt: Dict[str, Any] = {"queue": suggested}
+    if before:
+        filt["processedAt"] = {"$lt": before}
+    cur = db[f"{tenant}{INFERENCES}"].find(filt).sort("processedAt", DESCENDING).limit(limit)
+    return [to_api(d) for d in cur]
+
+
+def queue_counts(db, tenant: str) -> Dict[str, int]:
+    ensure_indexes(db, tenant)
+    col = db[f"{tenant}{INFERENCES}"]
+    return {s: col.count_documents({"queue": s}) for s in DECISIONS}
@@ -0,0 +1,373 @@
+# app/services/trinetra_pool.py
+"""
+Model-serving pool for Trinetra inference.
+
+Long-lived worker processes load the model once (TRINETRA_MODEL, a
+"module:attr" factory) and keep it warm. Requests go into one queue. Each
+worker has a dispatcher thread in the API process that takes the first
+waiting image, then keeps collecting until:
+- the batch reaches TRINETRA_MAX_BATCH images,
+- TRINETRA_MAX_WAIT_MS has passed, or
+- the worker's shared-memory buffer (TRINETRA_SHM_MB) is full.
+
+It then runs the whole batch in one predict() call. Image bytes are copied
+into that buffer and only (offset, length) pairs cross the pipe, so pixels
+are never pickled. When every worker is busy the queue grows, so the next
+batch starts out full.
+
+submit() raises PoolBusy once TRINETRA_MAX_QUEUE images are waiting or
+running, and the upload endpoint turns that into 503 + Retry-After. With
+TRINETRA_POOL_WORKERS=0 (the default in USE_INMEMORY_DB mode; the tests set
+it) the model runs on a dispatcher thread in this process, with the same batching.
+"""
+import importlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "app.services.trinetra_infer:MockDetector"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _default_workers() -> int:
+    return 0 if os.getenv("USE_INMEMORY_DB") == "1" else 1
+
+
+class PoolBusy(RuntimeError):
+    """The inference queue is full; the caller should retry later."""
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def load_model(spec: str, kwargs: Optional[Dict[str, Any]] = None):
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr or "MockDetector")(**(kwargs or {}))
+
+
+def _predict(model, images) -> List[Tuple[str, Any]]:
+    """Per-image ("ok", detections) / ("invalid" | "error", message); one bad image does not sink the batch."""
+    try:
+        return [("ok", dets) for dets in model.predict(images)]
+    except Exception:
+        out = []
+        for img in images:
+            try:
+                out.append(("ok", model.predict([img])[0]))
+            except ValueError as e:
+                out.append(("invalid", str(e)))
+            except Exception as e:
+                out.append(("error", f"{type(e).__name__}: {e}"))
+        return out
+
+
+def _serve(conn, shm_name: str, spec: str, kwargs: Dict[str, Any]) -> None:
+    """Worker process: attach the shared buffer, load the model once, answer batches until told to stop."""
+    from multiprocessing import shared_memory
+
+    # attaching re-registers the name with the parent's resource tracker (a
+    # no-op); the API process owns the segment and unlinks it on close
+    shm = shared_memory.SharedMemory(name=shm_name)
+    model = load_model(spec, kwargs)
+    conn.send(("ready", getattr(model, "model_id", spec)))
+    try:
+        while True:
+            spans = conn.recv()
+            if spans is None:
+                break
+            views = [shm.buf[a:a + n] for a, n in spans]
+            try:
+                results = _predict(model, views)
+            finally:
+                for v in views:
+                    v.release()
+            conn.send(results)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, pool: "InferencePool", index: int):
+        self.pool = pool
+        self.index = index
+        self.proc = None
+        self.conn = None
+        self.shm = None
+        self.capacity = pool.shm_bytes
+
+    def start(self) -> None:
+        from multiprocessing import get_context, shared_memory
+
+        ctx = get_context(self.pool.start_method)
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.capacity)
+        parent, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_serve, name=f"trinetra-model-{self.index}", daemon=True,
+                                args=(child, self.shm.name, self.pool.model_spec, self.pool.model_kwargs))
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        try:
+            _, model_id = self.conn.recv()
+        except EOFError:
+            self.proc.join(timeout=5)
+            code = self.proc.exitcode
+            self.conn, self.proc = None, None
+            raise WorkerError(f"inference worker failed to start (exit code {code})")
+        self.pool.model_id = model_id
+
+    def run(self, images: List[bytes]) -> List[Tuple[str, Any]]:
+        spans, off = [], 0
+        for img in images:
+            self.shm.buf[off:off + len(img)] = img
+            spans.append((off, len(img)))
+            off += len(img)
+        for attempt in (1, 2):
+            try:
+                if self.conn is None:  # crashed, or an earlier restart failed
+                    self.pool._count("restarts")
+                    self.start()
+                self.conn.send(spans)
+                return self.conn.recv()
+            except (EOFError, OSError):
+                # a crashed worker is replaced and the batch retried once
+                logger.error("trinetra worker %d died; restarting", self.index)
+                self.stop()
+            except WorkerError as e:
+                logger.error("trinetra worker %d: %s", self.index, e)
+        raise WorkerError("inference worker failed twice on the same batch")
+
+    def stop(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.proc is not None:
+            self.proc.join(timeout=5)
+            if self.proc.is_alive():
+                self.proc.kill()
+            self.proc = None
+
+    def release(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class _InProcess:
+    """Same interface as _Worker; runs the model on the dispatcher thread."""
+
+    def __init__(self, pool: "InferencePool"):
+        self.pool = pool
+        self.capacity = pool.shm_bytes
+        self.model = None
+
+    def start(self) -> None:
+        self.model = load_model(self.pool.model_spec, self.pool.model_kwargs)
+        self.pool.model_id = getattr(self.model, "model_id", self.pool.model_spec)
+
+    def run(self, images: List[bytes]) -> List[Tuple[str, Any]]:
+        return _predict(self.model, images)
+
+    def stop(self) -> None:
+        self.model = None
+
+    def release(self) -> None:
+        pass
+
+
+_STOP = object()
+
+
+class InferencePool:
+    def __init__(self, workers: Optional[int] = None, max_batch: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, max_queue: Optional[int] = None,
+                 shm_mb: Optional[int] = None, model: Optional[str] = None,
+                 model_kwargs: Optional[Dict[str, Any]] = None, start_method: Optional[str] = None):
+        self.workers = workers if workers is not None else _env_int("TRINETRA_POOL_WORKERS", _default_workers())
+        self.max_batch = max(1, max_batch or _env_int("TRINETRA_MAX_BATCH", 16))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else _env_int("TRINETRA_MAX_WAIT_MS", 10)) / 1000.0
+        self.max_queue = max_queue or _env_int("TRINETRA_MAX_QUEUE", 256)
+        self.shm_bytes = (shm_mb or _env_int("TRINETRA_SHM_MB", 64)) * 1024 * 1024
+        self.model_spec = model or os.getenv("TRINETRA_MODEL", DEFAULT_MODEL)
+        self.model_kwargs = model_kwargs or {}
+        self.start_method = start_method or os.getenv("TRINETRA_POOL_START", "spawn")
+        self.model_id: Optional[str] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._slots: List[Any] = []
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counts = {"submitted": 0, "rejected": 0, "batches": 0, "images": 0, "errors": 0, "restarts": 0}
+        self._started = False
+
+    # --- lifecycle ---------------------------------------------------------------
+    def start(self) -> "InferencePool":
+        with self._lock:
+            if self._started:
+                return self
+            self._slots = [_Worker(self, i) for i in range(self.workers)] or [_InProcess(self)]
+            for slot in self._slots:
+                slot.start()
+            self._threads = [threading.Thread(target=self._dispatch, args=(slot,), daemon=True,
+                                              name=f"trinetra-dispatch-{i}") for i, slot in enumerate(self._slots)]
+            for t in self._threads:
+                t.start()
+            self._started = True
+        logger.info("trinetra pool: %d worker(s), model %s, batch<=%d, wait<=%.0fms",
+                    self.workers, self.model_id, self.max_batch, self.max_wait * 1000)
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join(timeout=10)
+        for slot in self._slots:
+            slot.stop()
+            slot.release()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(PoolBusy("inference pool is shutting down"))
+
+    # --- requests ---------------------------------------------------------------
+    def submit(self, image: bytes) -> Future:
+        """Queue one image; the Future resolves to its detections."""
+        if len(image) > self.shm_bytes:
+            raise ValueError(f"image larger than TRINETRA_SHM_MB ({self.shm_bytes // (1024 * 1024)} MB)")
+        if not self._started:
+            self.start()
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._counts["rejected"] += 1
+                raise PoolBusy(f"inference queue full ({self.max_queue} pending)")
+            self._pending += 1
+            self._counts["submitted"] += 1
+        fut: Future = Future()
+        self._queue.put((image, fut))
+        return fut
+
+    def infer(self, image: bytes, timeout: Optional[float] = None):
+        return self.submit(image).result(timeout)
+
+    # --- dispatch ---------------------------------------------------------------
+    def _collect(self, capacity: int, carry):
+        first = carry if carry is not None else self._queue.get()
+        if first is _STOP:
+            return None, None
+        batch, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            if size + len(item[0]) > capacity:
+                return batch, item
+            batch.append(item)
+            size += len(item[0])
+        return batch, None
+
+    def _dispatch(self, slot) -> None:
+        carry = None
+        while True:
+            batch, carry = self._collect(slot.capacity, carry)
+            if batch is None:
+                return
+            try:
+                results = slot.run([img for img, _ in batch])
+            except Exception as e:
+                results = [("error", str(e))] * len(batch)
+            with self._lock:
+                self._pending -= len(batch)
+                self._counts["batches"] += 1
+                self._counts["images"] += len(batch)
+                self._counts["errors"] += sum(1 for r in results if r[0] != "ok")
+            for (_, fut), (status, value) in zip(batch, results):
+                if status == "ok":
+                    fut.set_result(value)
+                elif status == "invalid":
+                    from app.services.trinetra_infer import InvalidImage
+                    fut.set_exception(InvalidImage(value))
+                else:
+                    fut.set_exception(WorkerError(value))
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counts)
+            pending = self._pending
+        return {
+            "workers": self.workers, "started": self._started, "model_id": self.model_id,
+            "alive": sum(1 for s in self._slots if getattr(s, "proc", None) is not None and s.proc.is_alive())
+            if self.workers else int(self._started),
+            "pending": pending, "max_queue": self.max_queue, "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1), "shm_mb": self.shm_bytes // (1024 * 1024),
+            **c, "avg_batch": round(c["images"] / c["batches"], 2) if c["batches"] else None,
+        }
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> InferencePool:
+    """The process-wide pool, created (and its workers started) on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool()
+    return _pool.start()
+
+
+def current_pool() -> Optional[InferencePool]:
+    return _pool
+
+
+def warm() -> None:
+    """Start the model workers at boot (lifespan) so the first upload does not pay the model load."""
+    if _env_int("TRINETRA_POOL_WORKERS", _default_workers()) > 0 and os.getenv("TRINETRA_POOL_LAZY") != "1":
+        get_pool()
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,70 @@
+"""
+scripts/bench_jwt.py
+
+Usage:
+  python -m scripts.bench_jwt [--n 50000] [--keys 3] [--json out.json]
+
+Verifies the same HS256 tokens with the shared keyring (app/auth/keyring.py),
+PyJWT and python-jose, and prints verifications/sec for each. Tokens are
+signed with every key of a `--keys`-key ring, the way they look mid-rotation,
+so the keyring's kid lookup is part of what is measured. A library that is
+not installed is skipped.
+"""
+
+import argparse
+import json
+import time
+
+
+def _timed(fn, tokens, n: int):
+    t = time.perf_counter()
+    for i in range(n):
+        fn(tokens[i % len(tokens)])
+    dt = time.perf_counter() - t
+    return {"verifications": n, "seconds": round(dt, 4), "per_sec": round(n / dt) if dt else None}
+
+
+def run(n: int, keys: int):
+    from app.auth.keyring import Key, Keyring, check_audience
+
+    secrets = {f"k{i}": f"bench-secret-{i}" for i in range(keys)}
+    ring = Keyring([Key(kid, s) for kid, s in secrets.items()], active="k0")
+    now = int(time.time())
+    claims = {"sub": "analyst", "tid": "acme", "role": "analyst", "aud": "acme", "iat": now, "exp": now + 3600}
+    tokens = [ring.sign(claims, kid) for kid in secrets]
+    results = {"keyring": _timed(lambda t: check_audience(ring.verify(t), "acme"), tokens, n)}
+
+    try:
+        import jwt as pyjwt
+        kid_secret = {t: secrets[pyjwt.get_unverified_header(t)["kid"]] for t in tokens}
+        results["pyjwt"] = _timed(
+            lambda t: pyjwt.decode(t, kid_secret[t], algorithms=["HS256"], audience="acme"), tokens, n)
+    except ImportError:
+        pass
+    try:
+        from jose import jwt as jose_jwt
+        kid_secret = {t: secrets[jose_jwt.get_unverified_header(t)["kid"]] for t in tokens}
+        results["jose"] = _timed(
+            lambda t: jose_jwt.decode(t, kid_secret[t], algorithms=["HS256"], audience="acme"), tokens, n)
+    except ImportError:
+        pass
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=50_000)
+    ap.add_argument("--keys", type=int, default=3)
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    out = run(args.n, args.keys)
+    for name, r in out.items():
+        print(f"{name:8} {r['per_sec']:>9} verifications/s")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(out, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
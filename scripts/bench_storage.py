@@ -0,0 +1,132 @@
+"""
+scripts/bench_storage.py
+
+Usage:
+  python -m scripts.bench_storage [--docs 20000] [--tenants 20] [--backends memory,sqlite,mongo] [--json out.json]
+
+Runs the same router-shaped workload (bulk seed, latest-report lookup, status
+counts, time-range page, single-document updates) against each storage
+backend and prints ops/sec per step. The mongo backend uses MONGO_URI with a
+throwaway `<DB_NAME>_bench` database and is skipped if the server is unreachable.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def _workload_docs(tenant: str, n: int, rnd: random.Random):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "tenant": tenant,
+        "target": f"10.0.{rnd.randint(0, 9)}.{rnd.randint(1, 254)}",
+        "status": rnd.choice(["queued", "running", "done", "failed"]),
+        "ts": (base + timedelta(seconds=i * 37)).isoformat(),
+        "ports": rnd.randint(0, 40),
+        "key": f"{tenant}-{i}",
+    } for i in range(n)]
+
+
+def _timed(fn, repeat: int):
+    t = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    dt = time.perf_counter() - t
+    return {"ops": repeat, "seconds": round(dt, 4), "ops_per_sec": round(repeat / dt, 1) if dt else None}
+
+
+def run(db, docs: int, tenants: int, seed: int = 7):
+    rnd = random.Random(seed)
+    names = [f"bench{i}" for i in range(tenants)]
+    per = max(1, docs // tenants)
+    results = {}
+
+    def seed_all(i):
+        col = db[f"{names[i]}_scans"]
+        batch = _workload_docs(names[i], per, rnd)
+        for j in range(0, len(batch), 1000):
+            col.insert_many(batch[j:j + 1000])
+    results["insert_many"] = _timed(seed_all, tenants)
+    results["insert_many"]["docs"] = per * tenants
+
+    def index_all(i):
+        col = db[f"{names[i]}_scans"]
+        col.create_index([("status", 1), ("ts", -1)])
+        col.create_index("ts")
+        col.create_index("key", unique=True)
+    results["create_index"] = _timed(index_all, tenants)
+
+    results["latest_by_ts"] = _timed(
+        lambda i: db[f"{names[i % tenants]}_scans"].find_one({}, sort=[("ts", -1)]), 2000)
+    results["count_by_status"] = _timed(
+        lambda i: db[f"{names[i % tenants]}_scans"].count_documents({"status": "failed"}), 2000)
+    results["range_page"] = _timed(
+        lambda i: list(db[f"{names[i % tenants]}_scans"]
+                       .find({"status": "done", "ts": {"$gte": "2025-01-01T06:00:00"}})
+                       .sort("ts", -1).limit(20)), 2000)
+    results["update_by_key"] = _timed(
+        lambda i: db[f"{names[i % tenants]}_scans"].update_one(
+            {"key": f"{names[i % tenants]}-{i % per}"}, {"$set": {"status": "done"}}), 2000)
+    return results
+
+
+def _backends(names, tmpdir):
+    for name in names:
+        if name == "memory":
+            from app.db.memory import MemoryDB
+            yield name, MemoryDB("bench"), None
+        elif name == "sqlite":
+            from app.db.sqlite_store import SQLiteDB
+            db = SQLiteDB(os.path.join(tmpdir, "bench.db"))
+            yield name, db, db.close
+        elif name == "mongo":
+            from app.db import manager
+            try:
+                client = manager.get_client()
+                client.admin.command("ping")
+            except Exception as e:
+                print(f"[skip] mongo unreachable: {e}", file=sys.stderr)
+                continue
+            db_name = f"{os.getenv('DB_NAME', 'trishul')}_bench"
+            client.drop_database(db_name)
+
+            def cleanup(client=client, db_name=db_name):
+                client.drop_database(db_name)
+                manager.shutdown()
+            yield name, client[db_name], cleanup
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=20000)
+    ap.add_argument("--tenants", type=int, default=20)
+    ap.add_argument("--backends", default="memory,sqlite,mongo")
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, db, cleanup in _backends(args.backends.split(","), tmpdir):
+            try:
+                report[name] = run(db, args.docs, args.tenants)
+            finally:
+                if cleanup:
+                    cleanup()
+
+    steps = ["insert_many", "create_index", "latest_by_ts", "count_by_status", "range_page", "update_by_key"]
+    print(f"{'step':<18}" + "".join(f"{b:>14}" for b in report))
+    for step in steps:
+        print(f"{step:<18}" + "".join(f"{report[b][step]['ops_per_sec'] or 0:>14,.0f}" for b in report))
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"docs": args.docs, "tenants": args.tenants, "results": report}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+scripts/bench_trinetra_pool.py
+
+Usage:
+  python -m scripts.bench_trinetra_pool [--images 2000] [--batches 1,2,4,8,16,32] [--workers 2]
+                                        [--batch-ms 20] [--image-ms 1] [--concurrency 64] [--json out.json]
+
+Measures images/sec through the Trinetra model pool (app/services/trinetra_pool.py)
+for each max batch size. `--concurrency` clients each submit one image at a time,
+as upload requests do. The stand-in model sleeps `batch-ms` per predict() call plus
+`image-ms` per image, which mimics a CPU model whose fixed per-call cost is what
+micro-batching amortizes. Pass `--model module:attr` to benchmark a real one.
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+
+
+def _images(n: int, size: int):
+    from PIL import Image
+
+    out = []
+    for i in range(n):
+        buf = io.BytesIO()
+        Image.new("RGB", (size, size), (i % 256, (i * 7) % 256, (i * 13) % 256)).save(buf, format="PNG")
+        out.append(buf.getvalue())
+    return out
+
+
+def run(images, max_batch: int, workers: int, concurrency: int, model: str, model_kwargs, max_wait_ms: float):
+    from app.services.trinetra_pool import InferencePool
+
+    pool = InferencePool(workers=workers, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                         max_queue=len(images) + concurrency, model=model, model_kwargs=model_kwargs).start()
+    try:
+        pool.infer(images[0])  # warm-up
+        pool._counts.update(batches=0, images=0)
+        latencies, lock, cursor = [], threading.Lock(), iter(range(len(images)))
+
+        def client():
+            while True:
+                with lock:
+                    i = next(cursor, None)
+                if i is None:
+                    return
+                t = time.perf_counter()
+                pool.infer(images[i])
+                with lock:
+                    latencies.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        dt = time.perf_counter() - t
+        latencies.sort()
+        stats = pool.stats()
+        return {"max_batch": max_batch, "images_per_sec": round(len(images) / dt, 1),
+                "avg_batch": stats["avg_batch"], "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1)}
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", type=int, default=2000)
+    ap.add_argument("--size", type=int, default=256, help="image edge in pixels")
+    ap.add_argument("--batches", default="1,2,4,8,16,32")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--max-wait-ms", type=float, default=10)
+    ap.add_argument("--model", default="app.services.trinetra_infer:MockDetector")
+    ap.add_argument("--batch-ms", type=float, default=20)
+    ap.add_argument("--image-ms", type=float, default=1)
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    images = _images(args.images, args.size)
+    kwargs = {"batch_ms": args.batch_ms, "image_ms": args.image_ms} if args.model.endswith(":MockDetector") else {}
+    rows = [run(images, int(b), args.workers, args.concurrency, args.model, kwargs, args.max_wait_ms)
+            for b in args.batches.split(",")]
+
+    print(f"{'max_batch':>9} {'images/s':>10} {'avg_batch':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in rows:
+        print(f"{r['max_batch']:>9} {r['images_per_sec']:>10,.1f} {r['avg_batch'] or 0:>10} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
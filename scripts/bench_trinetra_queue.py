@@ -0,0 +1,129 @@
+"""
+scripts/bench_trinetra_queue.py
+
+Usage:
+  python -m scripts.bench_trinetra_queue [--records 1000000] [--fail-ratio 0.05] [--reviewed 0.8]
+                                         [--backends memory,sqlite,mongo] [--json out.json]
+
+Seeds one tenant with N Trinetra inference records (packed detections, a
+share of them already reviewed) and times the reviewer queries: first and
+deep pages of "unreviewed failures", pending counts, and recording a
+decision. For comparison it also times the same question asked the old way,
+as a filter on `suggestedDecision` + `decision` without the queue index,
+which has to scan every record.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from scripts.bench_storage import _backends, _timed
+
+TENANT = "benchqc"
+
+
+def _detections(rnd: random.Random, fail: bool):
+    n = rnd.randint(1, 3) if fail else rnd.randint(0, 1)
+    top = rnd.uniform(0.65, 0.99) if fail else rnd.uniform(0.05, 0.35)
+    return [{"label": rnd.choice(("scratch", "dent", "crack", "stain")),
+             "score": round(top if i == 0 else rnd.uniform(0.05, top), 4),
+             "bbox": {"x": rnd.randint(0, 600), "y": rnd.randint(0, 440), "w": rnd.randint(5, 80), "h": rnd.randint(5, 80)}}
+            for i in range(n)]
+
+
+def seed(db, records: int, fail_ratio: float, reviewed: float, rnd: random.Random):
+    from bson import ObjectId
+
+    from app.services import trinetra_infer as ti
+
+    col = db[f"{TENANT}{ti.INFERENCES}"]
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for i in range(records):
+        dets = _detections(rnd, rnd.random() < fail_ratio)
+        suggested = ti.suggest(dets)
+        done = rnd.random() < reviewed
+        doc = {"_id": f"inf_{ObjectId()}", "modelId": "mdl_bench", "inputType": "image",
+               "sourcePath": f"line{i % 8}/{i}.png", "results": ti.encode_detections(dets),
+               "score": max((d["score"] for d in dets), default=0.0), "suggestedDecision": suggested,
+               "decision": suggested if done else None,
+               "processedAt": ti._iso(base + timedelta(seconds=i * 3))}
+        if not done:
+            doc["queue"] = suggested
+        batch.append(doc)
+        if len(batch) == 5000:
+            col.insert_many(batch)
+            batch = []
+    if batch:
+        col.insert_many(batch)
+
+
+def run(db, records: int, fail_ratio: float, reviewed: float, seed_value: int = 7):
+    from app.services import trinetra_infer as ti
+
+    rnd = random.Random(seed_value)
+    results = {}
+    t = time.perf_counter()
+    seed(db, records, fail_ratio, reviewed, rnd)
+    results["seed"] = {"records": records, "seconds": round(time.perf_counter() - t, 2)}
+
+    results["scan_unreviewed_fail"] = _timed(
+        lambda i: list(db[f"{TENANT}{ti.INFERENCES}"].find({"suggestedDecision": "fail", "decision": None})
+                       .sort("processedAt", -1).limit(50)), 3)
+
+    t = time.perf_counter()
+    ti._indexed.discard((id(db), TENANT))
+    ti.ensure_indexes(db, TENANT)
+    results["create_index"] = {"seconds": round(time.perf_counter() - t, 2)}
+
+    first = ti.review_queue(db, TENANT, "fail", limit=50)
+    results["queue_first_page"] = _timed(lambda i: ti.review_queue(db, TENANT, "fail", limit=50), 200)
+    deep = first[-1]["processedAt"] if first else None
+    for _ in range(20):
+        page = ti.review_queue(db, TENANT, "fail", limit=50, before=deep)
+        if len(page) < 50:
+            break
+        deep = page[-1]["processedAt"]
+    results["queue_page_21"] = _timed(lambda i: ti.review_queue(db, TENANT, "fail", limit=50, before=deep), 200)
+    results["pending_counts"] = _timed(lambda i: ti.queue_counts(db, TENANT), 20)
+    ids = [d["inferenceId"] for d in ti.review_queue(db, TENANT, "fail", limit=200)]
+    results["decide"] = _timed(lambda i: ti.decide(db, TENANT, ids[i % len(ids)], "fail", None, "bench"),
+                               min(200, len(ids)) or 1)
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--records", type=int, default=1_000_000)
+    ap.add_argument("--fail-ratio", type=float, default=0.05)
+    ap.add_argument("--reviewed", type=float, default=0.8)
+    ap.add_argument("--backends", default="memory,sqlite,mongo")
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, db, cleanup in _backends(args.backends.split(","), tmpdir):
+            print(f"[{name}] seeding {args.records:,} records ...", file=sys.stderr)
+            try:
+                report[name] = run(db, args.records, args.fail_ratio, args.reviewed)
+            finally:
+                if cleanup:
+                    cleanup()
+
+    steps = ["scan_unreviewed_fail", "queue_first_page", "queue_page_21", "pending_counts", "decide"]
+    print(f"{'step (ops/sec)':<22}" + "".join(f"{b:>14}" for b in report))
+    for step in steps:
+        print(f"{step:<22}" + "".join(f"{report[b][step]['ops_per_sec'] or 0:>14,.1f}" for b in report))
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"records": args.records, "results": report}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,25 @@
 scripts/create_indexes.py
 
 Usage:
-  python scripts/create_indexes.py <tenant>
+  python -m scripts.create_indexes <tenant>
 
 Reads MONGO_URI and CORE_DB from .env.
 Creates per-tenant collections and indexes for Phase 2.1 acceptance.
+Uses the shared pooled client from app.db.manager (same timeouts/compression
+as the API) and closes it when done.
 """
 
 import os
 import sys
 from datetime import datetime
 from dotenv import load_dotenv
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING
+
+from app.db import manager
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python scripts/create_indexes.py <tenant>")
+        print("Usage: python -m scripts.create_indexes <tenant>")
         sys.exit(2)
 
     tenant = sys.argv[1].strip().lower()
@@ -28,8 +32,7 @@ def main():
         print("ERROR: MONGO_URI or CORE_DB missing in environment")
         sys.exit(1)
 
-    client = MongoClient(uri)
-    db = client[db_name]
+    db = manager.get_core_db()
 
     # Per-tenant collection names (simple convention)
     coll_scans = db[f"{tenant}_scans"]         # Kavach scan results
@@ -73,10 +76,35 @@ def main():
     for name, keys in log_indexes:
         coll_logs.create_index(keys, name=name)
 
+    # Kavach per-port snapshot and change log (see app/services/scan_diff.py)
+    from app.services import scan_diff
+    for suffix, specs in scan_diff.INDEXES.items():
+        for name, keys, unique in specs:
+            db[f"{tenant}{suffix}"].create_index(keys, name=name, unique=unique)
+
+    # Rudra usage day buckets (see app/services/rudra_usage.py)
+    from app.services import rudra_usage
+    rudra_usage.ensure_indexes(db, tenant)
+
+    # Trinetra inference records / review queues (see app/services/trinetra_infer.py)
+    from app.services import trinetra_infer
+    trinetra_infer.ensure_indexes(db, tenant)
+
+    # Job submission claims for idempotency / dedupe (see app/services/job_dedupe.py)
+    from app.services import job_dedupe
+    job_dedupe.ensure_indexes(db, tenant)
+
+    # Persisted job progress (see app/common/jobprogress.py)
+    from app.common import jobprogress
+    for suffix, specs in jobprogress.INDEXES.items():
+        for name, keys, unique in specs:
+            db[f"{tenant}{suffix}"].create_index(keys, name=name, unique=unique)
+
     print(f"Indexes created for {tenant}")
     # Optional: print actual index names for snapshotting in Atlas UI
     for coll in (coll_scans, coll_costs, coll_qc, coll_logs):
         print(f" - {coll.name}: {[idx['name'] for idx in coll.list_indexes()]}")
+    manager.shutdown()
 
 
 if __name__ == "__main__":
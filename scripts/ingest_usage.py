@@ -0,0 +1,42 @@
+"""
+scripts/ingest_usage.py
+
+Usage:
+  python -m scripts.ingest_usage <tenant> <export.csv|export.ndjson> [--format csv|ndjson]
+
+Bulk-loads a cloud billing export into the Rudra usage time-series
+(app/services/rudra_usage.py) of the configured backend. Rows are folded
+into per-service day buckets; re-running the same export is idempotent.
+"""
+
+import argparse
+import sys
+import time
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("tenant")
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=("csv", "ndjson"),
+                    help="default: from the file extension (.ndjson/.jsonl -> ndjson, else csv)")
+    args = ap.parse_args(argv)
+
+    from app.deps import get_db
+    from app.services import rudra_usage
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(args.path, encoding="utf-8-sig") as f:
+        text = f.read()
+    started = time.perf_counter()
+    out = rudra_usage.ingest_text(get_db(), args.tenant, text, fmt)
+    elapsed = time.perf_counter() - started
+    print(f"{out['points']} points into {out['buckets']} buckets, {out['skipped']} skipped "
+          f"in {elapsed:.2f}s")
+    for err in out["errors"]:
+        print(f"  {err}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+scripts/loadtest.py
+
+Usage:
+  python -m scripts.loadtest [--tenants 20] [--requests 3000] [--concurrency 32] [--seed 7]
+                             [--login-storm 0] [--json out.json] [--thresholds perf.json]
+                             [--baseline previous.json --max-regression 0.25]
+
+Boots app.main:app in-process (USE_INMEMORY_DB=1, no network) and drives a
+weighted mix of real routes across many tenants: login, kavach report
+generate/pdf, nandi events read/seed, trinetra upload, rudra forecast and
+jobs submit/poll. Prints requests/sec and p50/p95/p99 latency per route.
+
+--login-storm N adds N logins of distinct users ("login_cold") to the front
+half of the plan, like a shift change. None of them can be answered from the
+verified-login cache, so each costs a full bcrypt check. They retry on 503 as
+a client would. The p95 of the other routes shows whether the storm starves
+them.
+
+Regression gates (exit code 1 when any fails):
+  --thresholds  JSON {"<route>": {"p95_ms": 50, "p99_ms": 120, "min_rps": 20, "max_error_rate": 0}}
+                ("*" applies to every route)
+  --baseline    JSON written by an earlier --json run; a route fails if its p95
+                grew by more than --max-regression (fraction) over the baseline.
+"""
+
+import os
+
+# must be set before the app (and app.deps) are imported
+os.environ.setdefault("USE_INMEMORY_DB", "1")
+os.environ.setdefault("DISABLE_SCHEDULER", "1")
+os.environ.setdefault("SECRET_KEY", "loadtest-secret-key")
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict, deque
+
+import httpx
+
+# route name -> relative weight in the mix
+DEFAULT_MIX = {
+    "login": 8,
+    "kavach_report_generate": 6,
+    "kavach_report_pdf": 2,
+    "nandi_events_read": 20,
+    "nandi_events_seed": 10,
+    "trinetra_upload": 10,
+    "rudra_forecast": 18,
+    "jobs_submit": 12,
+    "jobs_poll": 14,
+}
+
+_JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+
+
+_COLD_PASSWORD = "shift-change-1"
+
+
+class _Tenant:
+    __slots__ = ("name", "host", "headers", "jobs", "cold")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.host = f"{name}.lvh.me"
+        self.headers = {"Host": self.host}
+        self.jobs = deque(maxlen=64)
+        self.cold = deque()
+
+
+async def _login(c, t, rnd):
+    user = rnd.choice(["owner", "analyst"])
+    return await c.post("/api/auth/login", headers={"Host": t.host},
+                        json={"username": user, "password": "secret123"})
+
+
+async def _login_cold(c, t, rnd):
+    user = t.cold.popleft() if t.cold else "shift0"
+    for _ in range(30):
+        r = await c.post("/api/auth/login", headers={"Host": t.host},
+                         json={"username": user, "password": _COLD_PASSWORD})
+        if r.status_code != 503:
+            return r
+        await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+    return r
+
+
+def _seed_cold_users(pool, n: int) -> None:
+    """n distinct users across the tenants, all with one precomputed hash (hashing each would take minutes)."""
+    from app.auth import credentials
+    from app.deps import get_db
+
+    db = get_db()
+    hashed = credentials.hash_password(_COLD_PASSWORD)
+    for i in range(n):
+        t = pool[i % len(pool)]
+        user = f"shift{i}"
+        db[f"{t.name}{credentials.USERS}"].update_one(
+            {"_id": user}, {"$set": {"hash": hashed, "role": "analyst", "disabled": False}}, upsert=True)
+        t.cold.append(user)
+
+
+async def _kavach_report_generate(c, t, rnd):
+    return await c.post("/api/kavach/report/generate", headers=t.headers)
+
+
+async def _kavach_report_pdf(c, t, rnd):
+    return await c.get("/api/kavach/report/pdf", headers=t.headers)
+
+
+async def _nandi_events_read(c, t, rnd):
+    return await c.get("/api/nandi/events", headers=t.headers)
+
+
+async def _nandi_events_seed(c, t, rnd):
+    events = [{"type": rnd.choice(["login", "scan", "alert"]), "severity": rnd.randint(1, 5)}
+              for _ in range(rnd.randint(1, 5))]
+    return await c.post("/api/nandi/events/seed", headers=t.headers, json=events)
+
+
+async def _trinetra_upload(c, t, rnd):
+    files = {"file": (f"part-{rnd.randint(1, 10**6)}.jpg", _JPEG, "image/jpeg")}
+    return await c.post("/api/trinetra/qc/upload", headers=t.headers, files=files)
+
+
+async def _rudra_forecast(c, t, rnd):
+    return await c.get("/api/rudra/cloud/forecast", headers=t.headers)
+
+
+async def _jobs_submit(c, t, rnd):
+    r = await c.post("/api/jobs/echo", headers=t.headers,
+                     json={"message": f"ping-{rnd.randint(1, 10**6)}", "delay_seconds": 0})
+    if r.status_code == 200:
+        t.jobs.append(r.json()["job_id"])
+    return r
+
+
+async def _jobs_poll(c, t, rnd):
+    if not t.jobs:
+        return await _jobs_submit(c, t, rnd)
+    return await c.get(f"/api/jobs/status/{rnd.choice(t.jobs)}", headers=t.headers)
+
+
+SCENARIOS = {
+    "login": _login,
+    "login_cold": _login_cold,
+    "kavach_report_generate": _kavach_report_generate,
+    "kavach_report_pdf": _kavach_report_pdf,
+    "nandi_events_read": _nandi_events_read,
+    "nandi_events_seed": _nandi_events_seed,
+    "trinetra_upload": _trinetra_upload,
+    "rudra_forecast": _rudra_forecast,
+    "jobs_submit": _jobs_submit,
+    "jobs_poll": _jobs_poll,
+}
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, errors, wall: float):
+    routes = {}
+    for name in sorted(set(samples) | set(errors)):
+        lat = sorted(samples.get(name, []))
+        n = len(lat)
+        routes[name] = {
+            "requests": n,
+            "errors": errors.get(name, 0),
+            "error_rate": round(errors.get(name, 0) / n, 4) if n else 0.0,
+            "rps": round(n / wall, 1) if wall else 0.0,
+            "mean_ms": round(sum(lat) / n, 3) if n else 0.0,
+            "p50_ms": round(percentile(lat, 50), 3),
+            "p95_ms": round(percentile(lat, 95), 3),
+            "p99_ms": round(percentile(lat, 99), 3),
+            "max_ms": round(lat[-1], 3) if lat else 0.0,
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "total_requests": total,
+        "total_errors": sum(r["errors"] for r in routes.values()),
+        "seconds": round(wall, 3),
+        "rps": round(total / wall, 1) if wall else 0.0,
+        "routes": routes,
+    }
+
+
+async def _run(app, tenants: int, requests: int, concurrency: int, seed: int, mix, login_storm: int = 0) -> dict:
+    rnd = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    pool = [_Tenant(f"load{i}") for i in range(tenants)]
+    plan = [(rnd.choice(pool), rnd.choices(names, weights)[0], rnd.random()) for _ in range(requests)]
+    if login_storm:
+        _seed_cold_users(pool, login_storm)
+        for i in range(login_storm):
+            plan.insert(rnd.randint(0, len(plan) // 2), (pool[i % len(pool)], "login_cold", rnd.random()))
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as c:
+            # warm-up: one token and one report per tenant, so the pdf route
+            # always has something to render and requests carry a bearer token
+            for t in pool:
+                r = await _login(c, t, random.Random(0))
+                if r.status_code == 200:
+                    t.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+                await _kavach_report_generate(c, t, rnd)
+
+            queue = deque(plan)
+
+            async def worker():
+                while queue:
+                    tenant, name, r_seed = queue.popleft()
+                    t0 = time.perf_counter()
+                    try:
+                        resp = await SCENARIOS[name](c, tenant, random.Random(r_seed))
+                        ok = resp.status_code < 400
+                    except Exception:
+                        ok = False
+                    samples[name].append((time.perf_counter() - t0) * 1000.0)
+                    if not ok:
+                        errors[name] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+            wall = time.perf_counter() - start
+
+    report = summarize(samples, errors, wall)
+    report["config"] = {"tenants": tenants, "requests": requests, "concurrency": concurrency,
+                        "seed": seed, "mix": dict(mix), "login_storm": login_storm}
+    return report
+
+
+def run(tenants: int = 20, requests: int = 3000, concurrency: int = 32, seed: int = 7, mix=None,
+        login_storm: int = 0) -> dict:
+    """Run one load test against the in-process app and return the summary."""
+    from app.main import app
+    return asyncio.run(_run(app, tenants, requests, concurrency, seed, mix or DEFAULT_MIX, login_storm))
+
+
+def check(report: dict, thresholds=None, baseline=None, max_regression: float = 0.25):
+    """Return a list of human-readable regression failures (empty == pass)."""
+    failures = []
+    routes = report.get("routes", {})
+    for name, stats in routes.items():
+        limits = {**(thresholds or {}).get("*", {}), **(thresholds or {}).get(name, {})}
+        for key in ("p50_ms", "p95_ms", "p99_ms", "mean_ms"):
+            if key in limits and stats[key] > limits[key]:
+                failures.append(f"{name}: {key} {stats[key]} > {limits[key]}")
+        if "min_rps" in limits and stats["rps"] < limits["min_rps"]:
+            failures.append(f"{name}: rps {stats['rps']} < {limits['min_rps']}")
+        if "max_error_rate" in limits and stats["error_rate"] > limits["max_error_rate"]:
+            failures.append(f"{name}: error_rate {stats['error_rate']} > {limits['max_error_rate']}")
+
+        base = (baseline or {}).get("routes", {}).get(name)
+        if base and base.get("p95_ms"):
+            allowed = base["p95_ms"] * (1.0 + max_regression)
+            if stats["p95_ms"] > allowed:
+                failures.append(f"{name}: p95 {stats['p95_ms']}ms regressed more than "
+                                f"{max_regression:.0%} over baseline {base['p95_ms']}ms")
+    return failures
+
+
+def _print_table(report: dict) -> None:
+    print(f"{'route':<24}{'reqs':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, s in report["routes"].items():
+        print(f"{name:<24}{s['requests']:>7}{s['errors']:>6}{s['rps']:>9.1f}"
+              f"{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+    print(f"{'total':<24}{report['total_requests']:>7}{report['total_errors']:>6}{report['rps']:>9.1f}"
+          f"   ({report['seconds']}s)")
+
+
+def _load_json(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tenants", type=int, default=20)
+    ap.add_argument("--requests", type=int, default=3000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--login-storm", type=int, default=0)
+    ap.add_argument("--json", dest="json_out")
+    ap.add_argument("--thresholds")
+    ap.add_argument("--baseline")
+    ap.add_argument("--max-regression", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    report = run(args.tenants, args.requests, args.concurrency, args.seed, login_storm=args.login_storm)
+    failures = check(report, _load_json(args.thresholds), _load_json(args.baseline), args.max_regression)
+    report["failures"] = failures
+
+    _print_table(report)
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+    for line in failures:
+        print(f"[FAIL] {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
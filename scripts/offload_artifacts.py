@@ -0,0 +1,67 @@
+"""
+scripts/offload_artifacts.py
+
+Usage:
+  python -m scripts.offload_artifacts [--tenants a,b,c] [--dry-run]
+
+Moves report HTML/PDF and raw nmap XML that older code stored inline in
+`{tenant}_kavach_reports` / `{tenant}_scans` into the artifact store
+(app/services/artifacts.py) and leaves only the references behind.
+"""
+
+import argparse
+import sys
+
+
+def offload(db, tenant: str, dry_run: bool = False) -> dict:
+    from app.services import artifacts
+
+    store = artifacts.get_store(db)
+    moved = {"reports": 0, "scans": 0, "bytes": 0}
+    reports = db[f"{tenant}_kavach_reports"]
+    for doc in reports.find({"$or": [{"html": {"$exists": True}}, {"pdf": {"$exists": True}}]}):
+        update = {}
+        for field, kind, ctype in (("html", "report_html", "text/html; charset=utf-8"),
+                                   ("pdf", "report_pdf", "application/pdf")):
+            if doc.get(field) is None:
+                continue
+            data = doc[field] if isinstance(doc[field], str) else bytes(doc[field])
+            moved["bytes"] += len(data)
+            if not dry_run:
+                meta = store.put(tenant, data, kind, ctype, artifact_id=f"{doc['_id']}.{field}",
+                                 report_id=str(doc["_id"]))
+                update[f"{field}_artifact"] = artifacts.summary(meta)
+        if not dry_run:
+            reports.update_one({"_id": doc["_id"]}, {"$set": update, "$unset": {"html": "", "pdf": ""}})
+        moved["reports"] += 1
+    scans = db[f"{tenant}_scans"]
+    for doc in scans.find({"raw_xml": {"$exists": True}}):
+        moved["bytes"] += len(doc["raw_xml"] or "")
+        if not dry_run:
+            meta = store.put(tenant, doc["raw_xml"] or "", "raw_xml", "application/xml",
+                             artifact_id=f"{doc['_id']}.xml")
+            scans.update_one({"_id": doc["_id"]}, {"$set": {"raw_xml_artifact": artifacts.summary(meta)},
+                                                   "$unset": {"raw_xml": ""}})
+        moved["scans"] += 1
+    return moved
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tenants", help="comma-separated tenants (default: every tenant with reports or scans)")
+    ap.add_argument("--dry-run", action="store_true", help="only count what would be moved")
+    args = ap.parse_args(argv)
+
+    from app.deps import get_db
+    from app.services.report_batch import discover_tenants
+
+    db = get_db()
+    tenants = args.tenants.split(",") if args.tenants else discover_tenants(db)
+    for t in tenants:
+        moved = offload(db, t, dry_run=args.dry_run)
+        print(f"{t}: {moved['reports']} reports, {moved['scans']} scans, {moved['bytes']} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
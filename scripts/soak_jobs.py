@@ -0,0 +1,69 @@
+"""
+scripts/soak_jobs.py
+
+Usage:
+  python -m scripts.soak_jobs [--jobs 1000000] [--max-finished 50000] [--ttl 3600]
+                              [--result-kb 1] [--large-every 1000] [--every 100000] [--json out.json]
+
+Pushes jobs through a job registry (app/common/jobregistry.py) the way the job
+routers do: create, then running, then succeeded. It prints the registry size
+and the process RSS every `--every` jobs. Memory should rise until the
+retention window (`--max-finished` / `--ttl`) is full and then stay flat.
+Every `--large-every`-th result is larger than the inline limit, so it is
+offloaded to an in-memory artifact store and deleted again on eviction.
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+
+def run(jobs: int, max_finished: int, ttl: float, result_kb: int, large_every: int, every: int):
+    from app.common import jobregistry
+    from app.db.memory import MemoryDB
+
+    db = MemoryDB("soak")
+    reg = jobregistry.JobRegistry(ttl=ttl, max_finished=max_finished, max_result_bytes=result_kb * 1024,
+                                  db_factory=lambda: db)
+    small = {"echo": "x" * 64}
+    large = {"rows": ["y" * 100] * (result_kb * 12)}
+    samples = []
+    t0 = time.perf_counter()
+    for i in range(1, jobs + 1):
+        jid = str(uuid.uuid4())
+        reg.create(jid, "soak", "echo", {"module": "echo", "tenant": "soak", "message": "m"}, "interactive")
+        reg.update(jid, "running")
+        reg.update(jid, "succeeded", large if large_every and i % large_every == 0 else small)
+        if i % every == 0 or i == jobs:
+            s = reg.stats()
+            sample = {"jobs_done": i, "held": s["jobs"], "evicted": s["evicted"], "offloaded": s["offloaded"],
+                      "rss_mb": round(s["rss_bytes"] / 2**20, 1) if s["rss_bytes"] else None,
+                      "elapsed_s": round(time.perf_counter() - t0, 1)}
+            samples.append(sample)
+            print(json.dumps(sample), flush=True)
+    artifacts_left = db["soak_artifacts"].count_documents({})
+    return {"samples": samples, "artifacts_left": artifacts_left,
+            "jobs_per_s": round(jobs / (time.perf_counter() - t0))}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, default=1_000_000)
+    ap.add_argument("--max-finished", type=int, default=50_000)
+    ap.add_argument("--ttl", type=float, default=3600)
+    ap.add_argument("--result-kb", type=int, default=1, help="inline result limit")
+    ap.add_argument("--large-every", type=int, default=1000)
+    ap.add_argument("--every", type=int, default=100_000)
+    ap.add_argument("--json", dest="json_out")
+    args = ap.parse_args(argv)
+
+    out = run(args.jobs, args.max_finished, args.ttl, args.result_kb, args.large_every, args.every)
+    print(f"{out['jobs_per_s']} jobs/s, {out['artifacts_left']} offloaded results still stored")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(out, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,26 @@
-﻿import pytest
+﻿import os
+import time
+
+import jwt
+import pytest
 from starlette.testclient import TestClient
+from app.core.config import settings
 from app.main import app
 
+os.environ.setdefault("AUTH_DEV_MODE", "1")  # built-in analyst/owner logins
+os.environ.setdefault("TRINETRA_POOL_WORKERS", "0")  # model runs in-process, no worker processes
+
 @pytest.fixture(scope="session")
 def httpx_client():
     with TestClient(app) as c:
         yield c
+
+@pytest.fixture
+def auth_headers():
+    """auth_headers(role, host, sub) -> Host + Bearer headers for a short-lived token of the host's tenant."""
+    def make(role="owner", host="tenant1.lvh.me", sub="u"):
+        now = int(time.time())
+        tok = jwt.encode({"sub": sub, "tid": host.split(".")[0], "role": role, "iat": now, "exp": now + 300},
+                         settings.SECRET_KEY, algorithm="HS256")
+        return {"Host": host, "Authorization": f"Bearer {tok}"}
+    return make
@@ -0,0 +1,66 @@
+import pytest
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.deps import get_db
+from app.main import app
+from app.services import artifacts
+
+H = {"Host": "artifacts.lvh.me"}
+
+
+@pytest.mark.parametrize("backend", ["db", "local"])
+def test_chunked_roundtrip_and_ranges(backend, tmp_path):
+    db = MemoryDB("art")
+    chunks = artifacts.LocalChunks(tmp_path) if backend == "local" else artifacts.DBChunks(db)
+    store = artifacts.ArtifactStore(db, chunks, codec="gzip", chunk_size=1024)
+    body = ("<tr><td>10.0.0.1</td><td>443/tcp open https</td></tr>\n" * 200).encode()
+    meta = store.put("acme", body, "report_html", "text/html", artifact_id="r1.html")
+
+    assert meta["chunks"] == -(-len(body) // 1024) and meta["stored_size"] < len(body) // 4
+    assert store.read("acme", store.get("acme", "r1.html")) == body
+    # a range spanning a chunk boundary only decodes the chunks it covers
+    assert b"".join(store.iter_bytes("acme", meta, 1000, 2100)) == body[1000:2101]
+    assert store.get("other", "r1.html") is None
+
+    store.put("acme", b"short", "report_html", "text/html", artifact_id="r1.html")
+    assert store.read("acme", store.get("acme", "r1.html")) == b"short"
+    assert store.delete("acme", "r1.html") and store.get("acme", "r1.html") is None
+    with pytest.raises(ValueError):
+        store.put("acme", b"x", "raw_xml", "application/xml", artifact_id="../escape")
+
+
+def test_parse_range():
+    assert artifacts.parse_range(None, 100) is None
+    assert artifacts.parse_range("bytes=10-19", 100) == (10, 19)
+    assert artifacts.parse_range("bytes=90-", 100) == (90, 99)
+    assert artifacts.parse_range("bytes=-5", 100) == (95, 99)
+    assert artifacts.parse_range("bytes=0-999", 100) == (0, 99)
+    with pytest.raises(ValueError):
+        artifacts.parse_range("bytes=100-", 100)
+
+
+def test_reports_and_scans_keep_only_metadata_inline():
+    client = TestClient(app)
+    db = get_db()
+    xml = '<nmaprun><ports><port protocol="tcp" portid="22"><state state="open"/></port></ports></nmaprun>'
+    r = client.post("/api/kavach/scans/seed", headers=H, json=[{"target": "gw", "raw_xml": xml}])
+    assert r.json()["diffs"][0]["ports"] == 1
+    scan = db["artifacts_scans"].find_one({"target": "gw"})
+    assert "raw_xml" not in scan
+    raw = client.get(f"/api/kavach/artifacts/{scan['raw_xml_artifact']['id']}", headers=H)
+    assert raw.text == xml
+
+    client.post("/api/kavach/report/generate", headers=H)
+    doc = db["artifacts_kavach_reports"].find_one(sort=[("ts", -1)])
+    assert "html" not in doc and doc["html_artifact"]["size"] > 0
+    assert "Kavach Security Report" in client.get("/api/kavach/report/latest", headers=H).json()["preview"]
+
+    full = client.get("/api/kavach/report/pdf", headers=H)
+    assert full.status_code == 200 and full.content.startswith(b"%PDF")
+    assert full.headers["accept-ranges"] == "bytes"
+    part = client.get("/api/kavach/report/pdf", headers={**H, "Range": "bytes=0-99"})
+    assert part.status_code == 206 and part.content == full.content[:100]
+    assert part.headers["content-range"] == f"bytes 0-99/{len(full.content)}"
+    bad = client.get("/api/kavach/report/pdf", headers={**H, "Range": f"bytes={len(full.content)}-"})
+    assert bad.status_code == 416
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import cost_anomaly, rudra_usage
+
+
+def _hourly(service, start, values):
+    return [(service, start + timedelta(hours=h), v, float("nan")) for h, v in enumerate(values)]
+
+
+def test_detector_flags_spikes_not_noise_and_survives_reload():
+    rnd = random.Random(7)
+    det = cost_anomaly.AnomalyDetector(alpha=0.1, z=4, min_points=12, min_cost=1)
+    hits = [det.update("t", "ec2", h * 3600.0, 10 + rnd.uniform(-0.5, 0.5)) for h in range(200)]
+    assert not any(hits)
+    spike = det.update("t", "ec2", 200 * 3600.0, 40.0)
+    assert spike and spike["z"] >= 4 and 9 < spike["expected"] < 11
+    # the clipped update keeps the baseline close to normal after the spike
+    assert det.mean[det._index[("t", "ec2")]] < 13
+    assert det.update("t", "ec2", 100.0, 99.0) is None  # late point ignored
+
+    db = MemoryDB("anom")
+    det._dirty.add("t")
+    assert det.flush(db, force=True) == 1
+    fresh = cost_anomaly.AnomalyDetector(alpha=0.1, z=4, min_points=12, min_cost=1)
+    fresh.ensure_loaded(db, "t")
+    assert fresh.n[fresh._index[("t", "ec2")]] == 201 and fresh.update("t", "ec2", 201 * 3600.0, 45.0)
+
+
+def test_workers_merge_state_on_flush():
+    db = MemoryDB("anom-merge")
+    a, b = cost_anomaly.AnomalyDetector(), cost_anomaly.AnomalyDetector()
+    for h in range(10):
+        a.update("t", "ec2", h * 3600.0, 10.0)
+        b.update("t", "s3", h * 3600.0, 2.0)
+    b.update("t", "ec2", 50 * 3600.0, 12.0)   # b saw a newer ec2 point
+    assert a.flush(db, force=True) == b.flush(db, force=True) == 1
+
+    fresh = cost_anomaly.AnomalyDetector()
+    fresh.ensure_loaded(db, "t")
+    ec2, s3 = fresh._index[("t", "ec2")], fresh._index[("t", "s3")]
+    assert fresh.n[s3] == 10 and fresh.last[ec2] == 50 * 3600.0
+    assert db[cost_anomaly.STATE].find_one({"_id": "t"})["rev"] == 2
+
+    a.update("t", "ec2", 11 * 3600.0, 10.0)   # stale against the stored ec2 series
+    a.flush(db, force=True)
+    fresh = cost_anomaly.AnomalyDetector()
+    fresh.ensure_loaded(db, "t")
+    assert fresh.last[fresh._index[("t", "ec2")]] == 50 * 3600.0 and fresh.n[fresh._index[("t", "s3")]] == 10
+
+
+def test_ingest_publishes_anomalies_to_nandi(auth_headers):
+    from app.deps import get_db
+    db = get_db()
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    old = now - timedelta(days=10)
+    # a backfilled export trains the state without alerting, even with spikes
+    rudra_usage.ingest_points(db, "anom", _hourly("s3", old, [5.0] * 30 + [50.0] + [5.0] * 5))
+    assert db["anom_nandi"].count_documents({"type": "rudra.cost_anomaly"}) == 0
+    rudra_usage.ingest_points(db, "anom", _hourly("s3", now - timedelta(hours=2), [5.0, 5.2, 60.0]))
+    events = list(db["anom_nandi"].find({"type": "rudra.cost_anomaly"}))
+    assert len(events) == 1 and events[0]["service"] == "s3" and events[0]["value"] == 60.0
+
+    r = TestClient(app).get("/api/rudra/anomalies", headers=auth_headers("analyst", "anom.lvh.me"))
+    assert [a["value"] for a in r.json()["anomalies"]] == [60.0]
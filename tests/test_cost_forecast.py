@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import cost_forecast, rudra_usage
+
+
+def _seed(db, tenant, per_day, days=90):
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    rudra_usage.ingest_points(db, tenant, [("ec2", today - timedelta(days=d), per_day, float("nan"))
+                                           for d in range(1, days + 1)])
+
+
+def test_trend_and_weekday_seasonality():
+    first, today = datetime(2023, 9, 15).date(), datetime(2025, 9, 15).date()
+    D = (today - first).days
+    days = np.datetime64(first) + np.arange(D)
+    weekday = (days.astype(int) + 3) % 7
+    Y = np.vstack([10 + 0.01 * np.arange(D), np.where(weekday < 5, 10.0, 2.0)])
+    out = cost_forecast.fit_predict(Y, first, today, 2)
+    assert abs(out[0, 1] - sum(10 + 0.01 * (D + 16 + i) for i in range(31))) < 1  # October
+    assert abs(out[1, 1] - (23 * 10 + 8 * 2)) / 246 < 0.05
+
+
+def test_monthly_forecast_api_and_budget_alerts(auth_headers):
+    from app.deps import get_db
+    _seed(get_db(), "costs", 10.0)
+    client = TestClient(app)
+    assert client.put("/api/costs/budget", headers=auth_headers(host="costs.lvh.me"), json={"monthly": 200}).json()["monthly"] == 200
+
+    body = client.get("/api/costs/forecast?months=3", headers=auth_headers("analyst", "costs.lvh.me")).json()
+    assert body["currency"] == "USD" and len(body["forecast"]) == 3
+    assert body["forecast"][1]["predicted"] >= 280  # ~10/day
+    assert body["alerts"] and body["alerts"][0]["type"] == "budget"
+    assert body["alerts"][0]["message"].startswith("Likely to exceed $200 in ")
+    assert client.get("/api/costs/forecast?months=99", headers=auth_headers(host="costs.lvh.me")).status_code == 422
+
+    _seed(get_db(), "costs2", 10.0)
+    r = client.post("/api/admin/costs/forecast/refresh?months=2", headers=auth_headers(host="costs.lvh.me"))
+    assert r.json()["tenants"] == 1  # the caller's tenant only
+
+
+def test_refresh_all_tenants_publishes_new_alerts_once():
+    db = MemoryDB("costs")
+    for i, t in enumerate(["a", "b", "c"]):
+        _seed(db, t, 5.0 * (i + 1))
+    cost_forecast.set_budget(db, "c", 100)
+    first = cost_forecast.refresh_all(db, months=2)
+    assert first["tenants"] == 3 and first["new_alerts"] == 2
+    assert db["rudra_cost_forecasts"].find_one({"_id": "a"})["alerts"] == []
+    assert db["c_nandi"].count_documents({"type": "rudra.budget_alert"}) == 2
+    assert cost_forecast.refresh_all(db, months=2)["new_alerts"] == 0
+
+
+def test_daily_rollup_tracks_bucket_totals_on_reingest():
+    db = MemoryDB("rollup")
+    ts = datetime(2025, 3, 1, 6, tzinfo=timezone.utc)
+    rudra_usage.ingest_points(db, "r", [("ec2", ts, 4.0, 1.0), ("s3", ts, 1.0, 1.0)])
+    rudra_usage.ingest_points(db, "r", [("ec2", ts, 2.5, 1.0)])  # replaces the ec2 point
+    Y = cost_forecast.load_daily(db, ["r"], datetime(2025, 2, 27).date(), datetime(2025, 3, 3).date())
+    assert Y.tolist() == [[0.0, 0.0, 3.5, 0.0]]
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import jwt as pyjwt
+import pytest
+from starlette.testclient import TestClient
+
+from app.auth import credentials
+from app.db.memory import MemoryDB
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def _cheap_hashes(monkeypatch):
+    monkeypatch.setenv("AUTH_BCRYPT_ROUNDS", "4")
+
+
+def _store(**throttle):
+    return credentials.CredentialStore(pool=credentials.HashPool(workers=1, max_pending=4),
+                                       throttle=credentials.Throttle(**throttle))
+
+
+def test_login_uses_hashes_and_the_verified_cache():
+    db, store = MemoryDB("creds"), _store()
+    store.set_user(db, "acme", "alice", password="pw-1", role="owner")
+    assert db["acme_users"].find_one({"_id": "alice"})["hash"].startswith("$2b$04$")
+
+    assert asyncio.run(store.authenticate(db, "acme", "alice", "pw-1"))["role"] == "owner"
+    checks = store.pool.done
+    asyncio.run(store.authenticate(db, "acme", "alice", "pw-1"))
+    assert store.pool.done == checks and store.cache.hits == 1  # no second bcrypt check
+    with pytest.raises(credentials.InvalidCredentials):
+        asyncio.run(store.authenticate(db, "other", "alice", "pw-1"))  # per-tenant store
+
+    store.set_user(db, "acme", "alice", password="pw-2")
+    with pytest.raises(credentials.InvalidCredentials):
+        asyncio.run(store.authenticate(db, "acme", "alice", "pw-1"))  # cached entry is for the old hash
+    store.set_user(db, "acme", "alice", disabled=True)
+    with pytest.raises(credentials.InvalidCredentials):
+        asyncio.run(store.authenticate(db, "acme", "alice", "pw-2"))
+    with pytest.raises(ValueError):
+        store.set_user(db, "acme", "bob", role="owner")  # new user without a password
+
+
+def test_failed_logins_are_throttled_before_hashing():
+    db, store = MemoryDB("creds"), _store(max_failures=3, window=60)
+    store.set_user(db, "acme", "alice", password="right")
+    for _ in range(3):
+        with pytest.raises(credentials.InvalidCredentials):
+            asyncio.run(store.authenticate(db, "acme", "alice", "wrong", ip="10.0.0.1"))
+    checks = store.pool.done
+    with pytest.raises(credentials.LoginThrottled) as exc:
+        asyncio.run(store.authenticate(db, "acme", "alice", "right", ip="10.0.0.2"))
+    assert 0 < exc.value.retry_after <= 61 and store.pool.done == checks
+    store.set_user(db, "acme", "bob", password="pw")
+    assert asyncio.run(store.authenticate(db, "acme", "bob", "pw", ip="10.0.0.1"))["_id"] == "bob"
+
+
+def test_hashing_pool_sheds_load_and_keeps_the_loop_free():
+    pool = credentials.HashPool(workers=1, max_pending=0)
+    gate = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(credentials.LoginBusy):
+            await pool.run(time.sleep, 0)
+        ticks = 0
+        while ticks < 5:  # the loop keeps running while the pool is busy
+            await asyncio.sleep(0.01)
+            ticks += 1
+        gate.set()
+        return await first
+
+    assert asyncio.run(scenario()) is True
+    assert pool.stats()["shed"] == 1
+
+
+def test_dev_accounts_only_in_dev_mode(monkeypatch):
+    from app import deps
+    monkeypatch.delenv("AUTH_DEV_USERS", raising=False)
+    assert "owner:" in credentials.dev_users()
+    monkeypatch.setattr(deps, "using_inmemory_db", lambda: False)
+    monkeypatch.delenv("AUTH_DEV_MODE", raising=False)
+    assert credentials.dev_users() == "" and _store()._dev_user("owner") is None
+    monkeypatch.setenv("AUTH_DEV_USERS", "ops:pw:owner")
+    assert _store()._dev_user("ops")["role"] == "owner"
+
+
+def test_login_endpoint_with_a_tenant_user(auth_headers):
+    client = TestClient(app)
+    h = {"Host": "credco.lvh.me"}
+    r = client.put("/api/admin/users/carol", headers=auth_headers("owner", "credco.lvh.me", sub="boss"),
+                   json={"password": "carol-pw", "role": "analyst"})
+    assert r.status_code == 200 and "hash" not in r.json()
+
+    r = client.post("/api/auth/login", headers=h, json={"username": "carol", "password": "carol-pw"})
+    assert r.status_code == 200
+    assert pyjwt.decode(r.json()["access_token"], options={"verify_signature": False})["role"] == "analyst"
+    for _ in range(credentials.store.throttle.max_failures):
+        assert client.post("/api/auth/login", headers=h,
+                           json={"username": "carol", "password": "nope"}).status_code == 401
+    r = client.post("/api/auth/login", headers=h, json={"username": "carol", "password": "carol-pw"})
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) > 0
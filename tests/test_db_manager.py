@@ -0,0 +1,34 @@
+from starlette.testclient import TestClient
+
+from app.db import manager
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_client_options_from_env(monkeypatch):
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "zstd,zlib")
+    opts = manager.client_options()
+    assert opts["maxPoolSize"] == 7
+    assert opts["compressors"] == "zstd,zlib"
+    assert manager.pool_metrics in opts["event_listeners"]
+
+
+def test_pool_metrics_wait_times():
+    m = manager.PoolMetrics()
+    ev = type("Ev", (), {"duration": 0.004})()
+    m.connection_checked_out(ev)
+    m.connection_checked_out(type("Ev", (), {"duration": 0.002})())
+    m.connection_checked_in(ev)
+    snap = m.snapshot()
+    assert snap["checkouts"] == 2 and snap["in_use"] == 1
+    assert snap["wait_max_ms"] == 4.0 and snap["wait_avg_ms"] == 3.0
+
+
+def test_pool_endpoint_requires_owner(auth_headers):
+    r = client.get("/api/admin/db/pool", headers=auth_headers("analyst"))
+    assert r.status_code == 403
+    r = client.get("/api/admin/db/pool", headers=auth_headers())
+    assert r.status_code == 200
+    assert r.json()["backend"] == "memory"
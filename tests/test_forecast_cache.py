@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.common.cache import MemoCache
+from app.main import app
+
+
+def test_single_flight_lru_and_ttl():
+    c = MemoCache("test_single_flight", maxsize=2, ttl=60)
+    calls = []
+    gate = threading.Event()
+
+    def slow():
+        calls.append(1)
+        gate.wait(2)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(c.get_or_compute("k", slow))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and {v for v, _ in results} == {42}
+    s = c.stats()
+    assert s["misses"] == 1 and s["coalesced"] == 7
+
+    c.get_or_compute("a", lambda: 1)
+    c.get_or_compute("b", lambda: 2)
+    assert c.stats()["size"] == 2 and c.stats()["evictions"] == 1
+
+    with pytest.raises(ZeroDivisionError):
+        c.get_or_compute("err", lambda: 1 / 0)
+    assert c.get_or_compute("err", lambda: 5) == (5, False)
+
+    short = MemoCache("test_ttl", ttl=0)
+    short.get_or_compute("k", lambda: 1)
+    assert short.get_or_compute("k", lambda: 2) == (2, False)
+
+
+def test_forecast_cached_until_new_usage(auth_headers):
+    client = TestClient(app)
+    h = auth_headers(host="fcache.lvh.me")
+    first = client.get("/api/rudra/cloud/forecast", headers=h)
+    again = client.get("/api/rudra/cloud/forecast", headers=h)
+    assert first.headers["x-cache"] == "MISS" and again.headers["x-cache"] == "HIT"
+    assert first.json() == again.json()
+
+    client.post("/api/rudra/cloud/mock-usage", headers=h, json={"usage": [{"service": "ec2", "hours": 10, "rate": 1}]})
+    fresh = client.get("/api/rudra/cloud/forecast", headers=h)
+    assert fresh.headers["x-cache"] == "MISS" and fresh.json()["total"] == 10.0
+
+    stats = {c["name"]: c for c in client.get("/api/admin/cache", headers=h).json()["caches"]}
+    assert stats["rudra_forecast"]["hits"] >= 1
@@ -0,0 +1,36 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# heavy optional stacks that must only load on first use
+DEFERRED = ("xhtml2pdf", "reportlab", "sklearn", "numpy", "scipy", "pandas", "httpx", "apscheduler")
+
+# cumulative microseconds for `import app.main`; generous so slow CI hosts pass,
+# but well below the ~2s the eager imports used to cost
+BUDGET_US = int(os.getenv("IMPORT_BUDGET_MS", "1500")) * 1000
+
+
+def _importtime():
+    env = {**os.environ, "SECRET_KEY": "import-budget", "USE_INMEMORY_DB": "1"}
+    env.pop("GITHUB_ACTIONS", None)
+    env.pop("CI", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    rows = {}
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$", line)
+        if m:
+            rows[m.group(4)] = int(m.group(2))
+    return rows
+
+
+def test_app_import_defers_heavy_dependencies_and_fits_budget():
+    rows = _importtime()
+    loaded = sorted({name.split(".")[0] for name in rows} & set(DEFERRED))
+    assert loaded == [], f"imported at startup: {loaded}"
+    assert rows["app.main"] <= BUDGET_US, f"import app.main took {rows['app.main'] / 1000:.0f}ms"
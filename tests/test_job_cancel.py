@@ -0,0 +1,126 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.common import jobcancel, jobqueue, worker
+from app.main import app
+
+
+class _States:
+    def __init__(self):
+        self.seen = {}
+        self.done = {}
+
+    def cb(self, name):
+        def on_state(state, value):
+            self.seen.setdefault(name, []).append(state)
+            if state != "running":
+                self.done.setdefault(name, threading.Event()).set()
+        return on_state
+
+    def wait(self, name, timeout=5.0):
+        ev = self.done.setdefault(name, threading.Event())
+        assert ev.wait(timeout), f"{name} did not finish"
+        return self.seen[name][-1]
+
+
+def test_cancel_queued_and_running_async_jobs_frees_the_worker():
+    sched = jobqueue.FairScheduler(workers=1, reserved=0, tenant_limit=4)
+    states = _States()
+
+    async def slow():
+        await asyncio.sleep(30)
+
+    try:
+        sched.submit("t", slow, job_id="a", priority="batch", on_state=states.cb("a"))
+        sched.submit("t", lambda: "ok", job_id="b", priority="batch", on_state=states.cb("b"))
+        sched.submit("t", lambda: "ok", job_id="c", priority="batch", on_state=states.cb("c"))
+        time.sleep(0.1)
+        assert sched.cancel("b") == "cancelled" and states.wait("b") == "cancelled"
+        t = time.monotonic()
+        assert sched.cancel("a") == "cancelling"
+        assert states.wait("a") == "cancelled" and states.wait("c") == "succeeded"
+        assert time.monotonic() - t < 2
+        assert sched.cancel("a") is None and states.seen["b"] == ["cancelled"]
+        assert sched.stats()["cancelled"] == 2
+    finally:
+        sched.shutdown()
+
+
+def test_deadline_times_out_and_a_stuck_sync_job_is_detached():
+    sched = jobqueue.FairScheduler(workers=1, reserved=0)
+    sched.grace = 0.1
+    states = _States()
+    release = threading.Event()
+    try:
+        sched.submit("t", lambda: release.wait(10), job_id="stuck", priority="batch", timeout=0.2,
+                     on_state=states.cb("stuck"))
+        sched.submit("t", lambda: "next", job_id="next", priority="batch", on_state=states.cb("next"))
+        assert states.wait("stuck") == "timeout"
+        assert states.wait("next") == "succeeded"  # ran on the replacement thread
+        assert sched.stats()["detached"] == 1
+        release.set()
+        time.sleep(0.1)
+        assert states.seen["stuck"] == ["running", "timeout"] and sched.stats()["threads"] == 1
+    finally:
+        release.set()
+        sched.shutdown()
+
+
+def test_subprocess_is_killed_on_deadline():
+    token = jobcancel.CancelToken("p", timeout=0.3).start()
+    t = time.monotonic()
+    with jobcancel.bind(token), pytest.raises(jobcancel.JobCancelled) as exc:
+        jobcancel.run_subprocess([sys.executable, "-c", "import time; time.sleep(30)"], timeout=180, grace=0.2)
+    assert exc.value.reason == "timeout" and time.monotonic() - t < 3
+
+
+def test_submit_job_retries_stop_at_the_deadline():
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        raise RuntimeError("boom")
+
+    token = jobcancel.CancelToken("r", timeout=0.5)
+    t = time.monotonic()
+    with pytest.raises(jobcancel.JobCancelled):
+        worker.run_with_retries(flaky, (), {}, token, retries=10, backoff=0.2)
+    assert 2 <= len(calls) <= 3 and time.monotonic() - t < 1.5
+
+
+def test_cancel_endpoint():
+    client = TestClient(app)
+    h = {"Host": "cancel.lvh.me"}
+    jid = client.post("/api/jobs/echo", headers=h, json={"message": "m", "delay_seconds": 20}).json()["job_id"]
+    assert client.post(f"/api/jobs/cancel/{jid}", headers={"Host": "other.lvh.me"}).status_code == 404
+    deadline = time.time() + 5
+    while client.get(f"/api/jobs/status/{jid}", headers=h).json()["status"] == "queued" and time.time() < deadline:
+        time.sleep(0.02)
+    r = client.post(f"/api/jobs/cancel/{jid}", headers=h)
+    assert r.status_code == 202 and r.json()["status"] in ("cancelled", "cancelling")
+    body = client.get(f"/api/jobs/status/{jid}?wait=5", headers=h).json()
+    assert body["status"] == "cancelled" and body["result"] == {"error": "cancelled"}
+    assert client.post(f"/api/jobs/cancel/{jid}", headers=h).status_code == 409
+
+
+def test_legacy_jobs_router_hides_other_tenants_jobs():
+    from fastapi import FastAPI
+    from app.api import jobs
+
+    legacy = FastAPI()
+    legacy.include_router(jobs.router)
+    client = TestClient(legacy)
+    jobs.REGISTRY.create("legacy-owned", "acme", "echo", {"payload": {}}, "interactive")
+    try:
+        other = {"Host": "other.lvh.me"}
+        assert client.get("/jobs/legacy-owned", headers=other).status_code == 404
+        assert client.post("/jobs/legacy-owned/cancel", headers=other).status_code == 404
+        assert jobs.REGISTRY.status("legacy-owned") == "queued"
+        assert client.get("/jobs/legacy-owned", headers={"Host": "acme.lvh.me"}).json()["status"] == "queued"
+    finally:
+        jobs.REGISTRY.discard("legacy-owned")
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import job_dedupe
+
+
+def test_concurrent_submissions_of_one_target_create_one_job():
+    db = MemoryDB("dedupe")
+    submitted, results = [], []
+    barrier = threading.Barrier(16)
+
+    def go():
+        barrier.wait()
+        results.append(job_dedupe.submit_once(db, "acme", "kavach", {"target": "h"}, submitted.append,
+                                              target="Example.COM"))
+    threads = [threading.Thread(target=go) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(submitted) == 1
+    assert {jid for jid, _ in results} == set(submitted)
+    assert sum(created for _, created in results) == 1
+
+
+def test_dead_holder_is_replaced_and_failed_submit_releases_claims():
+    db = MemoryDB("dedupe")
+    first, _ = job_dedupe.submit_once(db, "acme", "kavach", {}, lambda j: None, target="10.0.0.1")
+    again, created = job_dedupe.submit_once(db, "acme", "kavach", {}, lambda j: None, target="10.0.0.1",
+                                            is_dead=lambda j: j == first)
+    assert created and again != first
+
+    def boom(job_id):
+        raise RuntimeError("queue full")
+    with pytest.raises(RuntimeError):
+        job_dedupe.submit_once(db, "acme", "kavach", {}, boom, idempotency_key="k1", target="10.0.0.2")
+    assert db["acme_job_claims"].count_documents({"job_id": {"$nin": [again]}}) == 0
+
+
+def test_idempotency_key_and_target_dedupe_over_api():
+    client = TestClient(app)
+    h = {"Host": "dedupe.lvh.me", "Idempotency-Key": "retry-1"}
+    a = client.post("/api/jobs/echo", headers=h, json={"message": "once"}).json()
+    b = client.post("/api/jobs/echo", headers=h, json={"message": "once"}).json()
+    assert b["job_id"] == a["job_id"] and b["deduplicated"] and "deduplicated" not in a
+    assert client.post("/api/jobs/echo", headers=h, json={"message": "other"}).status_code == 422
+
+    h = {"Host": "dedupe.lvh.me"}
+    s1 = client.post("/api/jobs/kavach/scan", headers=h, json={"target": "scan.example.com"}).json()
+    s2 = client.post("/api/jobs/kavach/scan", headers=h, json={"target": "SCAN.example.com"}).json()
+    s3 = client.post("/api/jobs/kavach/scan", headers=h, json={"target": "other.example.com"}).json()
+    assert s1["job_id"] == s2["job_id"] != s3["job_id"]
+    # a retried echo without a key is never coalesced
+    assert client.post("/api/jobs/echo", headers=h, json={"message": "x"}).json()["job_id"] != \
+        client.post("/api/jobs/echo", headers=h, json={"message": "x"}).json()["job_id"]
@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+
+from starlette.testclient import TestClient
+
+from app.common import jobevents
+from app.main import app
+
+H = {"Host": "poll.lvh.me"}
+
+
+def _echo(client, delay=0.0, host=H):
+    return client.post("/api/jobs/echo", headers=host, json={"message": "m", "delay_seconds": delay}).json()["job_id"]
+
+
+def test_long_poll_returns_on_completion_and_times_out():
+    client = TestClient(app)
+    jid = _echo(client, 0.3)
+    t = time.monotonic()
+    body = client.get(f"/api/jobs/status/{jid}?wait=5", headers=H).json()
+    assert body["status"] == "succeeded" and time.monotonic() - t < 2
+
+    slow = _echo(client, 1.0)
+    t = time.monotonic()
+    body = client.get(f"/api/jobs/status/{slow}?wait=0.2", headers=H).json()
+    assert body["status"] in ("queued", "running") and 0.15 < time.monotonic() - t < 0.9
+    assert client.get("/api/jobs/status/nope?wait=1", headers=H).status_code == 404
+    assert client.get(f"/api/jobs/status/{jid}", headers={"Host": "other.lvh.me"}).status_code == 404
+
+
+def test_batch_status():
+    client = TestClient(app)
+    ids = [_echo(client) for _ in range(3)]
+    client.get(f"/api/jobs/status/{ids[-1]}?wait=5", headers=H)
+    out = client.post("/api/jobs/status", headers=H, json={"job_ids": ids + ["missing"]}).json()["jobs"]
+    assert set(out) == set(ids + ["missing"]) and out["missing"] is None
+    assert all(out[i]["job_id"] == i for i in ids)
+    other = client.post("/api/jobs/status", headers={"Host": "other.lvh.me"}, json={"job_ids": ids}).json()["jobs"]
+    assert all(v is None for v in other.values())
+
+
+def test_sse_stream_reports_transitions_for_the_tenant_only():
+    client = TestClient(app)
+    out = {}
+
+    def listen():
+        # the test client buffers the whole body, so the stream is bounded by max_events
+        out["r"] = client.get("/api/jobs/stream?max_events=3", headers={"Host": "sse.lvh.me"})
+    t = threading.Thread(target=listen)
+    t.start()
+    deadline = time.time() + 5
+    while jobevents.hub.stats()["stream_subscribers"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    _echo(client, host={"Host": "other.lvh.me"})
+    jid = _echo(client, host={"Host": "sse.lvh.me"})
+    t.join(10)
+
+    r = out["r"]
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[6:]) for line in r.text.splitlines() if line.startswith("data: ")]
+    assert [e["job_id"] for e in events] == [jid] * 3
+    assert [e["status"] for e in events] == ["queued", "running", "succeeded"]
+    assert jobevents.hub.stats()["stream_subscribers"] == 0
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from starlette.testclient import TestClient
+
+from app.common import jobprogress, jobqueue, jobregistry
+from app.db.memory import MemoryDB
+from app.main import app
+
+
+def test_reports_are_coalesced_and_persisted_incrementally():
+    db = MemoryDB("prog")
+    reg = jobregistry.JobRegistry(db_factory=lambda: db)
+    hub = jobprogress.ProgressHub(interval_ms=50, max_findings=300, registry=reg, db_factory=lambda: db)
+    reg.create("j1", "acme", "kavach", {}, "batch")
+    with hub.tracking("j1", "acme", "kavach"):
+        for i in range(500):
+            jobprogress.report(percent=i / 5, stage="scan", findings=[{"n": i}])
+            if i % 100 == 0:
+                time.sleep(0.08)  # let the flusher write mid-run
+        assert reg.get("j1")["progress"]["stage"] == "scan"
+    assert 2 <= hub.writes < 20 and hub.reports == 500
+
+    doc = db["acme_job_progress"].find_one({"_id": "j1"})
+    assert doc["findingsCount"] == 500 and [f["n"] for f in doc["findings"]] == list(range(300))
+    snap = hub.snapshot("acme", "j1", since=295)
+    assert not snap["live"] and snap["percent"] == 99.8 and len(snap["new_findings"]) == 5
+    jobprogress.report(percent=1)  # outside a job: ignored
+
+
+def test_progress_endpoint_and_status_show_partial_findings():
+    gate = threading.Event()
+
+    def job():
+        jobprogress.report(percent=50, stage="half", findings=[{"a": 1}, {"a": 2}])
+        gate.wait(5)
+        jobprogress.report(percent=100, findings=[{"a": 3}])
+        return {"ok": True}
+
+    client = TestClient(app)
+    jobregistry.registry.create("prog-1", "prog", "test", {"tenant": "prog"}, "interactive")
+    jobqueue.get_scheduler().submit("prog", job, job_id="prog-1", priority="interactive", module="test",
+                                    on_state=lambda s, v: jobregistry.registry.update("prog-1", s, v))
+    h = {"Host": "prog.lvh.me"}
+    deadline = time.time() + 5
+    while time.time() < deadline and "progress" not in client.get("/api/jobs/status/prog-1", headers=h).json():
+        time.sleep(0.05)
+    live = client.get("/api/jobs/progress/prog-1", headers=h).json()
+    assert live["live"] and live["stage"] == "half" and len(live["new_findings"]) == 2
+    assert client.get("/api/jobs/progress/prog-1", headers={"Host": "other.lvh.me"}).status_code == 404
+    gate.set()
+    assert client.get("/api/jobs/status/prog-1?wait=5", headers=h).json()["status"] == "succeeded"
+
+    done = client.get("/api/jobs/progress/prog-1?since=2", headers=h).json()
+    assert not done["live"] and done["percent"] == 100 and done["new_findings"] == [{"a": 3}]
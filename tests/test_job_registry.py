@@ -0,0 +1,54 @@
+import time
+
+from starlette.testclient import TestClient
+
+from app.common import jobregistry
+from app.db.memory import MemoryDB
+from app.main import app
+
+
+def _finish(reg, jid, result=None, tenant="reg"):
+    reg.create(jid, tenant, "echo", {"tenant": tenant}, "interactive")
+    reg.update(jid, "running")
+    return reg.update(jid, "succeeded", result if result is not None else {"ok": True})
+
+
+def test_finished_jobs_are_evicted_by_count_and_ttl_but_running_ones_stay():
+    reg = jobregistry.JobRegistry(ttl=3600, max_finished=3, db_factory=lambda: MemoryDB("reg"))
+    reg.create("live", "reg", "echo", {}, "batch")
+    reg.update("live", "running")
+    for i in range(5):
+        _finish(reg, f"j{i}")
+    assert reg.get("j0") is None and reg.get("j1") is None and reg.get("j4")["status"] == "succeeded"
+    assert reg.get("live")["status"] == "running"
+    assert reg.stats()["evicted"] == 2 and reg.stats()["active"] == 1
+
+    reg.ttl = 0.05
+    time.sleep(0.1)
+    _finish(reg, "fresh")
+    assert reg.get("j4") is None and reg.get("fresh") is not None and reg.get("live") is not None
+
+
+def test_large_results_are_offloaded_and_deleted_on_eviction():
+    db = MemoryDB("reg")
+    reg = jobregistry.JobRegistry(ttl=3600, max_finished=1, max_result_bytes=100, db_factory=lambda: db)
+    rec = _finish(reg, "big", {"rows": ["x" * 50] * 10})
+    assert rec["result"] is None and rec["result_ref"]["id"] == "job-big"
+    store, tenant, meta = reg.offloaded_result("big")
+    assert b'"rows"' in store.read(tenant, meta)
+
+    assert _finish(reg, "small")["result"] == {"ok": True}
+    assert reg.get("big") is None and db["reg_artifacts"].count_documents({}) == 0
+
+
+def test_api_serves_offloaded_result(monkeypatch):
+    monkeypatch.setattr(jobregistry.registry, "max_result_bytes", 64)
+    client = TestClient(app)
+    h = {"Host": "regapi.lvh.me"}
+    jid = client.post("/api/jobs/echo", headers=h, json={"message": "z" * 200}).json()["job_id"]
+    body = client.get(f"/api/jobs/status/{jid}?wait=5", headers=h).json()
+    assert body["status"] == "succeeded" and body["result"] is None and body["result_ref"]["size"] > 200
+    r = client.get(f"/api/jobs/status/{jid}/result", headers=h)
+    assert r.status_code == 200 and r.json()["echo"] == "z" * 200
+    assert client.get(f"/api/jobs/status/{jid}/result", headers={**h, "Range": "bytes=0-9"}).status_code == 206
+    assert client.get(f"/api/jobs/status/{jid}/result", headers={"Host": "other.lvh.me"}).status_code == 404
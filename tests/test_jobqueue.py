@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.common.jobqueue import FairScheduler, QueueFull
+from app.main import app
+
+
+def _recorder():
+    order, lock = [], threading.Lock()
+
+    def job(tag, seconds=0.0):
+        if seconds:
+            time.sleep(seconds)
+        with lock:
+            order.append(tag)
+    return order, job
+
+
+def test_flooding_tenant_does_not_starve_others():
+    order, job = _recorder()
+    s = FairScheduler(workers=1, reserved=0, tenant_limit=1, weights={}, limits={})
+    gate = threading.Event()
+    s.submit("bulk", gate.wait, priority="batch")  # hold the worker while we queue
+    for i in range(50):
+        s.submit("bulk", job, f"bulk{i}", priority="batch")
+    for i in range(5):
+        s.submit("small", job, f"small{i}", priority="batch")
+    s.start()
+    gate.set()
+    deadline = time.time() + 5
+    while len(order) < 55 and time.time() < deadline:
+        time.sleep(0.01)
+    s.shutdown()
+    # the late tenant's jobs interleave with the flood instead of waiting behind 50 jobs
+    assert max(order.index(f"small{i}") for i in range(5)) < 12
+
+
+def test_interactive_jobs_use_reserved_worker_during_batch_flood():
+    order, job = _recorder()
+    s = FairScheduler(workers=2, reserved=1, tenant_limit=4, weights={}, limits={})
+    for i in range(20):
+        s.submit("bulk", job, f"b{i}", 0.05, priority="batch")
+    time.sleep(0.02)
+    t0 = time.monotonic()
+    done = threading.Event()
+    s.submit("ui", lambda: done.set(), priority="interactive")
+    assert done.wait(1) and time.monotonic() - t0 < 0.2
+    st = s.stats()
+    assert st["classes"]["batch"]["running"] <= 1 and st["tenants"]["bulk"]["queued"]["batch"] > 10
+    s.shutdown()
+
+
+def test_tenant_quota_weights_and_queue_limit():
+    s = FairScheduler(workers=4, reserved=0, tenant_limit=1, max_queued=3, weights={"gold": 3}, limits={"gold": 2})
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+    for _ in range(3):
+        s.submit("gold", job)
+    with pytest.raises(QueueFull):
+        for _ in range(10):
+            s.submit("gold", job)
+    time.sleep(0.3)
+    assert peak[0] == 2 and s.stats()["rejected"] >= 1
+    s.shutdown()
+
+
+def test_jobs_api_runs_through_fair_scheduler():
+    client = TestClient(app)
+    r = client.post("/api/jobs/echo?priority=batch", headers={"Host": "jobs.lvh.me"},
+                    json={"message": "hi", "delay_seconds": 0})
+    assert r.status_code == 200 and r.json()["priority"] == "batch"
+    jid = r.json()["job_id"]
+    for _ in range(100):
+        body = client.get(f"/api/jobs/status/{jid}", headers={"Host": "jobs.lvh.me"}).json()
+        if body["status"] == "succeeded":
+            break
+        time.sleep(0.02)
+    assert body["status"] == "succeeded" and body["result"]["echo"] == "hi"
+    assert body["payload"]["tenant"] == "jobs"
+    assert client.post("/api/jobs/echo?priority=urgent", json={"message": "x"}).status_code == 422
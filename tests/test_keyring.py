@@ -0,0 +1,79 @@
+import json
+import time
+
+import jwt as pyjwt
+import pytest
+from starlette.testclient import TestClient
+
+from app.auth import keyring
+from app.auth.keyring import InvalidToken, Key, Keyring
+from app.core.config import settings
+from app.main import app
+
+
+def _claims(**extra):
+    now = int(time.time())
+    return {"sub": "u", "tid": "acme", "role": "analyst", "iat": now, "exp": now + 600, **extra}
+
+
+def test_rotation_keeps_old_tokens_valid_until_the_key_is_removed():
+    ring = Keyring([Key("k1", "s1")])
+    old = ring.sign(_claims())
+    ring.add(Key("k2", "s2"), activate=True)
+    new = ring.sign(_claims())
+    assert pyjwt.get_unverified_header(new)["kid"] == "k2"
+    assert ring.verify(old)["sub"] == ring.verify(new)["sub"] == "u"
+    with pytest.raises(ValueError):
+        ring.remove("k2")
+    ring.remove("k1")
+    with pytest.raises(InvalidToken, match="Unknown key id"):
+        ring.verify(old)
+
+
+def test_rejects_bad_signature_alg_none_and_expired_tokens():
+    ring = Keyring([Key(keyring.DEFAULT_KID, "s")])
+    plain = pyjwt.encode(_claims(), "s", algorithm="HS256")  # no kid: the default key
+    assert ring.verify(plain)["tid"] == "acme"
+    with pytest.raises(InvalidToken, match="Signature"):
+        ring.verify(pyjwt.encode(_claims(), "other", algorithm="HS256"))
+    with pytest.raises(InvalidToken, match="alg"):
+        ring.verify(pyjwt.encode(_claims(), None, algorithm="none"))
+    with pytest.raises(InvalidToken, match="expired"):
+        ring.verify(ring.sign(_claims(exp=int(time.time()) - 5)))
+    assert ring.verify(ring.sign(_claims(exp=int(time.time()) - 5)), leeway=60)
+    with pytest.raises(InvalidToken, match="aud"):
+        ring.verify(ring.sign(_claims()), require=("aud",))
+    for junk in ("", "a.b", "a.b.c", "ü.ü.ü"):
+        with pytest.raises(InvalidToken):
+            ring.verify(junk)
+    for header in ({"alg": "HS256", "kid": ["x"]}, {"alg": ["HS256"]}, {"alg": "HS256", "typ": 1}):
+        with pytest.raises(InvalidToken, match="header"):
+            ring.verify(keyring._b64e(json.dumps(header).encode()) + plain[plain.index("."):])
+
+
+def test_audience_is_case_insensitive():
+    keyring.check_audience({"aud": ["x", "ACME"]}, "acme")
+    keyring.check_audience({}, "acme")
+    with pytest.raises(InvalidToken):
+        keyring.check_audience({"aud": "other"}, "acme")
+    with pytest.raises(InvalidToken):
+        keyring.check_audience({}, "acme", required=True)
+
+
+def test_middleware_decodes_once_and_rejects_wrong_audience(monkeypatch):
+    client = TestClient(app)
+    token = pyjwt.encode(_claims(role="owner", aud="acme"), settings.SECRET_KEY, algorithm="HS256")
+    calls = []
+    ring = keyring.get_keyring()
+    real = ring.verify
+    monkeypatch.setattr(ring, "verify", lambda *a, **k: calls.append(1) or real(*a, **k))
+
+    r = client.get("/api/admin/jobs/queue", headers={"Host": "acme.lvh.me", "Authorization": f"Bearer {token}"})
+    assert r.status_code == 200 and len(calls) == 1  # one decode per request
+
+    r = client.get("/api/admin/jobs/queue", headers={"Host": "other.lvh.me", "Authorization": f"Bearer {token}"})
+    assert r.status_code == 401 and r.json()["detail"] == "invalid token: Invalid audience"
+
+    bad = keyring._b64e(json.dumps({"alg": "HS256", "kid": ["x"]}).encode()) + token[token.index("."):]
+    r = client.get("/api/admin/jobs/queue", headers={"Host": "acme.lvh.me", "Authorization": f"Bearer {bad}"})
+    assert r.status_code == 401
@@ -0,0 +1,32 @@
+from scripts import loadtest
+
+
+def test_small_mixed_workload_has_no_errors():
+    report = loadtest.run(tenants=3, requests=120, concurrency=4, seed=1)
+    assert report["total_requests"] == 120
+    assert report["total_errors"] == 0
+    for stats in report["routes"].values():
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+
+
+def test_check_flags_thresholds_and_baseline_regressions():
+    report = {"routes": {"login": {"p50_ms": 5, "p95_ms": 30, "p99_ms": 40, "mean_ms": 8,
+                                   "rps": 100, "error_rate": 0.0}}}
+    assert loadtest.check(report, {"*": {"p95_ms": 50}}) == []
+    assert loadtest.check(report, {"login": {"p99_ms": 20}})
+    assert loadtest.check(report, baseline={"routes": {"login": {"p95_ms": 20}}}, max_regression=0.25)
+    assert not loadtest.check(report, baseline={"routes": {"login": {"p95_ms": 28}}}, max_regression=0.25)
+
+
+def test_percentile_nearest_rank():
+    vals = list(range(1, 101))
+    assert loadtest.percentile(vals, 50) == 50
+    assert loadtest.percentile(vals, 99) == 99
+    assert loadtest.percentile([], 95) == 0.0
+
+
+def test_login_storm_is_served_without_errors(monkeypatch):
+    monkeypatch.setenv("AUTH_BCRYPT_ROUNDS", "4")
+    report = loadtest.run(tenants=2, requests=40, concurrency=4, seed=1, login_storm=8)
+    assert report["routes"]["login_cold"]["requests"] == 8
+    assert report["total_errors"] == 0
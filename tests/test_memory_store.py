@@ -0,0 +1,83 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.db.memory import MemoryDB
+
+
+@pytest.fixture
+def col():
+    return MemoryDB()["t_scans"]
+
+
+def test_find_sort_skip_limit_projection(col):
+    col.insert_many([{"n": i, "tag": "odd" if i % 2 else "even", "blob": "x"} for i in range(10)])
+    got = list(col.find({"tag": "odd"}, {"n": 1, "_id": 0}).sort("n", -1).skip(1).limit(2))
+    assert got == [{"n": 7}, {"n": 5}]
+    assert col.find_one(sort=[("n", -1)])["n"] == 9
+    assert col.count_documents({"n": {"$gte": 3, "$lt": 6}}) == 3
+
+
+def test_indexed_and_unindexed_queries_agree(col):
+    base = datetime(2025, 1, 1)
+    col.insert_many([{"target": f"h{i % 5}", "ts": base + timedelta(minutes=i), "ports": [i % 3, 443]}
+                     for i in range(200)])
+    queries = [
+        {"target": "h3"},
+        {"target": {"$in": ["h1", "h2"]}, "ports": 2},
+        {"ts": {"$gt": base + timedelta(minutes=150)}},
+        {"ports": 443, "target": {"$ne": "h0"}},
+    ]
+    before = [[d["_id"] for d in col.find(q).sort("ts", 1)] for q in queries]
+    col.create_index([("target", 1), ("ts", -1)])
+    col.create_index("ts")
+    col.create_index("ports")
+    after = [[d["_id"] for d in col.find(q).sort("ts", 1)] for q in queries]
+    assert before == after
+    assert [len(x) for x in after] == [40, 27, 49, 160]
+    latest = col.find_one({}, sort=[("ts", -1)])
+    assert latest["ts"] == base + timedelta(minutes=199)
+
+
+def test_multikey_range_matches_a_scan(col):
+    col.insert_many([{"a": [0, 10]}, {"a": [3]}, {"a": 7}, {"a": [6, 8]}, {"a": []}, {"b": 1}])
+    queries = [{"a": {"$gt": 1, "$lt": 5}}, {"a": {"$gte": 7}}, {"a": {"$lt": 1}}, {"a": {"$gt": 5, "$lte": 6}}]
+    before = [sorted(str(d["_id"]) for d in col.find(q)) for q in queries]
+    col.create_index("a")
+    after = [sorted(str(d["_id"]) for d in col.find(q)) for q in queries]
+    assert before == after
+    assert [len(x) for x in after] == [2, 3, 1, 2]
+
+
+def test_update_upsert_delete_keep_indexes_consistent(col):
+    col.create_index("status")
+    col.insert_one({"job": 1, "status": "queued"})
+    col.update_one({"job": 1}, {"$set": {"status": "running"}, "$inc": {"attempts": 1}})
+    assert col.count_documents({"status": "queued"}) == 0
+    assert col.find_one({"status": "running"})["attempts"] == 1
+    res = col.update_one({"job": 2}, {"$setOnInsert": {"status": "queued"}}, upsert=True)
+    assert res.upserted_id is not None
+    assert col.find_one({"status": "queued"})["job"] == 2
+    assert col.delete_many({"status": {"$in": ["queued", "running"]}}).deleted_count == 2
+    assert col.count_documents({}) == 0
+
+
+def test_unique_index_under_concurrency(col):
+    col.create_index("key", unique=True)
+    wins = []
+
+    def worker():
+        try:
+            col.insert_one({"key": "same"})
+            wins.append(1)
+        except DuplicateKeyError:
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(wins) == 1 and col.count_documents({"key": "same"}) == 1
@@ -0,0 +1,77 @@
+
+from starlette.testclient import TestClient
+
+from app.common import observability
+from app.main import app
+
+client = TestClient(app)
+H = {"Host": "tenant1.lvh.me"}
+
+
+def test_header_profiles_only_for_owner(auth_headers):
+    observability.profiles.clear()
+    r = client.get("/api/nandi/events", headers={**auth_headers("analyst"), "X-Profile": "1"})
+    assert r.status_code == 200 and "x-profile-id" not in r.headers
+
+    r = client.get("/api/rudra/cloud/forecast", headers={**auth_headers(), "X-Profile": "1"})
+    pid = r.headers["x-profile-id"]
+    listed = client.get("/api/admin/profiles", headers=auth_headers()).json()["profiles"]
+    assert [p["id"] for p in listed] == [pid]
+
+    trace = client.get(f"/api/admin/profiles/{pid}", headers=auth_headers()).json()
+    assert trace["reason"] == "header" and trace["status"] == 200
+    assert trace["span_totals"]["json.encode"]["count"] == 1
+    assert client.get("/api/admin/profiles", headers=auth_headers("analyst")).status_code == 403
+
+
+def test_profiles_are_scoped_to_the_owners_tenant(auth_headers):
+    observability.profiles.clear()
+    pid = client.get("/api/rudra/cloud/forecast", headers={**auth_headers(), "X-Profile": "1"}).headers["x-profile-id"]
+    other = auth_headers(host="tenant2.lvh.me")
+    assert client.get("/api/admin/profiles", headers=other).json()["profiles"] == []
+    assert client.get(f"/api/admin/profiles/{pid}", headers=other).status_code == 404
+    assert client.delete("/api/admin/profiles", headers=other).json() == {"cleared": 0}
+    for cfg in ({"tenants": ["tenant1"]}, {"allow_header": False}):
+        assert client.put("/api/admin/profiles/config", headers=other, json=cfg).status_code == 403
+
+    r = client.put("/api/admin/profiles/config", headers=other, json={"tenants": ["tenant2"], "routes": ["/api/nandi"]})
+    try:
+        assert r.json()["tenants"] == ["tenant2"] and r.json()["routes"] == ["/api/nandi"]
+        assert client.get("/api/admin/profiles/config", headers=auth_headers()).json()["tenants"] == []
+        assert "x-profile-id" not in client.get("/api/nandi/events", headers=H).headers
+    finally:
+        client.put("/api/admin/profiles/config", headers=other, json={"tenants": [], "routes": []})
+    assert [p["id"] for p in client.get("/api/admin/profiles", headers=auth_headers()).json()["profiles"]] == [pid]
+
+
+def test_route_targets_and_pdf_span(auth_headers):
+    observability.profiles.clear()
+    client.post("/api/kavach/report/generate", headers=H)
+    client.put("/api/admin/profiles/config", headers=auth_headers(), json={"routes": ["/api/kavach/report/pdf"]})
+    try:
+        r = client.get("/api/kavach/report/pdf", headers=H)
+        assert r.status_code == 200
+        trace = observability.profiles.get(r.headers["x-profile-id"]).to_dict()
+        assert trace["reason"] == "route"
+        assert trace["span_totals"]["pdf.render"]["ms"] > 0
+    finally:
+        client.put("/api/admin/profiles/config", headers=auth_headers(), json={"routes": []})
+    assert "x-profile-id" not in client.get("/api/kavach/report/pdf", headers=H).headers
+
+
+def test_ring_buffer_is_bounded_and_mongo_listener_records_spans():
+    store = observability.ProfileStore(size=3)
+    for i in range(5):
+        store.add(observability.ProfileTrace(f"p{i}", "t", "GET", "/", "header"))
+    assert [p["id"] for p in store.list()] == ["p4", "p3", "p2"]
+
+    tr = observability.ProfileTrace("m", "t", "GET", "/", "header")
+    token = observability._trace.set(tr)
+    try:
+        ev = type("Ev", (), {"request_id": 7, "command_name": "find", "command": {"find": "t_scans"},
+                             "duration_micros": 1500})()
+        observability.mongo_spans.started(ev)
+        observability.mongo_spans.succeeded(ev)
+    finally:
+        observability._trace.reset(token)
+    assert tr.spans[0]["name"] == "mongo.find" and tr.spans[0]["collection"] == "t_scans"
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.db.sqlite_store import SQLiteDB
+from app.deps import get_db
+from app.main import app
+from app.services import report_batch
+
+
+def _seed(db, tenants):
+    for i, t in enumerate(tenants):
+        db[f"{t}_scans"].insert_many([{"n": j} for j in range(i + 1)])
+        db[f"{t}_qc_results"].insert_many([{"ok": True} for _ in range(2 * i + 1)])
+        db[f"{t}_rudra_forecasts"].insert_many([{"value": 1.0, "ts": "2025-01-01"}, {"value": 9.5 + i, "ts": "2025-02-01"}])
+    db[f"{tenants[0]}_kavach_changes"].insert_many([
+        {"change": "opened", "ts": "2025-03-01", "baseline": False},
+        {"change": "opened", "ts": "2025-03-02", "baseline": True},
+    ])
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_union_pipeline_matches_per_tenant_queries(backend, tmp_path):
+    db = MemoryDB("agg") if backend == "memory" else SQLiteDB(str(tmp_path / "agg.db"))
+    tenants = ["a", "b", "c"]
+    _seed(db, tenants)
+    metrics = report_batch.collect_metrics(db, tenants)
+    for i, t in enumerate(tenants):
+        assert metrics[t]["scans"] == db[f"{t}_scans"].count_documents({}) == i + 1
+        assert metrics[t]["qc_results"] == 2 * i + 1
+        assert metrics[t]["last_forecast"] == 9.5 + i
+    assert metrics["a"]["changes"]["opened"] == 1 and metrics["b"]["changes"]["opened"] == 0
+
+
+def test_batch_job_resumes_after_crash_without_duplicates():
+    db = MemoryDB("batch")
+    tenants = [f"t{i:02d}" for i in range(7)]
+    _seed(db, tenants)
+
+    def crash(state):
+        raise RuntimeError("worker killed")
+
+    job = report_batch.BatchReportJob(db, chunk_size=3, workers=0, on_progress=crash)
+    with pytest.raises(RuntimeError):
+        job.run()
+    state = report_batch.get_job(db, job.job_id)
+    assert state["status"] == "failed" and state["cursor"] == "t02" and state["done"] == 3
+
+    final = report_batch.BatchReportJob(db, job_id=job.job_id, workers=0).run()
+    assert final["status"] == "completed" and final["done"] == 7 and final["total"] == 7
+    for t in tenants:
+        reports = list(db[f"{t}_kavach_reports"].find({"batch_id": job.job_id}))
+        assert len(reports) == 1
+    assert db["t03_kavach_reports"].find_one({})["scans"] == 4
+
+
+def test_batch_job_renders_pdfs_and_api_reports_progress(auth_headers):
+    db = get_db()
+    _seed(db, ["batcha", "batchb"])
+    h = auth_headers(host="batcha.lvh.me")
+    client = TestClient(app)
+    r = client.post("/api/admin/reports/batch", headers=h, json={"tenants": ["batcha", "batchb"], "pdf": True})
+    assert r.status_code == 403  # an owner reports on their own tenant only
+    r = client.post("/api/admin/reports/batch", headers=h, json={"pdf": True})
+    job_id = r.json()["job_id"]
+    for _ in range(100):
+        state = client.get(f"/api/admin/reports/batch/{job_id}", headers=h).json()
+        if state["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.1)
+    assert state["status"] == "completed" and state["done"] == 1
+    other = auth_headers(host="batchb.lvh.me")
+    assert client.get(f"/api/admin/reports/batch/{job_id}", headers=other).status_code == 404
+    assert client.post("/api/admin/reports/batch", headers=other, json={"job_id": job_id}).status_code == 404
+    assert get_db()["batchb_kavach_reports"].count_documents({}) == 0
+
+    pdf = client.get("/api/kavach/report/pdf", headers={"Host": "batcha.lvh.me"})
+    assert pdf.status_code == 200 and pdf.content.startswith(b"%PDF")
+
+    for bad in (0, -5, "10", True):
+        r = client.post("/api/admin/reports/batch", headers=h, json={"chunk_size": bad})
+        assert r.status_code == 422
+    assert report_batch.clamp_chunk(10_000) == report_batch.MAX_CHUNK
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.db.sqlite_store import SQLiteDB
+from app.main import app
+from app.services import rudra_usage
+
+CSV = """usage_date,service,unblended_cost,usage_quantity
+2025-01-01T00:00:00Z,ec2,1.5,10
+2025-01-01T01:00:00Z,ec2,2.5,20
+2025-01-02T00:00:00Z,ec2,4.0,30
+2025-01-01,s3,0.25,100
+2025-01-03,,9,9
+"""
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_buckets_pack_points_and_reingest_is_idempotent(backend, tmp_path):
+    db = MemoryDB("usage") if backend == "memory" else SQLiteDB(str(tmp_path / "usage.db"))
+    out = rudra_usage.ingest_text(db, "acme", CSV, "csv")
+    assert (out["points"], out["buckets"], out["skipped"]) == (4, 3, 1)
+    rudra_usage.ingest_text(db, "acme", CSV.replace("2.5,20", "3.5,20"), "csv")
+
+    bucket = db["acme_rudra_usage"].find_one({"_id": "ec2:2025-01-01"})
+    assert bucket["n"] == 2 and bucket["cost_sum"] == 5.0 and bucket["rev"] == 2
+
+    s = rudra_usage.series(db, "acme", "ec2")
+    assert s["cost"].dtype == np.float64 and s["cost"].tolist() == [1.5, 3.5, 4.0]
+    assert str(s["ts"][1]) == "2025-01-01T01:00:00"
+    ranged = rudra_usage.series(db, "acme", "ec2", start=datetime(2025, 1, 1, 1, tzinfo=timezone.utc),
+                                end=datetime(2025, 1, 2, tzinfo=timezone.utc))
+    assert ranged["cost"].tolist() == [3.5]
+
+    d = rudra_usage.daily(db, "acme")
+    assert d["services"] == ["ec2", "s3"] and d["cost"].shape == (2, 2)
+    assert d["cost"][0].tolist() == [5.0, 4.0] and d["cost"][1].tolist() == [0.25, 0.0]
+
+
+def test_ingest_and_query_api(auth_headers):
+    client = TestClient(app)
+    ndjson = "\n".join([
+        '{"timestamp": "2025-02-01T00:00:00Z", "service": "rds", "cost": 3, "quantity": 1}',
+        '{"timestamp": "2025-02-01T06:00:00Z", "service": "rds", "cost": 4}',
+        "not json",
+    ])
+    r = client.post("/api/rudra/usage/ingest?format=ndjson", headers=auth_headers(host="usage.lvh.me"), content=ndjson)
+    assert r.status_code == 200 and r.json()["points"] == 2 and r.json()["skipped"] == 1
+    assert client.post("/api/rudra/usage/ingest", headers=auth_headers("analyst", "usage.lvh.me"), content="x").status_code == 403
+
+    s = client.get("/api/rudra/usage/series?service=rds", headers=auth_headers("analyst", "usage.lvh.me")).json()
+    assert s["cost"] == [3.0, 4.0] and s["qty"] == [1.0, None]
+
+    client.post("/api/rudra/cloud/mock-usage", headers=auth_headers(host="usage.lvh.me"), json={"usage": [{"service": "ec2", "hours": 10, "rate": 0.5}]})
+    daily = client.get("/api/rudra/usage/daily", headers=auth_headers(host="usage.lvh.me")).json()
+    assert daily["services"]["ec2"][-1] == 5.0
+
+
+def test_non_finite_values_are_skipped(auth_headers):
+    db = MemoryDB("usage-nan")
+    bad = "usage_date,service,cost,quantity\n2025-01-01,ec2,nan,1\n2025-01-01,ec2,inf,1\n" \
+          "2025-01-01,ec2,2,-inf\n2025-01-01,ec2,2,1\n"
+    out = rudra_usage.ingest_text(db, "acme", bad, "csv")
+    assert (out["points"], out["skipped"]) == (1, 3) and "finite" in out["errors"][0]
+    assert db["acme_rudra_usage"].find_one({"_id": "ec2:2025-01-01"})["cost_sum"] == 2.0
+
+    client = TestClient(app)
+    h = auth_headers(host="usagenan.lvh.me")
+    r = client.post("/api/rudra/usage/ingest?format=csv", headers=h, content=bad)
+    assert r.status_code == 200 and r.json()["skipped"] == 3
+    assert client.get("/api/rudra/usage/daily", headers=h).status_code == 200
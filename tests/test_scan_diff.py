@@ -0,0 +1,81 @@
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import scan_diff
+
+client = TestClient(app)
+
+
+def _xml(ports):
+    body = "".join(
+        f'<port protocol="tcp" portid="{p}"><state state="{st}"/><service name="{svc}" version="{ver}"/></port>'
+        for p, st, svc, ver in ports)
+    return f'<nmaprun><host><address addr="10.0.0.5" addrtype="ipv4"/><ports>{body}</ports></host></nmaprun>'
+
+
+def test_ingest_records_only_the_delta():
+    db = MemoryDB("diff")
+    first = scan_diff.ingest(db, "acme", "web", _xml([(22, "open", "ssh", "8.9"), (80, "open", "http", "1.0")]),
+                             ts="2025-01-01T00:00:00Z")
+    assert first["baseline"] and first["changes"] == {"opened": 2}
+
+    same = scan_diff.ingest(db, "acme", "web", _xml([(22, "open", "ssh", "8.9"), (80, "open", "http", "1.0")]),
+                            ts="2025-01-02T00:00:00Z")
+    assert same["changes"] == {}
+
+    third = scan_diff.ingest(db, "acme", "web", _xml([(22, "open", "ssh", "9.6"), (443, "open", "https", "")]),
+                             ts="2025-01-03T00:00:00Z")
+    assert third["changes"] == {"service_changed": 1, "closed": 1, "opened": 1}
+
+    delta = scan_diff.changes_since(db, "acme", since="2025-01-02T00:00:00Z")
+    assert {(c["change"], c["port"]) for c in delta} == {("service_changed", 22), ("closed", 80), ("opened", 443)}
+    assert scan_diff.changes_since(db, "acme", since="2025-01-03T00:00:00Z") == []
+    assert len(scan_diff.changes_since(db, "acme", include_baseline=True)) == 5
+
+    ports = {d["port"]: d for d in db["acme_kavach_ports"].find({"target": "web"})}
+    assert ports[80]["state"] == "absent" and ports[22]["version"] == "9.6"
+    assert ports[22]["first_seen"] == "2025-01-01T00:00:00Z" and ports[22]["last_seen"] == "2025-01-03T00:00:00Z"
+    assert "by_target_port" in db["acme_kavach_ports"].index_information()
+    assert db["acme_nandi"].count_documents({"type": "kavach.port_opened"}) == 1
+
+
+def test_mock_runner_output_is_attributed_to_target():
+    xml = '<nmaprun><target>h</target><ports><port protocol="tcp" portid="80"><state state="open"/></port></ports></nmaprun>'
+    assert list(scan_diff.parse_nmap_xml(xml, "h")) == [("h", "tcp", 80)]
+
+
+def test_seeded_scans_feed_changes_and_report():
+    h = {"Host": "difftenant.lvh.me"}
+    client.post("/api/kavach/scans/seed", headers=h,
+                json=[{"target": "db", "raw_xml": _xml([(5432, "open", "postgresql", "15")]), "ts": "2025-02-01T00:00:00Z"}])
+    client.post("/api/kavach/report/generate", headers=h)
+    client.post("/api/kavach/scans/seed", headers=h,
+                json=[{"target": "db", "raw_xml": _xml([(5432, "open", "postgresql", "16")])}])
+
+    r = client.get("/api/kavach/changes", headers=h).json()
+    assert r["summary"]["service_changed"] == 1
+    assert client.get("/api/kavach/ports?target=db", headers=h).json()["ports"][0]["version"] == "16"
+    report = client.post("/api/kavach/report/generate", headers=h).json()
+    assert report["changes"] == {"opened": 0, "closed": 0, "service_changed": 1}
+
+
+def test_change_totals_are_not_capped_by_the_listing_limit():
+    h = {"Host": "manychanges.lvh.me"}
+    client.post("/api/kavach/scans/seed", headers=h, json=[{"target": "fleet", "raw_xml": _xml([(1, "open", "x", "1")])}])
+    client.post("/api/kavach/report/generate", headers=h)
+    client.post("/api/kavach/scans/seed", headers=h,
+                json=[{"target": "fleet", "raw_xml": _xml([(p, "open", "x", "1") for p in range(1, 81)])}])
+    r = client.get("/api/kavach/changes?limit=10", headers=h).json()
+    assert len(r["changes"]) == 10 and r["summary"]["opened"] == 79
+    assert client.post("/api/kavach/report/generate", headers=h).json()["changes"]["opened"] == 79
+
+def test_report_escapes_client_supplied_targets():
+    h = {"Host": "xsstenant.lvh.me"}
+    client.post("/api/kavach/scans/seed", headers=h,
+                json=[{"target": "<script>alert(1)</script>", "raw_xml": _xml([(80, "open", "http", "1")])}])
+    client.post("/api/kavach/scans/seed", headers=h,
+                json=[{"target": "<script>alert(1)</script>", "raw_xml": _xml([(443, "open", "https", "1")])}])
+    client.post("/api/kavach/report/generate", headers=h)
+    html = client.get("/api/kavach/report/latest", headers=h).json()["preview"]
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in html and "<script>" not in html
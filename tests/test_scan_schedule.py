@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+from starlette.testclient import TestClient
+
+from app.common import worker
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import kavach_runner, scan_schedule
+
+client = TestClient(app)
+H = {"Host": "tenant1.lvh.me"}
+
+
+def test_jitter_is_deterministic_and_inside_window():
+    a = scan_schedule.jitter_offset("acme", "10.0.0.1", 3600)
+    assert a == scan_schedule.jitter_offset("acme", "10.0.0.1", 3600)
+    assert 0 <= a < 3600
+    offsets = {scan_schedule.jitter_offset("acme", f"10.0.0.{i}", 3600) for i in range(50)}
+    assert len(offsets) > 40
+
+    doc = scan_schedule.normalize("acme", {"target": "10.0.0.1", "cron": "0 0 * * *", "jitter_minutes": 60})
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    fires = scan_schedule.fire_times(doc, start, start + timedelta(days=3))
+    assert [f - start for f in fires] == [timedelta(days=d, seconds=doc["offset_seconds"]) for d in range(3)]
+
+
+def test_schedule_api_roundtrip(auth_headers):
+    r = client.post("/api/kavach/schedules", headers=auth_headers("analyst"), json={"target": "x", "cron": "0 1 * * *"})
+    assert r.status_code == 403
+    r = client.post("/api/kavach/schedules", headers=auth_headers(), json={"target": "x", "cron": "61 * * * *"})
+    assert r.status_code == 400
+
+    r = client.post("/api/kavach/schedules", headers=auth_headers(),
+                    json={"target": "10.1.1.1", "interval_minutes": 60, "jitter_minutes": 30})
+    assert r.status_code == 200
+    sid = r.json()["_id"]
+    assert r.json()["next_run_at"]
+
+    listed = client.get("/api/kavach/schedules", headers=auth_headers("analyst")).json()["schedules"]
+    assert sid in [s["_id"] for s in listed]
+    sim = client.get("/api/kavach/schedules/simulate?hours=6&bucket_minutes=60", headers=auth_headers()).json()
+    assert sim["runs"] >= 6 and len(sim["buckets"]) == 6
+
+    assert client.delete(f"/api/kavach/schedules/{sid}", headers=auth_headers()).status_code == 200
+    assert client.delete(f"/api/kavach/schedules/{sid}", headers=auth_headers()).status_code == 404
+
+
+def test_run_respects_tenant_cap_and_coalesces(monkeypatch):
+    monkeypatch.setattr(kavach_runner, "run_nmap_or_mock", lambda target: ("mocked", "<nmaprun/>", b""))
+    monkeypatch.setattr(scan_schedule, "slots", scan_schedule.TenantSlots(cap=1))
+    db = MemoryDB("sched")
+    a = scan_schedule.create(db, "acme", {"target": "a", "cron": "0 0 * * *"})
+    b = scan_schedule.create(db, "acme", {"target": "b", "cron": "0 0 * * *"})
+
+    assert scan_schedule.slots.acquire("acme")          # another scan is running
+    assert scan_schedule.run_scheduled_scan("acme", b["_id"], db, fire_at="2025-01-01T00:00:00Z") is None
+    assert scan_schedule.run_scheduled_scan("acme", b["_id"], db, fire_at="2025-01-02T00:00:00Z") is None  # coalesced
+    assert scan_schedule.slots.snapshot()["waiting"] == {"acme": 1}
+    assert db["acme_scan_schedules"].find_one({"_id": b["_id"]})["coalesced_runs"] == 1
+
+    waiting = scan_schedule.slots.release("acme")
+    assert waiting == b["_id"]
+    scan = scan_schedule.run_scheduled_scan("acme", a["_id"], db, fire_at="2025-01-01T00:00:00Z")
+    assert scan["schedule_id"] == a["_id"] and scan["status"] == "mocked"
+    assert db["acme_scans"].count_documents({"source": "schedule"}) == 1
+    assert db["acme_scan_schedules"].find_one({"_id": a["_id"]})["runs"] == 1
+
+
+def test_two_workers_run_each_fire_once(monkeypatch):
+    monkeypatch.setattr(kavach_runner, "run_nmap_or_mock", lambda target: ("mocked", "<nmaprun/>", b""))
+    db = MemoryDB("sched-workers")
+    doc = scan_schedule.create(db, "acme", {"target": "a", "interval_minutes": 60, "jitter_minutes": 0})
+    fire = scan_schedule.next_run(doc)
+    workers = [scan_schedule.TenantSlots(cap=1), scan_schedule.TenantSlots(cap=1)]
+
+    for at in (fire, fire + timedelta(hours=1)):
+        monkeypatch.setattr(scan_schedule, "_now", lambda: at + timedelta(seconds=2))
+        runs = []
+        for slots in workers:  # both processes registered the schedule and fire together
+            monkeypatch.setattr(scan_schedule, "slots", slots)
+            runs.append(scan_schedule.run_scheduled_scan("acme", doc["_id"], db))
+        assert sum(r is not None for r in runs) == 1
+    assert db["acme_scans"].count_documents({"schedule_id": doc["_id"]}) == 2
+
+    # both restart after three missed fires: one catch-up run between them
+    monkeypatch.setattr(worker, "scheduler_enabled", lambda: True)
+    monkeypatch.setattr(scan_schedule, "register", lambda d: True)
+    submitted = []
+    monkeypatch.setattr(worker, "submit_job", lambda fn, *a, **k: submitted.append(a) or "job")
+    later = fire + timedelta(hours=4, seconds=2)
+    assert scan_schedule.load_all(db, later) == scan_schedule.load_all(db, later) == 1
+    assert submitted == [("acme", doc["_id"])]
+    assert db["acme_scan_schedules"].find_one({"_id": doc["_id"]})["coalesced_runs"] == 2
+
+
+def test_simulation_spreads_load_with_jitter():
+    docs = [scan_schedule.normalize(f"t{i}", {"target": f"h{j}", "cron": "0 0 * * *", "jitter_minutes": 120})
+            for i in range(10) for j in range(10)]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    flat = scan_schedule.simulate(docs, start, hours=4, scan_minutes=10, tenant_cap=100, jitter=False)
+    spread = scan_schedule.simulate(docs, start, hours=4, scan_minutes=10, tenant_cap=100)
+    assert flat["peak_concurrency"] == 100
+    assert spread["peak_concurrency"] < 40 and spread["runs"] == 100
+
+    capped = scan_schedule.simulate(docs, start, hours=4, scan_minutes=10, tenant_cap=2, jitter=False)
+    assert capped["peak_concurrency"] == 20 and capped["deferred"] == 80
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.db.memory import MemoryDB
+from app.db.sqlite_store import SQLiteDB
+
+BASE = datetime(2025, 1, 1)
+QUERIES = [
+    ({}, [("ts", -1)], 3),
+    ({"status": "open"}, [("ts", 1)], 0),
+    ({"status": {"$in": ["open", "closed"]}, "port": {"$gte": 100}}, [("port", -1)], 5),
+    ({"port": {"$lt": 50}}, None, 0),
+    ({"tags": "web"}, [("_id", -1)], 4),
+    ({"meta.host": "h2"}, None, 0),
+]
+
+
+def _docs():
+    return [{"status": ["open", "closed", "filtered"][i % 3], "port": i * 7 % 300,
+             "ts": BASE + timedelta(minutes=i), "tags": ["web"] if i % 4 == 0 else [],
+             "meta": {"host": f"h{i % 5}"}} for i in range(120)]
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    db = SQLiteDB(str(tmp_path / "t.db"))
+    yield db
+    db.close()
+
+
+def test_sqlite_matches_memory_store(sqlite_db):
+    mem = MemoryDB()["scans"]
+    sql = sqlite_db["scans"]
+    docs = _docs()  # insert_many assigns _id in place, so both stores share ids
+    for col in (mem, sql):
+        col.insert_many(docs)
+        col.create_index([("status", 1), ("ts", -1)])
+        col.create_index("port")
+        col.create_index("tags")
+    for filt, sort, limit in QUERIES:
+        a = [d["_id"] for d in mem.find(filt, sort=sort, limit=limit)]
+        b = [d["_id"] for d in sql.find(filt, sort=sort, limit=limit)]
+        assert a == b, filt
+        assert mem.count_documents(filt) == sql.count_documents(filt)
+    assert sql.find_one({}, sort=[("ts", -1)])["ts"] == BASE + timedelta(minutes=119)
+
+
+def test_datetime_sort_with_whole_and_fractional_seconds(sqlite_db):
+    # Extended JSON drops ".000" for whole seconds, so text order would be wrong
+    docs = [{"n": i, "ts": BASE + timedelta(milliseconds=500 * i)} for i in range(5)]
+    for indexed in (False, True):
+        col = sqlite_db[f"dates_{indexed}"]
+        col.insert_many([dict(d) for d in docs])
+        if indexed:
+            col.create_index("ts")
+        assert [d["n"] for d in col.find({}, sort=[("ts", 1)])] == [0, 1, 2, 3, 4]
+        assert [d["n"] for d in col.find({}, sort=[("ts", -1)], limit=2)] == [4, 3]
+        assert [d["n"] for d in col.find({"ts": {"$gte": BASE + timedelta(seconds=1)}})] == [2, 3, 4]
+
+
+def test_bool_and_number_equality_match_memory_store(sqlite_db):
+    docs = [{"f": v} for v in (True, 1, False, 0, 1.0, "1", None)]
+    mem, sql = MemoryDB()["flags"], sqlite_db["flags"]
+    for col in (mem, sql):
+        col.insert_many([dict(d) for d in docs])
+        col.create_index("f")
+    for filt in ({"f": 1}, {"f": 0}, {"f": "1"}, {"f": True}, {"f": {"$in": [0]}}, {"f": {"$in": [1, "1"]}},
+                 {"f": {"$eq": 1.0}}, {"f": {"$gte": 0}}):
+        assert sql.count_documents(filt) == mem.count_documents(filt), filt
+        assert [d["f"] for d in sql.find(filt)] == [d["f"] for d in mem.find(filt)], filt
+
+
+def test_sqlite_persists_and_updates(tmp_path):
+    path = str(tmp_path / "p.db")
+    db = SQLiteDB(path)
+    col = db["jobs"]
+    col.create_index("key", unique=True)
+    col.insert_one({"key": "a", "n": 1})
+    with pytest.raises(DuplicateKeyError):
+        col.insert_one({"key": "a"})
+    col.update_one({"key": "a"}, {"$inc": {"n": 2}})
+    col.update_one({"key": "b"}, {"$set": {"n": 5}}, upsert=True)
+    db.close()
+
+    db = SQLiteDB(path)
+    assert db._conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    col = db["jobs"]
+    assert col.find_one({"key": "a"})["n"] == 3
+    assert col.count_documents({"n": {"$gt": 2}}) == 2
+    assert "key_1" in col.index_information()
+    assert col.delete_many({"key": {"$in": ["a", "b"]}}).deleted_count == 2
+    db.close()
@@ -0,0 +1,110 @@
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.main import app
+from app.services import thumbnails
+from app.services.thumbnails import ThumbnailCache
+
+
+def _jpeg(w=800, h=600, color=(10, 120, 200)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (w, h), color).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = ThumbnailCache(str(tmp_path / "thumbs"), max_bytes=64 * 1024, workers=2)
+    monkeypatch.setattr(thumbnails, "_cache", c)
+    yield c
+    c.close()
+
+
+def test_images_are_stored_once_and_thumbnails_cached_by_digest_and_size(cache):
+    db = MemoryDB("thumbs")
+    data = _jpeg()
+    a = thumbnails.store_image(db, "acme", data, "image/jpeg", "a.jpg")
+    b = thumbnails.store_image(db, "acme", data, "image/jpeg", "copy.jpg")
+    assert a == b and db["acme_artifacts"].count_documents({}) == 1
+    assert db["acme_artifacts"].find_one({})["codec"] == "none"
+
+    calls = []
+    real = thumbnails.render
+    thumbnails.render = lambda *args: calls.append(args[1]) or real(*args)
+    try:
+        barrier = threading.Barrier(4)
+        outs = []
+
+        def fetch():
+            barrier.wait()
+            outs.append(thumbnails.derived(db, "acme", a["digest"], 200))
+        ts = [threading.Thread(target=fetch) for _ in range(4)]
+        [t.start() for t in ts]
+        [t.join() for t in ts]
+        assert calls == [256] and len({o["path"] for o in outs}) == 1
+        assert thumbnails.derived(db, "acme", a["digest"], 256)["hit"] is True
+    finally:
+        thumbnails.render = real
+
+    with Image.open(outs[0]["path"]) as im:
+        assert im.size == (256, 192)
+    assert thumbnails.derived(db, "acme", "0" * 64, 128) is None
+    assert thumbnails.derived(db, "acme", "../etc", 128) is None
+
+
+def test_lru_evicts_oldest_files_over_budget(tmp_path):
+    c = ThumbnailCache(str(tmp_path), max_bytes=3000, workers=1)
+    try:
+        for i in range(4):
+            c.get("t", f"{i:064x}", "64", lambda: b"x" * 1000)
+        c.get("t", f"{0:064x}", "64", lambda: b"never")  # evicted: rebuilt
+        assert c.stats()["evictions"] >= 1 and c.stats()["bytes"] <= 3000
+        assert not os.path.exists(c.path("t", f"{1:064x}", "64"))
+    finally:
+        c.close()
+    reopened = ThumbnailCache(str(tmp_path), max_bytes=3000, workers=1)
+    assert reopened.stats()["files"] == 3
+    reopened.close()
+
+
+def test_thumbnail_and_overlay_endpoints(cache, auth_headers):
+    h = auth_headers("analyst", "qc.lvh.me")
+    client = TestClient(app)
+    data = _jpeg(640, 480)
+    up = client.post("/api/trinetra/infer", headers=h, files={"file": ("part.jpg", data, "image/jpeg")}).json()
+    digest = up["imageDigest"]
+
+    r = client.get(f"/api/trinetra/images/{digest}/thumb?size=100", headers=h)
+    assert r.status_code == 200 and r.headers["content-type"] == "image/jpeg" and r.headers["x-cache"] == "MISS"
+    etag = r.headers["etag"]
+    assert etag == f'"{digest}-128"' and "immutable" in r.headers["cache-control"]
+    assert client.get(f"/api/trinetra/images/{digest}/thumb?size=128", headers=h).headers["x-cache"] == "HIT"
+    assert client.get(f"/api/trinetra/images/{digest}/thumb?size=128",
+                      headers={**h, "If-None-Match": etag}).status_code == 304
+    part = client.get(f"/api/trinetra/images/{digest}/thumb?size=128", headers={**h, "Range": "bytes=0-9"})
+    assert part.status_code == 206 and part.content == r.content[:10]
+
+    full = client.get(f"/api/trinetra/images/{digest}", headers=h)
+    assert full.content == data and full.headers["etag"] == f'"{digest}"'
+    ov = client.get(f"/api/trinetra/inferences/{up['inferenceId']}/overlay?size=512", headers=h)
+    assert ov.status_code == 200 and ov.headers["etag"].startswith(f'"{digest}-512-ov')
+    assert client.get(f"/api/trinetra/images/{'f' * 64}/thumb", headers=h).status_code == 404
+
+
+def test_thumbnail_of_a_non_image_upload_is_415_not_500(cache, auth_headers):
+    h = auth_headers("owner", "qc.lvh.me")
+    client = TestClient(app)
+    pdf = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n%%EOF\n"
+    up = client.post("/api/trinetra/qc/upload", headers=h, files={"file": ("spec.pdf", pdf, "application/pdf")})
+    assert up.status_code == 200
+    digest = up.json()["digest"]
+    r = client.get(f"/api/trinetra/images/{digest}/thumb?size=128", headers=h)
+    assert r.status_code == 415 and "not a readable image" in r.json()["detail"]
+    assert client.get(f"/api/trinetra/images/{digest}", headers=h).content == pdf
+    assert cache.stats()["files"] == 0
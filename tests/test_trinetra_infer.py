@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from PIL import Image
+from starlette.testclient import TestClient
+
+from app.db.memory import MemoryDB
+from app.db.sqlite_store import SQLiteDB
+from app.main import app
+from app.services import trinetra_infer
+
+
+def _png(seed: int, size=(64, 48)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, (seed % 256, seed * 7 % 256, 90)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+DETS = [{"label": "scratch", "score": 0.87, "bbox": {"x": 120, "y": 95, "w": 60, "h": 30}},
+        {"label": "dent", "score": 0.25, "bbox": {"x": 1, "y": 2, "w": 3, "h": 4}}]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_records_are_packed_and_queue_is_indexed(backend, tmp_path):
+    db = MemoryDB("qc") if backend == "memory" else SQLiteDB(str(tmp_path / "qc.db"))
+    a = trinetra_infer.record(db, "acme", "mdl", DETS, source_path="a.png")
+    b = trinetra_infer.record(db, "acme", "mdl", [], source_path="b.png")
+    c = trinetra_infer.record(db, "acme", "mdl", DETS[:1], source_path="c.png")
+    assert a["suggestedDecision"] == "fail" and b["suggestedDecision"] == "pass"
+
+    stored = db["acme_trinetra_inferences"].find_one({"_id": a["inferenceId"]})
+    assert len(stored["results"]["scores"]) == 8 and len(stored["results"]["boxes"]) == 32
+    assert trinetra_infer.get(db, "acme", a["inferenceId"])["detections"] == DETS
+    assert "review_queue" in db["acme_trinetra_inferences"].index_information()
+
+    assert [i["inferenceId"] for i in trinetra_infer.review_queue(db, "acme")] == [c["inferenceId"], a["inferenceId"]]
+    page = trinetra_infer.review_queue(db, "acme", limit=1)
+    assert trinetra_infer.review_queue(db, "acme", before=page[-1]["processedAt"])[0]["inferenceId"] == a["inferenceId"]
+
+    trinetra_infer.decide(db, "acme", c["inferenceId"], "pass", "buffed out", "u1")
+    assert [i["inferenceId"] for i in trinetra_infer.review_queue(db, "acme")] == [a["inferenceId"]]
+    assert trinetra_infer.queue_counts(db, "acme") == {"pass": 1, "fail": 1, "warn": 0}
+    with pytest.raises(ValueError):
+        trinetra_infer.decide(db, "acme", a["inferenceId"], "maybe")
+
+
+def test_infer_and_decision_api(auth_headers):
+    h = auth_headers("analyst", "qc.lvh.me", sub="reviewer1")
+    client = TestClient(app)
+    r = client.post("/api/trinetra/infer", headers=h, files={"file": ("p1.png", _png(3), "image/png")})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["modelId"] == "mdl_yolov8_s1" and body["overlayHint"] == "bbox"
+    assert body["suggestedDecision"] in ("pass", "warn", "fail")
+    for d in body["detections"]:
+        assert set(d) == {"label", "score", "bbox"} and d["bbox"]["x"] + d["bbox"]["w"] <= 64
+    again = client.post("/api/trinetra/infer", headers=h, files={"file": ("p1.png", _png(3), "image/png")}).json()
+    assert again["detections"] == body["detections"] and again["inferenceId"] != body["inferenceId"]
+
+    bad = client.post("/api/trinetra/infer", headers=h, files={"file": ("x.png", b"nope", "image/png")})
+    assert bad.status_code == 400
+    assert client.post("/api/trinetra/infer", headers={"Host": "qc.lvh.me"},
+                       files={"file": ("p.png", _png(1), "image/png")}).status_code == 401
+
+    r = client.post("/api/trinetra/decision", headers=h,
+                    json={"inferenceId": body["inferenceId"], "decision": "fail", "notes": "deep scratch"})
+    assert r.status_code == 201 and r.json()["decidedBy"] == "reviewer1"
+    assert client.post("/api/trinetra/decision", headers=h,
+                       json={"inferenceId": "inf_missing", "decision": "fail"}).status_code == 404
+    assert client.post("/api/trinetra/decision", headers=h,
+                       json={"inferenceId": body["inferenceId"], "decision": "?"}).status_code == 400
+
+    got = client.get(f"/api/trinetra/inferences/{body['inferenceId']}", headers=h).json()
+    assert got["decision"] == "fail" and got["notes"] == "deep scratch"
+    queue = client.get(f"/api/trinetra/review?suggested={body['suggestedDecision']}", headers=h).json()
+    assert body["inferenceId"] not in [i["inferenceId"] for i in queue["items"]]
@@ -0,0 +1,87 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.services import trinetra_pool
+from app.services.trinetra_infer import InvalidImage, MockDetector
+from app.services.trinetra_pool import InferencePool, PoolBusy
+
+
+def _png(seed: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), (seed % 256, 20, 30)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_in_process_pool_coalesces_concurrent_requests_into_batches():
+    pool = InferencePool(workers=0, max_batch=8, max_wait_ms=50, model_kwargs={"batch_ms": 30}).start()
+    try:
+        futs = [pool.submit(_png(i)) for i in range(16)] + [pool.submit(b"not an image")]
+        results = [f.result(5) for f in futs[:-1]]
+        with pytest.raises(InvalidImage):
+            futs[-1].result(5)
+        assert results == MockDetector().predict([_png(i) for i in range(16)])
+        s = pool.stats()
+        assert s["images"] == 17 and s["batches"] <= 4 and s["errors"] == 1 and s["pending"] == 0
+    finally:
+        pool.close()
+
+
+def test_full_queue_is_rejected():
+    pool = InferencePool(workers=0, max_batch=1, max_queue=2, model_kwargs={"batch_ms": 200}).start()
+    try:
+        first = [pool.submit(_png(1)), pool.submit(_png(2))]
+        with pytest.raises(PoolBusy):
+            pool.submit(_png(3))
+        assert pool.stats()["rejected"] == 1
+        [f.result(5) for f in first]
+        pool.submit(_png(3)).result(5)
+    finally:
+        pool.close()
+
+
+def test_process_workers_read_images_from_shared_memory():
+    pool = InferencePool(workers=1, max_batch=4, max_wait_ms=20, shm_mb=1).start()
+    try:
+        imgs = [_png(i) for i in range(6)]
+        assert [pool.submit(b).result(10) for b in imgs] == MockDetector().predict(imgs)
+        with pytest.raises(ValueError):
+            pool.submit(b"x" * (2 * 1024 * 1024))
+
+        pool._slots[0].proc.kill()
+        time.sleep(0.1)
+        assert pool.infer(imgs[0], 10) == MockDetector().predict(imgs[:1])[0]
+        assert pool.stats()["restarts"] == 1 and pool.stats()["alive"] == 1
+
+        slot, real, failures = pool._slots[0], pool._slots[0].start, [2]
+
+        def flaky_start():
+            if failures[0]:
+                failures[0] -= 1
+                raise trinetra_pool.WorkerError("inference worker failed to start")
+            real()
+
+        slot.start = flaky_start
+        slot.proc.kill()
+        time.sleep(0.1)
+        with pytest.raises(trinetra_pool.WorkerError):
+            pool.infer(imgs[0], 10)  # the restart fails twice
+        assert pool.infer(imgs[0], 10) == MockDetector().predict(imgs[:1])[0]  # started again later
+    finally:
+        pool.close()
+
+
+def test_upload_gets_503_when_pool_is_saturated(monkeypatch, auth_headers):
+    busy = InferencePool(workers=0, max_batch=1, max_queue=1, model_kwargs={"batch_ms": 300}).start()
+    monkeypatch.setattr(trinetra_pool, "_pool", busy)
+    try:
+        busy.submit(_png(9))
+        r = TestClient(app).post("/api/trinetra/infer", headers=auth_headers("analyst", "qc.lvh.me"),
+                                 files={"file": ("p.png", _png(1), "image/png")})
+        assert r.status_code == 503 and r.headers["retry-after"] == "1"
+    finally:
+        busy.close()